@@ -149,6 +149,10 @@ user_cache = TTLCache(default_ttl=120, max_size=200)
 # Query cache: Short TTL (30 seconds) - for expensive queries
 query_cache = TTLCache(default_ttl=30, max_size=100)
 
+# Analysis cache: Long TTL (1 hour) - planner analysis results. Keys embed the
+# versions of every input, so entries never need explicit invalidation.
+analysis_cache = TTLCache(default_ttl=3600, max_size=300)
+
 
 # =============================================================================
 # Decorators for easy caching
@@ -248,4 +252,5 @@ def get_cache_stats() -> Dict[str, Any]:
         "catalog_cache": catalog_cache.stats(),
         "user_cache": user_cache.stats(),
         "query_cache": query_cache.stats(),
+        "analysis_cache": analysis_cache.stats(),
     }
@@ -17,6 +17,8 @@ class ExcelCacheLoader:
         self._stock_cache: Optional[pd.DataFrame] = None
         self._equivalencias_cache: Optional[pd.DataFrame] = None
         self._consumo_cache: Optional[pd.DataFrame] = None
+        # Se incrementa en cada recarga: identifica el snapshot de los Excel en uso
+        self.snapshot_version = 0
 
     @staticmethod
     def _norm_codigo(val: str) -> str:
@@ -84,7 +86,12 @@ class ExcelCacheLoader:
         return self._equivalencias_cache
 
     def load_consumo(self) -> pd.DataFrame:
-        """Carga consumo histórico desde docs/consumo historico.xlsx"""
+        """
+        Carga consumo histórico desde docs/consumo historico.xlsx.
+
+        Solo se usa como respaldo mientras el histórico no fue importado a la
+        BD (services/consumo_store, scripts/import_consumo.py).
+        """
         if self._consumo_cache is not None:
             return self._consumo_cache
 
@@ -120,6 +127,7 @@ class ExcelCacheLoader:
         self._stock_cache = None
         self._equivalencias_cache = None
         self._consumo_cache = None
+        self.snapshot_version += 1
 
 
 # Instancia global única
@@ -141,6 +149,11 @@ def get_consumo_cache() -> pd.DataFrame:
     return _loader.load_consumo()
 
 
+def get_snapshot_version() -> int:
+    """API global para obtener la versión del snapshot de caches Excel"""
+    return _loader.snapshot_version
+
+
 def clear_cache():
     """API global para limpiar caches"""
     _loader.clear_all()
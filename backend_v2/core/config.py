@@ -62,6 +62,10 @@ class Settings(BaseSettings):
     # Database (unificada) - resuelve siempre a backend_v2/spm.db
     _DEFAULT_DB = Path(__file__).resolve().parent.parent / "spm.db"
     DATABASE_URL: str = f"sqlite:///{_DEFAULT_DB}"
+    # BD de archivo (retención). Vacío = <nombre>_archive.db junto a la BD principal
+    ARCHIVE_DATABASE_URL: str = ""
+    # BD de auditoría (append-only). Vacío = <nombre>_audit.db junto a la BD principal
+    AUDIT_DATABASE_URL: str = ""
 
     # Logging
     LOG_LEVEL: str = "INFO"
@@ -96,12 +96,14 @@ class NotificacionEvent:
 
     event: str
     data: dict
+    id: Optional[int] = None
 
     def to_sse_format(self) -> str:
-        """Formatear para Server-Sent Events"""
+        """Formatear para Server-Sent Events (con id: para reanudar vía Last-Event-ID)"""
         import json
 
-        return f"event: {self.event}\ndata: {json.dumps(self.data)}\n\n"
+        id_line = f"id: {self.id}\n" if self.id is not None else ""
+        return f"{id_line}event: {self.event}\ndata: {json.dumps(self.data)}\n\n"
 
 
 # Helper functions
@@ -7,15 +7,21 @@ import json
 import logging
 import sqlite3
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 logger = logging.getLogger(__name__)
 
 # Import con manejo de rutas relativas
 try:
     from backend_v2.core.config import settings
+    from backend_v2.services.atp import ATPService, actualizar_compromisos
+    from backend_v2.core.utils import tiene_tabla
+    from backend_v2.services.audit_log import get_audit_log
 except ImportError:
     from core.config import settings
+    from core.utils import tiene_tabla
+    from services.atp import ATPService, actualizar_compromisos
+    from services.audit_log import get_audit_log
 
 
 def _db_path() -> Path:
@@ -61,11 +67,16 @@ class SolicitudRepository:
         solicitud = SolicitudRepository.get_by_id(solicitud_id)
         if not solicitud:
             return []
+        return SolicitudRepository.parse_items(solicitud)
+
+    @staticmethod
+    def parse_items(solicitud: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Extrae los items del data_json de una solicitud ya cargada"""
         try:
             data = json.loads(solicitud.get("data_json") or "{}")
             return data.get("items", [])
         except json.JSONDecodeError as e:
-            logger.warning(f"Error parseando data_json de solicitud {solicitud_id}: {e}")
+            logger.warning(f"Error parseando data_json de solicitud {solicitud.get('id')}: {e}")
             return []
 
     @staticmethod
@@ -78,8 +89,42 @@ class SolicitudRepository:
                 "UPDATE solicitudes SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
                 (status, solicitud_id),
             )
+            actualizado = cur.rowcount > 0
+            if actualizado:
+                # Una solicitud cerrada libera su stock comprometido
+                actualizar_compromisos(conn, solicitud_id)
             conn.commit()
-            return cur.rowcount > 0
+            return actualizado
+        finally:
+            conn.close()
+
+    @staticmethod
+    def get_analysis_versions(solicitud_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Versiones de los datos de entrada del análisis PASO 1.
+
+        Returns:
+            Dict con updated_at, centro, almacén e items (data_json) de la
+            solicitud y version/monto/saldo del presupuesto centro/sector, o
+            None si la solicitud no existe
+        """
+        conn = _connect()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                SELECT s.id, s.updated_at, s.centro, s.sector, s.almacen_virtual, s.data_json,
+                       p.version AS presupuesto_version,
+                       p.monto_usd AS presupuesto_monto,
+                       p.saldo_usd AS presupuesto_saldo
+                FROM solicitudes s
+                LEFT JOIN presupuestos p ON p.centro = s.centro AND p.sector = s.sector
+                WHERE s.id = ?
+            """,
+                (solicitud_id,),
+            )
+            row = cur.fetchone()
+            return dict(row) if row else None
         finally:
             conn.close()
 
@@ -119,6 +164,117 @@ class SolicitudRepository:
         finally:
             conn.close()
 
+    @staticmethod
+    def list_cola_planner(
+        weights: Dict[str, float],
+        ahora: str,
+        statuses: List[str],
+        planner_id: Optional[str] = None,
+        centro: Optional[str] = None,
+        sector: Optional[str] = None,
+        criticidad: Optional[str] = None,
+        after: Optional[tuple] = None,
+        limit: int = 50,
+        include_items: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Página de la cola del planificador ordenada por prioridad.
+
+        La prioridad se calcula en SQL con los mismos componentes que
+        ScoringPipeline.score_solicitud (criticidad, urgencia por
+        fecha_necesidad, monto, cantidad de items e impacto fijo 0.5), así
+        que solo se leen y parsean las filas de la página pedida.
+
+        Args:
+            weights: Pesos por componente (ScoringPipeline.weights)
+            ahora: Fecha de referencia ISO para la urgencia
+            statuses: Estados incluidos
+            planner_id, centro, sector, criticidad: Filtros opcionales
+            after: (prioridad, id) de la última fila de la página anterior
+            limit: Máximo de filas
+            include_items: Incluir data_json en cada fila
+
+        Returns:
+            Filas con prioridad, dias_restantes y n_items, ordenadas por
+            (prioridad DESC, id DESC)
+        """
+        params: Dict[str, Any] = {
+            "ahora": ahora,
+            "limit": limit,
+            "w_criticidad": weights.get("criticidad", 0),
+            "w_urgencia": weights.get("fecha_urgencia", 0),
+            "w_monto": weights.get("monto", 0),
+            "w_complejidad": weights.get("complejidad", 0),
+            "w_impacto": weights.get("impacto", 0),
+        }
+        status_params = []
+        for i, status in enumerate(statuses):
+            params[f"status_{i}"] = status
+            status_params.append(f":status_{i}")
+        where = [f"s.status IN ({', '.join(status_params)})"]
+        for column, value in (
+            ("planner_id", planner_id),
+            ("centro", centro),
+            ("sector", sector),
+            ("criticidad", criticidad),
+        ):
+            if value:
+                where.append(f"s.{column} = :{column}")
+                params[column] = value
+
+        after_sql = ""
+        if after is not None:
+            after_sql = "WHERE prioridad < :after_p OR (prioridad = :after_p AND id < :after_id)"
+            params["after_p"], params["after_id"] = after
+
+        data_json_col = ", s.data_json" if include_items else ""
+        conn = _connect()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                f"""
+                SELECT * FROM (
+                    SELECT b.*, ROUND(
+                        :w_criticidad * CASE WHEN b.criticidad = 'Alta' THEN 1.0 ELSE 0.5 END
+                        + :w_urgencia * CASE
+                            WHEN b.dias_restantes IS NULL THEN 0.5
+                            WHEN b.dias_restantes <= 0 THEN 1.0
+                            WHEN b.dias_restantes <= 3 THEN 0.9
+                            WHEN b.dias_restantes <= 7 THEN 0.7
+                            WHEN b.dias_restantes <= 14 THEN 0.5
+                            WHEN b.dias_restantes <= 30 THEN 0.3
+                            ELSE 0.1
+                          END
+                        + :w_monto * MIN(COALESCE(b.total_monto, 0) / 100000.0, 1.0)
+                        + :w_complejidad * MIN(b.n_items / 20.0, 1.0)
+                        + :w_impacto * 0.5, 6) AS prioridad
+                    FROM (
+                        SELECT s.id, s.id_usuario, s.centro, s.sector, s.justificacion,
+                               s.centro_costos, s.almacen_virtual, s.criticidad,
+                               s.fecha_necesidad, s.status, s.total_monto, s.planner_id,
+                               s.created_at, s.updated_at, s.aprobador_id{data_json_col},
+                               u.nombre AS solicitante_nombre,
+                               u.apellido AS solicitante_apellido,
+                               CAST(julianday(s.fecha_necesidad) - julianday(:ahora) AS INTEGER)
+                                   AS dias_restantes,
+                               CASE WHEN json_valid(s.data_json)
+                                    THEN COALESCE(json_array_length(s.data_json, '$.items'), 0)
+                                    ELSE 0 END AS n_items
+                        FROM solicitudes s
+                        LEFT JOIN usuarios u ON s.id_usuario = u.id_spm
+                        WHERE {" AND ".join(where)}
+                    ) b
+                )
+                {after_sql}
+                ORDER BY prioridad DESC, id DESC
+                LIMIT :limit
+            """,
+                params,
+            )
+            return [dict(row) for row in cur.fetchall()]
+        finally:
+            conn.close()
+
 
 class PresupuestoRepository:
     """Repositorio para operaciones de Presupuesto"""
@@ -144,6 +300,22 @@ class PresupuestoRepository:
 class TratamientoRepository:
     """Repositorio para operaciones de Tratamiento de Solicitud"""
 
+    UPSERT_DECISION = """
+        INSERT INTO solicitud_items_tratamiento
+        (solicitud_id, item_index, decision, cantidad_aprobada, codigo_equivalente,
+         proveedor_sugerido, precio_unitario_estimado, comentario, updated_by)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(solicitud_id, item_index) DO UPDATE SET
+            decision = excluded.decision,
+            cantidad_aprobada = excluded.cantidad_aprobada,
+            codigo_equivalente = excluded.codigo_equivalente,
+            proveedor_sugerido = excluded.proveedor_sugerido,
+            precio_unitario_estimado = excluded.precio_unitario_estimado,
+            comentario = excluded.comentario,
+            updated_by = excluded.updated_by,
+            updated_at = CURRENT_TIMESTAMP
+    """
+
     @staticmethod
     def save_decision(
         solicitud_id: int,
@@ -161,21 +333,7 @@ class TratamientoRepository:
         try:
             cur = conn.cursor()
             cur.execute(
-                """
-                INSERT INTO solicitud_items_tratamiento
-                (solicitud_id, item_index, decision, cantidad_aprobada, codigo_equivalente,
-                 proveedor_sugerido, precio_unitario_estimado, comentario, updated_by)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(solicitud_id, item_index) DO UPDATE SET
-                    decision = excluded.decision,
-                    cantidad_aprobada = excluded.cantidad_aprobada,
-                    codigo_equivalente = excluded.codigo_equivalente,
-                    proveedor_sugerido = excluded.proveedor_sugerido,
-                    precio_unitario_estimado = excluded.precio_unitario_estimado,
-                    comentario = excluded.comentario,
-                    updated_by = excluded.updated_by,
-                    updated_at = CURRENT_TIMESTAMP
-            """,
+                TratamientoRepository.UPSERT_DECISION,
                 (
                     solicitud_id,
                     item_idx,
@@ -188,6 +346,7 @@ class TratamientoRepository:
                     updated_by,
                 ),
             )
+            actualizar_compromisos(conn, solicitud_id)
             conn.commit()
             return True
         except Exception as e:
@@ -196,6 +355,70 @@ class TratamientoRepository:
         finally:
             conn.close()
 
+    @staticmethod
+    def save_decisiones_bulk(
+        solicitud_id: int,
+        filas: List[tuple],
+        updated_by: str,
+        status: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Guarda varias decisiones y el nuevo status en una sola transacción.
+
+        Usa una conexión, BEGIN IMMEDIATE y un executemany del UPSERT. Si
+        alguna fila falla, se deshace solo el lote (SAVEPOINT) y se reintenta
+        fila por fila dentro de la misma transacción para reportar el error
+        de cada item sin perder las demás. El stock comprometido (services/atp)
+        se ajusta en la misma transacción.
+
+        Args:
+            solicitud_id: ID de la solicitud
+            filas: Tuplas (item_idx, decision, cantidad_aprobada,
+                codigo_equivalente, proveedor_sugerido, precio_unitario,
+                comentario)
+            updated_by: Usuario que guarda
+            status: Nuevo status de la solicitud (None = no cambiar)
+
+        Returns:
+            Errores por item [{item_idx, error}]
+        """
+        params = [(solicitud_id, *fila, updated_by) for fila in filas]
+        errores: List[Dict[str, Any]] = []
+        conn = _connect()
+        conn.isolation_level = None  # Transacción explícita
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("SAVEPOINT decisiones")
+            try:
+                conn.executemany(TratamientoRepository.UPSERT_DECISION, params)
+                conn.execute("RELEASE decisiones")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK TO decisiones")
+                conn.execute("RELEASE decisiones")
+                for fila in params:
+                    conn.execute("SAVEPOINT decision")
+                    try:
+                        conn.execute(TratamientoRepository.UPSERT_DECISION, fila)
+                    except sqlite3.Error as e:
+                        conn.execute("ROLLBACK TO decision")
+                        errores.append({"item_idx": fila[1], "error": str(e)})
+                    conn.execute("RELEASE decision")
+
+            if status:
+                conn.execute(
+                    "UPDATE solicitudes SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (status, solicitud_id),
+                )
+            actualizar_compromisos(conn, solicitud_id)
+            conn.execute("COMMIT")
+            return errores
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
     @staticmethod
     def get_decisiones(solicitud_id: int) -> List[Dict[str, Any]]:
         """Obtiene decisiones previas de una solicitud"""
@@ -224,22 +447,22 @@ class TratamientoRepository:
         payload: Dict[str, Any],
         actor_id: str,
     ) -> bool:
-        """Registra evento en auditoria"""
-        conn = _connect()
-        try:
-            cur = conn.cursor()
-            cur.execute(
-                """
-                INSERT INTO solicitud_tratamiento_log
-                (solicitud_id, item_index, actor_id, tipo, estado, payload_json)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """,
-                (solicitud_id, item_idx, actor_id, tipo, estado, json.dumps(payload)),
-            )
-            conn.commit()
-            return True
-        finally:
-            conn.close()
+        """Registra evento en auditoria (BD de auditoría, escritura en lote)"""
+        get_audit_log(_db_path()).append(solicitud_id, item_idx, tipo, estado, payload, actor_id)
+        return True
+
+    @staticmethod
+    def get_historial(
+        solicitud_id: int,
+        item_idx: Optional[int] = None,
+        tipos: Optional[List[str]] = None,
+        limit: int = 200,
+        before_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Historial de eventos de tratamiento, del más reciente al más antiguo"""
+        return get_audit_log(_db_path()).history(
+            solicitud_id, item_index=item_idx, tipos=tipos, limit=limit, before_id=before_id
+        )
 
 
 class ProveedorRepository:
@@ -266,6 +489,9 @@ class ProveedorRepository:
 class MaterialRepository:
     """Repositorio para operaciones de Material"""
 
+    # Máximo de parámetros por consulta IN (límite de SQLite: 999)
+    BATCH_SIZE = 500
+
     @staticmethod
     def get_info(codigo: str) -> Optional[Dict[str, Any]]:
         """Obtiene información de material"""
@@ -280,6 +506,39 @@ class MaterialRepository:
         finally:
             conn.close()
 
+    @staticmethod
+    def get_info_batch(codigos: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Obtiene información de varios materiales en una sola consulta por lote.
+
+        Returns:
+            Dict codigo -> {descripcion, precio_usd} (solo los encontrados)
+        """
+        unicos = list(dict.fromkeys(c for c in codigos if c))
+        result: Dict[str, Dict[str, Any]] = {}
+        if not unicos:
+            return result
+        conn = _connect()
+        try:
+            cur = conn.cursor()
+            for i in range(0, len(unicos), MaterialRepository.BATCH_SIZE):
+                lote = unicos[i : i + MaterialRepository.BATCH_SIZE]
+                cur.execute(
+                    f"""
+                    SELECT codigo, descripcion, precio_usd FROM materiales
+                    WHERE codigo IN ({",".join("?" * len(lote))})
+                    """,
+                    lote,
+                )
+                for row in cur.fetchall():
+                    result.setdefault(
+                        row["codigo"],
+                        {"descripcion": row["descripcion"], "precio_usd": row["precio_usd"]},
+                    )
+            return result
+        finally:
+            conn.close()
+
     @staticmethod
     def get_stock_detalle(
         codigo: str, centro: Optional[str] = None, almacen: Optional[str] = None
@@ -289,122 +548,223 @@ class MaterialRepository:
         Filtra almacenes excluidos y lotes excluidos según config.
         Enriquece con libre_disponibilidad y responsable desde config_almacenes.
         """
-        # Obtener config de almacenes y lotes excluidos
-        almacenes_config = ConfigAlmacenesRepository.get_all()
-        lotes_excluidos = ConfigAlmacenesRepository.get_lotes_excluidos()
+        return MaterialRepository.get_stock_detalle_batch([codigo], centro, almacen)[codigo]
+
+    @staticmethod
+    def get_stock_detalle_batch(
+        codigos: List[str], centro: Optional[str] = None, almacen: Optional[str] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Obtiene detalle de stock de varios materiales en una sola pasada.
+
+        Misma semántica que get_stock_detalle por código: todos los códigos se
+        resuelven contra el mismo índice de stock (core/services/stock_index),
+        que ya tiene aplicadas las exclusiones y la config de almacenes.
+
+        Args:
+            codigos: Códigos de material (se aceptan repetidos)
+            centro: Centro a filtrar (opcional)
+            almacen: Almacén a filtrar (opcional)
 
-        # Crear sets para filtrado rápido
-        almacenes_excluidos = {
-            f"{c['centro']}_{c['almacen']}" for c in almacenes_config if c.get("excluido")
+        Returns:
+            Dict codigo -> lista de filas de stock (vacía si no hay stock)
+        """
+        try:
+            from backend_v2.core.services.stock_index import get_stock_index
+        except ImportError:
+            from core.services.stock_index import get_stock_index
+        index = get_stock_index()
+        return {
+            codigo: index.detalle(codigo, centro, almacen) for codigo in dict.fromkeys(codigos)
         }
-        lotes_excluidos_set = {l.upper() for l in lotes_excluidos}
 
-        # Crear mapa de config por centro_almacen
-        config_map = {f"{c['centro']}_{c['almacen']}": c for c in almacenes_config}
+    @staticmethod
+    def get_consumo_promedio_batch(codigos: List[str]) -> Optional[Dict[str, float]]:
+        """
+        Promedio de los 180 consumos más recientes de varios materiales,
+        desde el histórico de consumo en BD (services/consumo_store).
+
+        Returns:
+            Dict codigo_norm -> promedio (solo códigos con historial), o None
+            si el histórico todavía no se importó a la BD
+        """
+        try:
+            from backend_v2.services import consumo_store
+        except ImportError:
+            from services import consumo_store
+        conn = _connect()
+        try:
+            if not consumo_store.tiene_consumo(conn):
+                return None
+            return consumo_store.promedio_reciente(conn, codigos)
+        finally:
+            conn.close()
 
+    @staticmethod
+    def get_comprometido_batch(
+        codigos: List[str],
+        centro: Optional[str] = None,
+        almacen: Optional[str] = None,
+        excluir_solicitud: Optional[int] = None,
+    ) -> Dict[str, float]:
+        """
+        Stock comprometido por decisiones 'stock' de solicitudes abiertas
+        (services/atp), con el mismo filtro de centro/almacén que el stock.
+
+        Args:
+            codigos: Códigos de material
+            centro: Centro a filtrar (opcional)
+            almacen: Almacén a filtrar (opcional)
+            excluir_solicitud: Solicitud cuyas reservas no se descuentan
+
+        Returns:
+            Dict codigo_norm -> cantidad comprometida
+        """
         conn = _connect()
-        rows_raw = []
+        try:
+            return ATPService.comprometido_batch(
+                conn, codigos, centro, almacen, excluir_solicitud=excluir_solicitud
+            )
+        finally:
+            conn.close()
+
+    @staticmethod
+    def get_comprometido_version() -> int:
+        """Versión del stock comprometido (cambia con cada reserva o liberación)"""
+        conn = _connect()
+        try:
+            return ATPService.get_version(conn)
+        finally:
+            conn.close()
+
+
+class ReferenceDataRepository:
+    """
+    Versión de los datos de referencia del planner (stock, catálogo,
+    configuración de almacenes). Quien modifica esos datos llama a bump()
+    para invalidar los análisis cacheados que dependen de ellos.
+    """
+
+    CREATE_TABLE = """
+        CREATE TABLE IF NOT EXISTS reference_data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        )
+    """
+
+    @staticmethod
+    def get_version(conn: Optional[sqlite3.Connection] = None) -> int:
+        """
+        Versión actual (0 si nunca se modificaron datos de referencia)
+
+        Args:
+            conn: Conexión a usar; sin conexión, abre una
+        """
+        own = conn is None
+        if own:
+            conn = _connect()
         try:
             cur = conn.cursor()
-            # Verificar existencia tabla
             cur.execute(
-                "SELECT name FROM sqlite_master WHERE type='table' AND name='stock_almacenes'"
+                "SELECT name FROM sqlite_master WHERE type='table' AND name='reference_data_version'"
             )
-            if cur.fetchone():
-                params = [codigo]
-                sql = "SELECT centro, almacen, SUM(cantidad) as cantidad FROM stock_almacenes WHERE codigo_material = ?"
-                if centro:
-                    sql += " AND centro = ?"
-                    params.append(centro)
-                if almacen:
-                    sql += " AND almacen = ?"
-                    params.append(almacen)
-                sql += " GROUP BY centro, almacen"
-
-                cur.execute(sql, params)
-                rows_raw = [dict(row) for row in cur.fetchall()]
+            if not cur.fetchone():
+                return 0
+            cur.execute("SELECT version FROM reference_data_version WHERE id = 1")
+            row = cur.fetchone()
+            return int(row[0]) if row else 0
         finally:
-            conn.close()
+            if own:
+                conn.close()
 
-        # Si no hay datos en BD, usar Excel cache
-        if not rows_raw:
-            try:
-                from backend_v2.core.cache_loader import get_stock_cache
-            except ImportError:
-                from core.cache_loader import get_stock_cache
-            df = get_stock_cache()
-            if df is not None and not df.empty:
-
-                def _norm(val: str) -> str:
-                    base = (val or "").strip()
-                    if base.endswith(".0"):
-                        base = base[:-2]
-                    return base.lstrip("0")
-
-                mask = df["codigo_norm"] == _norm(codigo)
-                if centro:
-                    mask = mask & (df["centro_norm"] == _norm(centro))
-                if almacen:
-                    mask = mask & (df["almacen_norm"] == _norm(almacen))
-                df_filtered = df.loc[mask]
-                if df_filtered.empty:
-                    df_filtered = df[df["codigo_norm"] == _norm(codigo)]
-
-                for _, r in (
-                    df_filtered.groupby(["centro", "almacen"])
-                    .sum(numeric_only=True)
-                    .reset_index()
-                    .iterrows()
-                ):
-                    lote_val = None
-                    if "lote" in df_filtered.columns:
-                        match = df_filtered[
-                            (df_filtered["centro"] == r["centro"])
-                            & (df_filtered["almacen"] == r["almacen"])
-                        ]
-                        lote_val = match["lote"].iloc[0] if not match.empty else None
-                    elif "Lote" in df_filtered.columns:
-                        match = df_filtered[
-                            (df_filtered["centro"] == r["centro"])
-                            & (df_filtered["almacen"] == r["almacen"])
-                        ]
-                        lote_val = match["Lote"].iloc[0] if not match.empty else None
-
-                    rows_raw.append(
-                        {
-                            "centro": str(r["centro"]),
-                            "almacen": str(r["almacen"]),
-                            "cantidad": float(r["stock"] or 0),
-                            "lote": str(lote_val) if lote_val is not None else None,
-                        }
-                    )
+    @staticmethod
+    def bump(conn: Optional[sqlite3.Connection] = None) -> None:
+        """
+        Incrementa la versión de los datos de referencia.
 
-        # Filtrar y enriquecer
-        result = []
-        for row in rows_raw:
-            centro_val = str(row.get("centro", ""))
-            almacen_val = str(row.get("almacen", "")).zfill(4)
-            lote_val = (row.get("lote") or "").upper()
+        Args:
+            conn: Conexión con la transacción que modificó los datos; el
+                llamador hace commit. Sin conexión, abre una y confirma.
+        """
+        own = conn is None
+        if own:
+            conn = _connect()
+        try:
+            conn.execute(ReferenceDataRepository.CREATE_TABLE)
+            conn.execute(
+                """
+                INSERT INTO reference_data_version (id, version, updated_at)
+                VALUES (1, 1, datetime('now'))
+                ON CONFLICT(id) DO UPDATE SET
+                    version = version + 1,
+                    updated_at = excluded.updated_at
+            """
+            )
+            if own:
+                conn.commit()
+        finally:
+            if own:
+                conn.close()
 
-            # Excluir almacenes según config
-            key = f"{centro_val}_{almacen_val}"
-            if key in almacenes_excluidos:
-                continue
 
-            # Excluir lotes según config
-            if lote_val and lote_val in lotes_excluidos_set:
-                continue
+class PlannerAnalysisRepository:
+    """
+    Análisis PASO 1 precalculados, compartidos entre workers.
 
-            # Enriquecer con config
-            config = config_map.get(key, {})
-            row["almacen"] = almacen_val
-            row["libre_disponibilidad"] = bool(config.get("libre_disponibilidad", False))
-            row["responsable"] = config.get("responsable_nombre")
-            row["nombre_almacen"] = config.get("nombre")
+    Una fila por solicitud con la clave de versiones con la que se calculó
+    (core/services/planner_analysis_cache): una clave distinta es un miss.
+    """
 
-            result.append(row)
+    CREATE_TABLE = """
+        CREATE TABLE IF NOT EXISTS planner_analisis_cache (
+            solicitud_id INTEGER PRIMARY KEY,
+            cache_key TEXT NOT NULL,
+            resultado_json TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """
 
-        return result
+    @staticmethod
+    def get(solicitud_id: int, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Análisis guardado con esa clave, o None"""
+        conn = _connect()
+        try:
+            if not tiene_tabla(conn, "planner_analisis_cache"):
+                return None
+            cur = conn.cursor()
+            cur.execute(
+                """
+                SELECT resultado_json FROM planner_analisis_cache
+                WHERE solicitud_id = ? AND cache_key = ?
+                """,
+                (solicitud_id, cache_key),
+            )
+            row = cur.fetchone()
+            return json.loads(row[0]) if row else None
+        finally:
+            conn.close()
+
+    @staticmethod
+    def save(solicitud_id: int, cache_key: str, resultado: Dict[str, Any]) -> None:
+        """Guarda el análisis, reemplazando el de una versión anterior"""
+        conn = _connect()
+        try:
+            conn.execute(PlannerAnalysisRepository.CREATE_TABLE)
+            conn.execute(
+                """
+                INSERT INTO planner_analisis_cache (solicitud_id, cache_key, resultado_json)
+                VALUES (?, ?, ?)
+                ON CONFLICT(solicitud_id) DO UPDATE SET
+                    cache_key = excluded.cache_key,
+                    resultado_json = excluded.resultado_json,
+                    created_at = datetime('now')
+                """,
+                (solicitud_id, cache_key, json.dumps(resultado, default=str)),
+            )
+            conn.commit()
+        finally:
+            conn.close()
 
 
 class ConfigAlmacenesRepository:
@@ -485,6 +845,7 @@ class ConfigAlmacenesRepository:
                     1 if excluido else 0,
                 ),
             )
+            ReferenceDataRepository.bump(conn)
             conn.commit()
             return True
         finally:
@@ -499,7 +860,130 @@ class ConfigAlmacenesRepository:
             cur.execute(
                 "DELETE FROM config_almacenes WHERE centro = ? AND almacen = ?", (centro, almacen)
             )
+            ReferenceDataRepository.bump(conn)
             conn.commit()
             return cur.rowcount > 0
         finally:
             conn.close()
+
+
+class PlanificadorAsignacionRepository:
+    """Repositorio para asignaciones de planificadores (planificador_asignaciones)"""
+
+    @staticmethod
+    def list_activas(conn: Optional[sqlite3.Connection] = None) -> List[Dict[str, Any]]:
+        """
+        Asignaciones activas ordenadas por prioridad (menor = preferida) e id.
+
+        Args:
+            conn: Conexión a usar (p.ej. dentro de una transacción en curso)
+        """
+        own = conn is None
+        if own:
+            conn = _connect()
+        try:
+            cur = conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name='planificador_asignaciones'"
+            )
+            if not cur.fetchone():
+                return []
+            cur = conn.execute(
+                """
+                SELECT id, planificador_id, centro, sector, almacen_virtual, prioridad
+                FROM planificador_asignaciones
+                WHERE COALESCE(activo, 1) = 1
+                ORDER BY COALESCE(prioridad, 1), id
+            """
+            )
+            return [dict(zip([c[0] for c in cur.description], row)) for row in cur.fetchall()]
+        finally:
+            if own:
+                conn.close()
+
+    @staticmethod
+    def reasignar(
+        planificador_id: str,
+        nuevo_planificador_id: Optional[str],
+        statuses: List[str],
+        resolver_desde: Callable[[List[Dict[str, Any]]], Callable[..., str]],
+    ) -> Dict[str, Any]:
+        """
+        Baja de un planificador con reasignación en bloque, en una transacción.
+
+        1. Si hay reemplazo, le copia las asignaciones activas (misma
+           prioridad); si ya las tenía, las reactiva. Las columnas NULL se
+           copian como '' (ambos son comodín): en un UNIQUE los NULL son
+           distintos entre sí y el ON CONFLICT nunca coincidiría.
+        2. Desactiva todas las asignaciones del planificador saliente.
+        3. Reasigna sus solicitudes abiertas resolviendo cada una contra las
+           asignaciones resultantes (executemany).
+
+        Args:
+            planificador_id: Planificador que se va
+            nuevo_planificador_id: Reemplazo (None = resolver por asignaciones)
+            statuses: Estados de solicitud considerados abiertos
+            resolver_desde: Construye la función resolve(centro, sector,
+                almacen_virtual) a partir de las asignaciones activas
+
+        Returns:
+            Dict con asignaciones transferidas/desactivadas, solicitudes
+            reasignadas y las asignaciones activas resultantes
+        """
+        conn = _connect()
+        conn.isolation_level = None  # Transacción explícita
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            transferidas = 0
+            if nuevo_planificador_id:
+                cur = conn.execute(
+                    """
+                    INSERT INTO planificador_asignaciones
+                        (planificador_id, centro, sector, almacen_virtual, prioridad, activo)
+                    SELECT ?, COALESCE(centro, ''), COALESCE(sector, ''),
+                        COALESCE(almacen_virtual, ''), prioridad, 1
+                    FROM planificador_asignaciones
+                    WHERE planificador_id = ? AND COALESCE(activo, 1) = 1
+                    ON CONFLICT(planificador_id, centro, sector, almacen_virtual)
+                    DO UPDATE SET activo = 1, prioridad = excluded.prioridad
+                """,
+                    (nuevo_planificador_id, planificador_id),
+                )
+                transferidas = cur.rowcount
+            cur = conn.execute(
+                "UPDATE planificador_asignaciones SET activo = 0 "
+                "WHERE planificador_id = ? AND COALESCE(activo, 1) = 1",
+                (planificador_id,),
+            )
+            desactivadas = cur.rowcount
+
+            activas = PlanificadorAsignacionRepository.list_activas(conn)
+            resolve = resolver_desde(activas)
+            placeholders = ",".join("?" * len(statuses))
+            abiertas = conn.execute(
+                f"""
+                SELECT id, centro, sector, almacen_virtual FROM solicitudes
+                WHERE planner_id = ? AND status IN ({placeholders})
+            """,
+                (planificador_id, *statuses),
+            ).fetchall()
+            cambios = [
+                (resolve(centro, sector, almacen), sid)
+                for sid, centro, sector, almacen in abiertas
+            ]
+            conn.executemany(
+                "UPDATE solicitudes SET planner_id = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                cambios,
+            )
+            conn.execute("COMMIT")
+            return {
+                "asignaciones_transferidas": transferidas,
+                "asignaciones_desactivadas": desactivadas,
+                "solicitudes_reasignadas": len(cambios),
+                "activas": activas,
+            }
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
@@ -67,6 +67,8 @@ CREATE TABLE IF NOT EXISTS solicitudes(
     FOREIGN KEY(id_usuario) REFERENCES usuarios(id_spm),
     FOREIGN KEY(planner_id) REFERENCES usuarios(id_spm)
 );
+-- Cola del planificador: filtro por estado y planificador asignado
+CREATE INDEX IF NOT EXISTS idx_solicitudes_status_planner ON solicitudes(status, planner_id);
 
 -- Asignaciones de planificadores
 CREATE TABLE IF NOT EXISTS planificador_asignaciones(
@@ -154,18 +156,7 @@ CREATE TABLE IF NOT EXISTS solicitud_tratamiento_eventos(
     FOREIGN KEY(solicitud_id) REFERENCES solicitudes(id) ON DELETE CASCADE
 );
 
--- Log de tratamiento
-CREATE TABLE IF NOT EXISTS solicitud_tratamiento_log(
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    solicitud_id INTEGER NOT NULL,
-    item_index INTEGER,
-    actor_id TEXT NOT NULL,
-    tipo TEXT NOT NULL,
-    estado TEXT,
-    payload_json TEXT,
-    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY(solicitud_id) REFERENCES solicitudes(id) ON DELETE CASCADE
-);
+-- Log de tratamiento: vive en la BD de auditoria (services/audit_log.py)
 
 -- Traslados
 CREATE TABLE IF NOT EXISTS traslados(
@@ -290,6 +281,37 @@ CREATE TABLE IF NOT EXISTS mensajes (
     FOREIGN KEY(parent_id) REFERENCES mensajes(id)
 );
 
+-- Contadores materializados de no leídos (mantenidos por los servicios)
+CREATE TABLE IF NOT EXISTS user_unread_counters (
+    user_id TEXT PRIMARY KEY,
+    unread_notifications INTEGER NOT NULL DEFAULT 0,
+    unread_messages INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT
+);
+
+-- Resumen de hilos de mensajes (mantenido por MessageService)
+CREATE TABLE IF NOT EXISTS message_threads (
+    thread_id INTEGER PRIMARY KEY,
+    asunto TEXT,
+    solicitud_id INTEGER,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    last_message_id INTEGER,
+    last_message_at TEXT,
+    last_remitente_id TEXT,
+    last_preview TEXT,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS message_thread_participants (
+    thread_id INTEGER NOT NULL,
+    user_id TEXT NOT NULL,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    last_message_at TEXT,
+    PRIMARY KEY (thread_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_thread_participants_user
+    ON message_thread_participants(user_id, last_message_at DESC);
+
 -- Ledger de presupuesto
 CREATE TABLE IF NOT EXISTS presupuesto_ledger (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -394,6 +416,13 @@ CREATE TABLE IF NOT EXISTS presupuestos (
     PRIMARY KEY (centro, sector)
 );
 
+-- Versión de los datos de referencia del planner (stock, catálogo, config almacenes)
+CREATE TABLE IF NOT EXISTS reference_data_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT
+);
+
 -- Trivias - puntajes
 CREATE TABLE IF NOT EXISTS trivias_scores (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -0,0 +1,168 @@
+"""
+Cache versionado del análisis PASO 1 del planner
+
+El resultado de paso_1_analizar_solicitud se guarda bajo una clave que
+incluye la versión de cada dato de entrada:
+- updated_at de la solicitud (items, centro, almacén)
+- versión/monto/saldo del presupuesto centro/sector
+- versión de los datos de referencia (BD + snapshot de caches Excel)
+- stock comprometido por otras solicitudes para los materiales de esta,
+  el mismo que usa el análisis (services/atp): una reserva de otro
+  material no la invalida
+
+Mientras ninguna cambie, abrir la solicitud devuelve el análisis cacheado
+sin recalcular ni volver a registrar analisis_iniciado. El resultado se
+guarda en memoria y en planner_analisis_cache (PlannerAnalysisRepository),
+compartida por todos los workers: el cálculo en segundo plano que se
+programa al aprobar deja la primera apertura como hit en cualquier worker.
+"""
+
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+try:
+    from backend_v2.core.cache import analysis_cache
+    from backend_v2.core.cache_loader import get_snapshot_version
+    from backend_v2.core.repository import (MaterialRepository,
+                                            PlannerAnalysisRepository,
+                                            ReferenceDataRepository,
+                                            SolicitudRepository)
+    from backend_v2.core.services.planner_service import \
+        paso_1_analizar_solicitud
+except ImportError:
+    from core.cache import analysis_cache
+    from core.cache_loader import get_snapshot_version
+    from core.repository import (MaterialRepository,
+                                 PlannerAnalysisRepository,
+                                 ReferenceDataRepository, SolicitudRepository)
+    from core.services.planner_service import paso_1_analizar_solicitud
+
+KEY_PREFIX = "planner_analisis"
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="planner-precompute")
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _comprometido_digest(versiones: Dict[str, Any]) -> str:
+    """Huella del stock comprometido por otras solicitudes para los materiales de esta"""
+    codigos = [item.get("codigo", "") for item in SolicitudRepository.parse_items(versiones)]
+    comprometido = MaterialRepository.get_comprometido_batch(
+        codigos,
+        versiones.get("centro"),
+        versiones.get("almacen_virtual"),
+        excluir_solicitud=versiones.get("id"),
+    )
+    datos = json.dumps(sorted(comprometido.items()))
+    return hashlib.md5(datos.encode()).hexdigest()[:12]
+
+
+def analysis_key(solicitud_id: int) -> Optional[str]:
+    """
+    Clave de cache del análisis según las versiones actuales de sus entradas.
+
+    Returns:
+        Clave, o None si la solicitud no existe
+    """
+    versiones = SolicitudRepository.get_analysis_versions(solicitud_id)
+    if not versiones:
+        return None
+    presupuesto = (
+        f"{versiones['presupuesto_version']}/{versiones['presupuesto_monto']}"
+        f"/{versiones['presupuesto_saldo']}"
+    )
+    referencia = (
+        f"{ReferenceDataRepository.get_version()}.{get_snapshot_version()}"
+        f".{_comprometido_digest(versiones)}"
+    )
+    return f"{KEY_PREFIX}:{solicitud_id}:{versiones['updated_at']}:{presupuesto}:{referencia}"
+
+
+def _store(solicitud_id: int, key: str, resultado: Dict[str, Any]) -> None:
+    # Las versiones anteriores de la misma solicitud ya no se van a pedir
+    analysis_cache.invalidate_pattern(f"{KEY_PREFIX}:{solicitud_id}:")
+    analysis_cache.set(key, resultado)
+    PlannerAnalysisRepository.save(solicitud_id, key, resultado)
+
+
+def _cached(solicitud_id: int, key: str) -> Optional[Dict[str, Any]]:
+    """Resultado vigente: del cache en memoria o, si no, de la tabla compartida"""
+    cached = analysis_cache.get(key)
+    if cached is None:
+        cached = PlannerAnalysisRepository.get(solicitud_id, key)
+        if cached is not None:
+            analysis_cache.invalidate_pattern(f"{KEY_PREFIX}:{solicitud_id}:")
+            analysis_cache.set(key, cached)
+    return cached
+
+
+def get_analysis(solicitud_id: int, force: bool = False) -> Dict[str, Any]:
+    """
+    Análisis PASO 1 de una solicitud, desde cache si sus entradas no cambiaron.
+
+    El resultado cacheado se comparte entre llamadas: no debe modificarse.
+
+    Args:
+        solicitud_id: ID de la solicitud
+        force: Recalcular aunque haya un resultado vigente
+
+    Returns:
+        Resultado de paso_1_analizar_solicitud
+
+    Raises:
+        ValueError: Si la solicitud no existe
+    """
+    key = analysis_key(solicitud_id)
+    if key is None:
+        raise ValueError(f"Solicitud {solicitud_id} no encontrada")
+    if not force:
+        cached = _cached(solicitud_id, key)
+        if cached is not None:
+            return cached
+
+    resultado = paso_1_analizar_solicitud(solicitud_id)
+    _store(solicitud_id, key, resultado)
+    return resultado
+
+
+def precompute_analysis(solicitud_id: int) -> bool:
+    """
+    Calcula y cachea el análisis si no hay uno vigente.
+
+    Returns:
+        True si se calculó, False si ya estaba en cache o la solicitud no existe
+    """
+    key = analysis_key(solicitud_id)
+    if key is None or _cached(solicitud_id, key) is not None:
+        return False
+    _store(solicitud_id, key, paso_1_analizar_solicitud(solicitud_id))
+    return True
+
+
+def _run_precompute(solicitud_id: int) -> None:
+    try:
+        precompute_analysis(solicitud_id)
+    except Exception as e:
+        print(f"Error precalculando análisis de solicitud {solicitud_id}: {e}")
+    finally:
+        with _pending_lock:
+            _pending.discard(solicitud_id)
+
+
+def schedule_precompute(solicitud_id: int):
+    """
+    Programa el cálculo del análisis en segundo plano (p.ej. al aprobar).
+
+    Si ya hay un cálculo pendiente para la solicitud no se encola otro.
+
+    Returns:
+        Future del cálculo, o None si ya estaba pendiente
+    """
+    with _pending_lock:
+        if solicitud_id in _pending:
+            return None
+        _pending.add(solicitud_id)
+    return _executor.submit(_run_precompute, solicitud_id)
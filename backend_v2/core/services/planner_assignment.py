@@ -0,0 +1,139 @@
+"""
+Índice en memoria de asignaciones de planificadores
+
+Resuelve qué planificador recibe una solicitud aprobada a partir de
+planificador_asignaciones sin consultar la tabla en cada aprobación. El
+índice es un dict (centro, sector, almacen_virtual) -> planificador_id
+construido con una sola lectura de las asignaciones activas:
+
+- Una columna vacía/NULL o '*' en la asignación es comodín.
+- La búsqueda va de la clave más específica a la más general; el centro
+  pesa más que el sector y éste más que el almacén virtual.
+- Para una misma clave gana la menor prioridad (1 = principal) y luego el
+  id más antiguo.
+
+El índice se guarda en catalog_cache, así que lo invalidan tanto
+invalidate_catalog_cache() como invalidate_index() (llamado por las rutas
+de admin que modifican asignaciones).
+"""
+
+from itertools import product
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from backend_v2.core import repository
+    from backend_v2.core.cache import catalog_cache
+    from backend_v2.core.repository import PlanificadorAsignacionRepository
+    from backend_v2.core.services.planner_queue import ESTADOS_COLA
+except ImportError:
+    from core import repository
+    from core.cache import catalog_cache
+    from core.repository import PlanificadorAsignacionRepository
+    from core.services.planner_queue import ESTADOS_COLA
+
+KEY_PREFIX = "planner_assignment_index"
+WILDCARD = "*"
+DEFAULT_PLANNER = "Admin"
+
+
+def _norm(value: Optional[str]) -> str:
+    value = str(value or "").strip()
+    return value or WILDCARD
+
+
+class AssignmentIndex:
+    """Índice inmutable de asignaciones activas"""
+
+    def __init__(self, asignaciones: List[Dict[str, Any]]):
+        """
+        Args:
+            asignaciones: Filas activas ordenadas por prioridad e id
+                (PlanificadorAsignacionRepository.list_activas)
+        """
+        self._index: Dict[Tuple[str, str, str], str] = {}
+        for a in asignaciones:
+            key = (_norm(a.get("centro")), _norm(a.get("sector")), _norm(a.get("almacen_virtual")))
+            # Las filas llegan ordenadas: la primera de cada clave es la preferida
+            self._index.setdefault(key, a["planificador_id"])
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def resolve(
+        self,
+        centro: Optional[str],
+        sector: Optional[str],
+        almacen_virtual: Optional[str] = None,
+        default: str = DEFAULT_PLANNER,
+    ) -> str:
+        """
+        Planificador para una solicitud.
+
+        Returns:
+            planificador_id de la asignación más específica, o default
+        """
+        centro, sector, almacen = _norm(centro), _norm(sector), _norm(almacen_virtual)
+        for key in product(
+            dict.fromkeys((centro, WILDCARD)),
+            dict.fromkeys((sector, WILDCARD)),
+            dict.fromkeys((almacen, WILDCARD)),
+        ):
+            planner = self._index.get(key)
+            if planner:
+                return planner
+        return default
+
+
+def _cache_key() -> str:
+    return f"{KEY_PREFIX}:{repository._db_path()}"
+
+
+def get_index() -> AssignmentIndex:
+    """Índice vigente; lo construye con una lectura si no está en cache"""
+    key = _cache_key()
+    index = catalog_cache.get(key)
+    if index is None:
+        index = AssignmentIndex(PlanificadorAsignacionRepository.list_activas())
+        catalog_cache.set(key, index)
+    return index
+
+
+def invalidate_index() -> None:
+    """Descartar el índice (llamar después de modificar asignaciones)"""
+    catalog_cache.invalidate_pattern(f"{KEY_PREFIX}:")
+
+
+def resolve_planner(
+    centro: Optional[str], sector: Optional[str], almacen_virtual: Optional[str] = None
+) -> str:
+    """Planificador asignado a (centro, sector, almacen_virtual); 'Admin' si no hay"""
+    try:
+        return get_index().resolve(centro, sector, almacen_virtual)
+    except Exception as e:
+        print(f"Error resolviendo planificador: {e}")
+        return DEFAULT_PLANNER
+
+
+def reasignar_planificador(
+    planificador_id: str, nuevo_planificador_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Baja de un planificador: desactiva sus asignaciones y reasigna en bloque
+    sus solicitudes abiertas.
+
+    Args:
+        planificador_id: Planificador que se va
+        nuevo_planificador_id: Reemplazo que hereda sus asignaciones; sin
+            reemplazo, cada solicitud se resuelve contra las asignaciones
+            restantes (comodines incluidos)
+
+    Returns:
+        Resumen de asignaciones y solicitudes modificadas
+    """
+    resultado = PlanificadorAsignacionRepository.reasignar(
+        planificador_id, nuevo_planificador_id, ESTADOS_COLA, lambda a: AssignmentIndex(a).resolve
+    )
+    # El índice nuevo sale de las mismas filas que usó la reasignación
+    invalidate_index()
+    catalog_cache.set(_cache_key(), AssignmentIndex(resultado.pop("activas")))
+    return resultado
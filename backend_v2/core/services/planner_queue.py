@@ -0,0 +1,133 @@
+"""
+Cola de trabajo del planificador
+
+Lista paginada de solicitudes abiertas ordenada por prioridad. La prioridad
+usa los pesos de ScoringPipeline y se calcula en SQL (ver
+SolicitudRepository.list_cola_planner), de modo que un planificador con
+miles de solicitudes recibe solo la página pedida.
+
+La paginación es por keyset: el cursor lleva (prioridad, id) de la última
+fila y la fecha de referencia de la urgencia, para que todas las páginas
+de un mismo recorrido usen el mismo "ahora" y el orden no se mueva.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+try:
+    from backend_v2.core.repository import SolicitudRepository
+except ImportError:
+    from core.repository import SolicitudRepository
+
+ESTADOS_COLA = ["Aprobada", "En Progreso", "En tratamiento"]
+LIMIT_DEFAULT = 50
+LIMIT_MAX = 200
+
+
+def _scoring_pipeline():
+    # Import diferido: el paquete agent carga dependencias de ML
+    try:
+        from backend_v2.agent.pipelines.scoring import ScoringPipeline
+    except ImportError:
+        from agent.pipelines.scoring import ScoringPipeline
+    return ScoringPipeline()
+
+
+def encode_cursor(prioridad: float, solicitud_id: int, ahora: str) -> str:
+    """Cursor opaco para la página siguiente"""
+    raw = json.dumps({"p": prioridad, "id": solicitud_id, "t": ahora}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    Decodifica un cursor de encode_cursor.
+
+    Raises:
+        ValueError: Si el cursor no es válido
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return {"p": float(data["p"]), "id": int(data["id"]), "t": str(data["t"])}
+    except Exception:
+        raise ValueError("cursor inválido")
+
+
+def cola_planificador(
+    planner_id: Optional[str] = None,
+    centro: Optional[str] = None,
+    sector: Optional[str] = None,
+    status: Optional[List[str]] = None,
+    criticidad: Optional[str] = None,
+    limit: int = LIMIT_DEFAULT,
+    cursor: Optional[str] = None,
+    include_items: bool = False,
+) -> Dict[str, Any]:
+    """
+    Página de la cola del planificador ordenada por prioridad descendente.
+
+    Args:
+        planner_id: Solo solicitudes asignadas a este planificador
+        centro, sector, criticidad: Filtros exactos
+        status: Estados a incluir (subconjunto de ESTADOS_COLA, default todos)
+        limit: Tamaño de página (1..LIMIT_MAX)
+        cursor: next_cursor de la página anterior
+        include_items: Incluir los items de cada solicitud
+
+    Returns:
+        Dict con solicitudes, next_cursor (None en la última página) y limit
+
+    Raises:
+        ValueError: Si limit, status o cursor no son válidos
+    """
+    if limit < 1 or limit > LIMIT_MAX:
+        raise ValueError(f"limit debe estar entre 1 y {LIMIT_MAX}")
+    statuses = ESTADOS_COLA
+    if status:
+        invalidos = [s for s in status if s not in ESTADOS_COLA]
+        if invalidos:
+            raise ValueError(f"Estados no válidos para la cola: {', '.join(invalidos)}")
+        statuses = list(dict.fromkeys(status))
+
+    after = None
+    ahora = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+    if cursor:
+        data = decode_cursor(cursor)
+        after = (data["p"], data["id"])
+        ahora = data["t"]
+
+    pipeline = _scoring_pipeline()
+    rows = SolicitudRepository.list_cola_planner(
+        pipeline.weights,
+        ahora,
+        statuses,
+        planner_id=planner_id,
+        centro=centro,
+        sector=sector,
+        criticidad=criticidad,
+        after=after,
+        limit=limit + 1,
+        include_items=include_items,
+    )
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        ultima = rows[-1]
+        next_cursor = encode_cursor(ultima["prioridad"], ultima["id"], ahora)
+
+    for row in rows:
+        row["prioridad_nivel"] = pipeline._get_priority_level(row["prioridad"])
+        if include_items:
+            row["items"] = SolicitudRepository.parse_items(row)
+            row.pop("data_json", None)
+
+    return {
+        "solicitudes": rows,
+        "next_cursor": next_cursor,
+        "limit": limit,
+        "referencia": ahora,
+    }
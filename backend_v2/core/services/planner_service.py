@@ -3,38 +3,72 @@ Servicio de Planner: lógica de negocio PASO 1–3 de tratamiento de solicitud
 Separado de rutas para facilitar tests y reutilización
 """
 
-from typing import Any, Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
 
 # Import con manejo de rutas relativas
 try:
-    from backend_v2.core.cache_loader import (get_consumo_cache,
-                                              get_equivalencias_cache)
+    from backend_v2.core.cache_loader import get_equivalencias_cache
     from backend_v2.core.repository import (MaterialRepository,
                                             PresupuestoRepository,
                                             ProveedorRepository,
                                             SolicitudRepository,
                                             TratamientoRepository)
+    from backend_v2.core.utils import norm_codigo
 except ImportError:
-    from core.cache_loader import get_consumo_cache, get_equivalencias_cache
+    from core.cache_loader import get_equivalencias_cache
     from core.repository import (MaterialRepository, PresupuestoRepository,
                                  ProveedorRepository, SolicitudRepository,
                                  TratamientoRepository)
+    from core.utils import norm_codigo
+
+
+def _consumos_promedio(codigos: List[str]) -> Dict[str, float]:
+    """
+    Consumo promedio de varios materiales desde el histórico en BD.
+
+    Returns:
+        Dict codigo_norm -> consumo promedio (solo códigos con historial;
+        vacío mientras el histórico no se haya importado)
+    """
+    return MaterialRepository.get_consumo_promedio_batch(codigos) or {}
+
 
+def _comprometidos(codigos: List[str], solicitud: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Stock comprometido por otras solicitudes (decisiones 'stock' abiertas),
+    con el mismo filtro de centro/almacén que el stock de la solicitud.
 
-def norm_codigo(val: str) -> str:
-    """Normaliza código de material (elimina ceros y .0 finales)"""
-    base = (val or "").strip()
-    if base.endswith(".0"):
-        base = base[:-2]
-    return base.lstrip("0")
+    Returns:
+        Dict codigo_norm -> cantidad comprometida ({} si no se pudo leer)
+    """
+    try:
+        return MaterialRepository.get_comprometido_batch(
+            codigos,
+            solicitud.get("centro"),
+            solicitud.get("almacen_virtual") or solicitud.get("almacen"),
+            excluir_solicitud=solicitud.get("id"),
+        )
+    except Exception as e:
+        print(f"Error leyendo stock comprometido: {e}")
+        return {}
 
 
-def _analizar_item_material(
-    idx: int, item: Dict[str, Any], solicitud: Dict[str, Any], consumo_df
+def _construir_material_info(
+    idx: int,
+    item: Dict[str, Any],
+    solicitud: Dict[str, Any],
+    stock_detalle: List[Dict[str, Any]],
+    consumo_promedio: float,
+    comprometido: float = 0.0,
 ) -> Dict[str, Any]:
     """
-    Analiza un item individual de la solicitud.
-    Retorna información del material con stock, consumo y criticidad.
+    Arma el resumen de material de un item a partir de stock y consumo ya resueltos.
+
+    stock_disponible es el disponible para prometer: stock físico menos lo
+    comprometido por otras solicitudes.
     """
     codigo = item.get("codigo", "")
     cantidad = float(item.get("cantidad", 0) or 0)
@@ -42,24 +76,8 @@ def _analizar_item_material(
     costo_item = cantidad * precio_unitario
 
     criticidad = (item.get("criticidad") or solicitud.get("criticidad") or "Normal").capitalize()
-
-    stock_detalle = (
-        MaterialRepository.get_stock_detalle(
-            codigo,
-            solicitud.get("centro"),
-            solicitud.get("almacen_virtual") or solicitud.get("almacen"),
-        )
-        or []
-    )
-    stock_disponible = sum(float(d.get("cantidad") or 0) for d in stock_detalle)
-
-    consumo_promedio = 0
-    if consumo_df is not None and not consumo_df.empty:
-        df_item = consumo_df[consumo_df["codigo_norm"] == norm_codigo(codigo)]
-        if not df_item.empty and "cantidad" in df_item.columns and "fecha" in df_item.columns:
-            recientes = df_item.sort_values("fecha", ascending=False).head(180)
-            if not recientes.empty:
-                consumo_promedio = float(recientes["cantidad"].mean() or 0)
+    stock_fisico = sum(float(d.get("cantidad") or 0) for d in stock_detalle)
+    stock_disponible = max(stock_fisico - comprometido, 0.0)
 
     return {
         "idx": idx,
@@ -69,81 +87,157 @@ def _analizar_item_material(
         "precio_unitario": precio_unitario,
         "costo_total": costo_item,
         "stock_disponible": stock_disponible,
+        "stock_fisico": stock_fisico,
+        "stock_comprometido": comprometido,
         "consumo_promedio": consumo_promedio,
         "criticidad": criticidad,
     }
 
 
-def _detectar_conflictos_item(
-    idx: int, item: Dict[str, Any], material_info: Dict[str, Any], presupuesto_disponible: float
+def _analizar_items_batch(
+    items: List[Dict[str, Any]],
+    solicitud: Dict[str, Any],
+    consumos: Dict[str, float],
+    stock_por_codigo,
+    comprometidos: Optional[Dict[str, float]] = None,
 ) -> List[Dict[str, Any]]:
     """
-    Detecta conflictos para un item específico.
-    Retorna lista de conflictos encontrados.
+    Analiza todos los items con stock y consumo resueltos en una sola pasada.
+
+    Args:
+        items: Items de la solicitud
+        solicitud: Solicitud (centro, criticidad)
+        consumos: Consumo promedio por codigo_norm (_consumos_promedio)
+        stock_por_codigo: Resultado de MaterialRepository.get_stock_detalle_batch
+        comprometidos: Stock comprometido por codigo_norm (_comprometidos)
+
+    Returns:
+        Lista de material_info en el orden de los items
     """
-    conflictos = []
+    return [
+        _construir_material_info(
+            idx,
+            item,
+            solicitud,
+            stock_por_codigo.get(item.get("codigo", "")) or [],
+            consumos.get(norm_codigo(item.get("codigo", "")), 0),
+            (comprometidos or {}).get(norm_codigo(item.get("codigo", "")), 0.0),
+        )
+        for idx, item in enumerate(items)
+    ]
+
+
+def _conflicto_stock(idx: int, material_info: Dict[str, Any]) -> Dict[str, Any]:
+    """Conflicto de stock insuficiente para un item"""
     codigo = material_info["codigo"]
     cantidad = material_info["cantidad"]
     stock_disponible = material_info["stock_disponible"]
-    precio_unitario = material_info["precio_unitario"]
+    descripcion = material_info["descripcion"]
+    return {
+        "tipo": "stock_insuficiente",
+        "item_idx": idx,
+        "codigo": codigo,
+        "descripcion_material": descripcion or "Sin descripción",
+        "cantidad_solicitada": cantidad,
+        "cantidad_disponible": stock_disponible,
+        "deficit": cantidad - stock_disponible,
+        "sugerencia": "Considerar proveedor externo o material equivalente",
+        "impacto_critico": material_info["criticidad"].lower().startswith("cri"),
+        "descripcion": f"Stock insuficiente: {descripcion or codigo} - Faltan {cantidad - stock_disponible} unidades",
+    }
+
+
+def _conflicto_presupuesto(
+    idx: int, material_info: Dict[str, Any], presupuesto_disponible: float
+) -> Dict[str, Any]:
+    """Conflicto de presupuesto insuficiente para un item"""
+    codigo = material_info["codigo"]
     costo_item = material_info["costo_total"]
+    descripcion = material_info["descripcion"]
+    return {
+        "tipo": "presupuesto_insuficiente",
+        "item_idx": idx,
+        "codigo": codigo,
+        "descripcion_material": descripcion or "Sin descripción",
+        "costo_item": costo_item,
+        "presupuesto_disponible": presupuesto_disponible,
+        "deficit_presupuesto": costo_item - presupuesto_disponible,
+        "sugerencia": "Solicitar ampliación de presupuesto o reducir cantidad",
+        "impacto_critico": True,
+        "descripcion": f"Presupuesto insuficiente: {descripcion or codigo} requiere USD$ {costo_item:.2f}, disponible USD$ {presupuesto_disponible:.2f}",
+    }
+
+
+def _conflicto_consumo(idx: int, material_info: Dict[str, Any]) -> Dict[str, Any]:
+    """Conflicto de consumo inusual (pedido > 1.5x el promedio) para un item"""
+    codigo = material_info["codigo"]
+    cantidad = material_info["cantidad"]
     consumo_promedio = material_info["consumo_promedio"]
-    criticidad = material_info["criticidad"]
     descripcion = material_info["descripcion"]
+    porcentaje_exceso = ((cantidad / consumo_promedio) - 1) * 100
+    return {
+        "tipo": "consumo_inusual",
+        "item_idx": idx,
+        "codigo": codigo,
+        "descripcion_material": descripcion or "Sin descripción",
+        "cantidad_solicitada": cantidad,
+        "consumo_promedio": consumo_promedio,
+        "exceso_porcentaje": porcentaje_exceso,
+        "sugerencia": "Verificar justificación del pedido con el solicitante",
+        "impacto_critico": False,
+        "descripcion": f"Consumo inusual: {descripcion or codigo} - Pedido {porcentaje_exceso:.1f}% mayor al promedio histórico",
+    }
 
-    # Conflicto: Stock insuficiente
-    if stock_disponible < cantidad:
-        conflictos.append(
-            {
-                "tipo": "stock_insuficiente",
-                "item_idx": idx,
-                "codigo": codigo,
-                "descripcion_material": descripcion or "Sin descripción",
-                "cantidad_solicitada": cantidad,
-                "cantidad_disponible": stock_disponible,
-                "deficit": cantidad - stock_disponible,
-                "sugerencia": "Considerar proveedor externo o material equivalente",
-                "impacto_critico": criticidad.lower().startswith("cri"),
-                "descripcion": f"Stock insuficiente: {descripcion or codigo} - Faltan {cantidad - stock_disponible} unidades",
-            }
-        )
 
-    # Conflicto: Presupuesto insuficiente
-    if costo_item > presupuesto_disponible:
-        conflictos.append(
-            {
-                "tipo": "presupuesto_insuficiente",
-                "item_idx": idx,
-                "codigo": codigo,
-                "descripcion_material": descripcion or "Sin descripción",
-                "costo_item": costo_item,
-                "presupuesto_disponible": presupuesto_disponible,
-                "deficit_presupuesto": costo_item - presupuesto_disponible,
-                "sugerencia": "Solicitar ampliación de presupuesto o reducir cantidad",
-                "impacto_critico": True,
-                "descripcion": f"Presupuesto insuficiente: {descripcion or codigo} requiere USD$ {costo_item:.2f}, disponible USD$ {presupuesto_disponible:.2f}",
-            }
-        )
+def _detectar_conflictos_batch(
+    materiales: List[Dict[str, Any]], presupuesto_disponible: float
+) -> Dict[str, Any]:
+    """
+    Detecta conflictos de todos los items con operaciones sobre arrays.
 
-    # Conflicto: Consumo inusual
-    if consumo_promedio and cantidad > consumo_promedio * 1.5:
-        porcentaje_exceso = ((cantidad / consumo_promedio) - 1) * 100
-        conflictos.append(
-            {
-                "tipo": "consumo_inusual",
-                "item_idx": idx,
-                "codigo": codigo,
-                "descripcion_material": descripcion or "Sin descripción",
-                "cantidad_solicitada": cantidad,
-                "consumo_promedio": consumo_promedio,
-                "exceso_porcentaje": porcentaje_exceso,
-                "sugerencia": "Verificar justificación del pedido con el solicitante",
-                "impacto_critico": False,
-                "descripcion": f"Consumo inusual: {descripcion or codigo} - Pedido {porcentaje_exceso:.1f}% mayor al promedio histórico",
-            }
-        )
+    Args:
+        materiales: material_info de cada item, en orden
+        presupuesto_disponible: Saldo del presupuesto centro/sector
 
-    return conflictos
+    Returns:
+        Dict con conflictos (mismo orden que el análisis item por item),
+        total_solicitado y presupuesto_real_necesario
+    """
+    if not materiales:
+        return {"conflictos": [], "total_solicitado": 0, "presupuesto_real_necesario": 0}
+
+    cantidad = np.array([m["cantidad"] for m in materiales], dtype=float)
+    stock = np.array([m["stock_disponible"] for m in materiales], dtype=float)
+    precio = np.array([m["precio_unitario"] for m in materiales], dtype=float)
+    costo = np.array([m["costo_total"] for m in materiales], dtype=float)
+    consumo = np.array([m["consumo_promedio"] for m in materiales], dtype=float)
+
+    deficit = cantidad - stock
+    stock_insuficiente = stock < cantidad
+    presupuesto_insuficiente = costo > presupuesto_disponible
+    consumo_inusual = (consumo != 0) & (cantidad > consumo * 1.5)
+
+    # Suma secuencial para conservar exactamente los totales del cálculo por item
+    total_solicitado = sum(costo.tolist(), 0)
+    presupuesto_real_necesario = sum((deficit * precio)[deficit > 0].tolist(), 0)
+
+    conflictos: List[Dict[str, Any]] = []
+    for idx in np.flatnonzero(stock_insuficiente | presupuesto_insuficiente | consumo_inusual):
+        idx = int(idx)
+        if stock_insuficiente[idx]:
+            conflictos.append(_conflicto_stock(idx, materiales[idx]))
+        if presupuesto_insuficiente[idx]:
+            conflictos.append(
+                _conflicto_presupuesto(idx, materiales[idx], presupuesto_disponible)
+            )
+        if consumo_inusual[idx]:
+            conflictos.append(_conflicto_consumo(idx, materiales[idx]))
+
+    return {
+        "conflictos": conflictos,
+        "total_solicitado": total_solicitado,
+        "presupuesto_real_necesario": presupuesto_real_necesario,
+    }
 
 
 def _generar_avisos_presupuesto(
@@ -188,10 +282,15 @@ def _generar_avisos_presupuesto(
     return avisos
 
 
-def _validar_integridad_items(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def _validar_integridad_items(
+    items: List[Dict[str, Any]], info_materiales: Optional[Dict[str, Dict[str, Any]]] = None
+) -> List[Dict[str, Any]]:
     """
     Valida la integridad de los items de la solicitud.
     Retorna lista de conflictos de validación.
+
+    Si se pasa info_materiales (de MaterialRepository.get_info_batch) se
+    usa en vez de consultar el catálogo item por item.
     """
     conflictos = []
     codigos_vistos = {}
@@ -267,7 +366,10 @@ def _validar_integridad_items(items: List[Dict[str, Any]]) -> List[Dict[str, Any
 
         # Validación 5: Material obsoleto/inactivo
         try:
-            mat_info = MaterialRepository.get_info(codigo)
+            if info_materiales is not None:
+                mat_info = info_materiales.get(codigo)
+            else:
+                mat_info = MaterialRepository.get_info(codigo)
             if mat_info:
                 activo = mat_info.get("activo", 1)
                 if not activo or activo == 0:
@@ -300,50 +402,65 @@ def paso_1_analizar_solicitud(solicitud_id: int) -> Dict[str, Any]:
     if not solicitud:
         raise ValueError(f"Solicitud {solicitud_id} no encontrada")
 
-    items = SolicitudRepository.get_items(solicitud_id)
+    items = SolicitudRepository.parse_items(solicitud)
     presupuesto_info = PresupuestoRepository.get_disponible(
         solicitud["centro"], solicitud["sector"]
     )
     presupuesto_total = presupuesto_info["monto"]
     presupuesto_disponible = presupuesto_info["saldo"]
 
-    # 2. Inicializar estructuras de datos
-    total_solicitado = 0
-    materiales_por_criticidad = {"Critico": [], "Normal": [], "Bajo": []}
+    # 2. Resolver stock, stock comprometido, consumo y catálogo de todos los
+    #    items a la vez. Son lecturas independientes: se lanzan en paralelo.
+    codigos = [item.get("codigo", "") for item in items]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futuro_stock = pool.submit(
+            MaterialRepository.get_stock_detalle_batch,
+            codigos,
+            solicitud.get("centro"),
+            solicitud.get("almacen_virtual") or solicitud.get("almacen"),
+        )
+        futuro_comprometido = pool.submit(_comprometidos, codigos, solicitud)
+        futuro_info = pool.submit(
+            MaterialRepository.get_info_batch,
+            [(item.get("codigo") or "").strip() for item in items],
+        )
+        futuro_consumo = pool.submit(_consumos_promedio, codigos)
+        consumos = futuro_consumo.result()
+        try:
+            info_materiales = futuro_info.result()
+        except Exception:
+            # Si no se puede verificar el catálogo, no es crítico
+            info_materiales = {}
+        stock_por_codigo = futuro_stock.result()
+        comprometidos = futuro_comprometido.result()
+
     conflictos: List[Dict[str, Any]] = []
-    presupuesto_real_necesario = 0  # Solo cuenta items que requieren compra externa
-    consumo_df = get_consumo_cache()
 
     # 2.1. Validar integridad de items (antes de procesar)
-    conflictos_validacion = _validar_integridad_items(items)
+    conflictos_validacion = _validar_integridad_items(items, info_materiales)
     conflictos.extend(conflictos_validacion)
 
-    # 3. Procesar cada item
-    for idx, item in enumerate(items):
-        # Analizar material
-        material_info = _analizar_item_material(idx, item, solicitud, consumo_df)
-
-        total_solicitado += material_info["costo_total"]
+    # 3. Analizar items y detectar conflictos en bloque
+    materiales = _analizar_items_batch(
+        items, solicitud, consumos, stock_por_codigo, comprometidos
+    )
 
-        # Clasificar por criticidad
-        criticidad = material_info["criticidad"]
-        if criticidad.lower().startswith("cri"):
+    # Clasificar por criticidad
+    materiales_por_criticidad = {"Critico": [], "Normal": [], "Bajo": []}
+    for material_info in materiales:
+        criticidad = material_info["criticidad"].lower()
+        if criticidad.startswith("cri"):
             materiales_por_criticidad["Critico"].append(material_info)
-        elif criticidad.lower().startswith("baj"):
+        elif criticidad.startswith("baj"):
             materiales_por_criticidad["Bajo"].append(material_info)
         else:
             materiales_por_criticidad["Normal"].append(material_info)
 
-        # Calcular presupuesto real necesario (solo déficit de stock)
-        deficit_stock = max(0, material_info["cantidad"] - material_info["stock_disponible"])
-        if deficit_stock > 0:
-            presupuesto_real_necesario += deficit_stock * material_info["precio_unitario"]
-
-        # Detectar conflictos del item
-        conflictos_item = _detectar_conflictos_item(
-            idx, item, material_info, presupuesto_disponible
-        )
-        conflictos.extend(conflictos_item)
+    analisis = _detectar_conflictos_batch(materiales, presupuesto_disponible)
+    conflictos.extend(analisis["conflictos"])
+    total_solicitado = analisis["total_solicitado"]
+    # Solo cuenta items que requieren compra externa (déficit de stock)
+    presupuesto_real_necesario = analisis["presupuesto_real_necesario"]
 
     # 4. Generar avisos
     avisos = _generar_avisos_presupuesto(
@@ -389,46 +506,60 @@ def paso_1_analizar_solicitud(solicitud_id: int) -> Dict[str, Any]:
     }
 
 
-def paso_2_opciones_abastecimiento(solicitud_id: int, item_idx: int) -> Dict[str, Any]:
+def _equivalencias_por_codigo(codigos: List[str]) -> Dict[str, List[Dict[str, Any]]]:
     """
-    PASO 2: Opciones de abastecimiento para un item
-    Retorna stock interno, proveedores externos, equivalencias, mix
+    Filas del catálogo de equivalencias para varios códigos base.
+
+    Returns:
+        Dict codigo_norm base -> filas (en el orden del catálogo)
     """
-    solicitud = SolicitudRepository.get_by_id(solicitud_id)
-    if not solicitud:
-        raise ValueError(f"Solicitud {solicitud_id} no encontrada")
+    catalogo_eq = get_equivalencias_cache()
+    if catalogo_eq is None or catalogo_eq.empty:
+        return {}
+    df_eq = catalogo_eq[catalogo_eq["codigo_base_norm"].isin({norm_codigo(c) for c in codigos})]
+    return {
+        codigo_norm: [row.to_dict() for _, row in grupo.iterrows()]
+        for codigo_norm, grupo in df_eq.groupby("codigo_base_norm", sort=False)
+    }
 
-    items = SolicitudRepository.get_items(solicitud_id)
-    if item_idx >= len(items):
-        raise ValueError(f"Item index {item_idx} fuera de rango")
 
-    item = items[item_idx]
+def _opciones_item(
+    solicitud_id: int,
+    item_idx: int,
+    item: Dict[str, Any],
+    detalle_stock_base: List[Dict[str, Any]],
+    consumo_promedio: float,
+    proveedores: List[Dict[str, Any]],
+    equivalencias: List[Dict[str, Any]],
+    info_equivalentes: Dict[str, Dict[str, Any]],
+    comprometido: float = 0.0,
+) -> Dict[str, Any]:
+    """
+    Arma las opciones de abastecimiento de un item con datos ya resueltos.
+
+    Args:
+        solicitud_id: ID de la solicitud
+        item_idx: Índice del item
+        item: Item de la solicitud
+        detalle_stock_base: Stock del material (get_stock_detalle)
+        consumo_promedio: Consumo histórico promedio del material
+        proveedores: Proveedores externos activos
+        equivalencias: Filas del catálogo de equivalencias del material
+        info_equivalentes: Catálogo de los materiales equivalentes (get_info_batch)
+        comprometido: Stock del material comprometido por otras solicitudes
+
+    Returns:
+        Resultado de PASO 2 para el item, con opciones ordenadas por score
+    """
     codigo_original = item.get("codigo", "")
     cantidad_solicitada = float(item.get("cantidad", 0) or 0)
     precio_unitario_original = float(item.get("precio_unitario", 0) or 0)
 
     opciones = []
     equivalencias_norm = set()
-    detalle_stock_base = (
-        MaterialRepository.get_stock_detalle(
-            codigo_original,
-            solicitud.get("centro"),
-            solicitud.get("almacen_virtual") or solicitud.get("almacen"),
-        )
-        or []
-    )
+    stock_fisico = sum(float(d.get("cantidad") or 0) for d in detalle_stock_base)
+    stock_total = max(stock_fisico - comprometido, 0.0)
 
-    stock_total = sum(float(d.get("cantidad") or 0) for d in detalle_stock_base)
-
-    # Calcular consumo histórico promedio
-    consumo_df = get_consumo_cache()
-    consumo_promedio = 0
-    if consumo_df is not None and not consumo_df.empty:
-        df_item = consumo_df[consumo_df["codigo_norm"] == norm_codigo(codigo_original)]
-        if not df_item.empty and "cantidad" in df_item.columns and "fecha" in df_item.columns:
-            recientes = df_item.sort_values("fecha", ascending=False).head(180)
-            if not recientes.empty:
-                consumo_promedio = float(recientes["cantidad"].mean() or 0)
     if stock_total > 0:
         opciones.append(
             {
@@ -450,7 +581,6 @@ def paso_2_opciones_abastecimiento(solicitud_id: int, item_idx: int) -> Dict[str
             }
         )
 
-    proveedores = ProveedorRepository.list_externos_activos()
     for prov in proveedores[:3]:  # Top 3
         opciones.append(
             _build_proveedor_option(
@@ -458,48 +588,42 @@ def paso_2_opciones_abastecimiento(solicitud_id: int, item_idx: int) -> Dict[str
             )
         )
 
-    catalogo_eq = get_equivalencias_cache()
-    if catalogo_eq is not None and not catalogo_eq.empty:
-        df_eq = catalogo_eq[catalogo_eq["codigo_base_norm"] == norm_codigo(codigo_original)]
-        for _, row in df_eq.iterrows():
-            cod_eq = str(row.get("codigo_equivalente") or "")
-            cod_norm = norm_codigo(cod_eq)
-            if not cod_norm or cod_norm in equivalencias_norm:
-                continue
-
-            descripcion_eq = row.get("descripcion_equivalente") or item.get("descripcion", "")
-            precio_equiv = precio_unitario_original
-
-            try:
-                mat_info = MaterialRepository.get_info(cod_eq)
-                if mat_info:
-                    descripcion_eq = mat_info.get("descripcion", descripcion_eq)
-                    precio_equiv = float(mat_info.get("precio_usd", precio_equiv) or precio_equiv)
-            except Exception:
-                pass
-
-            opciones.append(
-                {
-                    "opcion_id": f"equivalencia_catalogo_{cod_norm}",
-                    "tipo": "equivalencia",
-                    "nombre": "Material equivalente (catálogo)",
-                    "id_proveedor": "PROV006",
-                    "codigo_material": cod_eq,
-                    "codigo_original": codigo_original,
-                    "descripcion": descripcion_eq,
-                    "cantidad_disponible": cantidad_solicitada,
-                    "cantidad_solicitada": cantidad_solicitada,
-                    "plazo_dias": 1,
-                    "precio_unitario": float(precio_equiv),
-                    "costo_total": cantidad_solicitada * float(precio_equiv),
-                    "rating": 5.0,
-                    "compatibilidad_pct": 92,
-                    "observaciones": f"Equivalencia por {row.get('criterio', 'atributos')}",
-                    "motivo_equivalencia": str(row.get("motivo", "")),
-                    "detalle_stock": detalle_stock_base,
-                }
-            )
-            equivalencias_norm.add(cod_norm)
+    for row in equivalencias:
+        cod_eq = str(row.get("codigo_equivalente") or "")
+        cod_norm = norm_codigo(cod_eq)
+        if not cod_norm or cod_norm in equivalencias_norm:
+            continue
+
+        descripcion_eq = row.get("descripcion_equivalente") or item.get("descripcion", "")
+        precio_equiv = precio_unitario_original
+
+        mat_info = info_equivalentes.get(cod_eq)
+        if mat_info:
+            descripcion_eq = mat_info.get("descripcion", descripcion_eq)
+            precio_equiv = float(mat_info.get("precio_usd", precio_equiv) or precio_equiv)
+
+        opciones.append(
+            {
+                "opcion_id": f"equivalencia_catalogo_{cod_norm}",
+                "tipo": "equivalencia",
+                "nombre": "Material equivalente (catálogo)",
+                "id_proveedor": "PROV006",
+                "codigo_material": cod_eq,
+                "codigo_original": codigo_original,
+                "descripcion": descripcion_eq,
+                "cantidad_disponible": cantidad_solicitada,
+                "cantidad_solicitada": cantidad_solicitada,
+                "plazo_dias": 1,
+                "precio_unitario": float(precio_equiv),
+                "costo_total": cantidad_solicitada * float(precio_equiv),
+                "rating": 5.0,
+                "compatibilidad_pct": 92,
+                "observaciones": f"Equivalencia por {row.get('criterio', 'atributos')}",
+                "motivo_equivalencia": str(row.get("motivo", "")),
+                "detalle_stock": detalle_stock_base,
+            }
+        )
+        equivalencias_norm.add(cod_norm)
 
     if stock_total > 0 and stock_total < cantidad_solicitada and proveedores:
         prov = proveedores[0]
@@ -544,20 +668,6 @@ def paso_2_opciones_abastecimiento(solicitud_id: int, item_idx: int) -> Dict[str
         if opciones:
             opciones[0]["is_recomendada"] = True
 
-    TratamientoRepository.log_evento(
-        solicitud_id,
-        item_idx,
-        "opciones_consultadas",
-        "PASO_2",
-        {
-            "codigo": codigo_original,
-            "cantidad": cantidad_solicitada,
-            "opciones_disponibles": len(opciones),
-            "mejor_score": opciones[0].get("score_recomendacion") if opciones else 0,
-        },
-        actor_id="sistema",
-    )
-
     return {
         "solicitud_id": solicitud_id,
         "item_idx": item_idx,
@@ -570,6 +680,8 @@ def paso_2_opciones_abastecimiento(solicitud_id: int, item_idx: int) -> Dict[str
             "precio_unitario_original": precio_unitario_original,
             "costo_total_original": cantidad_solicitada * precio_unitario_original,
             "stock_disponible": stock_total,
+            "stock_fisico": stock_fisico,
+            "stock_comprometido": comprometido,
             "consumo_promedio": round(consumo_promedio, 2),
             "detalle_stock": detalle_stock_base,
         },
@@ -577,6 +689,165 @@ def paso_2_opciones_abastecimiento(solicitud_id: int, item_idx: int) -> Dict[str
     }
 
 
+def _info_equivalentes(equivalencias: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """Catálogo de todos los materiales equivalentes en una consulta"""
+    codigos = [
+        str(row.get("codigo_equivalente") or "") for filas in equivalencias.values() for row in filas
+    ]
+    try:
+        return MaterialRepository.get_info_batch(codigos)
+    except Exception:
+        return {}
+
+
+def _resumen_opciones(resultado: Dict[str, Any]) -> Dict[str, Any]:
+    """Datos de auditoría de las opciones consultadas para un item"""
+    opciones = resultado["opciones"]
+    return {
+        "codigo": resultado["item"]["codigo"],
+        "cantidad": resultado["item"]["cantidad"],
+        "opciones_disponibles": len(opciones),
+        "mejor_score": opciones[0].get("score_recomendacion") if opciones else 0,
+    }
+
+
+def paso_2_opciones_abastecimiento(solicitud_id: int, item_idx: int) -> Dict[str, Any]:
+    """
+    PASO 2: Opciones de abastecimiento para un item
+    Retorna stock interno, proveedores externos, equivalencias, mix
+    """
+    solicitud = SolicitudRepository.get_by_id(solicitud_id)
+    if not solicitud:
+        raise ValueError(f"Solicitud {solicitud_id} no encontrada")
+
+    items = SolicitudRepository.get_items(solicitud_id)
+    if item_idx >= len(items):
+        raise ValueError(f"Item index {item_idx} fuera de rango")
+
+    item = items[item_idx]
+    codigo_original = item.get("codigo", "")
+    detalle_stock_base = (
+        MaterialRepository.get_stock_detalle(
+            codigo_original,
+            solicitud.get("centro"),
+            solicitud.get("almacen_virtual") or solicitud.get("almacen"),
+        )
+        or []
+    )
+    equivalencias = _equivalencias_por_codigo([codigo_original])
+
+    resultado = _opciones_item(
+        solicitud_id,
+        item_idx,
+        item,
+        detalle_stock_base,
+        _consumos_promedio([codigo_original]).get(norm_codigo(codigo_original), 0),
+        ProveedorRepository.list_externos_activos(),
+        equivalencias.get(norm_codigo(codigo_original), []),
+        _info_equivalentes(equivalencias),
+        _comprometidos([codigo_original], solicitud).get(norm_codigo(codigo_original), 0.0),
+    )
+
+    TratamientoRepository.log_evento(
+        solicitud_id,
+        item_idx,
+        "opciones_consultadas",
+        "PASO_2",
+        _resumen_opciones(resultado),
+        actor_id="sistema",
+    )
+
+    return resultado
+
+
+def paso_2_opciones_abastecimiento_batch(
+    solicitud_id: int, item_indices: Optional[List[int]] = None
+) -> Dict[str, Any]:
+    """
+    PASO 2 en bloque: opciones de abastecimiento para varios items.
+
+    Carga la solicitud y los proveedores una sola vez, resuelve stock,
+    consumo, equivalencias y catálogo de todos los items juntos y registra
+    un único evento de auditoría. Cada item produce el mismo resultado que
+    paso_2_opciones_abastecimiento.
+
+    Args:
+        solicitud_id: ID de la solicitud
+        item_indices: Índices a consultar (default: todos los items)
+
+    Returns:
+        Dict con la lista de resultados por item, en el orden pedido
+    """
+    solicitud = SolicitudRepository.get_by_id(solicitud_id)
+    if not solicitud:
+        raise ValueError(f"Solicitud {solicitud_id} no encontrada")
+
+    items = SolicitudRepository.parse_items(solicitud)
+    if item_indices is None:
+        indices = list(range(len(items)))
+    else:
+        indices = list(dict.fromkeys(item_indices))
+        for item_idx in indices:
+            if item_idx < 0 or item_idx >= len(items):
+                raise ValueError(f"Item index {item_idx} fuera de rango")
+
+    codigos = [items[idx].get("codigo", "") for idx in indices]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futuro_stock = pool.submit(
+            MaterialRepository.get_stock_detalle_batch,
+            codigos,
+            solicitud.get("centro"),
+            solicitud.get("almacen_virtual") or solicitud.get("almacen"),
+        )
+        futuro_proveedores = pool.submit(ProveedorRepository.list_externos_activos)
+        futuro_consumo = pool.submit(_consumos_promedio, codigos)
+        futuro_comprometido = pool.submit(_comprometidos, codigos, solicitud)
+        equivalencias = _equivalencias_por_codigo(codigos)
+        info_equivalentes = _info_equivalentes(equivalencias)
+        consumos = futuro_consumo.result()
+        proveedores = futuro_proveedores.result()
+        stock_por_codigo = futuro_stock.result()
+        comprometidos = futuro_comprometido.result()
+
+    resultados = []
+    for idx, codigo in zip(indices, codigos):
+        resultados.append(
+            _opciones_item(
+                solicitud_id,
+                idx,
+                items[idx],
+                stock_por_codigo.get(codigo) or [],
+                consumos.get(norm_codigo(codigo), 0),
+                proveedores,
+                equivalencias.get(norm_codigo(codigo), []),
+                info_equivalentes,
+                comprometidos.get(norm_codigo(codigo), 0.0),
+            )
+        )
+
+    TratamientoRepository.log_evento(
+        solicitud_id,
+        None,
+        "opciones_consultadas",
+        "PASO_2",
+        {
+            "total_items": len(resultados),
+            "items": [
+                {"item_idx": r["item_idx"], **_resumen_opciones(r)} for r in resultados
+            ],
+        },
+        actor_id="sistema",
+    )
+
+    return {
+        "solicitud_id": solicitud_id,
+        "paso": 2,
+        "nombre_paso": "Decision de Abastecimiento",
+        "total_items": len(resultados),
+        "items": resultados,
+    }
+
+
 def paso_3_guardar_tratamiento(
     solicitud_id: int, decisiones: List[Dict[str, Any]], usuario_id: str
 ) -> Dict[str, Any]:
@@ -590,32 +861,27 @@ def paso_3_guardar_tratamiento(
     if not solicitud:
         raise ValueError(f"Solicitud {solicitud_id} no encontrada")
 
-    guardadas = 0
-    errores: List[Dict[str, Any]] = []
-
-    for decision in decisiones:
-        item_idx = decision.get("item_idx")
-        if item_idx is None:
-            continue
-
-        try:
-            TratamientoRepository.save_decision(
-                solicitud_id=solicitud_id,
-                item_idx=item_idx,
-                decision_tipo=str(decision.get("decision_tipo", "stock")).lower(),
-                cantidad_aprobada=decision.get("cantidad_aprobada", 0),
-                codigo_material=decision.get("codigo_material"),
-                proveedor_id=decision.get("id_proveedor"),
-                precio_unitario=decision.get("precio_unitario_final"),
-                observaciones=decision.get("observaciones", ""),
-                updated_by=usuario_id,
-            )
-            guardadas += 1
-        except Exception as e:
-            errores.append({"item_idx": item_idx, "error": str(e)})
+    filas = [
+        (
+            decision.get("item_idx"),
+            str(decision.get("decision_tipo", "stock")).lower(),
+            decision.get("cantidad_aprobada", 0),
+            decision.get("codigo_material"),
+            decision.get("id_proveedor"),
+            decision.get("precio_unitario_final"),
+            decision.get("observaciones", ""),
+        )
+        for decision in decisiones
+        if decision.get("item_idx") is not None
+    ]
 
-    SolicitudRepository.update_status(solicitud_id, "En tratamiento")
+    # Decisiones y status en una sola transacción (un solo commit)
+    errores = TratamientoRepository.save_decisiones_bulk(
+        solicitud_id, filas, usuario_id, status="En tratamiento"
+    )
+    guardadas = len(filas) - len(errores)
 
+    # El log de auditoría vive en otra BD: el evento se encola tras el commit
     TratamientoRepository.log_evento(
         solicitud_id,
         None,
@@ -0,0 +1,328 @@
+"""
+Índice en memoria de stock disponible
+
+Resuelve el stock de un material sin consultar stock_almacenes ni el Excel
+en cada llamada. El índice es un dict anidado
+
+    codigo -> centro -> almacen -> lote -> cantidad
+
+construido con una sola lectura de cada fuente:
+
+- stock_almacenes (BD) es la fuente principal; el stock de Excel
+  (backend_v2/stock.xlsx vía cache_loader) solo responde por los códigos o
+  filtros sin filas en BD, comparando códigos normalizados (sin ceros a la
+  izquierda).
+- Las exclusiones de config_almacenes (almacén excluido) y
+  config_lotes_excluidos se aplican al construir: los lotes excluidos no
+  entran al índice.
+- Cada almacén guarda ya resuelto libre_disponibilidad, responsable y
+  nombre_almacen desde config_almacenes.
+- Los almacenes se guardan con 4 dígitos ('1' -> '0001'); un almacén
+  virtual de solicitud ('ALM0001') filtra por su almacén físico.
+
+El índice se guarda en catalog_cache junto con la versión de los datos de
+referencia (ReferenceDataRepository) y la del snapshot Excel con que se
+construyó. Si la versión avanzó solo por sincronizaciones de stock
+(services/stock_sync), se vuelven a leer únicamente los materiales de su
+change-set; cualquier otro cambio (config, Excel) lo reconstruye completo.
+"""
+
+import copy
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+try:
+    from backend_v2.core import cache_loader, repository
+    from backend_v2.core.cache import catalog_cache
+    from backend_v2.core.repository import (ConfigAlmacenesRepository,
+                                            ReferenceDataRepository)
+    from backend_v2.core.utils import almacen_fisico, norm_codigo, tiene_tabla
+    from backend_v2.services.stock_sync import materiales_cambiados
+except ImportError:
+    from core import cache_loader, repository
+    from core.cache import catalog_cache
+    from core.repository import ConfigAlmacenesRepository, ReferenceDataRepository
+    from core.utils import almacen_fisico, norm_codigo, tiene_tabla
+    from services.stock_sync import materiales_cambiados
+
+KEY_PREFIX = "stock_index"
+BATCH_SIZE = 500
+
+# lote -> cantidad (None = sin lote)
+Lotes = Dict[Optional[str], float]
+Arbol = Dict[str, Dict[str, Dict[str, Lotes]]]
+
+
+def _centro(val: Any) -> str:
+    base = str(val if val is not None else "").strip()
+    return base[:-2] if base.endswith(".0") else base
+
+
+def _almacen(val: Any) -> str:
+    return almacen_fisico(val).zfill(4)
+
+
+def _lote(val: Any) -> Optional[str]:
+    if val is None or val != val:  # NaN de pandas
+        return None
+    base = str(val).strip()
+    return base or None
+
+
+class StockIndex:
+    """Índice inmutable de stock con exclusiones y config ya aplicadas"""
+
+    def __init__(
+        self,
+        filas_bd: List[Tuple[Any, Any, Any, Any, Any]],
+        filas_excel: List[Tuple[Any, Any, Any, Any, Any]],
+        almacenes_config: List[Dict[str, Any]],
+        lotes_excluidos: List[str],
+        version: int = 0,
+        snapshot: int = 0,
+    ):
+        """
+        Args:
+            filas_bd: (codigo, centro, almacen, lote, cantidad) de stock_almacenes
+            filas_excel: (codigo, centro, almacen, lote, cantidad) del Excel
+            almacenes_config: ConfigAlmacenesRepository.get_all()
+            lotes_excluidos: ConfigAlmacenesRepository.get_lotes_excluidos()
+            version: Versión de los datos de referencia leídos
+            snapshot: Versión del snapshot Excel leído
+        """
+        self._config: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        excluidos: Set[Tuple[str, str]] = set()
+        for c in almacenes_config:
+            key = (_centro(c.get("centro")), _almacen(c.get("almacen")))
+            self._config[key] = {
+                "libre_disponibilidad": bool(c.get("libre_disponibilidad", False)),
+                "responsable": c.get("responsable_nombre"),
+                "nombre_almacen": c.get("nombre"),
+            }
+            if c.get("excluido"):
+                excluidos.add(key)
+        self._excluidos = excluidos
+        self._lotes_fuera = {str(lote).strip().upper() for lote in lotes_excluidos if lote}
+        self.version = version
+        self.snapshot = snapshot
+
+        # Filtros (centro, almacen) con filas en BD antes de excluir: deciden si se usa Excel
+        self._presentes: Dict[str, Set[Tuple[Optional[str], Optional[str]]]] = {}
+        self._bd = self._construir(filas_bd, str, self._presentes)
+        self._excel = self._construir(filas_excel, norm_codigo)
+
+    def _construir(self, filas, clave_codigo, presentes=None) -> Arbol:
+        arbol: Arbol = {}
+        for codigo, centro, almacen, lote, cantidad in filas:
+            codigo, centro, almacen = clave_codigo(codigo), _centro(centro), _almacen(almacen)
+            if presentes is not None:
+                presentes.setdefault(codigo, set()).update(
+                    {(None, None), (centro, None), (None, almacen), (centro, almacen)}
+                )
+            lote = _lote(lote)
+            if (centro, almacen) in self._excluidos or (lote and lote.upper() in self._lotes_fuera):
+                continue
+            lotes = arbol.setdefault(codigo, {}).setdefault(centro, {}).setdefault(almacen, {})
+            lotes[lote] = lotes.get(lote, 0.0) + float(cantidad or 0)
+        return arbol
+
+    def con_cambios(
+        self, codigos: Set[str], filas_bd: List[Tuple[Any, Any, Any, Any, Any]], version: int
+    ) -> "StockIndex":
+        """
+        Índice nuevo con el stock en BD de algunos códigos reemplazado.
+
+        Args:
+            codigos: Materiales a reemplazar (change-set de la sincronización)
+            filas_bd: Filas actuales de stock_almacenes de esos códigos
+            version: Versión de los datos de referencia de filas_bd
+
+        Returns:
+            Copia del índice; el actual no se modifica (puede estar en uso)
+        """
+        nuevo = copy.copy(self)
+        nuevo.version = version
+        nuevo._bd = {c: v for c, v in self._bd.items() if c not in codigos}
+        nuevo._presentes = {c: v for c, v in self._presentes.items() if c not in codigos}
+        nuevo._bd.update(nuevo._construir(filas_bd, str, nuevo._presentes))
+        return nuevo
+
+    def __len__(self) -> int:
+        return len(self._bd) + len(self._excel)
+
+    def _fuente(
+        self, codigo: str, centro: Optional[str], almacen: Optional[str]
+    ) -> Tuple[Dict[str, Dict[str, Lotes]], bool]:
+        """Stock del código en la fuente que responde al filtro y si viene de Excel"""
+        if (centro, almacen) in self._presentes.get(str(codigo), ()):
+            return self._bd.get(str(codigo), {}), False
+        return self._excel.get(norm_codigo(codigo), {}), True
+
+    @staticmethod
+    def _filtrar(centros, centro, almacen):
+        for centro_val, almacenes in centros.items():
+            if centro and centro_val != centro:
+                continue
+            for almacen_val, lotes in almacenes.items():
+                if almacen and almacen_val != almacen:
+                    continue
+                yield centro_val, almacen_val, lotes
+
+    def lotes(
+        self, codigo: str, centro: Optional[str] = None, almacen: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Stock por lote.
+
+        Returns:
+            Filas {centro, almacen, lote, cantidad, libre_disponibilidad,
+            responsable, nombre_almacen}
+        """
+        centro = _centro(centro) if centro else None
+        almacen = _almacen(almacen) if almacen else None
+        centros, _ = self._fuente(codigo, centro, almacen)
+        return [
+            {
+                "centro": centro_val,
+                "almacen": almacen_val,
+                "lote": lote,
+                "cantidad": cantidad,
+                **self._enriquecer(centro_val, almacen_val),
+            }
+            for centro_val, almacen_val, lotes in self._filtrar(centros, centro, almacen)
+            for lote, cantidad in lotes.items()
+        ]
+
+    def detalle(
+        self, codigo: str, centro: Optional[str] = None, almacen: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Stock por centro/almacén (semántica de MaterialRepository.get_stock_detalle).
+
+        Si el código no tiene filas en BD para el filtro se responde desde
+        Excel, y si ahí el filtro lo deja vacío se devuelve todo su stock.
+
+        Returns:
+            Filas nuevas {centro, almacen, cantidad, libre_disponibilidad,
+            responsable, nombre_almacen}; las de Excel incluyen 'lote'
+        """
+        centro = _centro(centro) if centro else None
+        almacen = _almacen(almacen) if almacen else None
+        centros, excel = self._fuente(codigo, centro, almacen)
+        seleccion = list(self._filtrar(centros, centro, almacen))
+        if excel and not seleccion:
+            seleccion = list(self._filtrar(centros, None, None))
+
+        rows = []
+        for centro_val, almacen_val, lotes in seleccion:
+            row: Dict[str, Any] = {
+                "centro": centro_val,
+                "almacen": almacen_val,
+                "cantidad": sum(lotes.values()),
+            }
+            if excel:
+                row["lote"] = next(iter(lotes))
+            row.update(self._enriquecer(centro_val, almacen_val))
+            rows.append(row)
+        return rows
+
+    def disponible(
+        self, codigo: str, centro: Optional[str] = None, almacen: Optional[str] = None
+    ) -> float:
+        """Stock total del código para el filtro (sin relajar centro/almacén)"""
+        centro = _centro(centro) if centro else None
+        almacen = _almacen(almacen) if almacen else None
+        centros, _ = self._fuente(codigo, centro, almacen)
+        return float(
+            sum(sum(lotes.values()) for _, _, lotes in self._filtrar(centros, centro, almacen))
+        )
+
+    def _enriquecer(self, centro: str, almacen: str) -> Dict[str, Any]:
+        return dict(
+            self._config.get(
+                (centro, almacen),
+                {"libre_disponibilidad": False, "responsable": None, "nombre_almacen": None},
+            )
+        )
+
+
+def _filas_bd(codigos: Optional[List[str]] = None) -> List[Tuple[Any, Any, Any, Any, Any]]:
+    """Filas de stock_almacenes (de todos los códigos o de los indicados)"""
+    conn = repository._connect()
+    try:
+        if not tiene_tabla(conn, "stock_almacenes"):
+            return []
+        cur = conn.cursor()
+        columnas = {r[1] for r in cur.execute("PRAGMA table_info(stock_almacenes)")}
+        lote = "lote" if "lote" in columnas else "NULL"
+        sql = f"SELECT codigo_material, centro, almacen, {lote}, SUM(cantidad) FROM stock_almacenes"
+        agrupar = f" GROUP BY codigo_material, centro, almacen, {lote}"
+        if codigos is None:
+            cur.execute(sql + agrupar)
+            return [tuple(r) for r in cur.fetchall()]
+        filas = []
+        for i in range(0, len(codigos), BATCH_SIZE):
+            lote_codigos = codigos[i : i + BATCH_SIZE]
+            cur.execute(
+                f"{sql} WHERE codigo_material IN ({','.join('?' * len(lote_codigos))}){agrupar}",
+                lote_codigos,
+            )
+            filas.extend(tuple(r) for r in cur.fetchall())
+        return filas
+    finally:
+        conn.close()
+
+
+def _filas_excel() -> List[Tuple[Any, Any, Any, Any, Any]]:
+    df = cache_loader.get_stock_cache()
+    if df is None or df.empty:
+        return []
+    col_lote = "lote" if "lote" in df.columns else "Lote" if "Lote" in df.columns else None
+    lotes = df[col_lote] if col_lote else [None] * len(df)
+    return list(zip(df["codigo"], df["centro"], df["almacen"], lotes, df["stock"]))
+
+
+def construir_indice(version: int = 0, snapshot: int = 0) -> StockIndex:
+    """Índice nuevo leyendo stock_almacenes, el Excel y la config de almacenes"""
+    return StockIndex(
+        _filas_bd(),
+        _filas_excel(),
+        ConfigAlmacenesRepository.get_all(),
+        ConfigAlmacenesRepository.get_lotes_excluidos(),
+        version,
+        snapshot,
+    )
+
+
+def _cache_key() -> str:
+    return f"{KEY_PREFIX}:{repository._db_path()}"
+
+
+def _actualizar(index: Optional[StockIndex], version: int, snapshot: int) -> StockIndex:
+    """Índice al día: parcheando el change-set de stock si alcanza, si no completo"""
+    if index is not None and index.snapshot == snapshot and index.version < version:
+        conn = repository._connect()
+        try:
+            codigos = materiales_cambiados(conn, index.version, version)
+        finally:
+            conn.close()
+        if codigos is not None:
+            return index.con_cambios(codigos, _filas_bd(sorted(codigos)), version)
+    return construir_indice(version, snapshot)
+
+
+def get_stock_index() -> StockIndex:
+    """Índice vigente; lo actualiza si cambió el stock o la config"""
+    key = _cache_key()
+    # Versiones leídas antes que los datos: un cambio concurrente se ve en la próxima consulta
+    version = ReferenceDataRepository.get_version()
+    snapshot = cache_loader.get_snapshot_version()
+    index = catalog_cache.get(key)
+    if index is None or index.version != version or index.snapshot != snapshot:
+        index = _actualizar(index, version, snapshot)
+        catalog_cache.set(key, index)
+    return index
+
+
+def invalidate_stock_index() -> None:
+    """Descartar el índice (llamar después de modificar stock sin versionar)"""
+    catalog_cache.invalidate_pattern(f"{KEY_PREFIX}:")
@@ -0,0 +1,58 @@
+"""
+Utilidades compartidas por servicios y rutas
+
+- norm_codigo: forma canónica de códigos de material/centro/almacén, la
+  misma en BD, Excel e índices en memoria
+- almacen_fisico: almacén físico de un almacén virtual de solicitud
+- tiene_tabla: si una tabla existe en la BD de la conexión
+"""
+
+import re
+import sqlite3
+from typing import Any
+
+# Almacén virtual de las solicitudes: 'ALM' + número del almacén físico
+_ALMACEN_VIRTUAL = re.compile(r"^ALM[-_ ]?(\d+)$", re.IGNORECASE)
+
+
+def norm_codigo(val: Any) -> str:
+    """
+    Normaliza código de material/centro/almacén (elimina ceros y .0 finales).
+
+    Args:
+        val: Código como texto, número (1008.0 -> '1008') o None
+
+    Returns:
+        Código sin espacios, sin '.0' final ni ceros a la izquierda
+    """
+    if isinstance(val, float) and val.is_integer():
+        val = int(val)
+    base = "" if val is None else str(val).strip()
+    if base.endswith(".0"):
+        base = base[:-2]
+    return base.lstrip("0")
+
+
+def almacen_fisico(val: Any) -> str:
+    """
+    Almacén físico normalizado de un almacén virtual o físico.
+
+    Las solicitudes guardan un almacén virtual ('ALM0001', 'ALM-01') y el
+    stock está por almacén físico ('0001'): ambos lados se comparan con
+    esta clave.
+
+    Args:
+        val: Almacén virtual o físico
+
+    Returns:
+        Código del almacén físico normalizado como norm_codigo ('ALM0001' -> '1')
+    """
+    base = "" if val is None else str(val).strip()
+    virtual = _ALMACEN_VIRTUAL.match(base)
+    return norm_codigo(virtual.group(1) if virtual else val)
+
+
+def tiene_tabla(conn: sqlite3.Connection, nombre: str) -> bool:
+    """Si la tabla `nombre` existe en la BD de la conexión"""
+    cur = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (nombre,))
+    return cur.fetchone() is not None
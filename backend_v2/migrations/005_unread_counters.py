@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Migracion 005: Contadores materializados de no leidos
+
+Esta migracion:
+1. Crea tabla user_unread_counters (una fila por usuario)
+2. Carga los contadores iniciales desde notificaciones y mensajes
+"""
+
+import sqlite3
+from pathlib import Path
+
+# Ubicacion de la BD
+DB_PATH = Path("backend_v2/spm.db")
+
+# ============================================================================
+# 1. Tabla user_unread_counters
+# ============================================================================
+
+CREATE_UNREAD_COUNTERS = """
+CREATE TABLE IF NOT EXISTS user_unread_counters (
+    user_id TEXT PRIMARY KEY,
+    unread_notifications INTEGER NOT NULL DEFAULT 0,
+    unread_messages INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT
+)
+"""
+
+# ============================================================================
+# 2. Carga inicial
+# ============================================================================
+
+BACKFILL_SQL = """
+INSERT INTO user_unread_counters (user_id, unread_notifications, unread_messages, updated_at)
+SELECT user_id,
+       SUM(notif),
+       SUM(msg),
+       datetime('now')
+FROM (
+    SELECT destinatario_id AS user_id, COUNT(*) AS notif, 0 AS msg
+    FROM notificaciones WHERE leido = 0 GROUP BY destinatario_id
+    UNION ALL
+    SELECT destinatario_id AS user_id, 0 AS notif, COUNT(*) AS msg
+    FROM mensajes WHERE leido = 0 GROUP BY destinatario_id
+)
+GROUP BY user_id
+ON CONFLICT(user_id) DO UPDATE SET
+    unread_notifications = excluded.unread_notifications,
+    unread_messages = excluded.unread_messages,
+    updated_at = excluded.updated_at
+"""
+
+
+def run_migration():
+    """Ejecutar migracion"""
+    print(f">> Conectando a {DB_PATH}...")
+
+    if not DB_PATH.exists():
+        print(f"ERROR: Base de datos no encontrada en {DB_PATH}")
+        return False
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    try:
+        # 1. Crear tabla
+        print(">> [1/2] Creando tabla user_unread_counters...")
+        cursor.execute(CREATE_UNREAD_COUNTERS)
+        print("   OK: Tabla creada")
+
+        # 2. Cargar contadores
+        print(">> [2/2] Cargando contadores desde notificaciones y mensajes...")
+        cursor.execute(BACKFILL_SQL)
+        conn.commit()
+        cursor.execute("SELECT COUNT(*) FROM user_unread_counters")
+        count = cursor.fetchone()[0]
+        print(f"   OK: {count} usuarios con contadores")
+
+        return True
+
+    except Exception as e:
+        print(f"ERROR durante migracion: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+        print(">> Conexion cerrada")
+
+
+def main():
+    print("=" * 70)
+    print("  MIGRACION 005: Contadores de no leidos")
+    print("=" * 70)
+    print()
+
+    success = run_migration()
+
+    print()
+    if success:
+        print("OK: Migracion completada con exito!")
+    else:
+        print("ERROR: Migracion fallo. Revisa los errores arriba.")
+    print()
+
+
+if __name__ == "__main__":
+    main()
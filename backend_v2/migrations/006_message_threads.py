@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Migracion 006: Resumen de hilos de mensajes
+
+Esta migracion:
+1. Crea tablas message_threads y message_thread_participants
+2. Agrega indices de mensajes para inbox/outbox y recorrido de hilos
+3. Reconstruye el resumen desde la tabla mensajes
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend_v2.services.message_threads import MessageThreadService  # noqa: E402
+
+# Ubicacion de la BD
+DB_PATH = Path("backend_v2/spm.db")
+
+CREATE_MENSAJES_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_mensajes_destinatario ON mensajes(destinatario_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_mensajes_remitente ON mensajes(remitente_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_mensajes_parent ON mensajes(parent_id);
+"""
+
+
+def run_migration():
+    """Ejecutar migracion"""
+    print(f">> Conectando a {DB_PATH}...")
+
+    if not DB_PATH.exists():
+        print(f"ERROR: Base de datos no encontrada en {DB_PATH}")
+        return False
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    try:
+        print(">> [1/2] Creando indices de mensajes...")
+        cursor.executescript(CREATE_MENSAJES_INDEXES)
+        conn.commit()
+        print("   OK: Indices creados")
+    except Exception as e:
+        print(f"ERROR durante migracion: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+    try:
+        print(">> [2/2] Reconstruyendo resumen de hilos...")
+        count = MessageThreadService.rebuild(str(DB_PATH))
+        print(f"   OK: {count} hilos")
+        return True
+    except Exception as e:
+        print(f"ERROR durante migracion: {e}")
+        return False
+    finally:
+        print(">> Conexion cerrada")
+
+
+def main():
+    print("=" * 70)
+    print("  MIGRACION 006: Resumen de hilos de mensajes")
+    print("=" * 70)
+    print()
+
+    success = run_migration()
+
+    print()
+    if success:
+        print("OK: Migracion completada con exito!")
+    else:
+        print("ERROR: Migracion fallo. Revisa los errores arriba.")
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Migracion 007: Indice para la cola del planificador
+
+Esta migracion:
+1. Crea el indice solicitudes(status, planner_id) usado por
+   GET /api/planificador/cola para filtrar solicitudes abiertas
+"""
+
+import sqlite3
+from pathlib import Path
+
+# Ubicacion de la BD
+DB_PATH = Path("backend_v2/spm.db")
+
+CREATE_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_solicitudes_status_planner ON solicitudes(status, planner_id)
+"""
+
+
+def run_migration():
+    """Ejecutar migracion"""
+    print(f">> Conectando a {DB_PATH}...")
+
+    if not DB_PATH.exists():
+        print(f"ERROR: Base de datos no encontrada en {DB_PATH}")
+        return False
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    try:
+        print(">> [1/1] Creando indice de cola del planificador...")
+        cursor.execute(CREATE_INDEX)
+        conn.commit()
+        print("   OK: Indice creado")
+        return True
+    except Exception as e:
+        print(f"ERROR durante migracion: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+        print(">> Conexion cerrada")
+
+
+def main():
+    print("=" * 70)
+    print("  MIGRACION 007: Indice para la cola del planificador")
+    print("=" * 70)
+    print()
+
+    success = run_migration()
+
+    print()
+    if success:
+        print("OK: Migracion completada con exito!")
+    else:
+        print("ERROR: Migracion fallo. Revisa los errores arriba.")
+    print()
+
+
+if __name__ == "__main__":
+    main()
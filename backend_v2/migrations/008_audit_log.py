@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Migracion 008: Log de auditoria en BD separada
+
+Esta migracion:
+1. Crea la BD de auditoria (<nombre>_audit.db) con solicitud_tratamiento_log
+   append-only
+2. Copia los eventos existentes de solicitud_tratamiento_log de spm.db
+   (idempotente: cada fila se registra por su id original)
+3. Verifica que cada fila tenga su copia (por legacy_id) y elimina la tabla
+   de spm.db, para que los eventos no queden guardados dos veces
+
+Los eventos nuevos se escriben solo en la BD de auditoria.
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend_v2.services.audit_log import AuditLog, audit_path_for  # noqa: E402
+
+# Ubicacion de la BD
+DB_PATH = Path("backend_v2/spm.db")
+
+BATCH_SIZE = 5000
+
+
+def run_migration():
+    """Ejecutar migracion"""
+    print(f">> Conectando a {DB_PATH}...")
+
+    if not DB_PATH.exists():
+        print(f"ERROR: Base de datos no encontrada en {DB_PATH}")
+        return False
+
+    audit = AuditLog(audit_path_for(DB_PATH))
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+
+    try:
+        print(f">> [1/3] Creando BD de auditoria en {audit.path}...")
+        audit.import_rows([])
+        print("   OK: Tabla creada")
+
+        print(">> [2/3] Copiando eventos existentes...")
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='solicitud_tratamiento_log'"
+        ).fetchone()
+        total = 0
+        if exists:
+            cur = conn.execute("SELECT * FROM solicitud_tratamiento_log ORDER BY id")
+            while True:
+                rows = cur.fetchmany(BATCH_SIZE)
+                if not rows:
+                    break
+                total += audit.import_rows(dict(r) for r in rows)
+        print(f"   OK: {total} eventos copiados")
+
+        print(">> [3/3] Eliminando la tabla de spm.db...")
+        if not exists:
+            print("   SKIP: La tabla ya no existe")
+            return True
+        conn.execute("ATTACH DATABASE ? AS audit", (str(audit.path),))
+        faltantes = conn.execute(
+            """
+            SELECT COUNT(*) FROM main.solicitud_tratamiento_log l
+            WHERE NOT EXISTS (
+                SELECT 1 FROM audit.solicitud_tratamiento_log a WHERE a.legacy_id = l.id
+            )
+            """
+        ).fetchone()[0]
+        conn.execute("DETACH DATABASE audit")
+        if faltantes:
+            print(f"ERROR: {faltantes} eventos sin copia en auditoria; la tabla no se elimina")
+            return False
+        conn.execute("DROP TABLE main.solicitud_tratamiento_log")
+        conn.commit()
+        print("   OK: Tabla eliminada")
+        return True
+    except Exception as e:
+        print(f"ERROR durante migracion: {e}")
+        return False
+    finally:
+        conn.close()
+        print(">> Conexion cerrada")
+
+
+def main():
+    print("=" * 70)
+    print("  MIGRACION 008: Log de auditoria en BD separada")
+    print("=" * 70)
+    print()
+
+    success = run_migration()
+
+    print()
+    if success:
+        print("OK: Migracion completada con exito!")
+    else:
+        print("ERROR: Migracion fallo. Revisa los errores arriba.")
+    print()
+
+
+if __name__ == "__main__":
+    main()
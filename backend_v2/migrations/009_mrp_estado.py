@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Migracion 009: Estado MRP materializado
+
+Esta migracion:
+1. Crea materiales_mrp_estado (estado, clase, sugerencia, rotacion y
+   cobertura por material) con indice (centro, estado)
+2. Crea los triggers sobre materiales_mrp que recalculan solo las filas
+   insertadas, modificadas o borradas
+3. Calcula el estado de todos los materiales existentes
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend_v2.services.mrp_alertas import (ESTADO_TABLE,  # noqa: E402
+                                             ensure_estado_schema,
+                                             refrescar_estados)
+
+# Ubicacion de la BD
+DB_PATH = Path("backend_v2/spm.db")
+
+
+def run_migration():
+    """Ejecutar migracion"""
+    print(f">> Conectando a {DB_PATH}...")
+
+    if not DB_PATH.exists():
+        print(f"ERROR: Base de datos no encontrada en {DB_PATH}")
+        return False
+
+    conn = sqlite3.connect(DB_PATH)
+
+    try:
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='materiales_mrp'"
+        ).fetchone()
+        if not exists:
+            print("   SKIP: materiales_mrp no existe (se crea al importar datos MRP)")
+            return True
+
+        print(f">> [1/2] Creando {ESTADO_TABLE} y triggers...")
+        nueva = ensure_estado_schema(conn)
+        print("   OK: Tabla creada" if nueva else "   OK: Tabla ya existia")
+
+        print(">> [2/2] Calculando estado de todos los materiales...")
+        total = refrescar_estados(conn)
+        conn.commit()
+        print(f"   OK: {total} materiales calculados")
+        return True
+    except Exception as e:
+        print(f"ERROR durante migracion: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+        print(">> Conexion cerrada")
+
+
+def main():
+    print("=" * 70)
+    print("  MIGRACION 009: Estado MRP materializado")
+    print("=" * 70)
+    print()
+
+    success = run_migration()
+
+    print()
+    if success:
+        print("OK: Migracion completada con exito!")
+    else:
+        print("ERROR: Migracion fallo. Revisa los errores arriba.")
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Migracion 010: Sugerencias de parametros MRP
+
+Esta migracion:
+1. Crea materiales_mrp_sugerencias, donde el job
+   scripts/recalc_mrp_parameters.py deja los parametros sugeridos para
+   revision del planificador
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend_v2.services.mrp_parametros import ensure_sugerencias_schema  # noqa: E402
+
+# Ubicacion de la BD
+DB_PATH = Path("backend_v2/spm.db")
+
+
+def run_migration():
+    """Ejecutar migracion"""
+    print(f">> Conectando a {DB_PATH}...")
+
+    if not DB_PATH.exists():
+        print(f"ERROR: Base de datos no encontrada en {DB_PATH}")
+        return False
+
+    conn = sqlite3.connect(DB_PATH)
+
+    try:
+        print(">> [1/1] Creando tabla materiales_mrp_sugerencias...")
+        ensure_sugerencias_schema(conn)
+        conn.commit()
+        print("   OK: Tabla creada")
+        return True
+    except Exception as e:
+        print(f"ERROR durante migracion: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+        print(">> Conexion cerrada")
+
+
+def main():
+    print("=" * 70)
+    print("  MIGRACION 010: Sugerencias de parametros MRP")
+    print("=" * 70)
+    print()
+
+    success = run_migration()
+
+    print()
+    if success:
+        print("OK: Migracion completada con exito!")
+    else:
+        print("ERROR: Migracion fallo. Revisa los errores arriba.")
+    print()
+
+
+if __name__ == "__main__":
+    main()
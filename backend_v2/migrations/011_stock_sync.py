@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Migracion 011: Sincronizacion incremental de stock
+
+Esta migracion:
+1. Crea stock_almacenes si no existe (o le agrega lote/updated_at) y su
+   indice por (codigo_material, centro, almacen, lote)
+2. Crea stock_sync_log y stock_sync_cambios: el change-set de cada
+   sincronizacion (scripts/sync_stock.py o POST /api/admin/stock/sync)
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend_v2.services.stock_sync import ensure_schema  # noqa: E402
+
+# Ubicacion de la BD
+DB_PATH = Path("backend_v2/spm.db")
+
+
+def run_migration():
+    """Ejecutar migracion"""
+    print(f">> Conectando a {DB_PATH}...")
+
+    if not DB_PATH.exists():
+        print(f"ERROR: Base de datos no encontrada en {DB_PATH}")
+        return False
+
+    conn = sqlite3.connect(DB_PATH)
+
+    try:
+        print(">> [1/1] Creando tablas stock_almacenes, stock_sync_log y stock_sync_cambios...")
+        ensure_schema(conn)
+        conn.commit()
+        print("   OK: Tablas creadas")
+        return True
+    except Exception as e:
+        print(f"ERROR durante migracion: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+        print(">> Conexion cerrada")
+
+
+def main():
+    print("=" * 70)
+    print("  MIGRACION 011: Sincronizacion incremental de stock")
+    print("=" * 70)
+    print()
+
+    success = run_migration()
+
+    print()
+    if success:
+        print("OK: Migracion completada con exito!")
+    else:
+        print("ERROR: Migracion fallo. Revisa los errores arriba.")
+    print()
+
+
+if __name__ == "__main__":
+    main()
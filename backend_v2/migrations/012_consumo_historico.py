@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Migracion 012: Historico de consumo en la BD
+
+Esta migracion:
+1. Crea consumo_movimientos (un movimiento por fila, indexado por material
+   y fecha y por material y ubicacion)
+2. Crea consumo_mensual (resumen por material, ubicacion y mes) y
+   consumo_importaciones
+
+Los datos se cargan con scripts/import_consumo.py.
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend_v2.services.consumo_store import ensure_schema  # noqa: E402
+
+# Ubicacion de la BD
+DB_PATH = Path("backend_v2/spm.db")
+
+
+def run_migration():
+    """Ejecutar migracion"""
+    print(f">> Conectando a {DB_PATH}...")
+
+    if not DB_PATH.exists():
+        print(f"ERROR: Base de datos no encontrada en {DB_PATH}")
+        return False
+
+    conn = sqlite3.connect(DB_PATH)
+
+    try:
+        print(">> [1/1] Creando tablas consumo_movimientos, consumo_mensual y consumo_importaciones...")
+        ensure_schema(conn)
+        conn.commit()
+        print("   OK: Tablas creadas")
+        return True
+    except Exception as e:
+        print(f"ERROR durante migracion: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+        print(">> Conexion cerrada")
+
+
+def main():
+    print("=" * 70)
+    print("  MIGRACION 012: Historico de consumo en la BD")
+    print("=" * 70)
+    print()
+
+    success = run_migration()
+
+    print()
+    if success:
+        print("OK: Migracion completada con exito!")
+    else:
+        print("ERROR: Migracion fallo. Revisa los errores arriba.")
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Migracion 013: Stock comprometido (ATP)
+
+Esta migracion:
+1. Crea stock_compromisos (reserva por item tratado con decision 'stock'),
+   stock_comprometido (total por material/centro/almacen) y
+   stock_comprometido_version
+2. Carga las reservas de las solicitudes abiertas existentes
+"""
+
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend_v2.services.atp import ATPService  # noqa: E402
+
+# Ubicacion de la BD
+DB_PATH = Path("backend_v2/spm.db")
+
+
+def run_migration():
+    """Ejecutar migracion"""
+    print(f">> Conectando a {DB_PATH}...")
+
+    if not DB_PATH.exists():
+        print(f"ERROR: Base de datos no encontrada en {DB_PATH}")
+        return False
+
+    try:
+        print(">> [1/1] Creando tablas y cargando reservas desde solicitud_items_tratamiento...")
+        result = ATPService.reconstruir(DB_PATH)
+        print(f"   OK: {result['compromisos']} reservas en {result['materiales']} ubicaciones")
+        return True
+    except Exception as e:
+        print(f"ERROR durante migracion: {e}")
+        return False
+
+
+def main():
+    print("=" * 70)
+    print("  MIGRACION 013: Stock comprometido (ATP)")
+    print("=" * 70)
+    print()
+
+    success = run_migration()
+
+    print()
+    if success:
+        print("OK: Migracion completada con exito!")
+    else:
+        print("ERROR: Migracion fallo. Revisa los errores arriba.")
+    print()
+
+
+if __name__ == "__main__":
+    main()
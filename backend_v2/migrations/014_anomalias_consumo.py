@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Migracion 014: Anomalias de consumo
+
+Esta migracion:
+1. Crea consumo_estadisticas (media, desvio, mediana y MAD por material) y
+   solicitud_anomalias (marcas de consumo inusual por item)
+2. Calcula las estadisticas y escanea las solicitudes pendientes existentes
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend_v2.services import anomalias_consumo  # noqa: E402
+
+# Ubicacion de la BD
+DB_PATH = Path("backend_v2/spm.db")
+
+
+def run_migration():
+    """Ejecutar migracion"""
+    print(f">> Conectando a {DB_PATH}...")
+
+    if not DB_PATH.exists():
+        print(f"ERROR: Base de datos no encontrada en {DB_PATH}")
+        return False
+
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        print(">> [1/2] Creando tablas y calculando estadisticas de demanda...")
+        materiales = anomalias_consumo.recalcular_estadisticas(conn)
+        print(f"   OK: {materiales} materiales con estadisticas")
+
+        print(">> [2/2] Escaneando solicitudes pendientes...")
+        resumen = anomalias_consumo.escanear(conn)
+        print(f"   OK: {resumen['anomalias']} anomalias en {resumen['items']} items")
+        return True
+    except Exception as e:
+        print(f"ERROR durante migracion: {e}")
+        return False
+    finally:
+        conn.close()
+
+
+def main():
+    print("=" * 70)
+    print("  MIGRACION 014: Anomalias de consumo")
+    print("=" * 70)
+    print()
+
+    success = run_migration()
+
+    print()
+    if success:
+        print("OK: Migracion completada con exito!")
+    else:
+        print("ERROR: Migracion fallo. Revisa los errores arriba.")
+    print()
+
+
+if __name__ == "__main__":
+    main()
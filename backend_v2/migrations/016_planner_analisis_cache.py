@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Migracion 016: Cache compartido del analisis del planner
+
+Esta migracion:
+1. Crea planner_analisis_cache, donde se guardan los analisis PASO 1
+   precalculados al aprobar para que cualquier worker los encuentre
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend_v2.core.repository import PlannerAnalysisRepository  # noqa: E402
+
+# Ubicacion de la BD
+DB_PATH = Path("backend_v2/spm.db")
+
+
+def run_migration():
+    """Ejecutar migracion"""
+    print(f">> Conectando a {DB_PATH}...")
+
+    if not DB_PATH.exists():
+        print(f"ERROR: Base de datos no encontrada en {DB_PATH}")
+        return False
+
+    conn = sqlite3.connect(DB_PATH)
+
+    try:
+        print(">> [1/1] Creando tabla planner_analisis_cache...")
+        conn.execute(PlannerAnalysisRepository.CREATE_TABLE)
+        conn.commit()
+        print("   OK: Tabla creada")
+        return True
+    except Exception as e:
+        print(f"ERROR durante migracion: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+        print(">> Conexion cerrada")
+
+
+def main():
+    print("=" * 70)
+    print("  MIGRACION 016: Cache compartido del analisis del planner")
+    print("=" * 70)
+    print()
+
+    success = run_migration()
+
+    print()
+    if success:
+        print("OK: Migracion completada con exito!")
+    else:
+        print("ERROR: Migracion fallo. Revisa los errores arriba.")
+    print()
+
+
+if __name__ == "__main__":
+    main()
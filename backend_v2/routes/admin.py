@@ -5,21 +5,36 @@ Protegido: requiere rol admin (token access)
 
 import sqlite3
 import sys
+import tempfile
 from pathlib import Path
 
 from flask import Blueprint, jsonify, request
+from werkzeug.utils import secure_filename
 
 try:
     from backend_v2.core.cache import (get_cache_stats,
                                        invalidate_catalog_cache,
                                        invalidate_user_cache)
     from backend_v2.core.config import settings
+    from backend_v2.core.repository import ReferenceDataRepository
+    from backend_v2.core.services.planner_assignment import (
+        invalidate_index, reasignar_planificador)
     from backend_v2.routes.auth import _decode_token
+    from backend_v2.services import anomalias_consumo
+    from backend_v2.services.retention_service import RetentionService
+    from backend_v2.services.stock_sync import (StockSyncService,
+                                                SyncConflictoError)
 except ImportError:
     from core.cache import (get_cache_stats, invalidate_catalog_cache,
                             invalidate_user_cache)
     from core.config import settings
+    from core.repository import ReferenceDataRepository
+    from core.services.planner_assignment import (invalidate_index,
+                                                  reasignar_planificador)
     from routes.auth import _decode_token
+    from services import anomalias_consumo
+    from services.retention_service import RetentionService
+    from services.stock_sync import StockSyncService, SyncConflictoError
 
 bp = Blueprint("admin", __name__, url_prefix="/api/admin")
 
@@ -426,6 +441,7 @@ def admin_planificadores():
                 (data["usuario_id"], a.get("centro"), a.get("sector"), a.get("almacen_virtual")),
             )
         conn.commit()
+        invalidate_index()
     # Obtener usuarios con rol Planificador
     cur.execute(
         "SELECT id_spm, nombre, apellido, rol FROM usuarios WHERE rol LIKE '%Planificador%'"
@@ -467,9 +483,33 @@ def admin_planificadores_mod(usuario_id):
         )
     conn.commit()
     conn.close()
+    invalidate_index()
     return jsonify({"ok": True}), 200
 
 
+@bp.route("/planificadores/<usuario_id>/reasignar", methods=["POST"])
+def admin_planificadores_reasignar(usuario_id):
+    """
+    Baja de un planificador con reasignación en bloque.
+
+    Body (opcional): {"nuevo_planificador_id": "..."} hereda sus asignaciones.
+    Sin reemplazo, sus solicitudes abiertas se resuelven contra las
+    asignaciones restantes.
+    """
+    guard = _admin_guard()
+    if guard:
+        return guard
+    data = request.get_json(silent=True) or {}
+    nuevo = data.get("nuevo_planificador_id")
+    if nuevo is not None and str(nuevo) == str(usuario_id):
+        return jsonify({"ok": False, "error": "El reemplazo debe ser otro planificador"}), 400
+    try:
+        resultado = reasignar_planificador(usuario_id, str(nuevo) if nuevo else None)
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+    return jsonify({"ok": True, **resultado}), 200
+
+
 @bp.route("/presupuestos", methods=["GET", "POST"])
 def admin_presupuestos():
     guard = _admin_guard()
@@ -508,7 +548,8 @@ def admin_presupuestos_mod(centro, sector):
     if request.method == "PUT":
         data = request.get_json(silent=True) or {}
         cur.execute(
-            "UPDATE presupuestos SET monto_usd=?, saldo_usd=? WHERE centro=? AND sector=?",
+            "UPDATE presupuestos SET monto_usd=?, saldo_usd=?, version=COALESCE(version, 0) + 1 "
+            "WHERE centro=? AND sector=?",
             (data.get("monto_usd", 0), data.get("saldo_usd", 0), centro, sector),
         )
     else:
@@ -625,6 +666,7 @@ def admin_proveedores_internos():
                 1 if data.get("excluido") else 0,
             ),
         )
+        ReferenceDataRepository.bump(conn)
         conn.commit()
 
     # Obtener todos los almacenes con info del responsable
@@ -682,6 +724,8 @@ def admin_proveedores_internos_mod(centro, almacen):
             "DELETE FROM config_almacenes WHERE centro = ? AND almacen = ?", (centro, almacen)
         )
 
+    # La config de almacenes cambia el stock visible en los análisis del planner
+    ReferenceDataRepository.bump(conn)
     conn.commit()
     conn.close()
     return jsonify({"ok": True}), 200
@@ -799,3 +843,133 @@ def admin_cache_clear():
     invalidate_user_cache()
 
     return jsonify({"ok": True, "message": "All caches cleared"}), 200
+
+
+# ==============================================================================
+# RETENCION / ARCHIVO
+# ==============================================================================
+
+
+@bp.route("/retencion", methods=["GET", "POST"])
+def admin_retencion():
+    """
+    GET: politicas de retencion y filas candidatas a archivar (sin modificar nada)
+    POST: ejecuta el archivado. Body opcional: {"tables": [...], "vacuum": bool}
+    """
+    guard = _admin_guard()
+    if guard:
+        return guard
+
+    service = RetentionService(db_path=_db_path())
+    if request.method == "GET":
+        return (
+            jsonify(
+                {"ok": True, "policies": service.policies_dict(), "pendientes": service.preview()}
+            ),
+            200,
+        )
+
+    data = request.get_json(silent=True) or {}
+    tables = data.get("tables") or None
+    try:
+        report = service.run(tables=tables, vacuum=bool(data.get("vacuum")))
+    except sqlite3.Error as e:
+        return jsonify({"ok": False, "error": {"code": "retention_failed", "message": str(e)}}), 500
+    return jsonify({"ok": True, "report": report}), 200
+
+
+# ==============================================================================
+# SINCRONIZACION DE STOCK
+# ==============================================================================
+
+
+@bp.route("/stock/sync", methods=["GET", "POST"])
+def admin_stock_sync():
+    """
+    GET: últimas sincronizaciones de stock
+    POST: aplica una exportación de stock (multipart, campo 'archivo' .xlsx o
+    .csv) escribiendo solo las filas que cambiaron. Form/query opcionales:
+    dry_run=1 (solo diferencias), con_bajas=0 (no eliminar claves ausentes)
+    """
+    guard = _admin_guard()
+    if guard:
+        return guard
+
+    service = StockSyncService(db_path=_db_path())
+    if request.method == "GET":
+        limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+        return jsonify({"ok": True, "sincronizaciones": service.historial(limit)}), 200
+
+    archivo = request.files.get("archivo")
+    sufijo = Path(archivo.filename or "").suffix.lower() if archivo else ""
+    if sufijo not in (".xlsx", ".csv"):
+        return (
+            jsonify(
+                {
+                    "ok": False,
+                    "error": {
+                        "code": "invalid_file",
+                        "message": "Se requiere un archivo .xlsx o .csv",
+                    },
+                }
+            ),
+            400,
+        )
+
+    def _flag(nombre: str, default: bool) -> bool:
+        valor = request.values.get(nombre)
+        return default if valor is None else valor.lower() in ("1", "true", "si", "yes")
+
+    payload, _ = _require_admin()
+    with tempfile.TemporaryDirectory() as tmp:
+        nombre = Path(secure_filename(archivo.filename) or "stock").stem
+        path = Path(tmp) / f"{nombre}{sufijo}"
+        archivo.save(path)
+        try:
+            reporte = service.sync(
+                path,
+                dry_run=_flag("dry_run", False),
+                con_bajas=_flag("con_bajas", True),
+                usuario=str((payload or {}).get("user_id") or ""),
+            )
+        except ValueError as e:
+            return jsonify({"ok": False, "error": {"code": "invalid_file", "message": str(e)}}), 400
+        except SyncConflictoError as e:
+            error = {"code": "sync_conflict", "message": str(e)}
+            return jsonify({"ok": False, "error": error}), 409
+        except sqlite3.Error as e:
+            return jsonify({"ok": False, "error": {"code": "sync_failed", "message": str(e)}}), 500
+    return jsonify({"ok": True, "reporte": reporte}), 200
+
+
+# ==============================================================================
+# ANOMALIAS DE CONSUMO
+# ==============================================================================
+
+
+@bp.route("/anomalias/scan", methods=["GET", "POST"])
+def admin_anomalias_scan():
+    """
+    GET: estado del último escaneo de consumo inusual
+    POST: escanea todos los items de las solicitudes enviadas/aprobadas y
+    reemplaza las marcas. JSON opcional: recalcular=true fuerza recalcular
+    las estadísticas de demanda aunque no haya importaciones nuevas
+    """
+    guard = _admin_guard()
+    if guard:
+        return guard
+
+    conn = _connect()
+    try:
+        if request.method == "GET":
+            return jsonify({"ok": True, "estado": anomalias_consumo.estado_escaneo(conn)}), 200
+
+        data = request.get_json(silent=True) or {}
+        if data.get("recalcular"):
+            anomalias_consumo.recalcular_estadisticas(conn)
+        resumen = anomalias_consumo.escanear(conn)
+    except sqlite3.Error as e:
+        return jsonify({"ok": False, "error": {"code": "scan_failed", "message": str(e)}}), 500
+    finally:
+        conn.close()
+    return jsonify({"ok": True, "resumen": resumen}), 200
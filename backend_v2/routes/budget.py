@@ -9,6 +9,7 @@ Endpoints:
 - POST /api/budget-requests/:id/rechazar - Rechazar BUR
 - GET  /api/presupuesto-ledger       - Historial de movimientos
 - GET  /api/presupuesto/:centro/:sector  - Info de presupuesto
+- GET  /api/presupuesto/:centro/:sector/asignacion - Items pendientes a financiar
 """
 
 import sqlite3
@@ -21,14 +22,16 @@ try:
     from backend_v2.core.config import settings
     from backend_v2.core.roles import is_admin, normalize_roles
     from backend_v2.routes.auth import _decode_token
+    from backend_v2.services.asignacion_presupuesto import optimizar
     from backend_v2.services.budget_service import (BURService,
                                                     PresupuestoService)
     from backend_v2.services.notification_service import NotificationService
 except ImportError:
     from core.budget_schemas import NivelAprobacion
     from core.config import settings
-    from core.roles import normalize_roles
+    from core.roles import is_admin, normalize_roles
     from routes.auth import _decode_token
+    from services.asignacion_presupuesto import optimizar
     from services.budget_service import BURService, PresupuestoService
     from services.notification_service import NotificationService
 
@@ -122,10 +125,15 @@ def _resolve_sector_name(sector_value: str) -> str:
     # Si es numerico, intentar buscar por ID
     if sector_value.isdigit():
         conn = _connect()
-        cur = conn.cursor()
-        cur.execute("SELECT nombre FROM catalog_sectores WHERE id = ?", (int(sector_value),))
-        row = cur.fetchone()
-        conn.close()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT nombre FROM catalog_sectores WHERE id = ?", (int(sector_value),))
+            row = cur.fetchone()
+        except sqlite3.OperationalError:
+            # catalog_sectores sin columna id: el sector ya es el nombre
+            row = None
+        finally:
+            conn.close()
         if row:
             return row[0]
 
@@ -165,6 +173,78 @@ def get_presupuesto_info(centro, sector):
     return jsonify({"ok": True, "presupuesto": info.to_dict()}), 200
 
 
+@bp.route("/presupuesto/<centro>/<sector>/asignacion", methods=["GET"])
+def get_asignacion_presupuesto(centro, sector):
+    """
+    Qué items de las solicitudes pendientes del centro/sector financiar con
+    el saldo actual, priorizando por ScoringPipeline y descontando lo que
+    cubre el stock. Query: por_solicitud=true financia solicitudes completas
+    (solo admin o aprobadores de presupuesto)
+    """
+    payload, err = _require_auth()
+    if err:
+        return err
+
+    user = _get_user(str(payload.get("user_id")))
+    if not user:
+        return (
+            jsonify(
+                {
+                    "ok": False,
+                    "error": {"code": "user_not_found", "message": "Usuario no encontrado"},
+                }
+            ),
+            404,
+        )
+
+    rol = user.get("rol", "")
+    aprobador = any(
+        BURService.puede_aprobar_bur(normalize_roles(rol), nivel)
+        for nivel in BURService.ROLES_APROBAR
+    )
+    if not (is_admin(rol) or aprobador):
+        return (
+            jsonify(
+                {
+                    "ok": False,
+                    "error": {
+                        "code": "forbidden",
+                        "message": "Solo admin o aprobadores de presupuesto",
+                    },
+                }
+            ),
+            403,
+        )
+
+    sector_name = _resolve_sector_name(sector)
+    info = PresupuestoService.get_info(centro, sector_name)
+    if not info:
+        return (
+            jsonify(
+                {
+                    "ok": False,
+                    "error": {
+                        "code": "not_found",
+                        "message": f"No existe presupuesto para {centro}/{sector_name}",
+                    },
+                }
+            ),
+            404,
+        )
+
+    por_solicitud = request.args.get("por_solicitud", "false").lower() in ("1", "true", "si")
+    conn = _connect()
+    try:
+        asignacion = optimizar(conn, centro, sector_name, info.saldo_cents, por_solicitud)
+    except (sqlite3.Error, RuntimeError) as e:
+        error = {"code": "optimization_failed", "message": str(e)}
+        return jsonify({"ok": False, "error": error}), 500
+    finally:
+        conn.close()
+
+    return jsonify({"ok": True, "asignacion": asignacion}), 200
+
+
 # ============================================================================
 # Ledger
 # ============================================================================
@@ -181,9 +261,14 @@ def get_ledger():
     sector = request.args.get("sector")
     limit = min(request.args.get("limit", 50, type=int), 200)
     offset = request.args.get("offset", 0, type=int)
+    include_archived = request.args.get("include_archived", "false").lower() == "true"
 
     entries = PresupuestoService.get_ledger(
-        centro=centro, sector=sector, limit=limit, offset=offset
+        centro=centro,
+        sector=sector,
+        limit=limit,
+        offset=offset,
+        include_archived=include_archived,
     )
 
     return (
@@ -335,13 +420,12 @@ def create_budget_request():
     monto = float(monto_usd)
     approvers = _get_approvers_for_level(nivel)
 
-    for approver_id in approvers:
-        if approver_id != user_id:  # No notificar al creador
-            NotificationService.create_notification(
-                destinatario_id=approver_id,
-                mensaje=f"Nueva solicitud de presupuesto por ${monto:,.2f} para {centro}/{sector} requiere tu aprobacion",
-                tipo="warning",
-            )
+    # Una sola transaccion para todo el lote (no notificar al creador)
+    NotificationService.create_notifications_bulk(
+        [approver_id for approver_id in approvers if approver_id != user_id],
+        mensaje=f"Nueva solicitud de presupuesto por ${monto:,.2f} para {centro}/{sector} requiere tu aprobacion",
+        tipo="warning",
+    )
 
     return jsonify(result), 201
 
@@ -438,15 +522,15 @@ def aprobar_budget_request(bur_id):
     nuevo_estado = result.get("nuevo_estado", "aprobado")
 
     if nuevo_estado == "aprobado":
-        NotificationService.create_notification(
-            destinatario_id=solicitante_id,
+        NotificationService.create_notifications_bulk(
+            [solicitante_id],
             mensaje=f"Tu solicitud de presupuesto por ${monto_usd:,.2f} para {bur.centro}/{bur.sector} fue APROBADA",
             tipo="success",
         )
     else:
         # Aprobacion parcial (L1 o L2) - notificar que paso al siguiente nivel
-        NotificationService.create_notification(
-            destinatario_id=solicitante_id,
+        NotificationService.create_notifications_bulk(
+            [solicitante_id],
             mensaje=f"Tu solicitud de presupuesto por ${monto_usd:,.2f} avanzo al siguiente nivel de aprobacion ({nuevo_estado})",
             tipo="info",
         )
@@ -535,8 +619,8 @@ def rechazar_budget_request(bur_id):
     # Notificar al solicitante sobre el rechazo
     solicitante_id = bur.solicitante_id
     monto_usd = bur.monto_solicitado_cents / 100
-    NotificationService.create_notification(
-        destinatario_id=solicitante_id,
+    NotificationService.create_notifications_bulk(
+        [solicitante_id],
         mensaje=f"Tu solicitud de presupuesto por ${monto_usd:,.2f} para {bur.centro}/{bur.sector} fue RECHAZADA. Motivo: {motivo}",
         tipo="error",
     )
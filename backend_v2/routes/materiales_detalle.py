@@ -7,15 +7,21 @@ from flask import Blueprint, jsonify, request
 
 try:
     from backend_v2.core.config import settings
+    from backend_v2.core.services.stock_index import get_stock_index
+    from backend_v2.core.utils import norm_codigo
+    from backend_v2.services import consumo_store
+    from backend_v2.services.atp import ATPService
 except ImportError:
     from core.config import settings
+    from core.services.stock_index import get_stock_index
+    from core.utils import norm_codigo
+    from services import consumo_store
+    from services.atp import ATPService
 
 bp_detalle = Blueprint("materiales_detalle", __name__, url_prefix="/api/materiales")
 
-_STOCK_CACHE = None
 _PEDIDOS_CACHE = None
 _MRP_CACHE = None
-_CONSUMO_CACHE = None
 
 
 def _db_path() -> Path:
@@ -24,30 +30,6 @@ def _db_path() -> Path:
     return Path("spm.db")
 
 
-def _load_stock():
-    global _STOCK_CACHE
-    if _STOCK_CACHE is not None:
-        return _STOCK_CACHE
-    path = Path("backend_v2/stock.xlsx")
-    if not path.exists():
-        _STOCK_CACHE = pd.DataFrame()
-        return _STOCK_CACHE
-    df = pd.read_excel(path, dtype=str)
-    # Normaliza nombres
-    df = df.rename(
-        columns={
-            "Material": "codigo",
-            "Centro": "centro",
-            "Almac\u00e9n": "almacen",
-            "Stock": "stock",
-        }
-    )
-    # Asegura num\u00e9ricos
-    df["stock"] = pd.to_numeric(df.get("stock", 0), errors="coerce").fillna(0)
-    _STOCK_CACHE = df
-    return _STOCK_CACHE
-
-
 def _load_pedidos():
     global _PEDIDOS_CACHE
     if _PEDIDOS_CACHE is not None:
@@ -97,32 +79,6 @@ def _load_mrp():
     return _MRP_CACHE
 
 
-def _load_consumo():
-    """Carga consumo histórico desde docs/consumo historico.xlsx"""
-    global _CONSUMO_CACHE
-    if _CONSUMO_CACHE is not None:
-        return _CONSUMO_CACHE
-    path = Path("docs/consumo historico.xlsx")
-    if not path.exists():
-        _CONSUMO_CACHE = pd.DataFrame()
-        return _CONSUMO_CACHE
-    df = pd.read_excel(path, sheet_name="consumo historico")
-    df = df.rename(
-        columns={
-            "Material": "codigo",
-            "Centro": "centro",
-            "Almacen": "almacen",
-            "Cantidad": "cantidad",
-            "Fecha": "fecha",
-            "Descripcion": "descripcion",
-        }
-    )
-    df["cantidad"] = pd.to_numeric(df.get("cantidad", 0), errors="coerce").fillna(0)
-    df["fecha"] = pd.to_datetime(df.get("fecha"), errors="coerce")
-    _CONSUMO_CACHE = df
-    return _CONSUMO_CACHE
-
-
 @bp_detalle.route("/<codigo>/detalle", methods=["GET"])
 def detalle_material(codigo):
     codigo = str(codigo)
@@ -130,64 +86,36 @@ def detalle_material(codigo):
     almacen_param = (request.args.get("almacen") or "").strip()
     detalle = _detalle_db(codigo)
 
-    stock_df = _load_stock()
     pedidos_df = _load_pedidos()
 
-    stock_total = 0
-    stock_detalle = []
-    stock_detalle_full = []
     pedidos_total = 0
     mrp_data = None
-    consumo_data = None
 
     def _norm(val: str) -> str:
         return (val or "").strip().lstrip("0")
 
-    if not stock_df.empty:
-        df = stock_df.copy()
-        df["codigo_norm"] = df["codigo"].map(_norm)
-        mask = df["codigo_norm"] == _norm(codigo)
+    # Stock desde el índice (almacenes y lotes excluidos ya filtrados)
+    index = get_stock_index()
+    stock_total = index.disponible(codigo, almacen=almacen_param or None)
+    # Disponible para prometer: descuenta lo reservado por solicitudes abiertas
+    stock_comprometido = _stock_comprometido(codigo, almacen_param)
 
-        df["centro_norm"] = df["centro"].map(_norm)
-        df["almacen_norm"] = df["almacen"].map(_norm)
-
-        if centro_param:
-            mask_centro = mask & (df["centro_norm"] == _norm(centro_param))
-        else:
-            mask_centro = mask
+    def _por_lote(centro=None):
+        return [
+            {
+                "centro": r["centro"],
+                "almacen_consultado": r["almacen"],
+                "lote": r["lote"] or "",
+                "stock": r["cantidad"],
+                "libre_disponibilidad": r["libre_disponibilidad"],
+                "responsable": r["responsable"],
+            }
+            for r in index.lotes(codigo, centro, almacen_param or None)
+        ]
 
-        if almacen_param:
-            mask = mask & (df["almacen_norm"] == _norm(almacen_param))
-            mask_centro = mask_centro & (df["almacen_norm"] == _norm(almacen_param))
-
-        stock_total = float(df.loc[mask, "stock"].sum())
-
-        # Detalle por centro/almacen (centrado en el centro solicitado)
-        cols = ["centro", "almacen", "lote", "stock"]
-        if set(cols).issubset(df.columns):
-            stock_detalle = (
-                df.loc[mask_centro, cols]
-                .fillna({"lote": ""})
-                .rename(columns={"almacen": "almacen_consultado"})
-                .to_dict(orient="records")
-            )
-            stock_detalle_full = (
-                df.loc[mask, cols]
-                .fillna({"lote": ""})
-                .rename(columns={"almacen": "almacen_consultado"})
-                .to_dict(orient="records")
-            )
-        else:
-            stock_detalle = (
-                df.loc[mask_centro, ["centro", "almacen", "stock"]]
-                .rename(columns={"almacen": "almacen_consultado"})
-                .to_dict(orient="records")
-            )
-            stock_detalle_full = (
-                df.loc[mask, ["centro", "almacen", "stock"]]
-                .rename(columns={"almacen": "almacen_consultado"})
-                .to_dict(orient="records")
-            )
+    # Detalle por centro/almacen (centrado en el centro solicitado)
+    stock_detalle = _por_lote(centro_param or None)
+    stock_detalle_full = _por_lote()
 
     if not pedidos_df.empty:
         dfp = pedidos_df.copy()
@@ -226,62 +154,14 @@ def detalle_material(codigo):
                 "almacen": r.get("almacen"),
             }
 
-    # Consumo histórico
-    consumo_df = _load_consumo()
-    if not consumo_df.empty:
-        dfc = consumo_df.copy()
-        dfc["codigo_norm"] = dfc["codigo"].astype(str).map(_norm)
-        maskc_base = dfc["codigo_norm"] == _norm(codigo)
-
-        def _filtrar(mask_extra):
-            subset_local = dfc.loc[mask_extra].copy()
-            if subset_local.empty:
-                return None
-            subset_local = subset_local.dropna(subset=["fecha"])
-            subset_local["anio"] = subset_local["fecha"].dt.year
-            total_consumo_local = float(subset_local["cantidad"].sum())
-            if subset_local["anio"].empty:
-                anios_local = 1
-            else:
-                anios_local = max(1, subset_local["anio"].max() - subset_local["anio"].min() + 1)
-            promedio_anual_local = total_consumo_local / anios_local
-            return {
-                "total": total_consumo_local,
-                "promedio_anual": promedio_anual_local,
-                "anio_desde": (
-                    int(subset_local["anio"].min()) if not subset_local["anio"].empty else None
-                ),
-                "anio_hasta": (
-                    int(subset_local["anio"].max()) if not subset_local["anio"].empty else None
-                ),
-                "registros": subset_local.sort_values(by="fecha", ascending=False)
-                .head(5)[["fecha", "cantidad", "centro", "almacen"]]
-                .assign(fecha=lambda x: x["fecha"].dt.strftime("%Y-%m-%d"))
-                .to_dict(orient="records"),
-            }
-
-        mask_full = maskc_base.copy()
-        if centro_param:
-            dfc["centro_norm"] = dfc["centro"].astype(str).map(_norm)
-            mask_full = mask_full & (dfc["centro_norm"] == _norm(centro_param))
-        if almacen_param:
-            dfc["almacen_norm"] = dfc["almacen"].astype(str).map(_norm)
-            mask_full = mask_full & (dfc["almacen_norm"] == _norm(almacen_param))
-
-        consumo_data = _filtrar(mask_full)
-
-        # Si no hay registros para centro+almacen, relajamos a solo centro
-        if consumo_data is None and centro_param:
-            mask_centro = maskc_base & (dfc["centro"].astype(str).map(_norm) == _norm(centro_param))
-            consumo_data = _filtrar(mask_centro)
-
-        # Si sigue vacio, tomamos consumo global por material
-        if consumo_data is None:
-            consumo_data = _filtrar(maskc_base)
+    # Consumo histórico (centro+almacén, si no hay solo centro y si no global)
+    consumo_data = _consumo_material(codigo, centro_param, almacen_param)
 
     detalle.update(
         {
             "stock_total": stock_total,
+            "stock_comprometido": stock_comprometido,
+            "stock_disponible": max(stock_total - stock_comprometido, 0.0),
             "stock_detalle": stock_detalle,
             "stock_detalle_full": stock_detalle_full,
             "pedidos_en_curso": pedidos_total,
@@ -308,6 +188,39 @@ def detalle_material(codigo):
     return jsonify(detalle), 200
 
 
+def _consumo_material(codigo: str, centro: str, almacen: str):
+    path = _db_path()
+    if not path.exists():
+        return None
+    conn = sqlite3.connect(path)
+    try:
+        if not consumo_store.tiene_consumo(conn):
+            return None
+        consumo = consumo_store.resumen_material(conn, codigo, centro, almacen)
+        if consumo is None and centro:
+            consumo = consumo_store.resumen_material(conn, codigo, centro)
+        if consumo is None:
+            consumo = consumo_store.resumen_material(conn, codigo)
+        return consumo
+    finally:
+        conn.close()
+
+
+def _stock_comprometido(codigo: str, almacen: str) -> float:
+    path = _db_path()
+    if not path.exists():
+        return 0.0
+    conn = sqlite3.connect(path)
+    try:
+        comprometido = ATPService.comprometido_batch(conn, [codigo], almacen=almacen or None)
+        return comprometido.get(norm_codigo(codigo), 0.0)
+    except Exception as e:
+        print(f"Error leyendo stock comprometido de {codigo}: {e}")
+        return 0.0
+    finally:
+        conn.close()
+
+
 def _detalle_db(codigo: str) -> dict:
     path = _db_path()
     if not path.exists():
@@ -4,6 +4,7 @@ Rutas API para Sistema de Mensajería Bidireccional
 Endpoints:
 - GET /api/mensajes/inbox - Bandeja de entrada
 - GET /api/mensajes/outbox - Bandeja de salida
+- GET /api/mensajes/threads - Hilos de conversación (resumen paginado)
 - GET /api/mensajes/:id/thread - Hilo de conversación
 - POST /api/mensajes - Enviar nuevo mensaje
 - POST /api/mensajes/:id/reply - Responder mensaje
@@ -57,6 +58,7 @@ def get_inbox():
     - unread_only: bool - Solo no leídos (default: false)
     - limit: int - Cantidad máxima (default: 50, max: 100)
     - offset: int - Offset para paginación (default: 0)
+    - include_archived: bool - Incluir mensajes archivados (default: false)
 
     Returns:
         JSON con lista de mensajes recibidos
@@ -68,9 +70,14 @@ def get_inbox():
     unread_only = request.args.get("unread_only", "false").lower() == "true"
     limit = min(int(request.args.get("limit", 50)), 100)
     offset = int(request.args.get("offset", 0))
+    include_archived = request.args.get("include_archived", "false").lower() == "true"
 
     messages = MessageService.get_inbox(
-        user_id=user_id, unread_only=unread_only, limit=limit, offset=offset
+        user_id=user_id,
+        unread_only=unread_only,
+        limit=limit,
+        offset=offset,
+        include_archived=include_archived,
     )
 
     unread_count = MessageService.get_unread_count(user_id)
@@ -91,6 +98,7 @@ def get_outbox():
     Query params:
     - limit: int - Cantidad máxima (default: 50, max: 100)
     - offset: int - Offset para paginación (default: 0)
+    - include_archived: bool - Incluir mensajes archivados (default: false)
 
     Returns:
         JSON con lista de mensajes enviados
@@ -101,12 +109,39 @@ def get_outbox():
 
     limit = min(int(request.args.get("limit", 50)), 100)
     offset = int(request.args.get("offset", 0))
+    include_archived = request.args.get("include_archived", "false").lower() == "true"
 
-    messages = MessageService.get_outbox(user_id=user_id, limit=limit, offset=offset)
+    messages = MessageService.get_outbox(
+        user_id=user_id, limit=limit, offset=offset, include_archived=include_archived
+    )
 
     return jsonify({"ok": True, "total": len(messages), "messages": messages}), 200
 
 
+@bp.route("/threads", methods=["GET"])
+def get_threads():
+    """
+    Listar hilos de conversación del usuario, del más reciente al más antiguo
+
+    Query params:
+    - limit: int - Cantidad máxima (default: 50, max: 100)
+    - offset: int - Offset para paginación (default: 0)
+
+    Returns:
+        JSON con hilos (último mensaje, no leídos, participantes)
+    """
+    user_id = _get_user_from_token()
+    if not user_id:
+        return jsonify({"ok": False, "error": "Unauthorized"}), 401
+
+    limit = min(int(request.args.get("limit", 50)), 100)
+    offset = int(request.args.get("offset", 0))
+
+    threads = MessageService.get_threads(user_id=user_id, limit=limit, offset=offset)
+
+    return jsonify({"ok": True, "total": len(threads), "threads": threads}), 200
+
+
 @bp.route("/<int:message_id>/thread", methods=["GET"])
 def get_thread(message_id):
     """
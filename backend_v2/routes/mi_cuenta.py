@@ -17,9 +17,17 @@ from flask import Blueprint, jsonify, request
 try:
     from backend_v2.core.config import settings
     from backend_v2.routes.auth import _decode_token
+    from backend_v2.services.message_service import MessageService
+    from backend_v2.services.message_threads import MessageThreadService
+    from backend_v2.services.notification_service import NotificationService
+    from backend_v2.services.unread_counters import UnreadCounterService
 except ImportError:
     from core.config import settings
     from routes.auth import _decode_token
+    from services.message_service import MessageService
+    from services.message_threads import MessageThreadService
+    from services.notification_service import NotificationService
+    from services.unread_counters import UnreadCounterService
 
 bp = Blueprint("mi_cuenta", __name__)
 logger = logging.getLogger(__name__)
@@ -322,6 +330,7 @@ def update_contacto():
         if affected == 0:
             return jsonify({"ok": False, "error": {"message": "Usuario no encontrado"}}), 404
 
+        MessageService.invalidate_user_directory()
         logger.info(f"Contacto actualizado para usuario {user_id}")
         return (
             jsonify(
@@ -413,17 +422,12 @@ def solicitar_cambio_perfil():
 
         mensaje = f"Nueva solicitud de cambio de perfil de {nombre_solicitante}. Campos: {', '.join(cambios.keys())}"
 
-        for admin in admins:
-            admin_id = admin[0]
-            cur.execute(
-                """INSERT INTO notificaciones (destinatario_id, solicitud_id, mensaje, leido, created_at)
-                   VALUES (?, ?, ?, 0, ?)""",
-                (admin_id, request_id, mensaje, now),
-            )
-
-        conn.commit()
         conn.close()
 
+        NotificationService.create_notifications_bulk(
+            [admin[0] for admin in admins], mensaje=mensaje, solicitud_id=request_id
+        )
+
         logger.info(
             f"Solicitud de cambio de perfil registrada: {request_id} para usuario {user_id}. Notificados {len(admins)} admin(s)"
         )
@@ -657,14 +661,20 @@ def enviar_mensaje_solicitud(request_id: int):
         # Crear mensaje en la tabla mensajes
         asunto = f"Consulta sobre solicitud de cambio de perfil #{request_id}"
 
+        UnreadCounterService.ensure_table(conn)
+        MessageThreadService.ensure_tables(conn)
         cur.execute(
             """INSERT INTO mensajes (remitente_id, destinatario_id, asunto, mensaje, leido, created_at)
                VALUES (?, ?, ?, ?, 0, ?)""",
             (user_id, destinatario_id, asunto, mensaje, now),
         )
+        mensaje_id = cur.lastrowid
+        UnreadCounterService.adjust(conn, destinatario_id, "unread_messages", 1)
+        MessageThreadService.record_message(
+            conn, mensaje_id, None, user_id, destinatario_id, asunto, mensaje, None, now
+        )
 
         conn.commit()
-        mensaje_id = cur.lastrowid
         conn.close()
 
         logger.info(f"Usuario {user_id} envió mensaje al admin sobre solicitud {request_id}")
@@ -990,14 +1000,18 @@ def admin_aprobar_profile_request(request_id: int):
         if comentario:
             mensaje += f": {comentario}"
 
+        UnreadCounterService.ensure_table(conn)
         cur.execute(
             """INSERT INTO notificaciones (destinatario_id, solicitud_id, mensaje, tipo, leido, created_at)
                VALUES (?, ?, ?, ?, 0, ?)""",
             (usuario_id, request_id, mensaje, "profile_approved", now),
         )
+        UnreadCounterService.adjust(conn, usuario_id, "unread_notifications", 1)
 
         conn.commit()
         conn.close()
+        if updates:
+            MessageService.invalidate_user_directory()
 
         logger.info(f"Solicitud de perfil {request_id} aprobada por {user_id}")
 
@@ -1073,11 +1087,13 @@ def admin_rechazar_profile_request(request_id: int):
         # Crear notificación para el solicitante
         mensaje = f"Tu solicitud de cambio de perfil #{request_id} ha sido rechazada: {motivo}"
 
+        UnreadCounterService.ensure_table(conn)
         cur.execute(
             """INSERT INTO notificaciones (destinatario_id, solicitud_id, mensaje, tipo, leido, created_at)
                VALUES (?, ?, ?, ?, 0, ?)""",
             (usuario_id, request_id, mensaje, "profile_rejected", now),
         )
+        UnreadCounterService.adjust(conn, usuario_id, "unread_notifications", 1)
 
         conn.commit()
         conn.close()
@@ -1139,14 +1155,20 @@ def admin_enviar_mensaje_profile_request(request_id: int):
         # Crear mensaje en la tabla mensajes
         asunto = f"Sobre tu solicitud de cambio de perfil #{request_id}"
 
+        UnreadCounterService.ensure_table(conn)
+        MessageThreadService.ensure_tables(conn)
         cur.execute(
             """INSERT INTO mensajes (remitente_id, destinatario_id, asunto, mensaje, leido, created_at)
                VALUES (?, ?, ?, ?, 0, ?)""",
             (user_id, destinatario_id, asunto, mensaje, now),
         )
+        mensaje_id = cur.lastrowid
+        UnreadCounterService.adjust(conn, destinatario_id, "unread_messages", 1)
+        MessageThreadService.record_message(
+            conn, mensaje_id, None, user_id, destinatario_id, asunto, mensaje, None, now
+        )
 
         conn.commit()
-        mensaje_id = cur.lastrowid
         conn.close()
 
         logger.info(f"Mensaje enviado a {destinatario_id} sobre solicitud {request_id}")
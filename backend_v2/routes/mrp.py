@@ -10,6 +10,31 @@ from typing import Dict
 
 from flask import Blueprint, g, jsonify, request
 
+try:
+    from backend_v2.core.cache_loader import get_equivalencias_cache
+    from backend_v2.services.mrp_alertas import (consultar_alertas,
+                                                 resumen_desde_conteos)
+    from backend_v2.services.mrp_kpis import (kpis_centro,
+                                              kpis_todos_los_centros)
+    from backend_v2.services.mrp_parametros import (listar_sugerencias,
+                                                    revisar_sugerencias)
+    from backend_v2.services.mrp_proyeccion import (HORIZONTE_DEFAULT,
+                                                    consultar_proyeccion)
+    from backend_v2.services.mrp_rebalanceo import (ejecutar_traslados,
+                                                    hay_corridas,
+                                                    listar_traslados,
+                                                    recalcular_rebalanceo,
+                                                    revisar_traslados)
+except ImportError:
+    from core.cache_loader import get_equivalencias_cache
+    from services.mrp_alertas import consultar_alertas, resumen_desde_conteos
+    from services.mrp_kpis import kpis_centro, kpis_todos_los_centros
+    from services.mrp_parametros import listar_sugerencias, revisar_sugerencias
+    from services.mrp_proyeccion import HORIZONTE_DEFAULT, consultar_proyeccion
+    from services.mrp_rebalanceo import (ejecutar_traslados, hay_corridas,
+                                         listar_traslados, recalcular_rebalanceo,
+                                         revisar_traslados)
+
 bp = Blueprint("mrp", __name__, url_prefix="/api/mrp")
 
 
@@ -175,84 +200,29 @@ def get_alertas():
     offset = int(request.args.get("offset", 0))
 
     conn = get_db_connection()
-    cursor = conn.cursor()
 
     try:
-        # Obtener materiales MRP con datos reales de la tabla materiales_mrp
-        base_query = """
-            SELECT
-                codigo_material as codigo,
-                descripcion,
-                sector,
-                almacen,
-                centro,
-                stock_seguridad,
-                punto_pedido,
-                stock_maximo,
-                stock_actual,
-                pedidos_en_curso,
-                consumo_promedio_mensual,
-                lead_time_dias,
-                critico,
-                ubicacion
-            FROM materiales_mrp
-            WHERE 1=1
-        """
-        params = []
-
-        if centro:
-            base_query += " AND centro = ?"
-            params.append(int(centro))
-
-        if almacen:
-            base_query += " AND almacen = ?"
-            params.append(int(almacen))
-
-        if sector:
-            base_query += " AND sector = ?"
-            params.append(sector)
-
-        base_query += " ORDER BY codigo_material"
-
-        cursor.execute(base_query, params)
-        materiales = cursor.fetchall()
-
-        # Calcular alertas para cada material
-        alertas = []
-
-        for mat in materiales:
-            codigo = mat["codigo"]
+        # Estado (materializado), filtro, conteos y paginación se resuelven en SQL
+        resultado = consultar_alertas(
+            conn,
+            centro=int(centro) if centro else None,
+            almacen=int(almacen) if almacen else None,
+            sector=sector or None,
+            estado=estado_filtro,
+            limit=limit,
+            offset=offset,
+        )
+
+        alertas_paginadas = []
+        for mat in resultado["rows"]:
             stock_actual = mat["stock_actual"] or 0
-            stock_seguridad = mat["stock_seguridad"] or 0
-            punto_pedido = mat["punto_pedido"] or 0
-            stock_maximo = mat["stock_maximo"] or 0
-            pedidos_en_curso = mat["pedidos_en_curso"] or 0
             consumo_mensual = mat["consumo_promedio_mensual"] or 0
 
             # Calcular demanda anual desde consumo mensual
             demanda_anual = consumo_mensual * 12
-
-            # Calcular rotación
-            rotacion = calcular_rotacion(demanda_anual, stock_actual) if stock_actual > 0 else 0
-
-            # Calcular estado y sugerencia
-            estado_info = calcular_estado_material(
-                stock_actual=stock_actual,
-                stock_seguridad=stock_seguridad,
-                punto_pedido=punto_pedido,
-                stock_maximo=stock_maximo,
-                consumo_promedio=consumo_mensual,
-                pedidos_en_curso=pedidos_en_curso,
-            )
-
-            # Filtrar por estado si se especificó
-            if estado_filtro and estado_filtro.lower() != "todos":
-                if estado_filtro.lower() not in estado_info["estado"].lower():
-                    continue
-
-            alertas.append(
+            alertas_paginadas.append(
                 {
-                    "codigo": codigo,
+                    "codigo": mat["codigo"],
                     "descripcion": mat["descripcion"],
                     "unidad": "UNI",
                     "precio_usd": 0,
@@ -260,40 +230,26 @@ def get_alertas():
                     "sector": mat["sector"] or sector,
                     "almacen": mat["almacen"] or almacen or "1",
                     "demanda_estimada_anual": round(demanda_anual, 0),
-                    "stock_seguridad": stock_seguridad,
-                    "punto_pedido": punto_pedido,
-                    "stock_maximo": stock_maximo,
+                    "stock_seguridad": mat["stock_seguridad"] or 0,
+                    "punto_pedido": mat["punto_pedido"] or 0,
+                    "stock_maximo": mat["stock_maximo"] or 0,
                     "stock_actual": stock_actual,
-                    "pedidos_en_curso": pedidos_en_curso,
+                    "pedidos_en_curso": mat["pedidos_en_curso"] or 0,
                     "solpeds_en_curso": 0,
                     "ventas_ute_en_curso": 0,
                     "consumo_promedio_anual": round(demanda_anual, 2),
-                    "rotacion_pct": round(rotacion * 100, 1),
-                    "estado": estado_info["estado"],
-                    "estado_clase": estado_info["estado_clase"],
-                    "sugerencia": estado_info["sugerencia"],
+                    "rotacion_pct": round((mat["rotacion"] or 0) * 100, 1),
+                    "cobertura_meses": mat["cobertura_meses"],
+                    "estado": mat["estado"],
+                    "estado_clase": mat["estado_clase"],
+                    "sugerencia": mat["sugerencia"],
                     "critico": mat["critico"],
                     "ubicacion": mat["ubicacion"],
                 }
             )
 
-        # Aplicar paginación
-        total = len(alertas)
-        alertas_paginadas = alertas[offset : offset + limit]
-
-        # Resumen de estados
-        resumen = {
-            "total": total,
-            "quiebre_stock": sum(1 for a in alertas if "quiebre" in a["estado"].lower()),
-            "bajo_punto_pedido": sum(1 for a in alertas if "bajo punto" in a["estado"].lower()),
-            "bajo_stock_seguridad": sum(1 for a in alertas if "bajo stock" in a["estado"].lower()),
-            "sobrestock": sum(
-                1
-                for a in alertas
-                if "exceso" in a["estado"].lower() or "sobrestock" in a["estado"].lower()
-            ),
-            "normal": sum(1 for a in alertas if a["estado"].lower() == "normal"),
-        }
+        resumen = resumen_desde_conteos(resultado["conteos"])
+        total = resumen["total"]
 
         return jsonify(
             {
@@ -318,159 +274,106 @@ def get_alertas():
         conn.close()
 
 
-@bp.route("/kpis", methods=["GET"])
+@bp.route("/proyeccion", methods=["GET"])
 @require_planner_or_admin
-def get_kpis():
+def get_proyeccion():
     """
-    Obtiene los KPIs MRP.
+    Proyección de stock: fecha de quiebre, días de cobertura y fecha límite
+    de pedido de cada material.
 
     Query params:
-        centro: Filtro por centro (opcional, reservado para futuro uso)
-        periodo: Período de análisis ('mes', 'trimestre', 'anio') - default 'mes'
+        centro: Filtro por centro (opcional)
+        almacen: Filtro por almacén (opcional)
+        sector: Filtro por sector (opcional)
+        horizonte: Días a proyectar (default 180, máximo 730)
+        paso: 'dia' o 'semana' (default 'dia')
+        solo_quiebre: 'true' para devolver solo materiales que quiebran en el horizonte
+        serie: 'true' para incluir los niveles proyectados de cada material
+        limit: Límite de resultados (default 50)
+        offset: Offset para paginación (default 0)
     """
-    _ = request.args.get("centro", "").strip()  # Reservado para filtro por centro
-    periodo = request.args.get("periodo", "mes").strip()
+    centro = request.args.get("centro", "").strip()
+    almacen = request.args.get("almacen", "").strip()
+    sector = request.args.get("sector", "").strip()
+    horizonte = int(request.args.get("horizonte", HORIZONTE_DEFAULT))
+    paso = request.args.get("paso", "dia").strip()
+    solo_quiebre = request.args.get("solo_quiebre", "").lower() in ("1", "true", "si")
+    incluir_serie = request.args.get("serie", "").lower() in ("1", "true", "si")
+    limit = min(int(request.args.get("limit", 50)), 200)
+    offset = int(request.args.get("offset", 0))
 
     conn = get_db_connection()
-    cursor = conn.cursor()
 
     try:
-        # Calcular fechas según período
-        hoy = datetime.now()
-        if periodo == "anio":
-            fecha_inicio = hoy - timedelta(days=365)
-        elif periodo == "trimestre":
-            fecha_inicio = hoy - timedelta(days=90)
-        else:  # mes
-            fecha_inicio = hoy - timedelta(days=30)
-
-        fecha_inicio_str = fecha_inicio.strftime("%Y-%m-%d")
-
-        # Total de materiales MRP
-        cursor.execute("SELECT COUNT(*) as total FROM materiales_mrp")
-        total_materiales = cursor.fetchone()["total"]
-
-        # Materiales con solicitudes en el período (reservado para uso futuro)
-        cursor.execute(
-            """
-            SELECT COUNT(DISTINCT json_extract(value, '$.codigo')) as total
-            FROM solicitudes, json_each(data_json)
-            WHERE created_at >= ?
-        """,
-            (fecha_inicio_str,),
+        resultado = consultar_proyeccion(
+            conn,
+            centro=int(centro) if centro else None,
+            almacen=int(almacen) if almacen else None,
+            sector=sector or None,
+            horizonte_dias=horizonte,
+            paso=paso,
+            solo_quiebre=solo_quiebre,
+            limit=limit,
+            offset=offset,
+            incluir_serie=incluir_serie,
         )
-        _ = cursor.fetchone()["total"]  # materiales_con_demanda - para KPI futuro
+        total = resultado["total"]
 
-        # Solpeds creadas vs completadas
-        cursor.execute(
-            """
-            SELECT
-                COUNT(*) as total,
-                SUM(CASE WHEN status = 'creada' THEN 1 ELSE 0 END) as pendientes,
-                SUM(CASE WHEN status = 'enviada' THEN 1 ELSE 0 END) as enviadas,
-                SUM(CASE WHEN status = 'completada' THEN 1 ELSE 0 END) as completadas
-            FROM solpeds
-            WHERE created_at >= ?
-        """,
-            (fecha_inicio_str,),
+        return jsonify(
+            {
+                "ok": True,
+                "data": resultado["rows"],
+                "resumen": resultado["resumen"],
+                "pagination": {
+                    "total": total,
+                    "limit": limit,
+                    "offset": offset,
+                    "has_more": (offset + limit) < total,
+                },
+            }
         )
-        solpeds_stats = cursor.fetchone()
 
-        # Calcular lead time promedio (simulado por ahora)
-        # En producción, esto vendría de datos reales de órdenes de compra
-        lead_time_promedio = 15  # días
-        lead_time_objetivo = 12  # días
+    except Exception as e:
+        import traceback
 
-        # Pedidos vencidos (simulado)
-        cursor.execute(
-            """
-            SELECT COUNT(*) as total
-            FROM purchase_orders
-            WHERE status = 'emitida'
-            AND created_at < date('now', '-30 days')
-        """
-        )
-        pedidos_vencidos = cursor.fetchone()["total"]
+        traceback.print_exc()
+        return jsonify({"ok": False, "error": {"code": "db_error", "message": str(e)}}), 500
+    finally:
+        conn.close()
 
-        # Calcular KPIs
-        total_solpeds = solpeds_stats["total"] or 0
-        solpeds_completadas = solpeds_stats["completadas"] or 0
 
-        # % materiales en riesgo (simulado basado en hash)
-        pct_en_riesgo = round((total_materiales % 20) + 5, 1)  # 5-25%
-        pct_sobrestock = round((total_materiales % 15) + 3, 1)  # 3-18%
+@bp.route("/kpis", methods=["GET"])
+@require_planner_or_admin
+def get_kpis():
+    """
+    Obtiene los KPIs MRP.
 
-        # Rotación promedio (simulado)
-        rotacion_promedio = round(2.5 + (total_materiales % 30) / 10, 2)
+    Query params:
+        centro: Filtro por centro (opcional; sin centro, total de la empresa)
+        periodo: Período de análisis ('mes', 'trimestre', 'anio') - default 'mes'
+    """
+    centro = request.args.get("centro", "").strip()
+    periodo = request.args.get("periodo", "mes").strip()
 
-        # Cumplimiento MRP
-        cumplimiento_mrp = round(
-            (solpeds_completadas / total_solpeds * 100) if total_solpeds > 0 else 85, 1
-        )
+    conn = get_db_connection()
 
-        # Velocidad de respuesta (días promedio para resolver alertas)
-        velocidad_respuesta = round(3 + (total_materiales % 5) / 2, 1)
-
-        kpis = {
-            "materiales_en_riesgo": {
-                "valor": pct_en_riesgo,
-                "unidad": "%",
-                "tendencia": "up" if pct_en_riesgo > 10 else "down",
-                "descripcion": "Materiales por quiebre o bajo punto de pedido",
-            },
-            "materiales_sobrestock": {
-                "valor": pct_sobrestock,
-                "unidad": "%",
-                "tendencia": "stable",
-                "descripcion": "Materiales con exceso de inventario",
-            },
-            "rotacion_promedio": {
-                "valor": rotacion_promedio,
-                "unidad": "veces/año",
-                "tendencia": "up" if rotacion_promedio > 3 else "down",
-                "descripcion": "Rotación promedio del portafolio",
-            },
-            "lead_time_promedio": {
-                "valor": lead_time_promedio,
-                "unidad": "días",
-                "objetivo": lead_time_objetivo,
-                "tendencia": "up" if lead_time_promedio > lead_time_objetivo else "down",
-                "descripcion": "Tiempo promedio de entrega",
-            },
-            "cumplimiento_mrp": {
-                "valor": cumplimiento_mrp,
-                "unidad": "%",
-                "tendencia": "up" if cumplimiento_mrp > 80 else "down",
-                "descripcion": "Nivel de cumplimiento del plan MRP",
-            },
-            "pedidos_vencidos": {
-                "valor": pedidos_vencidos,
-                "unidad": "pedidos",
-                "tendencia": "down" if pedidos_vencidos < 5 else "up",
-                "descripcion": "Pedidos con más de 30 días sin completar",
-            },
-            "pct_pedidos_vencidos": {
-                "valor": round(
-                    (pedidos_vencidos / total_solpeds * 100) if total_solpeds > 0 else 0, 1
-                ),
-                "unidad": "%",
-                "tendencia": "down" if pedidos_vencidos < 5 else "up",
-                "descripcion": "Porcentaje de pedidos vencidos",
-            },
-            "velocidad_respuesta": {
-                "valor": velocidad_respuesta,
-                "unidad": "días",
-                "tendencia": "down" if velocidad_respuesta < 5 else "up",
-                "descripcion": "Tiempo promedio para resolver alertas",
-            },
-        }
+    try:
+        hoy = datetime.now()
+
+        # KPIs reales del centro (o del total), servidos desde el lote cacheado
+        resultado = kpis_centro(conn, centro or None, periodo, hoy.date())
+        kpis = resultado["kpis"]
+        total_materiales = int(resultado["sumas"]["materiales"])
+        pct_en_riesgo = kpis["materiales_en_riesgo"]["valor"]
+        pct_sobrestock = kpis["materiales_sobrestock"]["valor"]
+        fecha_inicio_str = resultado["fecha_inicio"]
 
         # Datos para gráficos
         graficos = {
             "distribucion_estados": [
                 {
                     "nombre": "Normal",
-                    "valor": 100 - pct_en_riesgo - pct_sobrestock,
+                    "valor": round(100 - pct_en_riesgo - pct_sobrestock, 1),
                     "color": "#22c55e",
                 },
                 {"nombre": "En Riesgo", "valor": pct_en_riesgo, "color": "#ef4444"},
@@ -521,7 +424,7 @@ def get_kpis():
                 "ok": True,
                 "kpis": kpis,
                 "graficos": graficos,
-                "periodo": periodo,
+                "periodo": resultado["periodo"],
                 "fecha_inicio": fecha_inicio_str,
                 "fecha_fin": hoy.strftime("%Y-%m-%d"),
                 "total_materiales": total_materiales,
@@ -537,6 +440,253 @@ def get_kpis():
         conn.close()
 
 
+@bp.route("/kpis/centros", methods=["GET"])
+@require_planner_or_admin
+def get_kpis_centros():
+    """
+    KPIs MRP de todos los centros en una sola respuesta (vista general de admin).
+
+    Query params:
+        periodo: Período de análisis ('mes', 'trimestre', 'anio') - default 'mes'
+    """
+    periodo = request.args.get("periodo", "mes").strip()
+
+    conn = get_db_connection()
+
+    try:
+        lote = kpis_todos_los_centros(conn, periodo)
+        return jsonify(
+            {
+                "ok": True,
+                "periodo": lote["periodo"],
+                "fecha_inicio": lote["fecha_inicio"],
+                "fecha_fin": lote["fecha_fin"],
+                "centros": {
+                    centro: datos["kpis"] for centro, datos in lote["centros"].items()
+                },
+                "total": lote["total"]["kpis"],
+            }
+        )
+
+    except Exception as e:
+        import traceback
+
+        traceback.print_exc()
+        return jsonify({"ok": False, "error": {"code": "db_error", "message": str(e)}}), 500
+    finally:
+        conn.close()
+
+
+@bp.route("/sugerencias", methods=["GET"])
+@require_planner_or_admin
+def get_sugerencias():
+    """
+    Parámetros MRP sugeridos desde el consumo histórico, para revisión.
+
+    Query params:
+        centro: Filtro por centro (opcional)
+        estado: 'pendiente' (default), 'aceptada', 'rechazada' o 'todos'
+        limit: Límite de resultados (default 50)
+        offset: Offset para paginación (default 0)
+    """
+    centro = request.args.get("centro", "").strip()
+    estado = request.args.get("estado", "pendiente").strip().lower()
+    limit = min(int(request.args.get("limit", 50)), 200)
+    offset = int(request.args.get("offset", 0))
+
+    conn = get_db_connection()
+
+    try:
+        resultado = listar_sugerencias(
+            conn,
+            centro=int(centro) if centro else None,
+            estado=None if estado == "todos" else estado,
+            limit=limit,
+            offset=offset,
+        )
+        total = resultado["total"]
+        return jsonify(
+            {
+                "ok": True,
+                "data": resultado["rows"],
+                "pagination": {
+                    "total": total,
+                    "limit": limit,
+                    "offset": offset,
+                    "has_more": (offset + limit) < total,
+                },
+            }
+        )
+
+    except Exception as e:
+        return jsonify({"ok": False, "error": {"code": "db_error", "message": str(e)}}), 500
+    finally:
+        conn.close()
+
+
+@bp.route("/sugerencias/revisar", methods=["POST"])
+@require_planner_or_admin
+def revisar_sugerencias_mrp():
+    """
+    Aceptar o rechazar sugerencias de parámetros.
+
+    Body:
+        ids: Lista de ids de sugerencias pendientes
+        accion: 'aceptar' (copia los parámetros a materiales_mrp) o 'rechazar'
+    """
+    payload = request.get_json(silent=True) or {}
+    ids = payload.get("ids") or []
+    accion = payload.get("accion")
+    if accion not in ("aceptar", "rechazar") or not isinstance(ids, list):
+        return (
+            jsonify(
+                {
+                    "ok": False,
+                    "error": {
+                        "code": "invalid_request",
+                        "message": "Se requiere 'ids' (lista) y 'accion' (aceptar/rechazar)",
+                    },
+                }
+            ),
+            400,
+        )
+
+    conn = get_db_connection()
+
+    try:
+        usuario = g.user.get("id_spm") or g.user.get("id") or ""
+        revisadas = revisar_sugerencias(
+            conn, [int(i) for i in ids], accion == "aceptar", str(usuario)
+        )
+        return jsonify({"ok": True, "revisadas": revisadas})
+
+    except Exception as e:
+        return jsonify({"ok": False, "error": {"code": "db_error", "message": str(e)}}), 500
+    finally:
+        conn.close()
+
+
+@bp.route("/rebalanceo", methods=["GET"])
+@require_planner_or_admin
+def get_rebalanceo():
+    """
+    Traslados sugeridos entre centros/almacenes (excedente -> déficit).
+
+    La primera consulta calcula el rebalanceo si nunca se corrió.
+
+    Query params:
+        centro: Centro de origen o destino (opcional)
+        codigo: Material pedido o de origen (opcional)
+        estado: 'pendiente' (default), 'aceptada', 'rechazada', 'ejecutada' o 'todos'
+        limit: Límite de resultados (default 50)
+        offset: Offset para paginación (default 0)
+    """
+    centro = request.args.get("centro", "").strip()
+    codigo = request.args.get("codigo", "").strip()
+    estado = request.args.get("estado", "pendiente").strip().lower()
+    limit = min(int(request.args.get("limit", 50)), 200)
+    offset = int(request.args.get("offset", 0))
+
+    conn = get_db_connection()
+
+    try:
+        if not hay_corridas(conn):
+            recalcular_rebalanceo(conn, get_equivalencias_cache())
+        resultado = listar_traslados(
+            conn,
+            centro=int(centro) if centro else None,
+            codigo=codigo or None,
+            estado=None if estado == "todos" else estado,
+            limit=limit,
+            offset=offset,
+        )
+        total = resultado["total"]
+        return jsonify(
+            {
+                "ok": True,
+                "data": resultado["rows"],
+                "pagination": {
+                    "total": total,
+                    "limit": limit,
+                    "offset": offset,
+                    "has_more": (offset + limit) < total,
+                },
+            }
+        )
+
+    except Exception as e:
+        return jsonify({"ok": False, "error": {"code": "db_error", "message": str(e)}}), 500
+    finally:
+        conn.close()
+
+
+@bp.route("/rebalanceo", methods=["POST"])
+@require_planner_or_admin
+def recalcular_rebalanceo_mrp():
+    """
+    Recalcular el rebalanceo sobre todo materiales_mrp.
+
+    Reemplaza los traslados pendientes; los revisados se conservan.
+    """
+    conn = get_db_connection()
+
+    try:
+        resumen = recalcular_rebalanceo(conn, get_equivalencias_cache())
+        return jsonify({"ok": True, "resumen": resumen})
+
+    except Exception as e:
+        return jsonify({"ok": False, "error": {"code": "db_error", "message": str(e)}}), 500
+    finally:
+        conn.close()
+
+
+@bp.route("/rebalanceo/revisar", methods=["POST"])
+@require_planner_or_admin
+def revisar_rebalanceo():
+    """
+    Aceptar o rechazar traslados sugeridos, o marcar ejecutados los aceptados.
+
+    Body:
+        ids: Lista de ids de traslados pendientes (aceptados para 'ejecutar')
+        accion: 'aceptar', 'rechazar' o 'ejecutar'
+    """
+    payload = request.get_json(silent=True) or {}
+    ids = payload.get("ids") or []
+    accion = payload.get("accion")
+    if accion not in ("aceptar", "rechazar", "ejecutar") or not isinstance(ids, list):
+        return (
+            jsonify(
+                {
+                    "ok": False,
+                    "error": {
+                        "code": "invalid_request",
+                        "message": (
+                            "Se requiere 'ids' (lista) y 'accion' "
+                            "(aceptar/rechazar/ejecutar)"
+                        ),
+                    },
+                }
+            ),
+            400,
+        )
+
+    conn = get_db_connection()
+
+    try:
+        usuario = g.user.get("id_spm") or g.user.get("id") or ""
+        ids = [int(i) for i in ids]
+        if accion == "ejecutar":
+            revisados = ejecutar_traslados(conn, ids, str(usuario))
+        else:
+            revisados = revisar_traslados(conn, ids, accion == "aceptar", str(usuario))
+        return jsonify({"ok": True, "revisados": revisados})
+
+    except Exception as e:
+        return jsonify({"ok": False, "error": {"code": "db_error", "message": str(e)}}), 500
+    finally:
+        conn.close()
+
+
 @bp.route("/catalogos", methods=["GET"])
 @require_auth
 def get_catalogos():
@@ -10,6 +10,7 @@ Endpoints:
 """
 
 import json
+import threading
 import time
 
 from flask import Blueprint, Response, jsonify, request, stream_with_context
@@ -26,6 +27,19 @@ except ImportError:
 
 bp = Blueprint("notificaciones", __name__, url_prefix="/api/notificaciones")
 
+# Los streams de este proceso esperan sobre esta condición; el listener del
+# servicio los despierta apenas se crea una notificación (o un lote)
+_nuevas_notificaciones = threading.Condition()
+
+
+def _despertar_streams(notifications):
+    """Listener de NotificationService: despierta los streams SSE en espera"""
+    with _nuevas_notificaciones:
+        _nuevas_notificaciones.notify_all()
+
+
+NotificationService.add_listener(_despertar_streams)
+
 
 def _get_user_from_token():
     """
@@ -60,6 +74,7 @@ def list_notifications():
     Query params:
     - unread_only: bool - Solo no leídas (default: false)
     - limit: int - Cantidad máxima (default: 50, max: 100)
+    - include_archived: bool - Incluir notificaciones archivadas (default: false)
 
     Returns:
         JSON con lista de notificaciones y contador de no leídas
@@ -70,9 +85,10 @@ def list_notifications():
 
     unread_only = request.args.get("unread_only", "false").lower() == "true"
     limit = min(int(request.args.get("limit", 50)), 100)
+    include_archived = request.args.get("include_archived", "false").lower() == "true"
 
     notifications = NotificationService.get_user_notifications(
-        user_id=user_id, unread_only=unread_only, limit=limit
+        user_id=user_id, unread_only=unread_only, limit=limit, include_archived=include_archived
     )
 
     unread_count = NotificationService.get_unread_count(user_id)
@@ -200,9 +216,10 @@ def notification_stream():
                 yield ": heartbeat\n\n"
                 last_check = current_time
 
-            # Verificar nuevas notificaciones (polling cada 2 segundos)
-            # En producción, usar Redis pub/sub
-            time.sleep(2)
+            # Despierta al crearse una notificación en este proceso; el timeout
+            # de 2 segundos cubre las creadas por otros workers
+            with _nuevas_notificaciones:
+                _nuevas_notificaciones.wait(timeout=2)
 
             new_notifications = NotificationService.get_user_notifications(user_id, limit=10)
 
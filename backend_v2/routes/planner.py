@@ -12,18 +12,30 @@ try:
                                         error_validation)
     from backend_v2.core.schemas import (ResultadoPaso1, ResultadoPaso2,
                                          ResultadoPaso3)
+    from backend_v2.core.services.planner_analysis_cache import get_analysis
+    from backend_v2.core.services.planner_queue import cola_planificador
     from backend_v2.core.services.planner_service import (
-        paso_1_analizar_solicitud, paso_2_opciones_abastecimiento,
+        paso_2_opciones_abastecimiento, paso_2_opciones_abastecimiento_batch,
         paso_3_guardar_tratamiento)
+    from backend_v2.core.services.stock_index import get_stock_index
     from backend_v2.routes.auth import _decode_token
+    from backend_v2.services import consumo_store
+    from backend_v2.services.atp import actualizar_compromisos
+    from backend_v2.services.audit_log import get_audit_log
 except ImportError:
     from core.config import settings
     from core.errors import (error_forbidden, error_internal, error_not_found,
                              error_validation)
-    from core.services.planner_service import (paso_1_analizar_solicitud,
-                                               paso_2_opciones_abastecimiento,
-                                               paso_3_guardar_tratamiento)
+    from core.services.planner_analysis_cache import get_analysis
+    from core.services.planner_queue import cola_planificador
+    from core.services.planner_service import (
+        paso_2_opciones_abastecimiento, paso_2_opciones_abastecimiento_batch,
+        paso_3_guardar_tratamiento)
+    from core.services.stock_index import get_stock_index
     from routes.auth import _decode_token
+    from services import consumo_store
+    from services.atp import actualizar_compromisos
+    from services.audit_log import get_audit_log
 
 # Blueprint histórico (/api/planner) con dashboard simple
 planner_bp = Blueprint("planner", __name__)
@@ -32,9 +44,7 @@ planner_bp = Blueprint("planner", __name__)
 # Blueprint nuevo para gestión planificador
 bp = Blueprint("planner_api", __name__, url_prefix="/api/planificador")
 
-_STOCK_XLS_CACHE = None
 _EQUIV_XLS_CACHE = None
-_CONSUMO_XLS_CACHE = None
 
 
 def _db_path() -> Path:
@@ -200,32 +210,6 @@ def _norm_codigo(val: str) -> str:
     return base.lstrip("0")
 
 
-def _load_stock_xlsx():
-    """Lee stock de backend_v2/stock.xlsx para validar equivalencias con stock."""
-    global _STOCK_XLS_CACHE
-    if _STOCK_XLS_CACHE is not None:
-        return _STOCK_XLS_CACHE
-    path = Path("backend_v2/stock.xlsx")
-    if not path.exists():
-        _STOCK_XLS_CACHE = pd.DataFrame()
-        return _STOCK_XLS_CACHE
-    df = pd.read_excel(path, dtype=str)
-    df = df.rename(
-        columns={
-            "Material": "codigo",
-            "Centro": "centro",
-            "Almac\u00e9n": "almacen",
-            "Stock": "stock",
-        }
-    )
-    df["stock"] = pd.to_numeric(df.get("stock", 0), errors="coerce").fillna(0)
-    df["codigo_norm"] = df["codigo"].astype(str).map(_norm_codigo)
-    df["centro_norm"] = df["centro"].astype(str).map(_norm_codigo)
-    df["almacen_norm"] = df["almacen"].astype(str).map(_norm_codigo)
-    _STOCK_XLS_CACHE = df
-    return _STOCK_XLS_CACHE
-
-
 def _load_equivalencias_catalogo():
     """Carga equivalencias desde docs/equivalencias_total_normalizado.xlsx"""
     global _EQUIV_XLS_CACHE
@@ -253,44 +237,9 @@ def _load_equivalencias_catalogo():
     return _EQUIV_XLS_CACHE
 
 
-def _stock_disponible(codigo: str, centro: str = None, almacen: str = None, stock_df=None) -> float:
-    """Obtiene stock disponible priorizando tabla stock_almacenes; cae a XLS si no existe."""
-    try:
-        conn = _connect()
-        cur = conn.cursor()
-        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='stock_almacenes'")
-        if cur.fetchone():
-            params = [_norm_codigo(codigo)]
-            sql = "SELECT COALESCE(SUM(cantidad),0) FROM stock_almacenes WHERE codigo_material = ?"
-            if centro:
-                sql += " AND centro = ?"
-                params.append(centro)
-            if almacen:
-                sql += " AND almacen = ?"
-                params.append(almacen)
-            cur.execute(sql, params)
-            row = cur.fetchone()
-            conn.close()
-            if row is not None:
-                return float(row[0] or 0)
-        else:
-            conn.close()
-    except Exception:
-        try:
-            conn.close()
-        except Exception:
-            pass
-
-    # Fallback XLS
-    sdf = stock_df if stock_df is not None else _load_stock_xlsx()
-    if sdf is None or sdf.empty:
-        return 0.0
-    mask = sdf["codigo_norm"] == _norm_codigo(codigo)
-    if centro:
-        mask = mask & (sdf["centro_norm"] == _norm_codigo(centro))
-    if almacen:
-        mask = mask & (sdf["almacen_norm"] == _norm_codigo(almacen))
-    return float(sdf.loc[mask, "stock"].sum())
+def _stock_disponible(codigo: str, centro: str = None, almacen: str = None) -> float:
+    """Stock disponible desde el índice de stock (exclusiones de config aplicadas)."""
+    return get_stock_index().disponible(codigo, centro, almacen)
 
 
 def _rankear_proveedores(cur, cantidad: float, precio_unitario: float):
@@ -316,130 +265,28 @@ def _rankear_proveedores(cur, cantidad: float, precio_unitario: float):
     return ranked
 
 
-def _load_consumo_stock():
-    """Carga consumo histórico para calcular promedio por centro/almacén."""
-    global _CONSUMO_XLS_CACHE
-    if _CONSUMO_XLS_CACHE is not None:
-        return _CONSUMO_XLS_CACHE
-    path = Path("docs/consumo historico.xlsx")
-    if not path.exists():
-        _CONSUMO_XLS_CACHE = pd.DataFrame()
-        return _CONSUMO_XLS_CACHE
-    df = pd.read_excel(path, sheet_name="consumo historico")
-    df = df.rename(
-        columns={
-            "Material": "codigo",
-            "Centro": "centro",
-            "Almacen": "almacen",
-            "Cantidad": "cantidad",
-            "Fecha": "fecha",
-            "Descripcion": "descripcion",
-        }
-    )
-    df["cantidad"] = pd.to_numeric(df.get("cantidad", 0), errors="coerce").fillna(0)
-    df["fecha"] = pd.to_datetime(df.get("fecha"), errors="coerce")
-    df["codigo_norm"] = df["codigo"].astype(str).map(_norm_codigo)
-    df["centro_norm"] = df["centro"].astype(str).map(_norm_codigo)
-    df["almacen_norm"] = df["almacen"].astype(str).map(_norm_codigo)
-    _CONSUMO_XLS_CACHE = df
-    return _CONSUMO_XLS_CACHE
-
-
-def _stock_detalle(codigo: str, centro: str = None, almacen: str = None, stock_df=None):
-    """Detalle por centro/almacén del stock disponible."""
-    detalle = []
-    consumo_df = _load_consumo_stock()
-    consumo_disponible = not consumo_df.empty
-    # Primero intentar tabla stock_almacenes
+def _stock_detalle(codigo: str, centro: str = None, almacen: str = None):
+    """Detalle por centro/almacén del stock disponible, con consumo histórico."""
+    consumo = {}
+    conn = _connect()
     try:
-        conn = _connect()
-        cur = conn.cursor()
-        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='stock_almacenes'")
-        if cur.fetchone():
-            params = [_norm_codigo(codigo)]
-            sql = "SELECT centro, almacen, SUM(cantidad) as cantidad FROM stock_almacenes WHERE codigo_material=?"
-            if centro:
-                sql += " AND centro=?"
-                params.append(centro)
-            if almacen:
-                sql += " AND almacen=?"
-                params.append(almacen)
-            sql += " GROUP BY centro, almacen"
-            cur.execute(sql, params)
-            for row in cur.fetchall() or []:
-                consumo_prom = None
-                consumo_total = None
-                if consumo_disponible:
-                    mask = (
-                        (consumo_df["codigo_norm"] == _norm_codigo(codigo))
-                        & (consumo_df["centro_norm"] == _norm_codigo(row[0]))
-                        & (consumo_df["almacen_norm"] == _norm_codigo(row[1]))
-                        & consumo_df["fecha"].notna()
-                    )
-                    subset = consumo_df.loc[mask].copy()
-                    if not subset.empty:
-                        subset["anio"] = subset["fecha"].dt.year
-                        consumo_total = float(subset["cantidad"].sum())
-                        anios = max(1, subset["anio"].max() - subset["anio"].min() + 1)
-                        consumo_prom = consumo_total / anios
-                detalle.append(
-                    {
-                        "centro": row[0],
-                        "almacen": row[1],
-                        "cantidad": float(row[2] or 0),
-                        "consumo_total": consumo_total,
-                        "consumo_promedio": consumo_prom,
-                        "libre_disponibilidad": str(row[1]) in ("0100", "9999"),
-                    }
-                )
-            conn.close()
-            return detalle
+        if consumo_store.tiene_consumo(conn):
+            consumo = consumo_store.consumo_por_ubicacion(conn, codigo)
+    finally:
         conn.close()
-    except Exception:
-        try:
-            conn.close()
-        except Exception:
-            pass
 
-    # Fallback XLS
-    sdf = stock_df if stock_df is not None else _load_stock_xlsx()
-    if sdf is None or sdf.empty:
-        return detalle
-    mask = sdf["codigo_norm"] == _norm_codigo(codigo)
-    if centro:
-        mask = mask & (sdf["centro_norm"] == _norm_codigo(centro))
-    if almacen:
-        mask = mask & (sdf["almacen_norm"] == _norm_codigo(almacen))
-    df_filtered = sdf.loc[mask]
-    # Si no hay resultado para centro/almacen solicitado, mostrar todos los centros/almacenes
-    if df_filtered.empty:
-        df_filtered = sdf[sdf["codigo_norm"] == _norm_codigo(codigo)]
-    for _, r in (
-        df_filtered.groupby(["centro", "almacen"]).sum(numeric_only=True).reset_index().iterrows()
-    ):
-        consumo_prom = None
-        consumo_total = None
-        if consumo_disponible:
-            maskc = (
-                (consumo_df["codigo_norm"] == _norm_codigo(codigo))
-                & (consumo_df["centro_norm"] == _norm_codigo(r.get("centro")))
-                & (consumo_df["almacen_norm"] == _norm_codigo(r.get("almacen")))
-                & consumo_df["fecha"].notna()
-            )
-            subset = consumo_df.loc[maskc].copy()
-            if not subset.empty:
-                subset["anio"] = subset["fecha"].dt.year
-                consumo_total = float(subset["cantidad"].sum())
-                anios = max(1, subset["anio"].max() - subset["anio"].min() + 1)
-                consumo_prom = consumo_total / anios
+    detalle = []
+    for row in get_stock_index().detalle(codigo, centro, almacen):
+        ubicacion = consumo.get((_norm_codigo(row["centro"]), _norm_codigo(row["almacen"])))
         detalle.append(
             {
-                "centro": r.get("centro"),
-                "almacen": r.get("almacen"),
-                "cantidad": float(r.get("stock") or 0),
-                "consumo_total": consumo_total,
-                "consumo_promedio": consumo_prom,
-                "libre_disponibilidad": str(r.get("almacen")) in ("0100", "9999"),
+                "centro": row["centro"],
+                "almacen": row["almacen"],
+                "cantidad": row["cantidad"],
+                "consumo_total": ubicacion["total"] if ubicacion else None,
+                "consumo_promedio": ubicacion["promedio_anual"] if ubicacion else None,
+                "libre_disponibilidad": row["libre_disponibilidad"],
+                "responsable": row["responsable"],
             }
         )
     return detalle
@@ -505,6 +352,54 @@ def listar_solicitudes_aprobadas():
     return jsonify(data), 200
 
 
+@bp.route("/cola", methods=["GET"])
+def cola_de_trabajo():
+    """
+    Cola de trabajo del planificador, paginada y ordenada por prioridad.
+
+    Query params:
+        centro, sector, criticidad: Filtros exactos
+        status: Estados separados por coma (default: todos los abiertos)
+        planner_id: Solo admin; los planificadores ven lo asignado a ellos
+        limit: Tamaño de página (default 50, máximo 200)
+        cursor: next_cursor de la respuesta anterior
+        include_items: true para incluir los items de cada solicitud
+
+    Delega a cola_planificador() en el servicio.
+    """
+    user = _current_user()
+    if isinstance(user, tuple):
+        return user
+    guard, is_admin = _require_planner_role(user)
+    if guard:
+        return guard
+    planner_id = user.get("id_spm") if not is_admin else request.args.get("planner_id")
+
+    try:
+        limit = int(request.args.get("limit") or 50)
+    except ValueError:
+        return error_validation("limit", "limit debe ser un entero")
+    status = [s.strip() for s in (request.args.get("status") or "").split(",") if s.strip()]
+    include_items = (request.args.get("include_items") or "").lower() in ("1", "true", "si")
+
+    try:
+        resultado = cola_planificador(
+            planner_id=planner_id,
+            centro=request.args.get("centro"),
+            sector=request.args.get("sector"),
+            status=status or None,
+            criticidad=request.args.get("criticidad"),
+            limit=limit,
+            cursor=request.args.get("cursor"),
+            include_items=include_items,
+        )
+        return jsonify({"ok": True, "data": resultado}), 200
+    except ValueError as e:
+        return error_validation("query", str(e))
+    except Exception as e:
+        return error_internal(str(e))
+
+
 @bp.route("/presupuesto", methods=["GET"])
 def obtener_presupuesto():
     """Retorna presupuesto y saldo por centro/sector para validaciones rápidas"""
@@ -640,6 +535,7 @@ def tratar_items(solicitud_id):
             ),
         )
         _log_evento(solicitud_id, idx, "item_tratado", it.get("decision") or "", it, actor=actor)
+    actualizar_compromisos(conn, solicitud_id)
     conn.commit()
     conn.close()
     _update_estado(solicitud_id, "En tratamiento")
@@ -667,12 +563,48 @@ def obtener_tratamiento(solicitud_id):
     return jsonify({"ok": True, "data": data}), 200
 
 
+@bp.route("/solicitudes/<int:solicitud_id>/historial", methods=["GET"])
+def obtener_historial(solicitud_id):
+    """
+    Historial de tratamiento (eventos de auditoría) de una solicitud.
+
+    Query params:
+        item: Solo eventos de este índice de item
+        tipo: Tipos de evento separados por coma
+        limit: Máximo de eventos (default 100, máximo 500)
+        before_id: Paginación: eventos anteriores a este id
+    """
+    guard, user = _require_solicitud_access(solicitud_id)
+    if guard:
+        return guard
+    try:
+        item = request.args.get("item")
+        before_id = request.args.get("before_id")
+        limit = min(max(int(request.args.get("limit") or 100), 1), 500)
+        item = int(item) if item not in (None, "") else None
+        before_id = int(before_id) if before_id not in (None, "") else None
+    except ValueError:
+        return error_validation("query", "item, limit y before_id deben ser enteros")
+    tipos = [t.strip() for t in (request.args.get("tipo") or "").split(",") if t.strip()]
+
+    try:
+        eventos = get_audit_log(_db_path()).history(
+            solicitud_id, item_index=item, tipos=tipos or None, limit=limit, before_id=before_id
+        )
+    except Exception as e:
+        return error_internal(str(e))
+    next_before_id = eventos[-1]["id"] if len(eventos) == limit else None
+    return jsonify({"ok": True, "data": eventos, "next_before_id": next_before_id}), 200
+
+
 @bp.route("/solicitudes/<int:solicitud_id>/analizar", methods=["POST"])
 def analizar_solicitud(solicitud_id):
     """
     PASO 1: Análisis integral de solicitud para tratamiento
 
-    Delega a paso_1_analizar_solicitud() en el servicio.
+    Delega a paso_1_analizar_solicitud() a través del cache versionado: si
+    la solicitud, su presupuesto y los datos de referencia no cambiaron,
+    retorna el análisis ya calculado. Query param refresh=1 fuerza el recálculo.
     Retorna objeto de análisis con métricas presupuesto, conflictos, avisos y recomendaciones.
     """
     guard, user = _require_solicitud_access(solicitud_id)
@@ -680,7 +612,8 @@ def analizar_solicitud(solicitud_id):
         return guard
 
     try:
-        resultado = paso_1_analizar_solicitud(solicitud_id)
+        force = request.args.get("refresh", "").lower() in ("1", "true")
+        resultado = get_analysis(solicitud_id, force=force)
         return jsonify({"ok": True, "data": resultado}), 200
     except ValueError as e:
         return error_validation("solicitud_id", str(e))
@@ -729,6 +662,7 @@ def _update_estado(solicitud_id: int, estado: str):
         "UPDATE solicitudes SET status=?, updated_at=CURRENT_TIMESTAMP WHERE id=?",
         (estado, solicitud_id),
     )
+    actualizar_compromisos(conn, solicitud_id)
     conn.commit()
     conn.close()
 
@@ -736,15 +670,9 @@ def _update_estado(solicitud_id: int, estado: str):
 def _log_evento(
     solicitud_id: int, item_index, tipo: str, estado: str, payload: dict, actor: str = "planner"
 ):
-    conn = _connect()
-    cur = conn.cursor()
-    # Usar columnas que existen en la tabla
-    cur.execute(
-        "INSERT INTO solicitud_tratamiento_log (solicitud_id, item_index, actor_id, tipo, estado, payload_json) VALUES (?,?,?,?,?,?)",
-        (solicitud_id, item_index, actor or "planner", tipo, estado, json.dumps(payload)),
+    get_audit_log(_db_path()).append(
+        solicitud_id, item_index, tipo, estado, payload, actor or "planner"
     )
-    conn.commit()
-    conn.close()
 
 
 @bp.route(
@@ -770,6 +698,37 @@ def obtener_opciones_abastecimiento(solicitud_id, item_idx):
         return error_internal(str(e))
 
 
+@bp.route("/solicitudes/<int:solicitud_id>/opciones-abastecimiento", methods=["GET"])
+def obtener_opciones_abastecimiento_batch(solicitud_id):
+    """
+    PASO 2 en bloque: opciones de abastecimiento para varios items.
+
+    Query params:
+        items: Índices separados por coma (default: todos los items)
+
+    Delega a paso_2_opciones_abastecimiento_batch() en el servicio.
+    """
+    guard, user = _require_solicitud_access(solicitud_id)
+    if guard:
+        return guard
+
+    item_indices = None
+    items_param = (request.args.get("items") or "").strip()
+    if items_param:
+        try:
+            item_indices = [int(v) for v in items_param.split(",") if v.strip()]
+        except ValueError:
+            return error_validation("items", "items debe ser una lista de índices separados por coma")
+
+    try:
+        resultado = paso_2_opciones_abastecimiento_batch(solicitud_id, item_indices)
+        return jsonify({"ok": True, "data": resultado}), 200
+    except ValueError as e:
+        return error_validation("items", str(e))
+    except Exception as e:
+        return error_internal(str(e))
+
+
 @bp.route("/solicitudes/<int:solicitud_id>/guardar-tratamiento", methods=["POST"])
 def guardar_tratamiento(solicitud_id):
     """
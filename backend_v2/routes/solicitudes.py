@@ -13,11 +13,21 @@ from werkzeug.utils import secure_filename
 
 try:
     from backend_v2.core.config import settings
+    from backend_v2.core.services.planner_assignment import resolve_planner
     from backend_v2.routes.auth import _decode_token
+    from backend_v2.services.anomalias_consumo import (actualizar_solicitud,
+                                                      anomalias_por_solicitud)
+    from backend_v2.services.atp import actualizar_compromisos
+    from backend_v2.services.audit_log import get_audit_log
 except ImportError:
     from core.config import settings
+    from core.services.planner_assignment import resolve_planner
 
     from routes.auth import _decode_token
+    from services.anomalias_consumo import (actualizar_solicitud,
+                                             anomalias_por_solicitud)
+    from services.atp import actualizar_compromisos
+    from services.audit_log import get_audit_log
 
 bp = Blueprint("solicitudes", __name__, url_prefix="/api/solicitudes")
 
@@ -125,6 +135,8 @@ def list_solicitudes():
             params + [page_size, offset],
         )
         rows = cur.fetchall()
+        # Marcas del último escaneo de consumo inusual (sin recalcular)
+        anomalias = anomalias_por_solicitud(conn, [r["id"] for r in rows])
     finally:
         conn.close()
 
@@ -136,6 +148,7 @@ def list_solicitudes():
         except Exception:
             extra = {}
         d["items"] = extra.get("items", [])
+        d["anomalias"] = anomalias.get(d["id"], [])
         solicitudes_list.append(d)
 
     return (
@@ -490,7 +503,9 @@ def aprobar_solicitud(solicitud_id):
         )
 
     # 6. Actualizar solicitud a Aprobada
-    planificador = _planificador_para(solicitud.get("centro"), solicitud.get("sector"))
+    planificador = resolve_planner(
+        solicitud.get("centro"), solicitud.get("sector"), solicitud.get("almacen_virtual")
+    )
     _update_solicitud(
         solicitud_id,
         {
@@ -500,6 +515,15 @@ def aprobar_solicitud(solicitud_id):
             "aprobador_id": aprobador_id,
         },
     )
+
+    # 7. Precalcular el análisis del planner en segundo plano
+    try:
+        from backend_v2.core.services.planner_analysis_cache import \
+            schedule_precompute
+    except ImportError:
+        from core.services.planner_analysis_cache import schedule_precompute
+    schedule_precompute(solicitud_id)
+
     return get_solicitud(solicitud_id)
 
 
@@ -546,31 +570,15 @@ def comentar_solicitud(solicitud_id):
             400,
         )
 
-    # Registrar el comentario en el log (si existe la tabla)
-    conn = _connect()
-    try:
-        cur = conn.cursor()
-        # Verificar si existe la tabla de log
-        cur.execute(
-            "SELECT name FROM sqlite_master WHERE type='table' AND name='solicitud_tratamiento_log'"
-        )
-        if cur.fetchone():
-            cur.execute(
-                "INSERT INTO solicitud_tratamiento_log (solicitud_id, item_index, actor_id, tipo, estado, payload_json) VALUES (?,?,?,?,?,?)",
-                (
-                    solicitud_id,
-                    None,
-                    actor_id,
-                    "comentario_agregado",
-                    "comentario",
-                    json.dumps({"comentario": comentario}),
-                ),
-            )
-            conn.commit()
-    except Exception:
-        pass  # Log error silently - consider proper logging in production
-    finally:
-        conn.close()
+    # Registrar el comentario en el log de auditoría
+    get_audit_log(_db_path()).append(
+        solicitud_id,
+        None,
+        "comentario_agregado",
+        "comentario",
+        {"comentario": comentario},
+        actor_id,
+    )
 
     return jsonify({"ok": True, "message": "Comentario agregado correctamente"}), 200
 
@@ -584,7 +592,11 @@ def _update_solicitud(solicitud_id: int, fields: dict):
     conn = _connect()
     cur = conn.cursor()
     cur.execute(f"UPDATE solicitudes SET {set_clause} WHERE id=?", params)
+    if "status" in fields or "data_json" in fields:
+        actualizar_compromisos(conn, solicitud_id)
     conn.commit()
+    if "status" in fields or "data_json" in fields:
+        actualizar_solicitud(conn, solicitud_id)
     conn.close()
 
 
@@ -622,20 +634,3 @@ def _aprobador_por_monto(total):
     if t >= 5000:
         return "Jefe"
     return "Admin"
-
-
-def _planificador_para(centro: str, sector: str) -> str:
-    centro = (centro or "").strip()
-    sector = (sector or "").strip()
-    conn = _connect()
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute("SELECT planificador_id, centro, sector FROM planificador_asignaciones")
-    rows = cur.fetchall()
-    conn.close()
-    for r in rows:
-        c = (r["centro"] or "").strip()
-        s = (r["sector"] or "").strip()
-        if (not centro or centro == c) and (not sector or sector == s):
-            return r["planificador_id"]
-    return "Admin"
@@ -0,0 +1,74 @@
+"""
+Importacion del consumo historico a la BD (consumo_movimientos y el resumen
+consumo_mensual). Acepta el archivo completo o un incremento: las fechas que
+cubre el archivo se reemplazan y solo se recalculan esos meses.
+
+Ejecutar desde el directorio raiz:
+    python backend_v2/scripts/import_consumo.py ["docs/consumo historico.xlsx"] [--forzar]
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend_v2.services.consumo_store import BATCH_SIZE, importar_consumo  # noqa: E402
+
+DB_PATH = ROOT_DIR / "backend_v2" / "spm.db"
+CONSUMO_PATH = ROOT_DIR / "docs" / "consumo historico.xlsx"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importacion del consumo historico")
+    parser.add_argument("archivo", nargs="?", default=str(CONSUMO_PATH), help="Excel de consumo")
+    parser.add_argument("--db", default=str(DB_PATH), help="Ruta de la BD principal")
+    parser.add_argument(
+        "--forzar", action="store_true", help="Importar aunque el archivo ya se haya importado"
+    )
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Filas por lote")
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    archivo = Path(args.archivo)
+    for path, desc in ((db_path, "base de datos"), (archivo, "consumo historico")):
+        if not path.exists():
+            print(f"ERROR: No se encontro {desc}: {path}")
+            sys.exit(1)
+
+    print("=" * 60)
+    print("  IMPORTACION DE CONSUMO HISTORICO")
+    print("=" * 60)
+    print(f"  Archivo: {archivo}")
+
+    def progreso(filas):
+        print(f"  -> {filas:,} movimientos leidos")
+
+    inicio = time.perf_counter()
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        resumen = importar_consumo(
+            conn, archivo, batch_size=args.batch_size, progress=progreso, forzar=args.forzar
+        )
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    if resumen["omitido"]:
+        print("\n  El archivo ya fue importado (usar --forzar para reimportarlo)")
+        return
+    print(f"\n  Importacion #{resumen['importacion_id']}")
+    print(f"  Movimientos: {resumen['filas']:,} (descartados: {resumen['descartadas']:,})")
+    print(f"  Rango: {resumen['desde']} a {resumen['hasta']}")
+    print(f"  Movimientos reemplazados: {resumen['reemplazadas']:,}")
+    print(f"  Meses recalculados: {resumen['meses']}")
+    print(f"  Tiempo: {time.perf_counter() - inicio:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,25 +7,265 @@ Archivos fuente:
 - docs/Copia de ZPEN ME2M SAP.xlsx: Pedidos en curso
 - docs/consumo historico.xlsx: Consumo historico para calcular promedio mensual
 
+Los cuatro archivos se leen en paralelo (un proceso por archivo, openpyxl en
+modo read-only) y se cruzan en una tabla temporal de staging. El staging se
+compara contra materiales_mrp y solo se aplican las altas, modificaciones y
+bajas, en una transaccion corta. El estado de alertas (materiales_mrp_estado)
+se mantiene por triggers, asi que solo esas filas se recalculan.
+
+Los parametros aceptados por el planificador (services/mrp_parametros) se
+aplican al staging antes del diff: BBDD.xlsx no los revierte.
+
 Ejecutar desde el directorio raiz:
     python backend_v2/scripts/import_mrp_data.py
 """
 
+import math
 import sqlite3
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
 from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
 
-import numpy as np
 import pandas as pd
+from openpyxl import load_workbook
 
 # Rutas a los archivos
 ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend_v2.core.repository import ReferenceDataRepository  # noqa: E402
+from backend_v2.services.mrp_alertas import ensure_estado_schema  # noqa: E402
+from backend_v2.services.mrp_parametros import (  # noqa: E402
+    aplicar_parametros_aceptados,
+    ensure_sugerencias_schema,
+)
+
 BBDD_PATH = ROOT_DIR / "docs" / "BBDD.xlsx"
 STOCK_PATH = ROOT_DIR / "docs" / "stock.xlsx"
 PEDIDOS_PATH = ROOT_DIR / "docs" / "Copia de ZPEN ME2M SAP.xlsx"
 CONSUMO_PATH = ROOT_DIR / "docs" / "consumo historico.xlsx"
 DB_PATH = ROOT_DIR / "backend_v2" / "spm.db"
 
+STAGING_TABLE = "materiales_mrp_staging"
+BATCH_SIZE = 10000
+
+COLUMNS = [
+    "sector",
+    "almacen",
+    "centro",
+    "codigo_material",
+    "descripcion",
+    "stock_seguridad",
+    "punto_pedido",
+    "stock_maximo",
+    "stock_actual",
+    "pedidos_en_curso",
+    "consumo_promedio_mensual",
+    "lead_time_dias",
+    "categoria_planificacion",
+    "sub_categoria",
+    "critico",
+    "inmovilizado",
+    "ubicacion",
+]
+KEY_COLUMNS = ["centro", "almacen", "codigo_material"]
+VALUE_COLUMNS = [c for c in COLUMNS if c not in KEY_COLUMNS]
+
+Key = Tuple[int, int, str]
+
+
+@contextmanager
+def fase(nombre: str):
+    """Imprimir la duracion de una fase de la importacion"""
+    inicio = time.perf_counter()
+    yield
+    print(f"[t] {nombre}: {time.perf_counter() - inicio:.2f}s")
+
+
+# ============================================================================
+# Lectura en streaming (se ejecuta en procesos separados)
+# ============================================================================
+
+
+def _to_number(value: Any) -> float:
+    """Equivalente a pd.to_numeric(errors="coerce").fillna(0) para una celda"""
+    if isinstance(value, bool) or value is None:
+        return 0.0
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if math.isnan(number) or math.isinf(number) else number
+
+
+def _to_int(value: Any) -> int:
+    return int(_to_number(value))
+
+
+def _key(row: Dict[str, Any]) -> Key:
+    # Material viene como float: float -> int -> string (evita notacion cientifica)
+    return (_to_int(row["centro"]), _to_int(row["almacen"]), str(_to_int(row["codigo_material"])))
+
+
+def _to_fecha(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    fecha = pd.to_datetime(value, errors="coerce")
+    return None if pd.isna(fecha) else fecha.to_pydatetime()
+
+
+def iter_sheet(path: Path, sheet: str, columns: Dict[str, str]) -> Iterator[Dict[str, Any]]:
+    """
+    Filas de una hoja leidas en streaming (openpyxl read-only).
+
+    Args:
+        path: Archivo xlsx
+        sheet: Nombre de la hoja
+        columns: Encabezado en el Excel -> nombre de columna destino
+
+    Yields:
+        Dict columna destino -> valor de la celda
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb[sheet].iter_rows(values_only=True)
+        header = [str(h).strip() if h is not None else None for h in next(rows, ())]
+        faltantes = [c for c in columns if c not in header]
+        if faltantes:
+            raise ValueError(f"{path.name}: faltan columnas {faltantes}")
+        posiciones = [(destino, header.index(origen)) for origen, destino in columns.items()]
+        for row in rows:
+            yield {destino: row[i] if i < len(row) else None for destino, i in posiciones}
+    finally:
+        wb.close()
+
+
+def parse_bbdd(path: Path) -> Dict[Key, tuple]:
+    """Materiales MRP base con sus parametros (la ultima fila de cada clave gana)"""
+    columns = {
+        "Sector": "sector",
+        "Almacen": "almacen",
+        "Centro": "centro",
+        "Codigo Material": "codigo_material",
+        "Descripcion": "descripcion",
+        "Stock de seguridad": "stock_seguridad",
+        "Punto de pedido": "punto_pedido",
+        "Stock maximo": "stock_maximo",
+    }
+    materiales = {}
+    for row in iter_sheet(path, "BBDD", columns):
+        descripcion = row["descripcion"]
+        materiales[_key(row)] = (
+            row["sector"],
+            "Sin descripcion" if descripcion in (None, "") else descripcion,
+            _to_int(row["stock_seguridad"]),
+            _to_int(row["punto_pedido"]),
+            _to_int(row["stock_maximo"]),
+        )
+    return materiales
+
+
+STOCK_ATTRS = ["categoria_planificacion", "sub_categoria", "critico", "inmovilizado", "ubicacion"]
+
+
+def parse_stock(path: Path) -> Dict[Key, list]:
+    """Stock actual agrupado por centro/almacen/material (puede haber duplicados por lote)"""
+    columns = {
+        "Centro": "centro",
+        "Almacén": "almacen",
+        "Material": "codigo_material",
+        "Stock": "stock_actual",
+        "Planificación_Categorías": "categoria_planificacion",
+        "Sub_Categorías": "sub_categoria",
+        "Critico": "critico",
+        "Inmovilizado": "inmovilizado",
+        "Ubicacion": "ubicacion",
+    }
+    stock: Dict[Key, list] = {}
+    for row in iter_sheet(path, "Export", columns):
+        actual = stock.setdefault(_key(row), [0] + [None] * len(STOCK_ATTRS))
+        actual[0] += _to_int(row["stock_actual"])
+        # Primer valor no vacio de cada atributo (como groupby().first())
+        for i, attr in enumerate(STOCK_ATTRS, start=1):
+            if actual[i] is None and row[attr] is not None:
+                actual[i] = row[attr]
+    return stock
+
+
+def parse_pedidos(path: Path) -> Dict[Key, float]:
+    """Saldo pendiente de pedidos en curso sumado por material"""
+    columns = {
+        "Centro": "centro",
+        "Almacen": "almacen",
+        "MATERIAL": "codigo_material",
+        "SALDO PEND": "cantidad_pendiente",
+    }
+    pedidos: Dict[Key, float] = {}
+    for row in iter_sheet(path, "ZPEN ME2M SAP", columns):
+        key = _key(row)
+        pedidos[key] = pedidos.get(key, 0.0) + _to_number(row["cantidad_pendiente"])
+    return pedidos
+
+
+def parse_consumo(path: Path) -> Dict[Key, float]:
+    """Consumo historico: promedio mensual por material sobre el periodo del archivo"""
+    columns = {
+        "Fecha": "fecha",
+        "Centro": "centro",
+        "Almacen": "almacen",
+        "Cantidad": "cantidad",
+        "Material": "codigo_material",
+    }
+    totales: Dict[Key, float] = {}
+    fecha_min = fecha_max = None
+    for row in iter_sheet(path, "consumo historico", columns):
+        key = _key(row)
+        totales[key] = totales.get(key, 0.0) + _to_number(row["cantidad"])
+        fecha = _to_fecha(row["fecha"])
+        if fecha is not None:
+            fecha_min = fecha if fecha_min is None or fecha < fecha_min else fecha_min
+            fecha_max = fecha if fecha_max is None or fecha > fecha_max else fecha_max
+
+    if fecha_min is not None and fecha_max is not None:
+        meses = max(1, (fecha_max - fecha_min).days / 30)
+    else:
+        meses = 6  # Default 6 meses
+
+    print(f"  -> Periodo de consumo: {fecha_min} a {fecha_max} ({meses:.1f} meses)")
+    return {key: round(total / meses, 2) for key, total in totales.items()}
+
+
+def build_rows(
+    bbdd: Dict[Key, tuple],
+    stock: Dict[Key, list],
+    pedidos: Dict[Key, float],
+    consumo: Dict[Key, float],
+) -> Iterator[tuple]:
+    """Cruzar las cuatro fuentes sobre los materiales de BBDD (en el orden de COLUMNS)"""
+    for key, (sector, descripcion, seguridad, punto, maximo) in bbdd.items():
+        centro, almacen, codigo = key
+        datos_stock = stock.get(key) or [0] + [None] * len(STOCK_ATTRS)
+        yield (
+            sector,
+            almacen,
+            centro,
+            codigo,
+            descripcion,
+            seguridad,
+            punto,
+            maximo,
+            datos_stock[0],
+            int(pedidos.get(key, 0)),
+            consumo.get(key, 0.0),
+            30,  # lead_time_dias: default, podria venir de otro archivo
+            *datos_stock[1:],
+        )
+
 
 def create_mrp_table(conn: sqlite3.Connection) -> None:
     """Crear tabla materiales_mrp si no existe"""
@@ -72,269 +312,151 @@ def create_mrp_table(conn: sqlite3.Connection) -> None:
     conn.commit()
     print("[OK] Tabla materiales_mrp creada/verificada")
 
+    if ensure_estado_schema(conn):
+        print("[OK] Tabla materiales_mrp_estado creada y calculada")
+    ensure_sugerencias_schema(conn)
 
-def load_stock_data(stock_path: Path) -> pd.DataFrame:
-    """Cargar datos de stock actual"""
-    print(f"Leyendo stock: {stock_path}")
-    df = pd.read_excel(stock_path, sheet_name="Export")
-
-    # Renombrar y seleccionar columnas relevantes
-    df = df.rename(
-        columns={
-            "Centro": "centro",
-            "Almacén": "almacen",
-            "Material": "codigo_material",
-            "Stock": "stock_actual",
-            "Planificación_Categorías": "categoria_planificacion",
-            "Sub_Categorías": "sub_categoria",
-            "Critico": "critico",
-            "Inmovilizado": "inmovilizado",
-            "Ubicacion": "ubicacion",
-        }
-    )
-
-    # Convertir tipos - IMPORTANTE: Material viene como float, convertir a int primero
-    df["centro"] = pd.to_numeric(df["centro"], errors="coerce").fillna(0).astype(int)
-    df["almacen"] = pd.to_numeric(df["almacen"], errors="coerce").fillna(0).astype(int)
-    # Convertir Material: float -> int -> string (evita notacion cientifica)
-    df["codigo_material"] = (
-        pd.to_numeric(df["codigo_material"], errors="coerce").fillna(0).astype(np.int64).astype(str)
-    )
-    df["stock_actual"] = pd.to_numeric(df["stock_actual"], errors="coerce").fillna(0).astype(int)
-
-    # Agrupar por centro/almacen/material (puede haber duplicados por lote)
-    stock_agg = (
-        df.groupby(["centro", "almacen", "codigo_material"])
-        .agg(
-            {
-                "stock_actual": "sum",
-                "categoria_planificacion": "first",
-                "sub_categoria": "first",
-                "critico": "first",
-                "inmovilizado": "first",
-                "ubicacion": "first",
-            }
-        )
-        .reset_index()
-    )
 
-    print(f"  -> {len(stock_agg):,} registros de stock (agrupados)")
-    return stock_agg
-
-
-def load_pedidos_data(pedidos_path: Path) -> pd.DataFrame:
-    """Cargar pedidos en curso"""
-    print(f"Leyendo pedidos: {pedidos_path}")
-    df = pd.read_excel(pedidos_path, sheet_name="ZPEN ME2M SAP")
-
-    df = df.rename(
-        columns={
-            "Centro": "centro",
-            "Almacen": "almacen",
-            "MATERIAL": "codigo_material",
-            "SALDO PEND": "cantidad_pendiente",
-        }
-    )
-
-    df["centro"] = pd.to_numeric(df["centro"], errors="coerce").fillna(0).astype(int)
-    df["almacen"] = pd.to_numeric(df["almacen"], errors="coerce").fillna(0).astype(int)
-    df["codigo_material"] = (
-        pd.to_numeric(df["codigo_material"], errors="coerce").fillna(0).astype(np.int64).astype(str)
+def load_staging(conn: sqlite3.Connection, rows: Iterator[tuple]) -> int:
+    """Cargar las filas cruzadas en una tabla temporal de staging por lotes"""
+    cursor = conn.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS temp.{STAGING_TABLE}")
+    # Mismas afinidades que la tabla viva, para que el diff compare igual
+    cursor.execute(
+        f"CREATE TEMP TABLE {STAGING_TABLE} AS "
+        f"SELECT {', '.join(COLUMNS)} FROM materiales_mrp WHERE 0"
     )
-    df["cantidad_pendiente"] = pd.to_numeric(df["cantidad_pendiente"], errors="coerce").fillna(0)
-
-    # Sumar pedidos por centro/almacen/material
-    pedidos_agg = (
-        df.groupby(["centro", "almacen", "codigo_material"])
-        .agg({"cantidad_pendiente": "sum"})
-        .reset_index()
+    cursor.execute(
+        f"CREATE UNIQUE INDEX temp.idx_{STAGING_TABLE}_key "
+        f"ON {STAGING_TABLE}(centro, almacen, codigo_material)"
     )
-    pedidos_agg = pedidos_agg.rename(columns={"cantidad_pendiente": "pedidos_en_curso"})
-
-    print(f"  -> {len(pedidos_agg):,} materiales con pedidos en curso")
-    return pedidos_agg
-
-
-def load_consumo_data(consumo_path: Path) -> pd.DataFrame:
-    """Cargar consumo historico y calcular promedio mensual"""
-    print(f"Leyendo consumo historico: {consumo_path}")
-    df = pd.read_excel(consumo_path, sheet_name="consumo historico")
-
-    df = df.rename(
-        columns={
-            "Fecha": "fecha",
-            "Centro": "centro",
-            "Almacen": "almacen",
-            "Cantidad": "cantidad",
-            "Material": "codigo_material",
-        }
+    insert_sql = (
+        f"INSERT OR REPLACE INTO {STAGING_TABLE} ({', '.join(COLUMNS)}) "
+        f"VALUES ({', '.join('?' for _ in COLUMNS)})"
     )
-
-    df["centro"] = pd.to_numeric(df["centro"], errors="coerce").fillna(0).astype(int)
-    df["almacen"] = pd.to_numeric(df["almacen"], errors="coerce").fillna(0).astype(int)
-    df["codigo_material"] = (
-        pd.to_numeric(df["codigo_material"], errors="coerce").fillna(0).astype(np.int64).astype(str)
+    total = 0
+    while True:
+        lote = list(islice(rows, BATCH_SIZE))
+        if not lote:
+            return total
+        cursor.executemany(insert_sql, lote)
+        total += len(lote)
+
+
+_JOIN_LIVE = """
+    LEFT JOIN materiales_mrp m
+        ON m.centro = s.centro AND m.almacen = s.almacen AND m.codigo_material = s.codigo_material
+"""
+_CHANGED = f"m.id IS NULL OR {' OR '.join(f'm.{c} IS NOT s.{c}' for c in VALUE_COLUMNS)}"
+_MISSING = f"""
+    NOT EXISTS (
+        SELECT 1 FROM {STAGING_TABLE} s
+        WHERE s.centro = materiales_mrp.centro
+          AND s.almacen = materiales_mrp.almacen
+          AND s.codigo_material = materiales_mrp.codigo_material
     )
-    df["cantidad"] = pd.to_numeric(df["cantidad"], errors="coerce").fillna(0)
-    df["fecha"] = pd.to_datetime(df["fecha"], errors="coerce")
-
-    # Calcular rango de fechas para determinar meses
-    fecha_min = df["fecha"].min()
-    fecha_max = df["fecha"].max()
-
-    if pd.notna(fecha_min) and pd.notna(fecha_max):
-        meses = max(1, (fecha_max - fecha_min).days / 30)
-    else:
-        meses = 6  # Default 6 meses
+"""
 
-    print(f"  -> Periodo de consumo: {fecha_min} a {fecha_max} ({meses:.1f} meses)")
 
-    # Sumar consumo total y calcular promedio mensual
-    consumo_agg = (
-        df.groupby(["centro", "almacen", "codigo_material"]).agg({"cantidad": "sum"}).reset_index()
-    )
-    consumo_agg["consumo_promedio_mensual"] = (consumo_agg["cantidad"] / meses).round(2)
-    consumo_agg = consumo_agg.drop(columns=["cantidad"])
-
-    print(f"  -> {len(consumo_agg):,} materiales con consumo historico")
-    return consumo_agg
-
-
-def import_mrp_data(conn: sqlite3.Connection) -> int:
-    """Importar y cruzar datos de todos los archivos"""
-
-    # 1. Cargar materiales MRP base (BBDD.xlsx)
-    print(f"Leyendo BBDD materiales MRP: {BBDD_PATH}")
-    df_mrp = pd.read_excel(BBDD_PATH, sheet_name="BBDD")
-
-    df_mrp = df_mrp.rename(
-        columns={
-            "Sector": "sector",
-            "Almacen": "almacen",
-            "Centro": "centro",
-            "Codigo Material": "codigo_material",
-            "Descripcion": "descripcion",
-            "Stock de seguridad": "stock_seguridad",
-            "Punto de pedido": "punto_pedido",
-            "Stock maximo": "stock_maximo",
-        }
-    )
+def diff_staging(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Contar altas/modificaciones y bajas del staging respecto de la tabla viva"""
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM {STAGING_TABLE} s {_JOIN_LIVE} WHERE {_CHANGED}")
+    upserts = cursor.fetchone()[0]
+    cursor.execute(f"SELECT COUNT(*) FROM materiales_mrp WHERE {_MISSING}")
+    deletes = cursor.fetchone()[0]
+    return {"upserts": upserts, "deletes": deletes}
 
-    df_mrp["centro"] = pd.to_numeric(df_mrp["centro"], errors="coerce").fillna(0).astype(int)
-    df_mrp["almacen"] = pd.to_numeric(df_mrp["almacen"], errors="coerce").fillna(0).astype(int)
-    df_mrp["codigo_material"] = (
-        pd.to_numeric(df_mrp["codigo_material"], errors="coerce")
-        .fillna(0)
-        .astype(np.int64)
-        .astype(str)
-    )
-    df_mrp["descripcion"] = df_mrp["descripcion"].fillna("Sin descripcion")
-    df_mrp["stock_seguridad"] = (
-        pd.to_numeric(df_mrp["stock_seguridad"], errors="coerce").fillna(0).astype(int)
-    )
-    df_mrp["punto_pedido"] = (
-        pd.to_numeric(df_mrp["punto_pedido"], errors="coerce").fillna(0).astype(int)
-    )
-    df_mrp["stock_maximo"] = (
-        pd.to_numeric(df_mrp["stock_maximo"], errors="coerce").fillna(0).astype(int)
-    )
 
-    print(f"  -> {len(df_mrp):,} materiales MRP base")
-
-    # 2. Cargar datos adicionales
-    df_stock = load_stock_data(STOCK_PATH)
-    df_pedidos = load_pedidos_data(PEDIDOS_PATH)
-    df_consumo = load_consumo_data(CONSUMO_PATH)
-
-    # 3. Cruzar datos
-    print("\nCruzando datos...")
-
-    # Merge con stock
-    df_mrp = df_mrp.merge(
-        df_stock[
-            [
-                "centro",
-                "almacen",
-                "codigo_material",
-                "stock_actual",
-                "categoria_planificacion",
-                "sub_categoria",
-                "critico",
-                "inmovilizado",
-                "ubicacion",
-            ]
-        ],
-        on=["centro", "almacen", "codigo_material"],
-        how="left",
-    )
-
-    # Merge con pedidos en curso
-    df_mrp = df_mrp.merge(
-        df_pedidos[["centro", "almacen", "codigo_material", "pedidos_en_curso"]],
-        on=["centro", "almacen", "codigo_material"],
-        how="left",
-    )
+def apply_diff(conn: sqlite3.Connection) -> None:
+    """
+    Aplicar el diff en una transaccion corta.
 
-    # Merge con consumo
-    df_mrp = df_mrp.merge(
-        df_consumo[["centro", "almacen", "codigo_material", "consumo_promedio_mensual"]],
-        on=["centro", "almacen", "codigo_material"],
-        how="left",
-    )
+    Solo se escriben las filas nuevas o modificadas y se borran las que ya no
+    estan, asi los triggers de materiales_mrp_estado recalculan solo esas.
+    En la misma transaccion se incrementa la version de datos de referencia.
+    Con WAL los lectores de la API siguen viendo la version anterior hasta
+    el COMMIT.
+    """
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(
+            f"""
+            INSERT INTO materiales_mrp ({", ".join(COLUMNS)})
+            SELECT {", ".join("s." + c for c in COLUMNS)}
+            FROM {STAGING_TABLE} s {_JOIN_LIVE}
+            WHERE {_CHANGED}
+            ON CONFLICT(centro, almacen, codigo_material) DO UPDATE SET
+                {", ".join(f"{c} = excluded.{c}" for c in VALUE_COLUMNS)},
+                updated_at = CURRENT_TIMESTAMP
+            """
+        )
+        cursor.execute(f"DELETE FROM materiales_mrp WHERE {_MISSING}")
+        # Invalida los KPIs y analisis cacheados que dependen del stock
+        ReferenceDataRepository.bump(conn)
+        cursor.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.isolation_level = isolation_level
 
-    # Rellenar NaN con defaults
-    df_mrp["stock_actual"] = df_mrp["stock_actual"].fillna(0).astype(int)
-    df_mrp["pedidos_en_curso"] = df_mrp["pedidos_en_curso"].fillna(0).astype(int)
-    df_mrp["consumo_promedio_mensual"] = df_mrp["consumo_promedio_mensual"].fillna(0).round(2)
-    df_mrp["lead_time_dias"] = 30  # Default, podria venir de otro archivo
 
-    # Estadisticas de cruce
-    con_stock = (df_mrp["stock_actual"] > 0).sum()
-    con_pedidos = (df_mrp["pedidos_en_curso"] > 0).sum()
-    con_consumo = (df_mrp["consumo_promedio_mensual"] > 0).sum()
+def parse_sources(max_workers: int = 4) -> tuple:
+    """Leer los cuatro archivos en paralelo, uno por proceso"""
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(parse_bbdd, BBDD_PATH),
+            pool.submit(parse_stock, STOCK_PATH),
+            pool.submit(parse_pedidos, PEDIDOS_PATH),
+            pool.submit(parse_consumo, CONSUMO_PATH),
+        ]
+        return tuple(f.result() for f in futures)
 
-    print(f"  -> Materiales con stock actual: {con_stock:,}")
-    print(f"  -> Materiales con pedidos en curso: {con_pedidos:,}")
-    print(f"  -> Materiales con consumo historico: {con_consumo:,}")
 
-    # 4. Insertar en BD
-    print("\nInsertando en base de datos...")
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM materiales_mrp")
-
-    columns = [
-        "sector",
-        "almacen",
-        "centro",
-        "codigo_material",
-        "descripcion",
-        "stock_seguridad",
-        "punto_pedido",
-        "stock_maximo",
-        "stock_actual",
-        "pedidos_en_curso",
-        "consumo_promedio_mensual",
-        "lead_time_dias",
-        "categoria_planificacion",
-        "sub_categoria",
-        "critico",
-        "inmovilizado",
-        "ubicacion",
-    ]
+def import_mrp_data(conn: sqlite3.Connection, max_workers: int = 4) -> int:
+    """
+    Importar y cruzar datos de todos los archivos.
 
-    placeholders = ", ".join(["?" for _ in columns])
-    insert_sql = (
-        f"INSERT OR REPLACE INTO materiales_mrp ({', '.join(columns)}) VALUES ({placeholders})"
-    )
+    Fases: lectura en paralelo (streaming), carga del staging, diff contra
+    materiales_mrp y aplicacion del diff. Una reimportacion sin cambios no
+    abre transaccion de escritura.
 
-    data_tuples = [
-        tuple(row[col] if pd.notna(row[col]) else None for col in columns)
-        for _, row in df_mrp.iterrows()
-    ]
-    cursor.executemany(insert_sql, data_tuples)
-    conn.commit()
+    Returns:
+        Cantidad de materiales en el staging
+    """
+    # Los lectores de la API no se bloquean mientras se aplica el diff
+    conn.execute("PRAGMA journal_mode=WAL")
+
+    with fase("lectura de archivos"):
+        bbdd, stock, pedidos, consumo = parse_sources(max_workers)
+    print(f"  -> {len(bbdd):,} materiales MRP base")
+    print(f"  -> {len(stock):,} registros de stock (agrupados)")
+    print(f"  -> {len(pedidos):,} materiales con pedidos en curso")
+    print(f"  -> {len(consumo):,} materiales con consumo historico")
+
+    with fase("carga de staging"):
+        total = load_staging(conn, build_rows(bbdd, stock, pedidos, consumo))
+        aceptados = aplicar_parametros_aceptados(conn, STAGING_TABLE)
+    print(f"  -> {aceptados:,} materiales con parametros aceptados por el planificador")
+
+    with fase("diff contra materiales_mrp"):
+        diff = diff_staging(conn)
+    print(f"  -> {diff['upserts']:,} materiales nuevos o modificados")
+    print(f"  -> {diff['deletes']:,} materiales eliminados (ya no estan en BBDD)")
+
+    if diff["upserts"] or diff["deletes"]:
+        with fase("aplicacion del diff"):
+            apply_diff(conn)
+    else:
+        print("  -> Sin cambios: no se modifica materiales_mrp")
 
-    return len(data_tuples)
+    conn.execute(f"DROP TABLE IF EXISTS temp.{STAGING_TABLE}")
+    return total
 
 
 def main():
@@ -352,11 +474,13 @@ def main():
             sys.exit(1)
 
     print(f"Conectando a base de datos: {DB_PATH}")
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=30)
 
     try:
+        inicio = time.perf_counter()
         create_mrp_table(conn)
         count = import_mrp_data(conn)
+        print(f"[t] total: {time.perf_counter() - inicio:.2f}s")
         print(f"\n[OK] Importados {count:,} materiales MRP correctamente")
 
         # Verificar
@@ -0,0 +1,38 @@
+"""
+Reconstruccion del stock comprometido (ATP)
+
+Recalcula stock_compromisos y stock_comprometido desde las decisiones de
+tratamiento con decision = 'stock' de solicitudes abiertas, reparando
+cualquier desvio producido por escrituras que no pasaron por los servicios
+(scripts de seed, SQL manual).
+
+Ejecutar desde el directorio raiz (p.ej. desde cron, una vez por noche):
+    python backend_v2/scripts/rebuild_stock_comprometido.py [ruta/a/spm.db]
+"""
+
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend_v2.services.atp import ATPService  # noqa: E402
+
+DB_PATH = ROOT_DIR / "backend_v2" / "spm.db"
+
+
+def main():
+    db_path = Path(sys.argv[1]) if len(sys.argv) > 1 else DB_PATH
+    if not db_path.exists():
+        print(f"ERROR: No se encontro la base de datos: {db_path}")
+        sys.exit(1)
+
+    print(f"Reconstruyendo stock comprometido en {db_path}...")
+    result = ATPService.reconstruir(db_path)
+    print(f"  Reservas vigentes: {result['compromisos']}")
+    print(f"  Ubicaciones con stock comprometido: {result['materiales']}")
+    print(f"  Totales corregidos: {result['corregidos']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Job de recalculo de parametros MRP desde el consumo historico
+
+Calcula stock de seguridad, punto de pedido y stock maximo sugeridos para
+cada material de materiales_mrp y los deja en materiales_mrp_sugerencias
+para revision del planificador (no modifica materiales_mrp).
+
+El consumo se lee del historico importado en la BD
+(scripts/import_consumo.py); --consumo usa un Excel en su lugar.
+
+Ejecutar desde el directorio raiz:
+    python backend_v2/scripts/recalc_mrp_parameters.py [--nivel-servicio 0.95] [--periodo mes]
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend_v2.services.mrp_parametros import (  # noqa: E402
+    NIVEL_SERVICIO_DEFAULT, PERIODOS, cargar_consumo, cargar_consumo_bd,
+    recalcular_parametros)
+
+DB_PATH = ROOT_DIR / "backend_v2" / "spm.db"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalculo de parametros MRP")
+    parser.add_argument("--db", default=str(DB_PATH), help="Ruta de la BD principal")
+    parser.add_argument(
+        "--consumo", default=None, help="Excel de consumo historico (por defecto, la BD)"
+    )
+    parser.add_argument(
+        "--nivel-servicio", type=float, default=NIVEL_SERVICIO_DEFAULT, help="Ej. 0.95"
+    )
+    parser.add_argument("--periodo", choices=sorted(PERIODOS), default="mes")
+    parser.add_argument("--centro", type=int, default=None, help="Limitar a un centro")
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    consumo_path = Path(args.consumo) if args.consumo else None
+    for path, desc in ((db_path, "base de datos"), (consumo_path, "consumo historico")):
+        if path is not None and not path.exists():
+            print(f"ERROR: No se encontro {desc}: {path}")
+            sys.exit(1)
+
+    def progreso(escritas, total):
+        print(f"  -> {escritas:,}/{total:,} sugerencias escritas ({escritas / total:.0%})")
+
+    inicio = time.perf_counter()
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        if consumo_path:
+            print(f"Leyendo consumo historico: {consumo_path}")
+            consumo = cargar_consumo(consumo_path)
+        else:
+            print("Leyendo consumo historico desde la BD")
+            consumo = cargar_consumo_bd(conn, args.periodo, args.centro)
+            if consumo.empty:
+                print("ERROR: No hay consumo importado (ejecutar scripts/import_consumo.py)")
+                sys.exit(1)
+        print(f"  -> {len(consumo):,} filas ({time.perf_counter() - inicio:.1f}s)")
+
+        resumen = recalcular_parametros(
+            conn,
+            consumo,
+            nivel_servicio=args.nivel_servicio,
+            periodo=args.periodo,
+            centro=args.centro,
+            progress=progreso,
+        )
+    finally:
+        conn.close()
+
+    print(f"\nCorrida {resumen['run_id']} (nivel de servicio {resumen['nivel_servicio']}, "
+          f"z={resumen['z']}, {resumen['periodos']} periodos)")
+    print(f"  Sugerencias escritas: {resumen['materiales']:,}")
+    print(f"  Con consumo historico: {resumen['con_consumo']:,}")
+    print(f"  Sin consumo (se mantienen los de BBDD): {resumen['sin_consumo']:,}")
+    print(f"  Con parametros distintos a los actuales: {resumen['con_cambios']:,}")
+    print(f"  Tiempo: {time.perf_counter() - inicio:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
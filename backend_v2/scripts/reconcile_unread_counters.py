@@ -0,0 +1,36 @@
+"""
+Job de reconciliación de contadores de no leídos
+
+Recalcula user_unread_counters (unread_notifications, unread_messages) desde
+las tablas notificaciones y mensajes, reparando cualquier desvío producido por
+escrituras que no pasaron por los servicios (scripts de seed, SQL manual).
+
+Ejecutar desde el directorio raiz (p.ej. desde cron, una vez por noche):
+    python backend_v2/scripts/reconcile_unread_counters.py [ruta/a/spm.db]
+"""
+
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend_v2.services.unread_counters import UnreadCounterService  # noqa: E402
+
+DB_PATH = ROOT_DIR / "backend_v2" / "spm.db"
+
+
+def main():
+    db_path = Path(sys.argv[1]) if len(sys.argv) > 1 else DB_PATH
+    if not db_path.exists():
+        print(f"ERROR: No se encontro la base de datos: {db_path}")
+        sys.exit(1)
+
+    print(f"Reconciliando contadores en {db_path}...")
+    result = UnreadCounterService.reconcile(str(db_path))
+    print(f"  Usuarios procesados: {result['usuarios']}")
+    print(f"  Contadores corregidos: {result['corregidos']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Job de retencion: archiva filas antiguas de notificaciones, mensajes,
+solicitud_tratamiento_log (desde la BD de auditoria) y presupuesto_ledger
+en la BD de archivo.
+
+Ejecutar desde el directorio raiz (p.ej. desde cron, semanalmente):
+    python backend_v2/scripts/run_retention.py [--dry-run] [--vacuum] [--table mensajes ...]
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend_v2.services.retention_service import RetentionService  # noqa: E402
+
+DB_PATH = ROOT_DIR / "backend_v2" / "spm.db"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archivado de tablas historicas")
+    parser.add_argument("--db", default=str(DB_PATH), help="Ruta de la BD principal")
+    parser.add_argument("--archive", default=None, help="Ruta de la BD de archivo")
+    parser.add_argument("--table", action="append", dest="tables", help="Tabla a procesar")
+    parser.add_argument("--dry-run", action="store_true", help="Solo contar candidatas")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM al final")
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        print(f"ERROR: No se encontro la base de datos: {db_path}")
+        sys.exit(1)
+
+    service = RetentionService(db_path=db_path, archive_path=args.archive)
+
+    print("=" * 60)
+    print("  RETENCION Y ARCHIVO")
+    print("=" * 60)
+    for policy in service.policies.values():
+        extra = f" y {policy.condition}" if policy.condition else ""
+        print(f"  {policy.table}: > {policy.retention_days} dias{extra}")
+
+    if args.dry_run:
+        print("\nFilas candidatas:")
+        for table, count in service.preview().items():
+            if not args.tables or table in args.tables:
+                print(f"  {table}: {count}")
+        return
+
+    report = service.run(tables=args.tables, vacuum=args.vacuum)
+    print(f"\nArchivo: {report['archive_path']}")
+    for table, info in report["tables"].items():
+        print(f"  {table}: {info['rows']} filas en {info['batches']} lotes (< {info['cutoff']})")
+    print(f"\nFilas archivadas: {report['rows_archived']}")
+    print(f"Bytes liberados en la BD: {report['bytes_freed']:,}")
+    print(f"Bytes recuperados en disco: {report['bytes_reclaimed']:,}")
+    print(f"Tiempo: {report['elapsed_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Escaneo de consumo inusual en solicitudes pendientes
+
+Puntúa todos los items de las solicitudes enviadas o aprobadas contra las
+estadísticas de demanda por material (media, desvío, mediana y MAD de los
+últimos 180 consumos) y reemplaza las marcas de solicitud_anomalias que
+ven los aprobadores en su bandeja.
+
+Ejecutar desde el directorio raiz (p.ej. desde cron, cada hora o luego de
+importar consumo):
+    python backend_v2/scripts/scan_anomalias_consumo.py [--db ruta/a/spm.db] [--recalcular]
+"""
+
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend_v2.services import anomalias_consumo  # noqa: E402
+
+DB_PATH = ROOT_DIR / "backend_v2" / "spm.db"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Escaneo de consumo inusual")
+    parser.add_argument("--db", default=str(DB_PATH), help="Ruta de la BD principal")
+    parser.add_argument(
+        "--recalcular",
+        action="store_true",
+        help="Recalcular estadisticas aunque no haya importaciones nuevas",
+    )
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        print(f"ERROR: No se encontro la base de datos: {db_path}")
+        sys.exit(1)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        if args.recalcular:
+            materiales = anomalias_consumo.recalcular_estadisticas(conn)
+            print(f"Estadisticas recalculadas: {materiales} materiales")
+        resumen = anomalias_consumo.escanear(conn)
+    finally:
+        conn.close()
+
+    print(f"Solicitudes escaneadas: {resumen['solicitudes']}")
+    print(f"Items: {resumen['items']} ({resumen['sin_historial']} sin historial)")
+    print(f"Anomalias: {resumen['anomalias']}")
+    print(f"Tiempo: {resumen['elapsed_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
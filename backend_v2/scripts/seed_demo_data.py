@@ -17,9 +17,16 @@ Genera:
 import json
 import random
 import sqlite3
+import sys
 from datetime import datetime, timedelta
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.services.audit_log import AuditLog, audit_path_for  # noqa: E402
+from backend_v2.services.message_threads import MessageThreadService  # noqa: E402
+from backend_v2.services.unread_counters import UnreadCounterService  # noqa: E402
+
 # Ruta a la base de datos
 DB_PATH = Path(__file__).parent.parent / "spm.db"
 
@@ -174,7 +181,7 @@ def generate_solicitudes(conn, materials):
     cursor.execute("DELETE FROM mensajes")
     cursor.execute("DELETE FROM foro_posts")
     cursor.execute("DELETE FROM foro_respuestas")
-    cursor.execute("DELETE FROM solicitud_tratamiento_log")
+    # El historial de tratamiento vive en la BD de auditoria append-only: no se borra
     conn.commit()
 
     solicitudes_creadas = []
@@ -280,8 +287,9 @@ def generate_solicitudes(conn, materials):
 
 
 def generate_tratamiento_log(conn, solicitudes):
-    """Genera historial de tratamiento para solicitudes"""
-    cursor = conn.cursor()
+    """Genera historial de tratamiento para solicitudes (en la BD de auditoria)"""
+    audit = AuditLog(audit_path_for(DB_PATH))
+    all_logs = []
 
     for sol in solicitudes:
         logs = []
@@ -405,26 +413,10 @@ def generate_tratamiento_log(conn, solicitudes):
                 }
             )
 
-        # Insertar logs
-        for log in logs:
-            cursor.execute(
-                """
-                INSERT INTO solicitud_tratamiento_log (
-                    solicitud_id, item_index, actor_id, tipo, estado, payload_json, created_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
-                (
-                    log["solicitud_id"],
-                    None,
-                    log["actor_id"],
-                    log["tipo"],
-                    log["estado"],
-                    log["payload_json"],
-                    log["created_at"],
-                ),
-            )
+        all_logs.extend(logs)
 
-    conn.commit()
+    # Escritura sincronica con las fechas del historial generado
+    audit.import_rows(all_logs)
 
 
 def generate_notificaciones(conn, solicitudes):
@@ -733,6 +725,10 @@ def main():
         post_count = cursor.fetchone()[0]
         print(f"      {msg_count} mensajes, {post_count} posts del foro")
 
+        # El seed inserta sin pasar por los servicios: recalcular badges e hilos
+        UnreadCounterService.reconcile(str(DB_PATH))
+        MessageThreadService.rebuild(str(DB_PATH))
+
         print("\n" + "=" * 60)
         print("  DATOS DEMO GENERADOS EXITOSAMENTE!")
         print("=" * 60)
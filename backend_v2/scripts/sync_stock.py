@@ -0,0 +1,72 @@
+"""
+Sincronizacion incremental de stock: aplica una exportacion SAP (xlsx o csv)
+sobre stock_almacenes escribiendo solo las filas que cambiaron.
+
+Ejecutar desde el directorio raiz:
+    python backend_v2/scripts/sync_stock.py export_stock.xlsx [--dry-run] [--sin-bajas]
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend_v2.services.stock_sync import (  # noqa: E402
+    BATCH_SIZE,
+    StockSyncService,
+    SyncConflictoError,
+)
+
+DB_PATH = ROOT_DIR / "backend_v2" / "spm.db"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sincronizacion incremental de stock SAP")
+    parser.add_argument("archivo", help="Exportacion de stock (.xlsx o .csv)")
+    parser.add_argument("--db", default=str(DB_PATH), help="Ruta de la BD principal")
+    parser.add_argument("--dry-run", action="store_true", help="Solo calcular diferencias")
+    parser.add_argument(
+        "--sin-bajas", action="store_true", help="No eliminar claves ausentes en la exportacion"
+    )
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Cambios por lote")
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        print(f"ERROR: No se encontro la base de datos: {db_path}")
+        sys.exit(1)
+    archivo = Path(args.archivo)
+    if not archivo.exists():
+        print(f"ERROR: No se encontro la exportacion: {archivo}")
+        sys.exit(1)
+
+    service = StockSyncService(db_path=db_path, batch_size=args.batch_size)
+
+    print("=" * 60)
+    print("  SINCRONIZACION DE STOCK")
+    print("=" * 60)
+    try:
+        reporte = service.sync(archivo, dry_run=args.dry_run, con_bajas=not args.sin_bajas)
+    except (ValueError, SyncConflictoError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    print(f"  Archivo: {reporte['archivo']} ({reporte['filas_exportacion']} filas)")
+    print(f"  Altas: {reporte['altas']}")
+    print(f"  Modificaciones: {reporte['modificaciones']}")
+    print(f"  Bajas: {reporte['bajas']}")
+    print(f"  Materiales afectados: {reporte['materiales_afectados']}")
+    if args.dry_run:
+        print("\n  (dry-run: no se escribieron cambios)")
+    elif reporte["sync_id"]:
+        print(f"\n  Sync #{reporte['sync_id']}: {reporte['lotes']} lotes")
+        print(f"  Version de datos de referencia: {reporte['version']}")
+    else:
+        print("\n  Sin cambios")
+    print(f"  Tiempo: {reporte['elapsed_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
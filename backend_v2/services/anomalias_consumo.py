@@ -0,0 +1,408 @@
+"""
+Detección en lote de consumo inusual en solicitudes pendientes
+
+El análisis PASO 1 marca consumo_inusual solo al abrir una solicitud y con
+una regla fija (pedido > 1.5x el promedio de los últimos 180 consumos).
+Este módulo puntúa de una vez todos los items de las solicitudes enviadas o
+aprobadas y guarda las marcas en solicitud_anomalias, de donde las leen las
+bandejas sin recalcular nada:
+
+1. consumo_estadisticas: por material, sobre sus últimos 180 movimientos
+   del histórico en BD (services/consumo_store): registros, media, desvío,
+   mediana y MAD. Se recalcula cuando hay una importación de consumo nueva.
+2. Cada item se puntúa con operaciones sobre columnas:
+   - z robusto = 0.6745 * (cantidad - mediana) / MAD  (anomalía si > 3.5)
+   - si MAD = 0: z = (cantidad - media) / desvío       (anomalía si > 3)
+   - con pocos registros o sin dispersión: cantidad > 1.5x la media
+"""
+
+import json
+import sqlite3
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    from backend_v2.core.utils import norm_codigo, tiene_tabla
+except ImportError:
+    from core.utils import norm_codigo, tiene_tabla
+
+RECIENTES = 180
+MIN_REGISTROS = 5
+Z_ROBUSTO_MAX = 3.5
+Z_MAX = 3.0
+FACTOR_PROMEDIO = 1.5
+# Constante de consistencia del MAD con el desvío de una normal
+K_MAD = 0.6745
+
+# Status (en minúsculas) de las solicitudes que se escanean
+ESTADOS_ESCANEO = (
+    "enviada",
+    "pendiente",
+    "pendiente de aprobación",
+    "submitted",
+    "aprobada",
+    "en progreso",
+    "en tratamiento",
+)
+
+METODO_ROBUSTO = "z_robusto"
+METODO_Z = "z"
+METODO_PROMEDIO = "promedio"
+
+CREATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS consumo_estadisticas (
+    codigo_norm TEXT PRIMARY KEY,
+    registros INTEGER NOT NULL,
+    media REAL NOT NULL,
+    desvio REAL NOT NULL,
+    mediana REAL NOT NULL,
+    mad REAL NOT NULL,
+    importacion_id INTEGER,
+    updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS solicitud_anomalias (
+    solicitud_id INTEGER NOT NULL,
+    item_index INTEGER NOT NULL,
+    codigo_norm TEXT NOT NULL,
+    cantidad REAL NOT NULL,
+    registros INTEGER NOT NULL,
+    media REAL NOT NULL,
+    mediana REAL NOT NULL,
+    z_score REAL,
+    z_robusto REAL,
+    ratio REAL,
+    metodo TEXT NOT NULL,
+    scan_at TEXT NOT NULL,
+    PRIMARY KEY (solicitud_id, item_index)
+);
+"""
+
+COLUMNAS_ESTADISTICAS = ["codigo_norm", "registros", "media", "desvio", "mediana", "mad"]
+
+
+def ensure_schema(conn: sqlite3.Connection) -> None:
+    """Crear consumo_estadisticas y solicitud_anomalias si no existen"""
+    conn.executescript(CREATE_SCHEMA)
+
+
+def estadisticas_demanda(movimientos: pd.DataFrame) -> pd.DataFrame:
+    """
+    Estadísticas por material de un conjunto de movimientos.
+
+    Args:
+        movimientos: Columnas codigo_norm y cantidad
+
+    Returns:
+        DataFrame con codigo_norm, registros, media, desvio (muestral, 0 con
+        un registro), mediana y mad (mediana de desvíos absolutos)
+    """
+    if movimientos.empty:
+        return pd.DataFrame(columns=COLUMNAS_ESTADISTICAS)
+    grupos = movimientos.groupby("codigo_norm")["cantidad"]
+    desvio_abs = (movimientos["cantidad"] - grupos.transform("median")).abs()
+    stats = grupos.agg(registros="count", media="mean", desvio="std", mediana="median")
+    stats["mad"] = desvio_abs.groupby(movimientos["codigo_norm"]).median()
+    stats["desvio"] = stats["desvio"].fillna(0.0)
+    return stats.reset_index()[COLUMNAS_ESTADISTICAS]
+
+
+def _importacion_actual(conn: sqlite3.Connection) -> Optional[int]:
+    if not tiene_tabla(conn, "consumo_importaciones"):
+        return None
+    return conn.execute("SELECT MAX(id) FROM consumo_importaciones").fetchone()[0]
+
+
+def estadisticas_vigentes(conn: sqlite3.Connection) -> bool:
+    """Si consumo_estadisticas ya refleja la última importación de consumo"""
+    ensure_schema(conn)
+    calculada, filas = conn.execute(
+        "SELECT MAX(importacion_id), COUNT(*) FROM consumo_estadisticas"
+    ).fetchone()
+    return filas > 0 and calculada == _importacion_actual(conn)
+
+
+def recalcular_estadisticas(conn: sqlite3.Connection, n: int = RECIENTES) -> int:
+    """
+    Recalcular consumo_estadisticas desde los últimos n movimientos de cada
+    material del histórico en BD.
+
+    Returns:
+        Cantidad de materiales con estadísticas
+    """
+    ensure_schema(conn)
+    if tiene_tabla(conn, "consumo_movimientos"):
+        movimientos = pd.read_sql_query(
+            """
+            SELECT codigo_norm, cantidad FROM (
+                SELECT codigo_norm, cantidad,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY codigo_norm ORDER BY fecha DESC, id
+                       ) AS rn
+                FROM consumo_movimientos
+            )
+            WHERE rn <= ?
+            """,
+            conn,
+            params=[n],
+        )
+    else:
+        movimientos = pd.DataFrame(columns=["codigo_norm", "cantidad"])
+    stats = estadisticas_demanda(movimientos)
+
+    importacion_id = _importacion_actual(conn)
+    now = datetime.utcnow().isoformat()
+    try:
+        conn.execute("DELETE FROM consumo_estadisticas")
+        conn.executemany(
+            """
+            INSERT INTO consumo_estadisticas
+                (codigo_norm, registros, media, desvio, mediana, mad, importacion_id, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (codigo, int(registros), media, desvio, mediana, mad, importacion_id, now)
+                for codigo, registros, media, desvio, mediana, mad in stats.itertuples(
+                    index=False
+                )
+            ],
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(stats)
+
+
+def puntuar(items: pd.DataFrame, stats: pd.DataFrame) -> pd.DataFrame:
+    """
+    Puntuar items contra las estadísticas de su material en una pasada.
+
+    Args:
+        items: Columnas codigo_norm y cantidad (más las que se quieran conservar)
+        stats: Resultado de estadisticas_demanda
+
+    Returns:
+        items con registros, media, mediana, z_score, z_robusto, ratio,
+        metodo y anomalia (bool). Sin historial, anomalia es False.
+    """
+    df = items.merge(stats, on="codigo_norm", how="left")
+    registros = df["registros"].fillna(0).to_numpy(dtype=float)
+    cantidad = df["cantidad"].to_numpy(dtype=float)
+    media = df["media"].to_numpy(dtype=float)
+    desvio = df["desvio"].to_numpy(dtype=float)
+    mediana = df["mediana"].to_numpy(dtype=float)
+    mad = df["mad"].to_numpy(dtype=float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z_robusto = np.where(mad > 0, K_MAD * (cantidad - mediana) / mad, np.nan)
+        z_score = np.where(desvio > 0, (cantidad - media) / desvio, np.nan)
+        ratio = np.where(media > 0, cantidad / media, np.nan)
+
+    suficientes = registros >= MIN_REGISTROS
+    usa_robusto = suficientes & (mad > 0)
+    usa_z = suficientes & ~usa_robusto & (desvio > 0)
+    usa_promedio = (registros > 0) & ~usa_robusto & ~usa_z
+
+    df["registros"] = registros.astype(int)
+    df["z_score"] = z_score
+    df["z_robusto"] = z_robusto
+    df["ratio"] = ratio
+    df["metodo"] = np.select(
+        [usa_robusto, usa_z, usa_promedio], [METODO_ROBUSTO, METODO_Z, METODO_PROMEDIO], None
+    )
+    df["anomalia"] = (
+        (usa_robusto & (z_robusto > Z_ROBUSTO_MAX))
+        | (usa_z & (z_score > Z_MAX))
+        | (usa_promedio & (ratio > FACTOR_PROMEDIO))
+    )
+    return df.drop(columns=["desvio", "mad"])
+
+
+def _items_pendientes(
+    conn: sqlite3.Connection, estados: Iterable[str], solicitud_ids: Optional[List[int]]
+) -> pd.DataFrame:
+    """Items de las solicitudes a escanear como DataFrame"""
+    estados = [e.lower() for e in estados]
+    sql = (
+        "SELECT id, data_json FROM solicitudes "
+        f"WHERE LOWER(status) IN ({','.join('?' * len(estados))})"
+    )
+    params: List[Any] = list(estados)
+    if solicitud_ids is not None:
+        sql += f" AND id IN ({','.join('?' * len(solicitud_ids))})"
+        params.extend(solicitud_ids)
+
+    filas = []
+    for solicitud_id, data_json in conn.execute(sql, params):
+        try:
+            items = json.loads(data_json or "{}").get("items") or []
+        except (json.JSONDecodeError, AttributeError):
+            continue
+        for idx, item in enumerate(items):
+            codigo = norm_codigo(item.get("codigo"))
+            if codigo:
+                filas.append((solicitud_id, idx, codigo, item.get("cantidad")))
+    items = pd.DataFrame(filas, columns=["solicitud_id", "item_index", "codigo_norm", "cantidad"])
+    items["cantidad"] = pd.to_numeric(items["cantidad"], errors="coerce").fillna(0.0)
+    return items
+
+
+def _nulo(valor: float) -> Optional[float]:
+    return None if pd.isna(valor) else float(valor)
+
+
+def escanear(
+    conn: sqlite3.Connection,
+    solicitud_ids: Optional[List[int]] = None,
+    estados: Iterable[str] = ESTADOS_ESCANEO,
+    recalcular: bool = True,
+) -> Dict[str, Any]:
+    """
+    Puntuar los items de las solicitudes pendientes y guardar las anomalías.
+
+    Un escaneo completo reemplaza todas las marcas (las de solicitudes que
+    ya no están pendientes desaparecen); con solicitud_ids solo se
+    reemplazan las de esas solicitudes. Las estadísticas se recalculan si
+    hubo una importación de consumo desde el último cálculo.
+
+    Args:
+        conn: Conexión a la BD principal
+        solicitud_ids: Escanear solo estas solicitudes (default: todas)
+        estados: Status (en minúsculas) a escanear
+        recalcular: Recalcular estadísticas desactualizadas antes de puntuar
+
+    Returns:
+        Resumen: solicitudes, items, sin_historial, anomalias y elapsed_ms
+    """
+    inicio = time.perf_counter()
+    if solicitud_ids is not None and not solicitud_ids:
+        return {"solicitudes": 0, "items": 0, "sin_historial": 0, "anomalias": 0, "elapsed_ms": 0}
+    ensure_schema(conn)
+    if recalcular and not estadisticas_vigentes(conn):
+        recalcular_estadisticas(conn)
+
+    items = _items_pendientes(conn, estados, solicitud_ids)
+    sql = f"SELECT {', '.join(COLUMNAS_ESTADISTICAS)} FROM consumo_estadisticas"
+    codigos: List[str] = []
+    if solicitud_ids is not None:
+        # Escaneo parcial: solo las estadísticas de los materiales pedidos
+        codigos = items["codigo_norm"].unique().tolist() or [""]
+        sql += f" WHERE codigo_norm IN ({','.join('?' * len(codigos))})"
+    stats = pd.read_sql_query(sql, conn, params=codigos)
+    puntuados = puntuar(items, stats)
+    anomalias = puntuados[puntuados["anomalia"]]
+
+    now = datetime.utcnow().isoformat()
+    filas = [
+        (
+            int(r.solicitud_id),
+            int(r.item_index),
+            r.codigo_norm,
+            float(r.cantidad),
+            int(r.registros),
+            float(r.media),
+            float(r.mediana),
+            _nulo(r.z_score),
+            _nulo(r.z_robusto),
+            _nulo(r.ratio),
+            r.metodo,
+            now,
+        )
+        for r in anomalias.itertuples(index=False)
+    ]
+    try:
+        if solicitud_ids is None:
+            conn.execute("DELETE FROM solicitud_anomalias")
+        else:
+            conn.execute(
+                "DELETE FROM solicitud_anomalias "
+                f"WHERE solicitud_id IN ({','.join('?' * len(solicitud_ids))})",
+                list(solicitud_ids),
+            )
+        conn.executemany(
+            """
+            INSERT INTO solicitud_anomalias
+                (solicitud_id, item_index, codigo_norm, cantidad, registros, media, mediana,
+                 z_score, z_robusto, ratio, metodo, scan_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            filas,
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return {
+        "solicitudes": int(items["solicitud_id"].nunique()),
+        "items": len(items),
+        "sin_historial": int((puntuados["registros"] == 0).sum()),
+        "anomalias": len(filas),
+        "elapsed_ms": int((time.perf_counter() - inicio) * 1000),
+    }
+
+
+def estado_escaneo(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """Resumen de las marcas guardadas y de las estadísticas vigentes"""
+    ensure_schema(conn)
+    anomalias, solicitudes, ultimo = conn.execute(
+        "SELECT COUNT(*), COUNT(DISTINCT solicitud_id), MAX(scan_at) FROM solicitud_anomalias"
+    ).fetchone()
+    materiales, calculadas = conn.execute(
+        "SELECT COUNT(*), MAX(updated_at) FROM consumo_estadisticas"
+    ).fetchone()
+    return {
+        "anomalias": anomalias,
+        "solicitudes": solicitudes,
+        "ultimo_escaneo": ultimo,
+        "materiales_con_estadisticas": materiales,
+        "estadisticas_calculadas": calculadas,
+        "estadisticas_vigentes": estadisticas_vigentes(conn),
+    }
+
+
+def anomalias_por_solicitud(
+    conn: sqlite3.Connection, solicitud_ids: List[int]
+) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Anomalías guardadas de varias solicitudes (para las bandejas).
+
+    Returns:
+        Dict solicitud_id -> lista de anomalías por item (solo solicitudes
+        con anomalías)
+    """
+    if not solicitud_ids or not tiene_tabla(conn, "solicitud_anomalias"):
+        return {}
+    cur = conn.execute(
+        f"""
+        SELECT solicitud_id, item_index, codigo_norm, cantidad, registros, media, mediana,
+               z_score, z_robusto, ratio, metodo, scan_at
+        FROM solicitud_anomalias
+        WHERE solicitud_id IN ({','.join('?' * len(solicitud_ids))})
+        ORDER BY solicitud_id, item_index
+        """,
+        list(solicitud_ids),
+    )
+    columnas = [c[0] for c in cur.description]
+    resultado: Dict[int, List[Dict[str, Any]]] = {}
+    for fila in cur.fetchall():
+        anomalia = dict(zip(columnas, fila))
+        resultado.setdefault(anomalia.pop("solicitud_id"), []).append(anomalia)
+    return resultado
+
+
+def actualizar_solicitud(conn: sqlite3.Connection, solicitud_id: int) -> None:
+    """
+    Re-escanear una solicitud al enviarla o editarla, con las estadísticas
+    ya calculadas (el recálculo queda para el job). Un error no debe
+    interrumpir la operación del llamador.
+    """
+    try:
+        escanear(conn, [solicitud_id], recalcular=False)
+    except Exception as e:
+        print(f"Error escaneando anomalías de la solicitud {solicitud_id}: {e}")
@@ -0,0 +1,331 @@
+"""
+Asignación de presupuesto a solicitudes pendientes
+
+Los aprobadores deciden solicitud por solicitud si el presupuesto de
+(centro, sector) alcanza. Este módulo elige de una vez qué items de las
+solicitudes pendientes de ese alcance financiar con el saldo actual
+(presupuestos.saldo_cents):
+
+1. Items de las solicitudes enviadas del centro/sector. Las aprobadas no
+   entran: aprobar ya descuenta su monto del saldo.
+2. Cobertura con stock: el stock libre de cada material/almacén (índice de
+   stock menos lo comprometido, services/atp) se reparte entre los items
+   por prioridad; solo la cantidad sin cubrir se compra.
+   costo_cents = cantidad_compra * precio_unitario * 100
+3. Mochila 0/1: maximizar sum(prioridad * costo) con sum(costo) <= saldo,
+   es decir gastar el saldo en lo más prioritario. La prioridad es el
+   total_score de ScoringPipeline de la solicitud. Los casos chicos
+   (items x saldo en centavos <= DP_MAX_CELDAS) se resuelven exactos con
+   programación dinámica; el resto con scipy.optimize.milp (HiGHS) con
+   límite de tiempo.
+
+Con por_solicitud=True cada solicitud se financia completa o no se
+financia, como en la aprobación.
+"""
+
+import json
+import sqlite3
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import Bounds, LinearConstraint, milp
+
+try:
+    from backend_v2.core.services.stock_index import get_stock_index
+    from backend_v2.core.utils import norm_codigo, tiene_tabla
+    from backend_v2.services.atp import ATPService
+except ImportError:
+    from core.services.stock_index import get_stock_index
+    from core.utils import norm_codigo, tiene_tabla
+    from services.atp import ATPService
+
+# Status (en minúsculas) de las solicitudes que esperan aprobación
+ESTADOS_PENDIENTES = ("enviada", "submitted", "pendiente", "pendiente de aprobación")
+
+DP_MAX_CELDAS = 5_000_000
+MILP_TIEMPO_MAX = 2.0
+MILP_GAP = 1e-4
+
+METODO_TRIVIAL = "trivial"
+METODO_DP = "dp"
+METODO_MILP = "milp"
+
+# Clave de stock: (codigo_norm, almacen de la solicitud)
+ClaveStock = Tuple[str, str]
+
+
+def _scoring_pipeline():
+    # Import diferido: el paquete agent carga dependencias de ML
+    try:
+        from backend_v2.agent.pipelines.scoring import ScoringPipeline
+    except ImportError:
+        from agent.pipelines.scoring import ScoringPipeline
+    return ScoringPipeline()
+
+
+def _nombres_sector(conn: sqlite3.Connection) -> Dict[str, str]:
+    """
+    id -> nombre de catalog_sectores, para solicitudes que guardan el id.
+
+    El esquema actual usa el nombre como clave (sin columna id): entonces
+    las solicitudes guardan el nombre y no hay nada que traducir.
+    """
+    if not tiene_tabla(conn, "catalog_sectores"):
+        return {}
+    columnas = {c[1] for c in conn.execute("PRAGMA table_info(catalog_sectores)")}
+    if "id" not in columnas:
+        return {}
+    return {str(i): n for i, n in conn.execute("SELECT id, nombre FROM catalog_sectores")}
+
+
+def cargar_items(conn: sqlite3.Connection, centro: str, sector: str) -> pd.DataFrame:
+    """
+    Items de las solicitudes pendientes de un alcance de presupuesto.
+
+    Returns:
+        DataFrame con solicitud_id, item_index, codigo, codigo_norm, almacen,
+        cantidad, precio_unitario (del item o de materiales.precio_usd) y
+        prioridad (total_score de la solicitud)
+    """
+    sectores = _nombres_sector(conn)
+    cur = conn.execute(
+        f"""
+        SELECT id, centro, sector, almacen_virtual, criticidad, fecha_necesidad,
+               total_monto, data_json
+        FROM solicitudes
+        WHERE centro = ? AND LOWER(status) IN ({",".join("?" * len(ESTADOS_PENDIENTES))})
+        """,
+        [str(centro)] + list(ESTADOS_PENDIENTES),
+    )
+    columnas = [c[0] for c in cur.description]
+    pipeline = _scoring_pipeline()
+    filas = []
+    for fila in cur.fetchall():
+        solicitud = dict(zip(columnas, fila))
+        sector_solicitud = str(solicitud["sector"] or "")
+        if sectores.get(sector_solicitud, sector_solicitud) != sector:
+            continue
+        try:
+            solicitud["data_json"] = json.loads(solicitud["data_json"] or "{}")
+        except json.JSONDecodeError:
+            continue
+        solicitud["total_monto"] = solicitud["total_monto"] or 0
+        prioridad = pipeline.score_solicitud(solicitud)["total_score"]
+        for idx, item in enumerate(solicitud["data_json"].get("items") or []):
+            filas.append(
+                (
+                    solicitud["id"],
+                    idx,
+                    str(item.get("codigo") or ""),
+                    str(solicitud["almacen_virtual"] or ""),
+                    item.get("cantidad"),
+                    item.get("precio_unitario"),
+                    prioridad,
+                )
+            )
+
+    items = pd.DataFrame(
+        filas,
+        columns=[
+            "solicitud_id", "item_index", "codigo", "almacen", "cantidad",
+            "precio_unitario", "prioridad",
+        ],
+    )
+    items["codigo_norm"] = items["codigo"].map(norm_codigo)
+    items["cantidad"] = pd.to_numeric(items["cantidad"], errors="coerce").fillna(0.0)
+    items["precio_unitario"] = pd.to_numeric(items["precio_unitario"], errors="coerce")
+
+    sin_precio = items["precio_unitario"].isna() | (items["precio_unitario"] <= 0)
+    if sin_precio.any() and tiene_tabla(conn, "materiales"):
+        codigos = items.loc[sin_precio, "codigo"].unique().tolist()
+        precios = dict(
+            conn.execute(
+                f"SELECT codigo, precio_usd FROM materiales "
+                f"WHERE codigo IN ({','.join('?' * len(codigos))})",
+                codigos,
+            ).fetchall()
+        )
+        items.loc[sin_precio, "precio_unitario"] = items.loc[sin_precio, "codigo"].map(precios)
+    items["precio_unitario"] = pd.to_numeric(items["precio_unitario"], errors="coerce").fillna(0.0)
+    return items
+
+
+def stock_libre(
+    conn: sqlite3.Connection, items: pd.DataFrame, centro: str
+) -> Dict[ClaveStock, float]:
+    """
+    Stock libre por material y almacén: índice de stock menos lo
+    comprometido por decisiones 'stock' de solicitudes abiertas.
+    """
+    index = get_stock_index()
+    libre: Dict[ClaveStock, float] = {}
+    for almacen, grupo in items.groupby("almacen"):
+        codigos = grupo["codigo"].unique().tolist()
+        comprometido = ATPService.comprometido_batch(conn, codigos, centro, almacen or None)
+        for codigo in codigos:
+            clave = (norm_codigo(codigo), almacen)
+            fisico = index.disponible(codigo, centro, almacen or None)
+            libre[clave] = max(fisico - comprometido.get(clave[0], 0.0), 0.0)
+    return libre
+
+
+def cubrir_con_stock(items: pd.DataFrame, libre: Dict[ClaveStock, float]) -> pd.DataFrame:
+    """
+    Repartir el stock libre entre los items, los más prioritarios primero.
+
+    Returns:
+        items con cantidad_stock, cantidad_compra y costo_cents
+    """
+    df = items.sort_values(
+        ["prioridad", "solicitud_id", "item_index"], ascending=[False, True, True]
+    ).copy()
+    claves = list(zip(df["codigo_norm"], df["almacen"]))
+    disponible = np.array([libre.get(c, 0.0) for c in claves], dtype=float)
+    pedido_previo = df.groupby(["codigo_norm", "almacen"])["cantidad"].cumsum() - df["cantidad"]
+    df["cantidad_stock"] = np.clip(disponible - pedido_previo.to_numpy(), 0, df["cantidad"])
+    df["cantidad_compra"] = df["cantidad"] - df["cantidad_stock"]
+    df["costo_cents"] = np.round(df["cantidad_compra"] * df["precio_unitario"] * 100).astype(
+        np.int64
+    )
+    return df.sort_values(["solicitud_id", "item_index"]).reset_index(drop=True)
+
+
+def _mochila_dp(valores: np.ndarray, costos: np.ndarray, capacidad: int) -> np.ndarray:
+    """Mochila 0/1 exacta; una fila de decisiones por item para reconstruir"""
+    mejor = np.zeros(capacidad + 1)
+    toma = np.zeros((len(valores), capacidad + 1), dtype=bool)
+    for i, (valor, costo) in enumerate(zip(valores, costos)):
+        candidato = np.full(capacidad + 1, -np.inf)
+        candidato[costo:] = mejor[: capacidad + 1 - costo] + valor
+        toma[i] = candidato > mejor
+        mejor = np.maximum(mejor, candidato)
+
+    elegidos = np.zeros(len(valores), dtype=bool)
+    resto = capacidad
+    for i in range(len(valores) - 1, -1, -1):
+        if toma[i, resto]:
+            elegidos[i] = True
+            resto -= costos[i]
+    return elegidos
+
+
+def seleccionar(
+    valores: np.ndarray, costos: np.ndarray, capacidad: int
+) -> Tuple[np.ndarray, str, bool]:
+    """
+    Elegir el subconjunto de mayor valor cuyo costo entra en la capacidad.
+
+    Los costos 0 siempre se eligen y los mayores que la capacidad nunca.
+
+    Returns:
+        (máscara de elegidos, método, si la solución es óptima probada)
+    """
+    capacidad = max(int(capacidad), 0)
+    elegidos = costos == 0
+    candidatos = np.flatnonzero((costos > 0) & (costos <= capacidad))
+    if len(candidatos) == 0:
+        return elegidos, METODO_TRIVIAL, True
+    if costos[candidatos].sum() <= capacidad:
+        elegidos[candidatos] = True
+        return elegidos, METODO_TRIVIAL, True
+
+    v, c = valores[candidatos], costos[candidatos]
+    # Escala común: el DP trabaja en unidades del MCD de los costos
+    paso = int(np.gcd.reduce(np.append(c, capacidad))) or 1
+    if len(candidatos) * (capacidad // paso + 1) <= DP_MAX_CELDAS:
+        elegidos[candidatos] = _mochila_dp(v, c // paso, capacidad // paso)
+        return elegidos, METODO_DP, True
+
+    resultado = milp(
+        -v,
+        constraints=LinearConstraint(c.astype(float)[np.newaxis, :], -np.inf, capacidad),
+        integrality=np.ones(len(candidatos)),
+        bounds=Bounds(0, 1),
+        options={"time_limit": MILP_TIEMPO_MAX, "mip_rel_gap": MILP_GAP},
+    )
+    if resultado.x is None:
+        raise RuntimeError(f"No se pudo resolver la asignación: {resultado.message}")
+    elegidos[candidatos] = resultado.x > 0.5
+    return elegidos, METODO_MILP, resultado.status == 0
+
+
+def optimizar(
+    conn: sqlite3.Connection,
+    centro: str,
+    sector: str,
+    saldo_cents: int,
+    por_solicitud: bool = False,
+    libre: Optional[Dict[ClaveStock, float]] = None,
+) -> Dict[str, Any]:
+    """
+    Qué items (o solicitudes) de un alcance financiar con el saldo.
+
+    Args:
+        conn: Conexión a la BD principal
+        centro, sector: Alcance del presupuesto (sector por nombre)
+        saldo_cents: Saldo disponible (presupuestos.saldo_cents)
+        por_solicitud: Financiar solicitudes completas en vez de items
+        libre: Stock libre por (codigo_norm, almacen); default stock_libre()
+
+    Returns:
+        Dict con el resumen de la asignación, 'items' y 'solicitudes'
+    """
+    inicio = time.perf_counter()
+    items = cargar_items(conn, centro, sector)
+    if libre is None:
+        libre = stock_libre(conn, items, centro)
+    items = cubrir_con_stock(items, libre)
+
+    if por_solicitud:
+        grupos = items.groupby("solicitud_id")
+        unidades = pd.DataFrame(
+            {"costo_cents": grupos["costo_cents"].sum(), "prioridad": grupos["prioridad"].first()}
+        )
+    else:
+        unidades = items[["costo_cents", "prioridad"]]
+    costos = unidades["costo_cents"].to_numpy(dtype=np.int64)
+    valores = unidades["prioridad"].to_numpy(dtype=float) * costos
+    elegidos, metodo, optimo = seleccionar(valores, costos, saldo_cents)
+
+    if por_solicitud:
+        financiadas = set(unidades.index[elegidos])
+        items["financiado"] = items["solicitud_id"].isin(financiadas)
+    else:
+        items["financiado"] = elegidos
+
+    costo_financiado = int(items.loc[items["financiado"], "costo_cents"].sum())
+    solicitudes = (
+        items.assign(costo_financiado_cents=items["costo_cents"].where(items["financiado"], 0))
+        .groupby("solicitud_id")
+        .agg(
+            prioridad=("prioridad", "first"),
+            items=("item_index", "count"),
+            items_financiados=("financiado", "sum"),
+            costo_cents=("costo_cents", "sum"),
+            costo_financiado_cents=("costo_financiado_cents", "sum"),
+        )
+        .reset_index()
+        .sort_values(["prioridad", "solicitud_id"], ascending=[False, True])
+    )
+    solicitudes["completa"] = solicitudes["items_financiados"] == solicitudes["items"]
+
+    columnas_item = [
+        "solicitud_id", "item_index", "codigo", "almacen", "cantidad", "cantidad_stock",
+        "cantidad_compra", "precio_unitario", "costo_cents", "prioridad", "financiado",
+    ]
+    return {
+        "centro": centro,
+        "sector": sector,
+        "saldo_cents": int(saldo_cents),
+        "por_solicitud": por_solicitud,
+        "metodo": metodo,
+        "optimo": optimo,
+        "costo_total_cents": int(items["costo_cents"].sum()),
+        "costo_financiado_cents": costo_financiado,
+        "saldo_restante_cents": int(saldo_cents) - costo_financiado,
+        "items": items[columnas_item].astype(object).to_dict("records"),
+        "solicitudes": solicitudes.astype(object).to_dict("records"),
+        "elapsed_ms": int((time.perf_counter() - inicio) * 1000),
+    }
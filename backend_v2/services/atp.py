@@ -0,0 +1,421 @@
+"""
+Stock comprometido y disponible para prometer (ATP)
+
+Las decisiones de tratamiento con decision = 'stock' reservan stock que
+todavía figura en stock_almacenes hasta que SAP registra la salida. Este
+módulo mantiene esas reservas materializadas:
+- stock_compromisos: una fila por item tratado (solicitud_id, item_index)
+  con el material, la ubicación y la cantidad comprometida
+- stock_comprometido: suma por (codigo_norm, centro, almacen), que se lee
+  con una búsqueda por PK en vez de recorrer las decisiones
+
+sincronizar() recalcula las reservas de una solicitud y aplica la
+diferencia al total dentro de la transacción del llamador (al guardar
+decisiones o cambiar el status). Una solicitud cerrada (despachada,
+rechazada, etc.) no compromete stock. reconstruir() recalcula todo desde
+las tablas fuente para reparar desvíos.
+
+Las reservas se guardan por almacén físico (core/utils.almacen_fisico):
+la solicitud tiene un almacén virtual ('ALM0001') y el stock está por
+almacén físico ('0001'). Una solicitud sin almacén reserva a nivel de
+centro (almacen = '') y esa reserva se descuenta de todos sus almacenes.
+
+disponible = stock (índice de stock) - comprometido
+"""
+
+import json
+import logging
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from backend_v2.core.utils import almacen_fisico, norm_codigo
+except ImportError:
+    from core.utils import almacen_fisico, norm_codigo
+
+logger = logging.getLogger(__name__)
+
+# Status de solicitud que liberan el stock comprometido
+ESTADOS_CERRADOS = {
+    "rechazada",
+    "cancelada",
+    "anulada",
+    "despachada",
+    "cerrada",
+    "finalizada",
+    "completada",
+}
+DECISION_STOCK = "stock"
+
+CREATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stock_compromisos (
+    solicitud_id INTEGER NOT NULL,
+    item_index INTEGER NOT NULL,
+    codigo_norm TEXT NOT NULL,
+    centro TEXT NOT NULL,
+    almacen TEXT NOT NULL,
+    cantidad REAL NOT NULL,
+    PRIMARY KEY (solicitud_id, item_index)
+);
+CREATE TABLE IF NOT EXISTS stock_comprometido (
+    codigo_norm TEXT NOT NULL,
+    centro TEXT NOT NULL,
+    almacen TEXT NOT NULL,
+    cantidad REAL NOT NULL DEFAULT 0,
+    updated_at TEXT,
+    PRIMARY KEY (codigo_norm, centro, almacen)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stock_comprometido_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT
+);
+"""
+
+# (codigo_norm, centro, almacen)
+Clave = Tuple[str, str, str]
+
+# Rutas de BD ya verificadas en este proceso (evita consultar sqlite_master cada vez)
+_ensured_paths = set()
+
+
+def _db_file(conn: sqlite3.Connection) -> str:
+    row = conn.execute("PRAGMA database_list").fetchone()
+    return row[2] if row else ""
+
+
+def _tablas(conn: sqlite3.Connection) -> set:
+    return {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+
+
+def _compromisos(
+    conn: sqlite3.Connection, solicitud_id: Optional[int] = None
+) -> Dict[Tuple[int, int], Tuple[str, str, str, float]]:
+    """
+    Reservas vigentes según las tablas fuente.
+
+    Args:
+        conn: Conexión abierta
+        solicitud_id: Solo esta solicitud (default: todas)
+
+    Returns:
+        Dict (solicitud_id, item_index) -> (codigo_norm, centro, almacen, cantidad)
+    """
+    if not {"solicitudes", "solicitud_items_tratamiento"} <= _tablas(conn):
+        return {}
+    sql = """
+        SELECT s.id, s.status, s.centro, s.almacen_virtual, s.data_json,
+               t.item_index, t.cantidad_aprobada, t.codigo_equivalente
+        FROM solicitud_items_tratamiento t
+        JOIN solicitudes s ON s.id = t.solicitud_id
+        WHERE LOWER(t.decision) = ? AND t.cantidad_aprobada > 0
+    """
+    params: List[Any] = [DECISION_STOCK]
+    if solicitud_id is not None:
+        sql += " AND t.solicitud_id = ?"
+        params.append(solicitud_id)
+
+    items_por_solicitud: Dict[int, List[Dict[str, Any]]] = {}
+    resultado = {}
+    for sid, status, centro, almacen, data_json, idx, cantidad, equivalente in conn.execute(
+        sql, params
+    ):
+        if (status or "").strip().lower() in ESTADOS_CERRADOS:
+            continue
+        if sid not in items_por_solicitud:
+            try:
+                items_por_solicitud[sid] = json.loads(data_json or "{}").get("items") or []
+            except (json.JSONDecodeError, AttributeError):
+                items_por_solicitud[sid] = []
+        items = items_por_solicitud[sid]
+        codigo = (equivalente or "").strip()
+        if not codigo and 0 <= idx < len(items):
+            codigo = str(items[idx].get("codigo") or "")
+        codigo = norm_codigo(codigo)
+        if not codigo:
+            continue
+        ubicacion = (norm_codigo(centro), almacen_fisico(almacen))
+        resultado[(sid, idx)] = (codigo, *ubicacion, float(cantidad))
+    return resultado
+
+
+def _ajustar(conn: sqlite3.Connection, deltas: Dict[Clave, float]) -> None:
+    """Sumar deltas al total comprometido (sin commit; nunca baja de 0)"""
+    now = datetime.utcnow().isoformat()
+    conn.executemany(
+        """
+        INSERT INTO stock_comprometido (codigo_norm, centro, almacen, cantidad, updated_at)
+        VALUES (?, ?, ?, MAX(?, 0), ?)
+        ON CONFLICT(codigo_norm, centro, almacen) DO UPDATE SET
+            cantidad = MAX(cantidad + ?, 0),
+            updated_at = excluded.updated_at
+        """,
+        [(*clave, delta, now, delta) for clave, delta in deltas.items() if delta],
+    )
+    conn.execute("DELETE FROM stock_comprometido WHERE cantidad <= 0")
+
+
+def _bump(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        INSERT INTO stock_comprometido_version (id, version, updated_at)
+        VALUES (1, 1, datetime('now'))
+        ON CONFLICT(id) DO UPDATE SET
+            version = version + 1,
+            updated_at = excluded.updated_at
+        """
+    )
+
+
+class ATPService:
+    """Mantenimiento y lectura del stock comprometido"""
+
+    @staticmethod
+    def ensure_tables(conn: sqlite3.Connection) -> None:
+        """
+        Crear las tablas de stock comprometido si no existen.
+
+        Si se crean en una BD que ya tiene decisiones, se reconstruyen de
+        inmediato. Debe invocarse antes de modificar decisiones o status; si
+        hay una transacción abierta, la creación queda dentro de ella y la
+        confirma el llamador.
+        """
+        path = _db_file(conn)
+        if path and path in _ensured_paths:
+            return
+        if "stock_comprometido" not in _tablas(conn):
+            in_transaction = conn.in_transaction
+            for sentencia in CREATE_SCHEMA.split(";"):
+                if sentencia.strip():
+                    conn.execute(sentencia)
+            ATPService._reconstruir_con(conn)
+            if not in_transaction:
+                conn.commit()
+        if path:
+            _ensured_paths.add(path)
+
+    @staticmethod
+    def sincronizar(conn: sqlite3.Connection, solicitud_id: int) -> bool:
+        """
+        Recalcular las reservas de una solicitud y ajustar el total.
+
+        No hace commit: el llamador confirma el ajuste junto con la
+        modificación de decisiones o status.
+
+        Args:
+            conn: Conexión con la transacción en curso
+            solicitud_id: ID de la solicitud modificada
+
+        Returns:
+            True si el stock comprometido cambió
+        """
+        ATPService.ensure_tables(conn)
+        nuevos = _compromisos(conn, solicitud_id)
+        previos = {
+            (solicitud_id, idx): (codigo, centro, almacen, cantidad)
+            for idx, codigo, centro, almacen, cantidad in conn.execute(
+                """
+                SELECT item_index, codigo_norm, centro, almacen, cantidad
+                FROM stock_compromisos WHERE solicitud_id = ?
+                """,
+                (solicitud_id,),
+            )
+        }
+        if nuevos == previos:
+            return False
+
+        deltas: Dict[Clave, float] = {}
+        for signo, filas in ((-1, previos), (1, nuevos)):
+            for codigo, centro, almacen, cantidad in filas.values():
+                clave = (codigo, centro, almacen)
+                deltas[clave] = deltas.get(clave, 0.0) + signo * cantidad
+
+        # Si algo falla, no queda un ajuste a medias en la transacción del llamador
+        conn.execute("SAVEPOINT atp")
+        try:
+            _ajustar(conn, deltas)
+            conn.execute("DELETE FROM stock_compromisos WHERE solicitud_id = ?", (solicitud_id,))
+            conn.executemany(
+                """
+                INSERT INTO stock_compromisos
+                    (solicitud_id, item_index, codigo_norm, centro, almacen, cantidad)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                [(sid, idx, *fila) for (sid, idx), fila in nuevos.items()],
+            )
+            _bump(conn)
+        except Exception:
+            conn.execute("ROLLBACK TO atp")
+            raise
+        finally:
+            conn.execute("RELEASE atp")
+        return True
+
+    @staticmethod
+    def get_version(conn: sqlite3.Connection) -> int:
+        """Versión del stock comprometido (0 si nunca se modificó)"""
+        if "stock_comprometido_version" not in _tablas(conn):
+            return 0
+        row = conn.execute("SELECT version FROM stock_comprometido_version WHERE id = 1").fetchone()
+        return int(row[0]) if row else 0
+
+    @staticmethod
+    def comprometido_batch(
+        conn: sqlite3.Connection,
+        codigos: Iterable[str],
+        centro: Optional[str] = None,
+        almacen: Optional[str] = None,
+        excluir_solicitud: Optional[int] = None,
+    ) -> Dict[str, float]:
+        """
+        Stock comprometido de varios materiales.
+
+        Args:
+            conn: Conexión abierta
+            codigos: Códigos de material
+            centro: Centro a filtrar (opcional)
+            almacen: Almacén físico o virtual a filtrar (opcional); incluye
+                las reservas sin almacén
+            excluir_solicitud: No contar las reservas de esta solicitud (la
+                que se está analizando)
+
+        Returns:
+            Dict codigo_norm -> cantidad comprometida (solo códigos con reservas)
+        """
+        ATPService.ensure_tables(conn)
+        normas = list(dict.fromkeys(norm_codigo(c) for c in codigos if norm_codigo(c)))
+        filtros, params_filtro = "", []
+        if centro:
+            filtros += " AND centro = ?"
+            params_filtro.append(norm_codigo(centro))
+        if almacen:
+            filtros += " AND almacen IN (?, '')"
+            params_filtro.append(almacen_fisico(almacen))
+
+        resultado: Dict[str, float] = {}
+        for i in range(0, len(normas), 500):
+            parte = normas[i : i + 500]
+            marcas = ",".join("?" * len(parte))
+            for codigo, cantidad in conn.execute(
+                f"""
+                SELECT codigo_norm, SUM(cantidad) FROM stock_comprometido
+                WHERE codigo_norm IN ({marcas}){filtros}
+                GROUP BY codigo_norm
+                """,
+                [*parte, *params_filtro],
+            ):
+                resultado[codigo] = float(cantidad or 0)
+            if excluir_solicitud is None:
+                continue
+            for codigo, cantidad in conn.execute(
+                f"""
+                SELECT codigo_norm, SUM(cantidad) FROM stock_compromisos
+                WHERE solicitud_id = ? AND codigo_norm IN ({marcas}){filtros}
+                GROUP BY codigo_norm
+                """,
+                [excluir_solicitud, *parte, *params_filtro],
+            ):
+                restante = resultado.get(codigo, 0.0) - float(cantidad or 0)
+                if restante > 0:
+                    resultado[codigo] = restante
+                else:
+                    resultado.pop(codigo, None)
+        return resultado
+
+    @staticmethod
+    def _reconstruir_con(conn: sqlite3.Connection) -> Dict[str, int]:
+        """Recalcular reservas y totales desde las tablas fuente (sin commit)"""
+        antes = {
+            (codigo, centro, almacen): cantidad
+            for codigo, centro, almacen, cantidad in conn.execute(
+                "SELECT codigo_norm, centro, almacen, cantidad FROM stock_comprometido"
+            )
+        }
+        compromisos = _compromisos(conn)
+        totales: Dict[Clave, float] = {}
+        for codigo, centro, almacen, cantidad in compromisos.values():
+            clave = (codigo, centro, almacen)
+            totales[clave] = totales.get(clave, 0.0) + cantidad
+
+        now = datetime.utcnow().isoformat()
+        conn.execute("DELETE FROM stock_compromisos")
+        conn.executemany(
+            """
+            INSERT INTO stock_compromisos
+                (solicitud_id, item_index, codigo_norm, centro, almacen, cantidad)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [(sid, idx, *fila) for (sid, idx), fila in compromisos.items()],
+        )
+        conn.execute("DELETE FROM stock_comprometido")
+        conn.executemany(
+            """
+            INSERT INTO stock_comprometido (codigo_norm, centro, almacen, cantidad, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [(*clave, cantidad, now) for clave, cantidad in totales.items() if cantidad > 0],
+        )
+
+        corregidos = sum(
+            1
+            for clave in set(antes) | set(totales)
+            if abs(antes.get(clave, 0.0) - totales.get(clave, 0.0)) > 1e-9
+        )
+        if corregidos:
+            _bump(conn)
+        return {
+            "compromisos": len(compromisos),
+            "materiales": len(totales),
+            "corregidos": corregidos,
+        }
+
+    @staticmethod
+    def reconstruir(db_path: Optional[Path] = None) -> Dict[str, int]:
+        """
+        Job de reconciliación: recalcula todo el stock comprometido.
+
+        Args:
+            db_path: Ruta de la BD (default: la de settings)
+
+        Returns:
+            Dict con reservas vigentes, ubicaciones con stock comprometido y
+            cantidad de totales corregidos
+        """
+        if db_path is None:
+            try:
+                from backend_v2.core.repository import _db_path
+            except ImportError:
+                from core.repository import _db_path
+            db_path = _db_path()
+
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for sentencia in CREATE_SCHEMA.split(";"):
+                if sentencia.strip():
+                    conn.execute(sentencia)
+            resultado = ATPService._reconstruir_con(conn)
+            conn.commit()
+            if _db_file(conn):
+                _ensured_paths.add(_db_file(conn))
+            return resultado
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+
+def actualizar_compromisos(conn: sqlite3.Connection, solicitud_id: int) -> None:
+    """
+    Ajustar el stock comprometido tras modificar decisiones o status.
+
+    Para usar dentro de la transacción del llamador: un error solo se
+    registra (reconstruir() repara el desvío) y no interrumpe la operación.
+    """
+    try:
+        ATPService.sincronizar(conn, solicitud_id)
+    except Exception as e:
+        logger.error("Error actualizando stock comprometido de solicitud %s: %s", solicitud_id, e)
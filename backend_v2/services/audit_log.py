@@ -0,0 +1,491 @@
+"""
+Log de auditoría append-only en BD separada
+
+Los eventos de tratamiento de solicitudes (solicitud_tratamiento_log) se
+escriben en un archivo SQLite propio (<nombre>_audit.db por defecto), de
+modo que la auditoría no compite por el lock de escritura de spm.db con las
+transacciones de presupuesto.
+
+Escritura:
+- append() solo encola el evento (con su created_at) y retorna.
+- Un hilo escritor por archivo vacía la cola en lotes: toma todo lo que haya
+  encolado (hasta max_batch) y lo inserta en una sola transacción. Con poca
+  carga cada evento se escribe de inmediato; con mucha, los eventos que
+  llegan durante un commit van juntos en el siguiente. La latencia queda
+  acotada a un commit.
+- WAL + synchronous=FULL: un lote confirmado sobrevive a una caída. Al
+  salir del proceso se vacía la cola (atexit); flush() permite esperar a
+  que lo encolado esté en disco.
+
+- Un lote que falla MAX_RETRIES veces seguidas (archivo bloqueado o
+  corrupto, disco lleno) se vuelca a <archivo>.spool.jsonl y se registra
+  el error; el escritor reintenta el volcado en el próximo lote confirmado.
+
+La tabla rechaza UPDATE por trigger y DELETE salvo para eventos ya
+archivados: la retención registra en audit_archivado hasta qué id copió al
+archivo (purge_archived) y solo esas filas pueden borrarse. Las lecturas
+(history, events_by_actor) esperan primero a lo encolado para ver las
+propias escrituras.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    from backend_v2.core.config import settings
+except ImportError:
+    from core.config import settings
+
+CREATE_AUDIT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS solicitud_tratamiento_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    solicitud_id INTEGER NOT NULL,
+    item_index INTEGER,
+    actor_id TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    estado TEXT,
+    payload_json TEXT,
+    created_at TEXT NOT NULL,
+    legacy_id INTEGER UNIQUE
+);
+CREATE INDEX IF NOT EXISTS idx_audit_solicitud
+    ON solicitud_tratamiento_log(solicitud_id, id);
+CREATE INDEX IF NOT EXISTS idx_audit_actor
+    ON solicitud_tratamiento_log(actor_id, id);
+CREATE TRIGGER IF NOT EXISTS audit_no_update
+    BEFORE UPDATE ON solicitud_tratamiento_log
+    BEGIN SELECT RAISE(ABORT, 'solicitud_tratamiento_log es append-only'); END;
+CREATE TABLE IF NOT EXISTS audit_archivado (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hasta_id INTEGER NOT NULL,
+    archivo TEXT NOT NULL,
+    filas INTEGER NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS audit_archivado_no_update
+    BEFORE UPDATE ON audit_archivado
+    BEGIN SELECT RAISE(ABORT, 'audit_archivado es append-only'); END;
+CREATE TRIGGER IF NOT EXISTS audit_archivado_no_delete
+    BEFORE DELETE ON audit_archivado
+    BEGIN SELECT RAISE(ABORT, 'audit_archivado es append-only'); END;
+DROP TRIGGER IF EXISTS audit_no_delete;
+CREATE TRIGGER IF NOT EXISTS audit_no_delete_vigente
+    BEFORE DELETE ON solicitud_tratamiento_log
+    WHEN OLD.id > (SELECT COALESCE(MAX(hasta_id), 0) FROM audit_archivado)
+    BEGIN SELECT RAISE(ABORT, 'solicitud_tratamiento_log es append-only'); END;
+"""
+
+INSERT_EVENT = """
+INSERT INTO solicitud_tratamiento_log
+    (solicitud_id, item_index, actor_id, tipo, estado, payload_json, created_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+_STOP = object()
+
+MAX_RETRIES = 5
+
+logger = logging.getLogger(__name__)
+
+
+def _main_db_path() -> Path:
+    if settings.DATABASE_URL.startswith("sqlite:///"):
+        return Path(settings.DATABASE_URL.split("sqlite:///", 1)[1])
+    return Path("spm.db")
+
+
+def audit_path_for(db_path: Path) -> Path:
+    """
+    Ruta de la BD de auditoría asociada a una BD principal.
+
+    Usa settings.AUDIT_DATABASE_URL si está definida; si no,
+    <nombre>_audit.db en el mismo directorio.
+    """
+    url = settings.AUDIT_DATABASE_URL
+    if url and url.startswith("sqlite:///"):
+        return Path(url.split("sqlite:///", 1)[1])
+    db_path = Path(db_path)
+    return db_path.with_name(f"{db_path.stem}_audit{db_path.suffix or '.db'}")
+
+
+def ensure_audit_schema(conn: sqlite3.Connection) -> None:
+    """Crear tablas y triggers de auditoría (actualiza el trigger de DELETE previo)"""
+    conn.executescript(CREATE_AUDIT_SCHEMA)
+
+
+def purge_archived(conn: sqlite3.Connection, hasta_id: int, archivo: str) -> int:
+    """
+    Borrar los eventos con id <= hasta_id, ya copiados a la BD de archivo (sin commit).
+
+    Es la única vía de borrado que el trigger permite: primero registra la
+    marca en audit_archivado (append-only) y luego borra.
+
+    Args:
+        conn: Conexión a la BD de auditoría, con transacción abierta
+        hasta_id: Último id archivado (los anteriores también deben estarlo)
+        archivo: Ruta de la BD de archivo (queda registrada)
+
+    Returns:
+        Eventos borrados
+    """
+    filas = conn.execute(
+        "SELECT COUNT(*) FROM solicitud_tratamiento_log WHERE id <= ?", (hasta_id,)
+    ).fetchone()[0]
+    conn.execute(
+        "INSERT INTO audit_archivado (hasta_id, archivo, filas, created_at) VALUES (?, ?, ?, ?)",
+        (hasta_id, str(archivo), filas, datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")),
+    )
+    return conn.execute(
+        "DELETE FROM solicitud_tratamiento_log WHERE id <= ?", (hasta_id,)
+    ).rowcount
+
+
+def _row_to_event(row: sqlite3.Row) -> Dict[str, Any]:
+    event = dict(row)
+    event.pop("legacy_id", None)
+    try:
+        event["payload"] = json.loads(event.pop("payload_json") or "{}")
+    except ValueError:
+        event["payload"] = {}
+    return event
+
+
+class AuditLog:
+    """Almacén de auditoría de un archivo con escritor en segundo plano"""
+
+    def __init__(
+        self,
+        path: Path,
+        max_batch: int = 500,
+        retry_seconds: float = 0.5,
+        max_retries: int = MAX_RETRIES,
+    ):
+        """
+        Args:
+            path: Archivo SQLite de auditoría
+            max_batch: Máximo de eventos por transacción
+            retry_seconds: Espera inicial antes de reintentar un lote fallido
+            max_retries: Reintentos antes de volcar el lote al spool
+        """
+        self.path = Path(path)
+        self.spool_path = self.path.with_name(f"{self.path.name}.spool.jsonl")
+        self.max_batch = max_batch
+        self.retry_seconds = retry_seconds
+        self.max_retries = max_retries
+        self._queue: "queue.Queue" = queue.Queue()
+        self._cond = threading.Condition()
+        self._enqueued = 0
+        self._written = 0
+        self._thread: Optional[threading.Thread] = None
+        self._schema_ready = False
+
+    # ------------------------------------------------------------------
+    # Conexiones
+    # ------------------------------------------------------------------
+
+    def _open(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        if not self._schema_ready:
+            ensure_audit_schema(conn)
+            self._schema_ready = True
+        return conn
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+
+    def _ensure_writer(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name=f"audit-writer-{self.path.name}", daemon=True
+            )
+            self._thread.start()
+
+    def append(
+        self,
+        solicitud_id: int,
+        item_index: Optional[int],
+        tipo: str,
+        estado: Optional[str],
+        payload: Optional[Dict[str, Any]],
+        actor_id: str,
+    ) -> None:
+        """
+        Encolar un evento. No bloquea por la escritura en disco.
+
+        Args:
+            solicitud_id: ID de la solicitud
+            item_index: Índice del item (None para eventos de la solicitud)
+            tipo: Tipo de evento (p.ej. item_tratado)
+            estado: Estado resultante
+            payload: Datos adicionales (se serializan a JSON)
+            actor_id: Usuario que generó el evento
+        """
+        event = (
+            solicitud_id,
+            item_index,
+            str(actor_id),
+            tipo,
+            estado,
+            json.dumps(payload or {}),
+            datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        with self._cond:
+            self._enqueued += 1
+        self._queue.put(event)
+        self._ensure_writer()
+
+    def _spool(self, batch: List[tuple]) -> None:
+        """Volcar un lote que no pudo escribirse a un archivo JSON lines"""
+        try:
+            with open(self.spool_path, "a", encoding="utf-8") as f:
+                for event in batch:
+                    f.write(json.dumps(event) + "\n")
+            logger.error(
+                "Auditoría: %d eventos volcados a %s tras %d intentos",
+                len(batch), self.spool_path, self.max_retries,
+            )
+        except OSError as e:
+            logger.error("Auditoría: se descartan %d eventos (%s)", len(batch), e)
+
+    def _replay_spool(self, conn: sqlite3.Connection) -> None:
+        """Insertar los eventos volcados al spool y borrarlo"""
+        if not self.spool_path.exists():
+            return
+        try:
+            with open(self.spool_path, encoding="utf-8") as f:
+                events = [tuple(json.loads(line)) for line in f if line.strip()]
+            with conn:
+                conn.executemany(INSERT_EVENT, events)
+            self.spool_path.unlink()
+            logger.info("Auditoría: %d eventos recuperados de %s", len(events), self.spool_path)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            logger.error("Auditoría: no se pudo recuperar %s: %s", self.spool_path, e)
+
+    def _write_batch(
+        self, conn: Optional[sqlite3.Connection], batch: List[tuple]
+    ) -> Optional[sqlite3.Connection]:
+        for attempt in range(self.max_retries):
+            try:
+                if conn is None:
+                    conn = self._open()
+                with conn:
+                    conn.executemany(INSERT_EVENT, batch)
+                self._replay_spool(conn)
+                break
+            except sqlite3.Error as e:
+                logger.warning("Error escribiendo auditoría (%d eventos): %s", len(batch), e)
+                if conn is not None:
+                    conn.close()
+                    conn = None
+                if attempt + 1 < self.max_retries:
+                    time.sleep(min(self.retry_seconds * (2**attempt), 5.0))
+        else:
+            self._spool(batch)
+        with self._cond:
+            self._written += len(batch)
+            self._cond.notify_all()
+        return conn
+
+    def _run(self) -> None:
+        conn = None
+        stop = False
+        while not stop:
+            event = self._queue.get()
+            if event is _STOP:
+                break
+            batch = [event]
+            while len(batch) < self.max_batch:
+                try:
+                    event = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if event is _STOP:
+                    stop = True
+                    break
+                batch.append(event)
+            conn = self._write_batch(conn, batch)
+        if conn is not None:
+            conn.close()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """
+        Esperar a que todo lo encolado hasta ahora esté confirmado en disco.
+
+        Returns:
+            True si se confirmó dentro del timeout
+        """
+        with self._cond:
+            target = self._enqueued
+            if self._written >= target:
+                return True
+        self._ensure_writer()
+        with self._cond:
+            return self._cond.wait_for(lambda: self._written >= target, timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Vaciar la cola y detener el escritor (se llama al salir del proceso)"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def import_rows(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """
+        Importar eventos existentes de forma síncrona (migración desde spm.db).
+
+        Las filas con 'id' se registran como legacy_id y no se duplican si
+        la importación se repite.
+
+        Returns:
+            Filas nuevas insertadas
+        """
+        conn = self._open()
+        try:
+            with conn:
+                before = conn.total_changes
+                conn.executemany(
+                    """
+                    INSERT OR IGNORE INTO solicitud_tratamiento_log
+                        (solicitud_id, item_index, actor_id, tipo, estado, payload_json,
+                         created_at, legacy_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    [
+                        (
+                            r["solicitud_id"],
+                            r.get("item_index"),
+                            r.get("actor_id") or "system",
+                            r["tipo"],
+                            r.get("estado"),
+                            r.get("payload_json"),
+                            r.get("created_at") or datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+                            r.get("id"),
+                        )
+                        for r in rows
+                    ],
+                )
+                return conn.total_changes - before
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+
+    def _query(self, sql: str, params: List[Any]) -> List[Dict[str, Any]]:
+        self.flush()
+        if not self.path.exists():
+            return []
+        conn = self._open()
+        conn.row_factory = sqlite3.Row
+        try:
+            return [_row_to_event(r) for r in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+    def history(
+        self,
+        solicitud_id: int,
+        item_index: Optional[int] = None,
+        tipos: Optional[List[str]] = None,
+        limit: int = 200,
+        before_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Historial de tratamiento de una solicitud, del más reciente al más antiguo.
+
+        Args:
+            solicitud_id: ID de la solicitud
+            item_index: Solo eventos de este item
+            tipos: Solo estos tipos de evento
+            limit: Máximo de eventos
+            before_id: Paginación: eventos con id menor a este
+
+        Returns:
+            Lista de eventos con payload ya decodificado
+        """
+        where = ["solicitud_id = ?"]
+        params: List[Any] = [solicitud_id]
+        if item_index is not None:
+            where.append("item_index = ?")
+            params.append(item_index)
+        if tipos:
+            where.append(f"tipo IN ({','.join('?' * len(tipos))})")
+            params.extend(tipos)
+        if before_id is not None:
+            where.append("id < ?")
+            params.append(before_id)
+        params.append(limit)
+        return self._query(
+            f"""
+            SELECT * FROM solicitud_tratamiento_log
+            WHERE {" AND ".join(where)}
+            ORDER BY id DESC
+            LIMIT ?
+            """,
+            params,
+        )
+
+    def events_by_actor(
+        self, actor_id: str, limit: int = 200, before_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Eventos generados por un usuario, del más reciente al más antiguo"""
+        params: List[Any] = [str(actor_id)]
+        before_sql = ""
+        if before_id is not None:
+            before_sql = "AND id < ?"
+            params.append(before_id)
+        params.append(limit)
+        return self._query(
+            f"""
+            SELECT * FROM solicitud_tratamiento_log
+            WHERE actor_id = ? {before_sql}
+            ORDER BY id DESC
+            LIMIT ?
+            """,
+            params,
+        )
+
+
+_logs: Dict[str, AuditLog] = {}
+_logs_lock = threading.Lock()
+
+
+def get_audit_log(db_path: Optional[Path] = None) -> AuditLog:
+    """
+    Almacén de auditoría asociado a una BD principal (uno por archivo).
+
+    Args:
+        db_path: BD principal (default: la de settings)
+    """
+    path = audit_path_for(db_path or _main_db_path()).resolve()
+    key = str(path)
+    with _logs_lock:
+        log = _logs.get(key)
+        if log is None:
+            log = _logs[key] = AuditLog(path)
+        return log
+
+
+def _close_all() -> None:
+    for log in list(_logs.values()):
+        log.close()
+
+
+atexit.register(_close_all)
@@ -26,6 +26,8 @@ try:
     from backend_v2.core.budget_transaction import AtomicBudgetTransaction
     from backend_v2.core.config import settings
     from backend_v2.core.roles import is_admin, normalize_roles
+    from backend_v2.services.retention_service import (archived_source,
+                                                       attach_archive)
 except ImportError:
     from core.budget_schemas import (UMBRAL_L2_CENTS, BudgetUpdateRequest,
                                      EstadoBUR, LedgerEntry, NivelAprobacion,
@@ -34,6 +36,7 @@ except ImportError:
                                      determinar_nivel_aprobacion)
     from core.budget_transaction import AtomicBudgetTransaction
     from core.config import settings
+    from services.retention_service import archived_source, attach_archive
 
 
 def _db_path() -> Path:
@@ -132,11 +135,18 @@ class PresupuestoService:
 
     @staticmethod
     def get_ledger(
-        centro: Optional[str] = None, sector: Optional[str] = None, limit: int = 50, offset: int = 0
+        centro: Optional[str] = None,
+        sector: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0,
+        include_archived: bool = False,
     ) -> List[LedgerEntry]:
-        """Obtiene historial de movimientos"""
+        """Obtiene historial de movimientos (opcionalmente incluyendo el archivo)"""
         conn = _connect()
         try:
+            source = "presupuesto_ledger"
+            if include_archived and attach_archive(conn, _db_path()):
+                source = archived_source(conn, "presupuesto_ledger")
             cur = conn.cursor()
             where = []
             params = []
@@ -152,7 +162,7 @@ class PresupuestoService:
             params.extend([limit, offset])
 
             cur.execute(
-                f"""SELECT * FROM presupuesto_ledger
+                f"""SELECT * FROM {source} AS l
                     {where_sql}
                     ORDER BY created_at DESC
                     LIMIT ? OFFSET ?""",
@@ -0,0 +1,472 @@
+"""
+Histórico de consumo en SQLite
+
+Reemplaza la lectura completa de docs/consumo historico.xlsx en cada
+proceso por dos tablas en la BD principal:
+- consumo_movimientos: un movimiento por fila, indexado por
+  (codigo_norm, fecha) para "últimos N consumos" y por
+  (codigo_norm, centro, almacen) para consumo por ubicación. La columna mes
+  (YYYY-MM) particiona las cargas y el resumen mensual.
+- consumo_mensual: suma y cantidad de movimientos por material, ubicación
+  y mes; de ahí salen totales, promedios anuales y la demanda por período.
+
+Códigos, centros y almacenes se guardan normalizados (sin ceros a la
+izquierda ni '.0'), igual que los comparaban los lectores del Excel.
+
+importar_consumo carga el archivo completo o un incremento: las fechas que
+cubre el archivo se reemplazan (el archivo manda en su rango) y solo se
+recalculan los meses afectados del resumen. Un archivo ya importado (mismo
+sha256) se omite.
+"""
+
+import hashlib
+import sqlite3
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+from openpyxl import load_workbook
+
+try:
+    from backend_v2.core.repository import ReferenceDataRepository
+    from backend_v2.core.utils import norm_codigo, tiene_tabla
+except ImportError:
+    from core.repository import ReferenceDataRepository
+    from core.utils import norm_codigo, tiene_tabla
+
+SHEET = "consumo historico"
+BATCH_SIZE = 10000
+RECIENTES = 180
+STAGING_TABLE = "consumo_staging"
+
+CREATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS consumo_movimientos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    codigo_material TEXT NOT NULL,
+    codigo_norm TEXT NOT NULL,
+    centro TEXT NOT NULL,
+    almacen TEXT NOT NULL,
+    fecha TEXT NOT NULL,
+    mes TEXT NOT NULL,
+    cantidad REAL NOT NULL DEFAULT 0,
+    descripcion TEXT,
+    importacion_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_consumo_mov_codigo_fecha
+    ON consumo_movimientos(codigo_norm, fecha);
+CREATE INDEX IF NOT EXISTS idx_consumo_mov_ubicacion
+    ON consumo_movimientos(codigo_norm, centro, almacen);
+CREATE INDEX IF NOT EXISTS idx_consumo_mov_fecha
+    ON consumo_movimientos(fecha);
+
+CREATE TABLE IF NOT EXISTS consumo_mensual (
+    codigo_norm TEXT NOT NULL,
+    centro TEXT NOT NULL,
+    almacen TEXT NOT NULL,
+    mes TEXT NOT NULL,
+    cantidad REAL NOT NULL,
+    movimientos INTEGER NOT NULL,
+    PRIMARY KEY (codigo_norm, centro, almacen, mes)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_consumo_mensual_mes ON consumo_mensual(mes);
+
+CREATE TABLE IF NOT EXISTS consumo_importaciones (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    archivo TEXT,
+    sha256 TEXT NOT NULL,
+    filas INTEGER NOT NULL DEFAULT 0,
+    descartadas INTEGER NOT NULL DEFAULT 0,
+    desde TEXT,
+    hasta TEXT,
+    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+CREATE INDEX IF NOT EXISTS idx_consumo_importaciones_sha ON consumo_importaciones(sha256);
+"""
+
+# Encabezado en el Excel -> columna
+COLUMNAS_EXCEL = {
+    "Material": "codigo_material",
+    "Centro": "centro",
+    "Almacen": "almacen",
+    "Almacén": "almacen",
+    "Cantidad": "cantidad",
+    "Fecha": "fecha",
+    "Descripcion": "descripcion",
+    "Descripción": "descripcion",
+}
+OBLIGATORIAS = ("codigo_material", "centro", "almacen", "cantidad", "fecha")
+
+_ROLLUP_SQL = """
+    INSERT INTO consumo_mensual (codigo_norm, centro, almacen, mes, cantidad, movimientos)
+    SELECT codigo_norm, centro, almacen, mes, SUM(cantidad), COUNT(*)
+    FROM consumo_movimientos
+    {where}
+    GROUP BY codigo_norm, centro, almacen, mes
+"""
+
+
+def ensure_schema(conn: sqlite3.Connection) -> None:
+    """Crear las tablas del histórico de consumo si no existen"""
+    conn.executescript(CREATE_SCHEMA)
+
+
+def _fecha(val: Any) -> Optional[str]:
+    if isinstance(val, (datetime, date)):
+        return val.strftime("%Y-%m-%d")
+    fecha = pd.to_datetime(val, errors="coerce")
+    return None if pd.isna(fecha) else fecha.strftime("%Y-%m-%d")
+
+
+def _cantidad(val: Any) -> float:
+    cantidad = pd.to_numeric(val, errors="coerce")
+    return 0.0 if pd.isna(cantidad) else float(cantidad)
+
+
+def tiene_consumo(conn: sqlite3.Connection) -> bool:
+    """Si el histórico de consumo ya fue importado a la BD"""
+    if not tiene_tabla(conn, "consumo_movimientos"):
+        return False
+    return conn.execute("SELECT 1 FROM consumo_movimientos LIMIT 1").fetchone() is not None
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for bloque in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(bloque)
+    return digest.hexdigest()
+
+
+def iter_movimientos(path: Path) -> Iterator[Optional[Tuple[Any, ...]]]:
+    """
+    Movimientos del Excel leídos en streaming (openpyxl read-only).
+
+    Yields:
+        (codigo_material, codigo_norm, centro, almacen, fecha, mes, cantidad,
+        descripcion), o None por cada fila sin material o con fecha inválida
+
+    Raises:
+        ValueError: Si faltan columnas obligatorias
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        hoja = wb[SHEET] if SHEET in wb.sheetnames else wb.active
+        filas = hoja.iter_rows(values_only=True)
+        encabezado = [str(h).strip() if h is not None else None for h in next(filas, ())]
+        posiciones: Dict[str, int] = {}
+        for i, nombre in enumerate(encabezado):
+            columna = COLUMNAS_EXCEL.get(nombre)
+            if columna and columna not in posiciones:
+                posiciones[columna] = i
+        faltantes = [c for c in OBLIGATORIAS if c not in posiciones]
+        if faltantes:
+            raise ValueError(f"{Path(path).name}: faltan columnas {faltantes}")
+
+        def valor(fila, columna):
+            i = posiciones.get(columna)
+            return fila[i] if i is not None and i < len(fila) else None
+
+        for fila in filas:
+            codigo = valor(fila, "codigo_material")
+            fecha = _fecha(valor(fila, "fecha"))
+            if codigo is None or fecha is None:
+                yield None
+                continue
+            codigo_txt = norm_codigo(codigo) if isinstance(codigo, float) else str(codigo).strip()
+            descripcion = valor(fila, "descripcion")
+            yield (
+                codigo_txt,
+                norm_codigo(codigo),
+                norm_codigo(valor(fila, "centro")),
+                norm_codigo(valor(fila, "almacen")),
+                fecha,
+                fecha[:7],
+                _cantidad(valor(fila, "cantidad")),
+                None if descripcion is None else str(descripcion),
+            )
+    finally:
+        wb.close()
+
+
+def reconstruir_mensual(
+    conn: sqlite3.Connection, desde_mes: Optional[str] = None, hasta_mes: Optional[str] = None
+) -> None:
+    """
+    Recalcular consumo_mensual (todo, o solo los meses del rango).
+
+    No confirma: corre dentro de la transacción del llamador.
+    """
+    if desde_mes and hasta_mes:
+        conn.execute(
+            "DELETE FROM consumo_mensual WHERE mes BETWEEN ? AND ?", (desde_mes, hasta_mes)
+        )
+        conn.execute(
+            _ROLLUP_SQL.format(where="WHERE fecha BETWEEN ? AND ?"),
+            (f"{desde_mes}-01", f"{hasta_mes}-31"),
+        )
+    else:
+        conn.execute("DELETE FROM consumo_mensual")
+        conn.execute(_ROLLUP_SQL.format(where=""))
+
+
+def importar_consumo(
+    conn: sqlite3.Connection,
+    path: Path,
+    batch_size: int = BATCH_SIZE,
+    progress: Optional[Callable[[int], None]] = None,
+    forzar: bool = False,
+) -> Dict[str, Any]:
+    """
+    Importar el histórico de consumo completo o un incremento.
+
+    Las filas se cargan por lotes en una tabla temporal; luego, en una sola
+    transacción, se reemplazan los movimientos del rango de fechas del
+    archivo, se recalculan esos meses de consumo_mensual y se incrementa la
+    versión de los datos de referencia.
+
+    Args:
+        conn: Conexión a la BD principal
+        path: Excel con la hoja 'consumo historico'
+        batch_size: Filas por executemany
+        progress: Callback con las filas leídas después de cada lote
+        forzar: Importar aunque el archivo ya se haya importado
+
+    Returns:
+        Resumen con importacion_id (None si se omitió), filas, descartadas,
+        desde, hasta, reemplazadas y meses recalculados
+    """
+    path = Path(path)
+    ensure_schema(conn)
+    sha = _sha256(path)
+    if not forzar and conn.execute(
+        "SELECT 1 FROM consumo_importaciones WHERE sha256 = ?", (sha,)
+    ).fetchone():
+        return {"importacion_id": None, "archivo": path.name, "omitido": True}
+
+    conn.execute(f"DROP TABLE IF EXISTS temp.{STAGING_TABLE}")
+    conn.execute(
+        f"""
+        CREATE TEMP TABLE {STAGING_TABLE} AS
+        SELECT codigo_material, codigo_norm, centro, almacen, fecha, mes, cantidad, descripcion
+        FROM consumo_movimientos WHERE 0
+        """
+    )
+    insert = f"INSERT INTO temp.{STAGING_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+    filas = descartadas = 0
+    lote: List[Tuple[Any, ...]] = []
+    for mov in iter_movimientos(path):
+        if mov is None:
+            descartadas += 1
+            continue
+        lote.append(mov)
+        if len(lote) >= batch_size:
+            conn.executemany(insert, lote)
+            filas += len(lote)
+            lote = []
+            if progress:
+                progress(filas)
+    if lote:
+        conn.executemany(insert, lote)
+        filas += len(lote)
+        if progress:
+            progress(filas)
+
+    desde, hasta = conn.execute(
+        f"SELECT MIN(fecha), MAX(fecha) FROM temp.{STAGING_TABLE}"
+    ).fetchone()
+    conn.commit()
+    resumen: Dict[str, Any] = {
+        "importacion_id": None,
+        "archivo": path.name,
+        "omitido": False,
+        "filas": filas,
+        "descartadas": descartadas,
+        "desde": desde,
+        "hasta": hasta,
+        "reemplazadas": 0,
+    }
+
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        cur = conn.execute(
+            """
+            INSERT INTO consumo_importaciones (archivo, sha256, filas, descartadas, desde, hasta)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (path.name, sha, filas, descartadas, desde, hasta),
+        )
+        resumen["importacion_id"] = cur.lastrowid
+        if desde is not None:
+            cur = conn.execute(
+                "DELETE FROM consumo_movimientos WHERE fecha BETWEEN ? AND ?", (desde, hasta)
+            )
+            resumen["reemplazadas"] = cur.rowcount
+            conn.execute(
+                f"""
+                INSERT INTO consumo_movimientos (codigo_material, codigo_norm, centro, almacen,
+                    fecha, mes, cantidad, descripcion, importacion_id)
+                SELECT codigo_material, codigo_norm, centro, almacen, fecha, mes, cantidad,
+                    descripcion, ?
+                FROM temp.{STAGING_TABLE}
+                ORDER BY codigo_norm, fecha
+                """,
+                (resumen["importacion_id"],),
+            )
+            reconstruir_mensual(conn, desde[:7], hasta[:7])
+        ReferenceDataRepository.bump(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute(f"DROP TABLE IF EXISTS temp.{STAGING_TABLE}")
+
+    resumen["meses"] = (
+        conn.execute(
+            "SELECT COUNT(DISTINCT mes) FROM consumo_mensual WHERE mes BETWEEN ? AND ?",
+            (desde[:7], hasta[:7]),
+        ).fetchone()[0]
+        if desde
+        else 0
+    )
+    return resumen
+
+
+def promedio_reciente(
+    conn: sqlite3.Connection, codigos: List[str], n: int = RECIENTES, lote: int = 500
+) -> Dict[str, float]:
+    """
+    Promedio de los n movimientos más recientes de cada material.
+
+    Returns:
+        Dict codigo_norm -> promedio (solo códigos con historial)
+    """
+    normas = list(dict.fromkeys(norm_codigo(c) for c in codigos if c))
+    resultado: Dict[str, float] = {}
+    for i in range(0, len(normas), lote):
+        parte = normas[i : i + lote]
+        cur = conn.execute(
+            f"""
+            SELECT codigo_norm, AVG(cantidad) FROM (
+                SELECT codigo_norm, cantidad,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY codigo_norm ORDER BY fecha DESC, id
+                       ) AS rn
+                FROM consumo_movimientos
+                WHERE codigo_norm IN ({",".join("?" * len(parte))})
+            )
+            WHERE rn <= ?
+            GROUP BY codigo_norm
+            """,
+            [*parte, n],
+        )
+        resultado.update({codigo: float(promedio or 0) for codigo, promedio in cur.fetchall()})
+    return resultado
+
+
+def resumen_material(
+    conn: sqlite3.Connection,
+    codigo: str,
+    centro: Optional[str] = None,
+    almacen: Optional[str] = None,
+    registros: int = 5,
+) -> Optional[Dict[str, Any]]:
+    """
+    Consumo total, promedio anual y últimos movimientos de un material.
+
+    Returns:
+        Dict con total, promedio_anual, anio_desde, anio_hasta y registros
+        (los más recientes), o None si no hay consumo para el filtro
+    """
+    where = ["codigo_norm = ?"]
+    params: List[Any] = [norm_codigo(codigo)]
+    if centro:
+        where.append("centro = ?")
+        params.append(norm_codigo(centro))
+    if almacen:
+        where.append("almacen = ?")
+        params.append(norm_codigo(almacen))
+    condicion = " AND ".join(where)
+
+    total, movimientos, desde, hasta = conn.execute(
+        f"""
+        SELECT SUM(cantidad), SUM(movimientos), MIN(mes), MAX(mes)
+        FROM consumo_mensual WHERE {condicion}
+        """,
+        params,
+    ).fetchone()
+    if not movimientos:
+        return None
+
+    anio_desde, anio_hasta = int(desde[:4]), int(hasta[:4])
+    cur = conn.execute(
+        f"""
+        SELECT fecha, cantidad, centro, almacen FROM consumo_movimientos
+        WHERE {condicion} ORDER BY fecha DESC, id LIMIT ?
+        """,
+        [*params, registros],
+    )
+    return {
+        "total": float(total or 0),
+        "promedio_anual": float(total or 0) / max(1, anio_hasta - anio_desde + 1),
+        "anio_desde": anio_desde,
+        "anio_hasta": anio_hasta,
+        "registros": [
+            {"fecha": fecha, "cantidad": cantidad, "centro": centro_val, "almacen": almacen_val}
+            for fecha, cantidad, centro_val, almacen_val in cur.fetchall()
+        ],
+    }
+
+
+def consumo_por_ubicacion(
+    conn: sqlite3.Connection, codigo: str
+) -> Dict[Tuple[str, str], Dict[str, float]]:
+    """
+    Consumo total y promedio anual de un material por centro/almacén.
+
+    Returns:
+        Dict (centro, almacen) normalizados -> {total, promedio_anual}
+    """
+    cur = conn.execute(
+        """
+        SELECT centro, almacen, SUM(cantidad), MIN(mes), MAX(mes)
+        FROM consumo_mensual WHERE codigo_norm = ?
+        GROUP BY centro, almacen
+        """,
+        (norm_codigo(codigo),),
+    )
+    return {
+        (centro, almacen): {
+            "total": float(total or 0),
+            "promedio_anual": float(total or 0) / max(1, int(hasta[:4]) - int(desde[:4]) + 1),
+        }
+        for centro, almacen, total, desde, hasta in cur.fetchall()
+    }
+
+
+def consumo_por_periodo(
+    conn: sqlite3.Connection, periodo: str = "mes", centro: Optional[int] = None
+) -> pd.DataFrame:
+    """
+    Consumo para el cálculo de demanda (services/mrp_parametros).
+
+    Con periodo 'mes' se lee el resumen mensual (una fila por material,
+    ubicación y mes, fechada el día 1); con otro período, los movimientos.
+
+    Returns:
+        DataFrame con fecha, centro, almacen, codigo_material y cantidad
+    """
+    if periodo == "mes":
+        tabla, fecha = "consumo_mensual", "mes || '-01'"
+    else:
+        tabla, fecha = "consumo_movimientos", "fecha"
+    sql = (
+        f"SELECT {fecha} AS fecha, centro, almacen, codigo_norm AS codigo_material, cantidad "
+        f"FROM {tabla}"
+    )
+    params: List[Any] = []
+    if centro:
+        sql += " WHERE centro = ?"
+        params.append(norm_codigo(centro))
+    return pd.read_sql_query(sql, conn, params=params)
@@ -17,9 +17,25 @@ from typing import Dict, List, Optional
 
 # Importar configuración de BD
 try:
+    from backend_v2.core.cache import catalog_cache
     from backend_v2.core.config import settings
+    from backend_v2.services.message_threads import MessageThreadService
+    from backend_v2.services.retention_service import (archived_source,
+                                                       attach_archive)
+    from backend_v2.services.unread_counters import UnreadCounterService
 except ImportError:
+    from core.cache import catalog_cache
     from core.config import settings
+    from services.message_threads import MessageThreadService
+    from services.retention_service import archived_source, attach_archive
+    from services.unread_counters import UnreadCounterService
+
+COUNTER_FIELD = "unread_messages"
+
+USER_DIRECTORY_PREFIX = "user_directory"
+
+# Campos de usuario que se agregan a cada mensaje (prefijo remitente_/destinatario_)
+_USER_FIELDS = ("nombre", "apellido", "rol")
 
 
 class MessageService:
@@ -39,6 +55,56 @@ class MessageService:
         db_path = MessageService._get_db_path()
         return sqlite3.connect(db_path)
 
+    @staticmethod
+    def _user_directory() -> Dict[str, Dict]:
+        """
+        Directorio id_spm -> {nombre, apellido, rol} cacheado en catalog_cache.
+
+        Reemplaza los JOIN a usuarios de cada listado; se invalida junto con
+        el resto de los catálogos cuando admin modifica usuarios, y con
+        invalidate_user_directory cuando un usuario cambia su propio perfil.
+        """
+        key = f"{USER_DIRECTORY_PREFIX}:{MessageService._get_db_path()}"
+        directory = catalog_cache.get(key)
+        if directory is not None:
+            return directory
+
+        conn = MessageService._connect()
+        try:
+            rows = conn.execute("SELECT id_spm, nombre, apellido, rol FROM usuarios").fetchall()
+            directory = {
+                str(r[0]): {"nombre": r[1], "apellido": r[2], "rol": r[3]} for r in rows
+            }
+        except Exception as e:
+            print(f"Error al cargar directorio de usuarios: {e}")
+            return {}
+        finally:
+            conn.close()
+
+        catalog_cache.set(key, directory)
+        return directory
+
+    @staticmethod
+    def invalidate_user_directory() -> None:
+        """Descartar el directorio de usuarios cacheado (tras cambios en usuarios)"""
+        catalog_cache.invalidate_pattern(f"{USER_DIRECTORY_PREFIX}:")
+
+    @staticmethod
+    def _mensajes_source(conn: sqlite3.Connection, include_archived: bool) -> str:
+        """Tabla mensajes, o su unión con el archivo si se pide include_archived"""
+        if include_archived and attach_archive(conn, MessageService._get_db_path()):
+            return archived_source(conn, "mensajes")
+        return "mensajes"
+
+    @staticmethod
+    def _with_names(msg: Dict, directory: Dict[str, Dict], *roles: str) -> Dict:
+        """Agregar nombre/apellido/rol de remitente y/o destinatario desde el directorio"""
+        for role in roles:
+            user = directory.get(str(msg.get(f"{role}_id"))) or {}
+            for field in _USER_FIELDS:
+                msg[f"{role}_{field}"] = user.get(field)
+        return msg
+
     @staticmethod
     def send_message(
         remitente_id: str,
@@ -72,7 +138,10 @@ class MessageService:
         try:
             import json
 
+            UnreadCounterService.ensure_table(conn)
+            MessageThreadService.ensure_tables(conn)
             metadata_json = json.dumps(metadata) if metadata else None
+            now = datetime.utcnow().isoformat()
 
             cursor.execute(
                 """
@@ -92,12 +161,24 @@ class MessageService:
                     parent_id,
                     tipo,
                     metadata_json,
-                    datetime.utcnow().isoformat(),
-                    datetime.utcnow().isoformat(),
+                    now,
+                    now,
                 ),
             )
 
             message_id = cursor.lastrowid
+            UnreadCounterService.adjust(conn, destinatario_id, COUNTER_FIELD, 1)
+            MessageThreadService.record_message(
+                conn,
+                message_id,
+                parent_id,
+                remitente_id,
+                destinatario_id,
+                asunto,
+                mensaje,
+                solicitud_id,
+                now,
+            )
             conn.commit()
             return message_id
 
@@ -110,7 +191,11 @@ class MessageService:
 
     @staticmethod
     def get_inbox(
-        user_id: str, unread_only: bool = False, limit: int = 50, offset: int = 0
+        user_id: str,
+        unread_only: bool = False,
+        limit: int = 50,
+        offset: int = 0,
+        include_archived: bool = False,
     ) -> List[Dict]:
         """
         Obtener mensajes recibidos (inbox)
@@ -120,6 +205,7 @@ class MessageService:
             unread_only: Solo mensajes no leídos
             limit: Cantidad máxima de mensajes
             offset: Offset para paginación
+            include_archived: Incluir mensajes movidos a la BD de archivo
 
         Returns:
             Lista de mensajes con información del remitente
@@ -135,16 +221,13 @@ class MessageService:
             if unread_only:
                 where_clause += " AND m.leido = 0"
 
+            source = MessageService._mensajes_source(conn, include_archived)
             query = f"""
                 SELECT
                     m.*,
-                    u.nombre AS remitente_nombre,
-                    u.apellido AS remitente_apellido,
-                    u.rol AS remitente_rol,
                     s.justificacion AS solicitud_justificacion
-                FROM mensajes m
-                LEFT JOIN usuarios u ON m.remitente_id = u.id_spm
-                LEFT JOIN solicitudes s ON m.solicitud_id = s.id
+                FROM {source} m
+                LEFT JOIN main.solicitudes s ON m.solicitud_id = s.id
                 {where_clause}
                 ORDER BY m.created_at DESC
                 LIMIT ? OFFSET ?
@@ -152,10 +235,11 @@ class MessageService:
 
             cursor.execute(query, params + [limit, offset])
             rows = cursor.fetchall()
+            directory = MessageService._user_directory()
 
             messages = []
             for row in rows:
-                msg = dict(row)
+                msg = MessageService._with_names(dict(row), directory, "remitente")
                 # Parse metadata JSON if exists
                 if msg.get("metadata_json"):
                     import json
@@ -175,7 +259,9 @@ class MessageService:
             conn.close()
 
     @staticmethod
-    def get_outbox(user_id: str, limit: int = 50, offset: int = 0) -> List[Dict]:
+    def get_outbox(
+        user_id: str, limit: int = 50, offset: int = 0, include_archived: bool = False
+    ) -> List[Dict]:
         """
         Obtener mensajes enviados (outbox)
 
@@ -183,6 +269,7 @@ class MessageService:
             user_id: ID del usuario
             limit: Cantidad máxima de mensajes
             offset: Offset para paginación
+            include_archived: Incluir mensajes movidos a la BD de archivo
 
         Returns:
             Lista de mensajes con información del destinatario
@@ -192,16 +279,13 @@ class MessageService:
         cursor = conn.cursor()
 
         try:
-            query = """
+            source = MessageService._mensajes_source(conn, include_archived)
+            query = f"""
                 SELECT
                     m.*,
-                    u.nombre AS destinatario_nombre,
-                    u.apellido AS destinatario_apellido,
-                    u.rol AS destinatario_rol,
                     s.justificacion AS solicitud_justificacion
-                FROM mensajes m
-                LEFT JOIN usuarios u ON m.destinatario_id = u.id_spm
-                LEFT JOIN solicitudes s ON m.solicitud_id = s.id
+                FROM {source} m
+                LEFT JOIN main.solicitudes s ON m.solicitud_id = s.id
                 WHERE m.remitente_id = ?
                 ORDER BY m.created_at DESC
                 LIMIT ? OFFSET ?
@@ -209,10 +293,11 @@ class MessageService:
 
             cursor.execute(query, (user_id, limit, offset))
             rows = cursor.fetchall()
+            directory = MessageService._user_directory()
 
             messages = []
             for row in rows:
-                msg = dict(row)
+                msg = MessageService._with_names(dict(row), directory, "destinatario")
                 if msg.get("metadata_json"):
                     import json
 
@@ -233,64 +318,84 @@ class MessageService:
     @staticmethod
     def get_thread(message_id: int, user_id: str) -> List[Dict]:
         """
-        Obtener hilo de conversación (mensaje original + respuestas)
+        Obtener hilo de conversación (mensaje original + todas las respuestas)
+
+        Un único CTE recursivo recorre las respuestas a cualquier profundidad;
+        los nombres salen del directorio de usuarios cacheado.
 
         Args:
             message_id: ID del mensaje original
             user_id: ID del usuario (para validar permisos)
 
         Returns:
-            Lista de mensajes ordenados cronológicamente
+            Lista de mensajes: el original primero y luego las respuestas
+            ordenadas cronológicamente
         """
         conn = MessageService._connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
 
         try:
-            # Obtener mensaje original
             cursor.execute(
                 """
-                SELECT m.*,
-                       u_rem.nombre AS remitente_nombre,
-                       u_rem.apellido AS remitente_apellido,
-                       u_dest.nombre AS destinatario_nombre,
-                       u_dest.apellido AS destinatario_apellido
-                FROM mensajes m
-                LEFT JOIN usuarios u_rem ON m.remitente_id = u_rem.id_spm
-                LEFT JOIN usuarios u_dest ON m.destinatario_id = u_dest.id_spm
-                WHERE m.id = ? AND (m.remitente_id = ? OR m.destinatario_id = ?)
+                WITH RECURSIVE thread(id, depth) AS (
+                    SELECT id, 0 FROM mensajes
+                    WHERE id = ? AND (remitente_id = ? OR destinatario_id = ?)
+                    UNION ALL
+                    SELECT m.id, t.depth + 1
+                    FROM mensajes m JOIN thread t ON m.parent_id = t.id
+                )
+                SELECT m.*
+                FROM thread t JOIN mensajes m ON m.id = t.id
+                ORDER BY t.depth > 0, m.created_at ASC, m.id ASC
                 """,
                 (message_id, user_id, user_id),
             )
-
-            original = cursor.fetchone()
-            if not original:
+            rows = cursor.fetchall()
+            if not rows:
                 return []
 
-            # Obtener respuestas
-            cursor.execute(
-                """
-                SELECT m.*,
-                       u_rem.nombre AS remitente_nombre,
-                       u_rem.apellido AS remitente_apellido,
-                       u_dest.nombre AS destinatario_nombre,
-                       u_dest.apellido AS destinatario_apellido
-                FROM mensajes m
-                LEFT JOIN usuarios u_rem ON m.remitente_id = u_rem.id_spm
-                LEFT JOIN usuarios u_dest ON m.destinatario_id = u_dest.id_spm
-                WHERE m.parent_id = ?
-                ORDER BY m.created_at ASC
-                """,
-                (message_id,),
-            )
+            directory = MessageService._user_directory()
+            return [
+                MessageService._with_names(dict(r), directory, "remitente", "destinatario")
+                for r in rows
+            ]
 
-            replies = cursor.fetchall()
+        except Exception as e:
+            print(f"Error al obtener thread: {e}")
+            return []
+        finally:
+            conn.close()
+
+    @staticmethod
+    def get_threads(user_id: str, limit: int = 50, offset: int = 0) -> List[Dict]:
+        """
+        Listar hilos de conversación del usuario (resumen materializado)
+
+        Args:
+            user_id: ID del usuario
+            limit: Cantidad máxima de hilos
+            offset: Offset para paginación
+
+        Returns:
+            Lista de hilos con último mensaje, no leídos y participantes
+        """
+        conn = MessageService._connect()
 
-            thread = [dict(original)] + [dict(r) for r in replies]
-            return thread
+        try:
+            threads = MessageThreadService.list_threads(conn, user_id, limit, offset)
+            directory = MessageService._user_directory()
+            for thread in threads:
+                thread["participants"] = [
+                    {"id": pid, **(directory.get(pid) or {"nombre": None, "apellido": None})}
+                    for pid in thread["participants"]
+                ]
+                last = directory.get(str(thread["last_remitente_id"])) or {}
+                thread["last_remitente_nombre"] = last.get("nombre")
+            return threads
 
         except Exception as e:
-            print(f"Error al obtener thread: {e}")
+            print(f"Error al obtener threads: {e}")
             return []
         finally:
             conn.close()
@@ -311,17 +416,29 @@ class MessageService:
         cursor = conn.cursor()
 
         try:
+            UnreadCounterService.ensure_table(conn)
+            MessageThreadService.ensure_tables(conn)
+            # El UPDATE condicional decide quién descuenta: dos llamadas
+            # concurrentes no pueden restar dos veces el mismo mensaje
             cursor.execute(
                 """
                 UPDATE mensajes
                 SET leido = 1, updated_at = ?
-                WHERE id = ? AND destinatario_id = ?
+                WHERE id = ? AND destinatario_id = ? AND leido = 0
                 """,
                 (datetime.utcnow().isoformat(), message_id, user_id),
             )
+            if cursor.rowcount == 1:
+                UnreadCounterService.adjust(conn, user_id, COUNTER_FIELD, -1)
+                MessageThreadService.mark_read(conn, message_id, user_id)
+                conn.commit()
+                return True
 
-            conn.commit()
-            return cursor.rowcount > 0
+            cursor.execute(
+                "SELECT 1 FROM mensajes WHERE id = ? AND destinatario_id = ?",
+                (message_id, user_id),
+            )
+            return cursor.fetchone() is not None
 
         except Exception as e:
             print(f"Error al marcar como leído: {e}")
@@ -335,6 +452,8 @@ class MessageService:
         """
         Obtener cantidad de mensajes no leídos
 
+        Lee el contador materializado (búsqueda por PK) en vez de un COUNT(*).
+
         Args:
             user_id: ID del usuario
 
@@ -342,15 +461,9 @@ class MessageService:
             Cantidad de mensajes no leídos
         """
         conn = MessageService._connect()
-        cursor = conn.cursor()
 
         try:
-            cursor.execute(
-                "SELECT COUNT(*) FROM mensajes WHERE destinatario_id = ? AND leido = 0", (user_id,)
-            )
-
-            count = cursor.fetchone()[0]
-            return count
+            return UnreadCounterService.get(conn, user_id, COUNTER_FIELD)
 
         except Exception as e:
             print(f"Error al contar no leídos: {e}")
@@ -363,6 +476,10 @@ class MessageService:
         """
         Eliminar mensaje (solo si es el remitente o destinatario)
 
+        Las respuestas al mensaje pasan a colgar de su padre, así el hilo no se
+        corta. Si se borra la raíz, sus respuestas conservan el parent_id
+        original, que sigue identificando al hilo (ver message_threads).
+
         Args:
             message_id: ID del mensaje
             user_id: ID del usuario
@@ -374,16 +491,42 @@ class MessageService:
         cursor = conn.cursor()
 
         try:
+            UnreadCounterService.ensure_table(conn)
+            MessageThreadService.ensure_tables(conn)
             cursor.execute(
                 """
-                DELETE FROM mensajes
+                SELECT destinatario_id, parent_id FROM mensajes
                 WHERE id = ? AND (remitente_id = ? OR destinatario_id = ?)
                 """,
                 (message_id, user_id, user_id),
             )
+            row = cursor.fetchone()
+            if not row:
+                return False
+            thread_id = MessageThreadService.thread_id_for(conn, message_id)
+
+            # Primero solo si está sin leer: el rowcount decide el descuento aunque
+            # otra conexión lo haya marcado como leído entre el SELECT y el DELETE
+            delete_sql = """
+                DELETE FROM mensajes
+                WHERE id = ? AND (remitente_id = ? OR destinatario_id = ?)
+            """
+            cursor.execute(delete_sql + " AND leido = 0", (message_id, user_id, user_id))
+            deleted = cursor.rowcount == 1
+            if deleted:
+                # Un mensaje no leído borrado (por cualquiera de las partes) deja de contar
+                UnreadCounterService.adjust(conn, row[0], COUNTER_FIELD, -1)
+            else:
+                cursor.execute(delete_sql, (message_id, user_id, user_id))
+                deleted = cursor.rowcount == 1
+            if deleted and row[1] is not None:
+                cursor.execute(
+                    "UPDATE mensajes SET parent_id = ? WHERE parent_id = ?", (row[1], message_id)
+                )
+            MessageThreadService.refresh_thread(conn, thread_id)
 
             conn.commit()
-            return cursor.rowcount > 0
+            return deleted
 
         except Exception as e:
             print(f"Error al eliminar mensaje: {e}")
@@ -0,0 +1,385 @@
+"""
+Resumen materializado de hilos de mensajes
+
+Mantiene dos tablas derivadas de mensajes:
+- message_threads: una fila por hilo (último mensaje, cantidad, asunto)
+- message_thread_participants: una fila por (hilo, usuario) con los no leídos
+  de ese participante y la fecha del último mensaje, indexada por usuario
+
+El hilo de un mensaje se identifica por su raíz: se sigue parent_id hacia
+arriba hasta el primer mensaje sin padre existente. Si la raíz fue borrada,
+el ID del hilo sigue siendo el de la raíz original (el parent_id huérfano),
+así las respuestas no cambian de hilo.
+
+MessageService actualiza el resumen en la misma transacción que modifica
+mensajes, por lo que listar hilos de un usuario es una lectura paginada por
+índice que no depende de la cantidad de mensajes.
+"""
+
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, Optional
+
+CREATE_THREAD_TABLES = """
+CREATE TABLE IF NOT EXISTS message_threads (
+    thread_id INTEGER PRIMARY KEY,
+    asunto TEXT,
+    solicitud_id INTEGER,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    last_message_id INTEGER,
+    last_message_at TEXT,
+    last_remitente_id TEXT,
+    last_preview TEXT,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS message_thread_participants (
+    thread_id INTEGER NOT NULL,
+    user_id TEXT NOT NULL,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    last_message_at TEXT,
+    PRIMARY KEY (thread_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_thread_participants_user
+    ON message_thread_participants(user_id, last_message_at DESC);
+"""
+
+PREVIEW_LENGTH = 120
+
+# Rutas de BD ya verificadas en este proceso
+_ensured_paths = set()
+
+
+def _db_file(conn: sqlite3.Connection) -> str:
+    row = conn.execute("PRAGMA database_list").fetchone()
+    return row[2] if row else ""
+
+
+def _preview(texto: Optional[str]) -> str:
+    texto = (texto or "").strip().replace("\n", " ")
+    return texto[:PREVIEW_LENGTH]
+
+
+class MessageThreadService:
+    """Mantenimiento y lectura del resumen de hilos"""
+
+    @staticmethod
+    def ensure_tables(conn: sqlite3.Connection) -> None:
+        """
+        Crear las tablas de resumen si no existen y poblarlas desde mensajes.
+
+        Igual que UnreadCounterService.ensure_table: debe llamarse antes de
+        modificar mensajes; si hay transacción abierta, la creación queda en ella.
+        """
+        path = _db_file(conn)
+        if path and path in _ensured_paths:
+            return
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='message_threads'"
+        ).fetchone()
+        if not exists:
+            in_transaction = conn.in_transaction
+            for statement in CREATE_THREAD_TABLES.split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+            MessageThreadService._rebuild_with(conn)
+            if not in_transaction:
+                conn.commit()
+        if path:
+            _ensured_paths.add(path)
+
+    @staticmethod
+    def thread_id_for(conn: sqlite3.Connection, message_id: int) -> int:
+        """
+        Obtener el ID de hilo (raíz) de un mensaje con un CTE recursivo ascendente.
+
+        Args:
+            conn: Conexión abierta
+            message_id: ID de cualquier mensaje del hilo (o de su padre)
+
+        Returns:
+            ID de la raíz del hilo
+        """
+        row = conn.execute(
+            """
+            WITH RECURSIVE chain(id, parent_id, depth) AS (
+                SELECT id, parent_id, 0 FROM mensajes WHERE id = ?
+                UNION ALL
+                SELECT m.id, m.parent_id, c.depth + 1
+                FROM mensajes m JOIN chain c ON m.id = c.parent_id
+            )
+            SELECT COALESCE(parent_id, id) FROM chain ORDER BY depth DESC LIMIT 1
+            """,
+            (message_id,),
+        ).fetchone()
+        return int(row[0]) if row else int(message_id)
+
+    @staticmethod
+    def record_message(
+        conn: sqlite3.Connection,
+        message_id: int,
+        parent_id: Optional[int],
+        remitente_id: str,
+        destinatario_id: str,
+        asunto: str,
+        mensaje: str,
+        solicitud_id: Optional[int],
+        created_at: str,
+    ) -> int:
+        """
+        Registrar un mensaje nuevo en el resumen de su hilo (sin commit).
+
+        Returns:
+            ID del hilo
+        """
+        thread_id = (
+            MessageThreadService.thread_id_for(conn, parent_id) if parent_id else message_id
+        )
+        conn.execute(
+            """
+            INSERT INTO message_threads (
+                thread_id, asunto, solicitud_id, message_count, last_message_id,
+                last_message_at, last_remitente_id, last_preview, updated_at
+            )
+            VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?)
+            ON CONFLICT(thread_id) DO UPDATE SET
+                message_count = message_count + 1,
+                last_message_id = excluded.last_message_id,
+                last_message_at = excluded.last_message_at,
+                last_remitente_id = excluded.last_remitente_id,
+                last_preview = excluded.last_preview,
+                updated_at = excluded.updated_at
+            """,
+            (
+                thread_id,
+                asunto,
+                solicitud_id,
+                message_id,
+                created_at,
+                remitente_id,
+                _preview(mensaje),
+                datetime.utcnow().isoformat(),
+            ),
+        )
+        participants = [(remitente_id, 0)]
+        if destinatario_id != remitente_id:
+            participants.append((destinatario_id, 1))
+        conn.executemany(
+            """
+            INSERT INTO message_thread_participants (thread_id, user_id, unread_count, last_message_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(thread_id, user_id) DO UPDATE SET
+                unread_count = unread_count + excluded.unread_count,
+                last_message_at = excluded.last_message_at
+            """,
+            [(thread_id, str(user), unread, created_at) for user, unread in participants],
+        )
+        return thread_id
+
+    @staticmethod
+    def mark_read(conn: sqlite3.Connection, message_id: int, user_id: str) -> None:
+        """Descontar un no leído del participante en el hilo del mensaje (sin commit)."""
+        thread_id = MessageThreadService.thread_id_for(conn, message_id)
+        conn.execute(
+            """
+            UPDATE message_thread_participants
+            SET unread_count = MAX(unread_count - 1, 0)
+            WHERE thread_id = ? AND user_id = ?
+            """,
+            (thread_id, str(user_id)),
+        )
+
+    @staticmethod
+    def refresh_thread(conn: sqlite3.Connection, thread_id: int) -> None:
+        """
+        Recalcular el resumen de un hilo desde mensajes (sin commit).
+
+        Usado tras borrar mensajes, cuando el último mensaje o los no leídos
+        pueden haber cambiado. Si el hilo quedó vacío se elimina su resumen.
+        """
+        rows = conn.execute(
+            """
+            WITH RECURSIVE t(id) AS (
+                SELECT id FROM mensajes WHERE id = :root OR parent_id = :root
+                UNION
+                SELECT m.id FROM mensajes m JOIN t ON m.parent_id = t.id
+            )
+            SELECT m.id, m.remitente_id, m.destinatario_id, m.asunto, m.mensaje,
+                   m.solicitud_id, m.leido, m.created_at
+            FROM mensajes m JOIN t ON m.id = t.id
+            ORDER BY m.created_at, m.id
+            """,
+            {"root": thread_id},
+        ).fetchall()
+
+        conn.execute("DELETE FROM message_thread_participants WHERE thread_id = ?", (thread_id,))
+        conn.execute("DELETE FROM message_threads WHERE thread_id = ?", (thread_id,))
+        if rows:
+            MessageThreadService._insert_summaries(conn, {thread_id: rows})
+
+    @staticmethod
+    def _insert_summaries(conn: sqlite3.Connection, threads: Dict[int, list]) -> None:
+        """Insertar resúmenes para filas de mensajes agrupadas por hilo (ordenadas)."""
+        now = datetime.utcnow().isoformat()
+        thread_rows = []
+        participant_rows = []
+        for thread_id, rows in threads.items():
+            first, last = rows[0], rows[-1]
+            thread_rows.append(
+                (
+                    thread_id,
+                    first[3],
+                    first[5],
+                    len(rows),
+                    last[0],
+                    last[7],
+                    last[1],
+                    _preview(last[4]),
+                    now,
+                )
+            )
+            participants: Dict[str, List] = {}
+            for _, remitente, destinatario, _, _, _, leido, created_at in rows:
+                for user in (remitente, destinatario):
+                    entry = participants.setdefault(str(user), [0, created_at])
+                    entry[1] = created_at
+                if not leido and destinatario != remitente:
+                    participants[str(destinatario)][0] += 1
+            participant_rows.extend(
+                (thread_id, user, unread, last_at)
+                for user, (unread, last_at) in participants.items()
+            )
+
+        conn.executemany(
+            """
+            INSERT INTO message_threads (
+                thread_id, asunto, solicitud_id, message_count, last_message_id,
+                last_message_at, last_remitente_id, last_preview, updated_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            thread_rows,
+        )
+        conn.executemany(
+            """
+            INSERT INTO message_thread_participants (thread_id, user_id, unread_count, last_message_at)
+            VALUES (?, ?, ?, ?)
+            """,
+            participant_rows,
+        )
+
+    @staticmethod
+    def _rebuild_with(conn: sqlite3.Connection) -> int:
+        """Reconstruir todo el resumen desde mensajes (sin commit)."""
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        conn.execute("DELETE FROM message_thread_participants")
+        conn.execute("DELETE FROM message_threads")
+        if "mensajes" not in tables:
+            return 0
+
+        rows = conn.execute(
+            """
+            SELECT id, remitente_id, destinatario_id, asunto, mensaje,
+                   solicitud_id, leido, created_at, parent_id
+            FROM mensajes
+            ORDER BY created_at, id
+            """
+        ).fetchall()
+        parents = {r[0]: r[8] for r in rows}
+
+        roots: Dict[int, int] = {}
+
+        def root_of(message_id: int) -> int:
+            path = []
+            current = message_id
+            while current not in roots:
+                parent = parents.get(current)
+                path.append(current)
+                if parent is None:
+                    root = current
+                    break
+                if parent not in parents:
+                    root = parent
+                    break
+                current = parent
+            else:
+                root = roots[current]
+            for node in path:
+                roots[node] = root
+            return root
+
+        threads: Dict[int, list] = {}
+        for row in rows:
+            threads.setdefault(root_of(row[0]), []).append(row[:8])
+        MessageThreadService._insert_summaries(conn, threads)
+        return len(threads)
+
+    @staticmethod
+    def rebuild(db_path: str) -> int:
+        """
+        Reconstruir el resumen completo de hilos.
+
+        Args:
+            db_path: Ruta de la BD
+
+        Returns:
+            Cantidad de hilos reconstruidos
+        """
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for statement in CREATE_THREAD_TABLES.split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+            count = MessageThreadService._rebuild_with(conn)
+            conn.commit()
+            return count
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def list_threads(
+        conn: sqlite3.Connection, user_id: str, limit: int = 50, offset: int = 0
+    ) -> List[Dict]:
+        """
+        Listar hilos de un usuario, del más reciente al más antiguo.
+
+        Lee solo las tablas de resumen usando el índice (user_id, last_message_at).
+
+        Returns:
+            Lista de hilos con no leídos del usuario y participantes
+        """
+        MessageThreadService.ensure_tables(conn)
+        rows = conn.execute(
+            """
+            SELECT t.thread_id, t.asunto, t.solicitud_id, t.message_count,
+                   t.last_message_id, t.last_message_at, t.last_remitente_id,
+                   t.last_preview, p.unread_count,
+                   (SELECT GROUP_CONCAT(p2.user_id)
+                    FROM message_thread_participants p2
+                    WHERE p2.thread_id = t.thread_id) AS participants
+            FROM message_thread_participants p
+            JOIN message_threads t ON t.thread_id = p.thread_id
+            WHERE p.user_id = ?
+            ORDER BY p.last_message_at DESC
+            LIMIT ? OFFSET ?
+            """,
+            (str(user_id), limit, offset),
+        ).fetchall()
+        return [
+            {
+                "thread_id": r[0],
+                "asunto": r[1],
+                "solicitud_id": r[2],
+                "message_count": r[3],
+                "last_message_id": r[4],
+                "last_message_at": r[5],
+                "last_remitente_id": r[6],
+                "last_preview": r[7],
+                "unread_count": r[8],
+                "participants": (r[9] or "").split(",") if r[9] else [],
+            }
+            for r in rows
+        ]
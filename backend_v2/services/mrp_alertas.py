@@ -0,0 +1,355 @@
+"""
+Clasificación de alertas MRP en SQL
+
+La regla de routes/mrp.py::calcular_estado_material expresada como un CASE
+de SQLite, para que /api/mrp/alertas filtre por estado, pagine y cuente el
+resumen dentro de la BD. Solo la página pedida se trae a Python.
+
+Las condiciones se evalúan en el mismo orden y con la misma aritmética que
+la función original (NULL = 0, división real para la cobertura), de modo
+que ambas clasifican igual cada material.
+
+El resultado se materializa en materiales_mrp_estado (estado, clase,
+sugerencia, rotación y cobertura por material). Los triggers sobre
+materiales_mrp recalculan solo la fila insertada o modificada cuando cambian
+stock, pedidos, consumo o parámetros MRP, así que las lecturas del tablero
+son consultas indexadas por (centro, estado). Si la tabla aún no existe
+(BD sin migrar) el estado se calcula al vuelo con el mismo CASE.
+"""
+
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    from backend_v2.core.utils import tiene_tabla
+except ImportError:
+    from core.utils import tiene_tabla
+
+# Estado -> (clase CSS, sugerencia), en el orden en que se evalúan
+ESTADOS_MRP = {
+    "Quiebre de Stock": (
+        "danger",
+        "Urgente: Reclamar pedido vencido o generar compra de emergencia",
+    ),
+    "Bajo Punto de Pedido": ("warning", "Generar solicitud de pedido"),
+    "Bajo Stock de Seguridad": ("warning", "Reclamar pedido vencido o acelerar entrega"),
+    "Sobrestock Crítico": ("info", "Bajar parámetros y disponibilizar stock"),
+    "Exceso de Stock": ("info", "Revisar parámetros MRP"),
+    "Bajo Consumo": ("info", "Evaluar obsolescencia o transferir a otro centro"),
+    "Normal": ("success", ""),
+}
+
+ESTADO_SQL = """
+    CASE
+        WHEN COALESCE(stock_actual, 0) <= 0 THEN 'Quiebre de Stock'
+        WHEN COALESCE(stock_actual, 0) + COALESCE(pedidos_en_curso, 0)
+             < COALESCE(punto_pedido, 0) THEN 'Bajo Punto de Pedido'
+        WHEN COALESCE(stock_actual, 0) < COALESCE(stock_seguridad, 0)
+             THEN 'Bajo Stock de Seguridad'
+        WHEN COALESCE(stock_maximo, 0) > 0
+             AND COALESCE(stock_actual, 0) > COALESCE(stock_maximo, 0) * 1.5
+             THEN 'Sobrestock Crítico'
+        WHEN COALESCE(stock_maximo, 0) > 0
+             AND COALESCE(stock_actual, 0) > COALESCE(stock_maximo, 0)
+             THEN 'Exceso de Stock'
+        WHEN COALESCE(consumo_promedio_mensual, 0) > 0
+             AND CAST(COALESCE(stock_actual, 0) AS REAL)
+                 / (COALESCE(consumo_promedio_mensual, 0) / 12.0) > 24
+             THEN 'Bajo Consumo'
+        ELSE 'Normal'
+    END
+"""
+
+ROTACION_SQL = """
+    CASE
+        WHEN COALESCE(stock_actual, 0) > 0
+             THEN ROUND(COALESCE(consumo_promedio_mensual, 0) * 12.0 / stock_actual, 2)
+        ELSE 0
+    END
+"""
+
+# Misma cobertura que evalúa la regla de "Bajo Consumo"; NULL sin consumo
+COBERTURA_SQL = """
+    CASE
+        WHEN COALESCE(consumo_promedio_mensual, 0) > 0
+             THEN ROUND(CAST(COALESCE(stock_actual, 0) AS REAL)
+                        / (consumo_promedio_mensual / 12.0), 2)
+    END
+"""
+
+
+def _case_por_estado(posicion: int) -> str:
+    """CASE estado -> clase (posicion 0) o sugerencia (posicion 1)"""
+    whens = " ".join(
+        "WHEN '{}' THEN '{}'".format(estado, valores[posicion].replace("'", "''"))
+        for estado, valores in ESTADOS_MRP.items()
+    )
+    return f"CASE estado {whens} END"
+
+
+ALERTA_COLUMNS = """
+    codigo_material AS codigo, descripcion, sector, almacen, centro,
+    stock_seguridad, punto_pedido, stock_maximo, stock_actual, pedidos_en_curso,
+    consumo_promedio_mensual, lead_time_dias, critico, ubicacion
+"""
+
+ESTADO_TABLE = "materiales_mrp_estado"
+
+# Columnas de materiales_mrp que afectan al estado o a los filtros
+COLUMNAS_ESTADO = (
+    "centro",
+    "almacen",
+    "sector",
+    "codigo_material",
+    "stock_actual",
+    "pedidos_en_curso",
+    "consumo_promedio_mensual",
+    "stock_seguridad",
+    "punto_pedido",
+    "stock_maximo",
+)
+
+# Los triggers heredan la política de conflicto de la sentencia externa
+# (p. ej. un upsert), así que se borra y se inserta en vez de INSERT OR REPLACE
+_REFRESH_SQL = f"""
+    INSERT INTO {ESTADO_TABLE} (
+        material_id, centro, almacen, sector, codigo_material,
+        estado, estado_clase, sugerencia, rotacion, cobertura_meses, updated_at
+    )
+    SELECT material_id, centro, almacen, sector, codigo_material,
+           estado, {_case_por_estado(0)}, {_case_por_estado(1)},
+           rotacion, cobertura_meses, CURRENT_TIMESTAMP
+    FROM (
+        SELECT id AS material_id, centro, almacen, sector, codigo_material,
+               {ESTADO_SQL} AS estado, {ROTACION_SQL} AS rotacion,
+               {COBERTURA_SQL} AS cobertura_meses
+        FROM materiales_mrp
+        WHERE {{where}}
+    )
+"""
+
+CREATE_ESTADO_SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS {ESTADO_TABLE} (
+        material_id INTEGER PRIMARY KEY,
+        centro INTEGER,
+        almacen INTEGER,
+        sector TEXT,
+        codigo_material TEXT,
+        estado TEXT NOT NULL,
+        estado_clase TEXT NOT NULL,
+        sugerencia TEXT,
+        rotacion REAL DEFAULT 0,
+        cobertura_meses REAL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_mrp_estado_centro
+        ON {ESTADO_TABLE}(centro, estado, codigo_material);
+    CREATE INDEX IF NOT EXISTS idx_mrp_estado_estado
+        ON {ESTADO_TABLE}(estado, codigo_material);
+
+    CREATE TRIGGER IF NOT EXISTS trg_mrp_estado_insert
+    AFTER INSERT ON materiales_mrp
+    BEGIN
+        DELETE FROM {ESTADO_TABLE} WHERE material_id = NEW.id;
+        {_REFRESH_SQL.format(where="id = NEW.id")};
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_mrp_estado_update
+    AFTER UPDATE OF {", ".join(COLUMNAS_ESTADO)} ON materiales_mrp
+    BEGIN
+        DELETE FROM {ESTADO_TABLE} WHERE material_id IN (OLD.id, NEW.id);
+        {_REFRESH_SQL.format(where="id = NEW.id")};
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_mrp_estado_delete
+    AFTER DELETE ON materiales_mrp
+    BEGIN
+        DELETE FROM {ESTADO_TABLE} WHERE material_id = OLD.id;
+    END;
+"""
+
+
+def refrescar_estados(
+    conn: sqlite3.Connection, material_ids: Optional[Iterable[int]] = None
+) -> int:
+    """
+    Recalcular el estado materializado.
+
+    Los triggers ya mantienen la tabla al día; esto sirve para la carga
+    inicial y para reparar la tabla después de cambios hechos sin triggers.
+
+    Args:
+        conn: Conexión (el commit queda a cargo del llamador)
+        material_ids: ids de materiales_mrp a recalcular; None = todos
+
+    Returns:
+        Cantidad de filas recalculadas
+    """
+    cur = conn.cursor()
+    if material_ids is None:
+        cur.execute(f"DELETE FROM {ESTADO_TABLE}")
+        cur.execute(_REFRESH_SQL.format(where="1=1"))
+        return cur.rowcount
+
+    total = 0
+    ids = list(material_ids)
+    for i in range(0, len(ids), 500):
+        lote = ids[i : i + 500]
+        marcas = ",".join("?" * len(lote))
+        cur.execute(f"DELETE FROM {ESTADO_TABLE} WHERE material_id IN ({marcas})", lote)
+        cur.execute(_REFRESH_SQL.format(where=f"id IN ({marcas})"), lote)
+        total += cur.rowcount
+    return total
+
+
+def ensure_estado_schema(conn: sqlite3.Connection) -> bool:
+    """
+    Crear materiales_mrp_estado y sus triggers si no existen.
+
+    La primera vez también calcula el estado de todos los materiales.
+
+    Returns:
+        True si la tabla se creó (y se pobló) en esta llamada
+    """
+    nueva = not tiene_tabla(conn, ESTADO_TABLE)
+    conn.executescript(CREATE_ESTADO_SCHEMA)
+    if nueva:
+        refrescar_estados(conn)
+    conn.commit()
+    return nueva
+
+
+def fuente_estados(conn: sqlite3.Connection) -> str:
+    """
+    Subconsulta con el estado de cada material y sus datos de stock.
+
+    Columnas: centro, almacen, sector, codigo_material, estado, rotacion,
+    stock_actual, consumo_promedio_mensual, lead_time_dias. Usa la tabla
+    materializada si existe.
+    """
+    if tiene_tabla(conn, ESTADO_TABLE):
+        return f"""
+            SELECT e.centro, e.almacen, e.sector, e.codigo_material, e.estado, e.rotacion,
+                   m.stock_actual, m.consumo_promedio_mensual, m.lead_time_dias
+            FROM {ESTADO_TABLE} e JOIN materiales_mrp m ON m.id = e.material_id
+        """
+    return f"""
+        SELECT centro, almacen, sector, codigo_material, {ESTADO_SQL} AS estado,
+               {ROTACION_SQL} AS rotacion, stock_actual, consumo_promedio_mensual,
+               lead_time_dias
+        FROM materiales_mrp
+    """
+
+
+def estados_para_filtro(filtro: Optional[str]) -> Optional[List[str]]:
+    """
+    Estados que coinciden con el filtro de la UI.
+
+    El filtro es una subcadena sin distinguir mayúsculas ("bajo" incluye
+    los tres estados "Bajo ..."), igual que el filtrado original.
+
+    Returns:
+        Lista de estados, o None si no hay filtro (o es "todos")
+    """
+    filtro = (filtro or "").strip().lower()
+    if not filtro or filtro == "todos":
+        return None
+    return [e for e in ESTADOS_MRP if filtro in e.lower()]
+
+
+def resumen_desde_conteos(conteos: Dict[str, int]) -> Dict[str, int]:
+    """Resumen del tablero a partir de los conteos por estado"""
+    return {
+        "total": sum(conteos.values()),
+        "quiebre_stock": conteos.get("Quiebre de Stock", 0),
+        "bajo_punto_pedido": conteos.get("Bajo Punto de Pedido", 0),
+        "bajo_stock_seguridad": conteos.get("Bajo Stock de Seguridad", 0),
+        "sobrestock": conteos.get("Exceso de Stock", 0) + conteos.get("Sobrestock Crítico", 0),
+        "normal": conteos.get("Normal", 0),
+    }
+
+
+def consultar_alertas(
+    conn: sqlite3.Connection,
+    centro: Optional[int] = None,
+    almacen: Optional[int] = None,
+    sector: Optional[str] = None,
+    estado: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0,
+) -> Dict[str, Any]:
+    """
+    Página de alertas MRP y conteos por estado, calculados en SQL.
+
+    Lee materiales_mrp_estado si existe; si no, clasifica al vuelo.
+
+    Args:
+        conn: Conexión con row_factory sqlite3.Row
+        centro, almacen, sector: Filtros exactos
+        estado: Filtro de estado (subcadena, ver estados_para_filtro)
+        limit, offset: Paginación
+
+    Returns:
+        Dict con 'rows' (página ordenada por código, centro y almacén, con
+        estado, estado_clase, sugerencia, rotacion y cobertura_meses) y
+        'conteos' (estado -> cantidad, con el filtro de estado aplicado)
+    """
+    where = ["1=1"]
+    params: List[Any] = []
+    if centro:
+        where.append("centro = ?")
+        params.append(centro)
+    if almacen:
+        where.append("almacen = ?")
+        params.append(almacen)
+    if sector:
+        where.append("sector = ?")
+        params.append(sector)
+
+    estados = estados_para_filtro(estado)
+    if estados is not None:
+        if not estados:
+            return {"rows": [], "conteos": {}}
+        where.append(f"estado IN ({','.join('?' * len(estados))})")
+        params = params + estados
+
+    if tiene_tabla(conn, ESTADO_TABLE):
+        # Lecturas indexadas sobre el estado materializado
+        conteos_sql = f"SELECT estado, COUNT(*) FROM {ESTADO_TABLE} WHERE {{where}} GROUP BY estado"
+        filas = f"""
+            SELECT e.material_id
+            FROM {ESTADO_TABLE} e
+            WHERE {{where}}
+            ORDER BY e.codigo_material, e.centro, e.almacen
+            LIMIT ? OFFSET ?
+        """
+        pagina_sql = f"""
+            SELECT {", ".join("m." + c.strip() for c in ALERTA_COLUMNS.split(","))},
+                   e.estado, e.estado_clase, e.sugerencia, e.rotacion, e.cobertura_meses
+            FROM ({filas}) p
+            JOIN {ESTADO_TABLE} e ON e.material_id = p.material_id
+            JOIN materiales_mrp m ON m.id = p.material_id
+            ORDER BY e.codigo_material, e.centro, e.almacen
+        """
+    else:
+        base = f"""
+            SELECT {ALERTA_COLUMNS}, estado, {_case_por_estado(0)} AS estado_clase,
+                   {_case_por_estado(1)} AS sugerencia, rotacion, cobertura_meses
+            FROM (
+                SELECT *, {ESTADO_SQL} AS estado, {ROTACION_SQL} AS rotacion,
+                       {COBERTURA_SQL} AS cobertura_meses
+                FROM materiales_mrp
+            )
+            WHERE {{where}}
+        """
+        conteos_sql = f"SELECT estado, COUNT(*) FROM ({base}) GROUP BY estado"
+        pagina_sql = f"SELECT * FROM ({base}) ORDER BY codigo, centro, almacen LIMIT ? OFFSET ?"
+
+    where_sql = " AND ".join(where)
+    cur = conn.cursor()
+    cur.execute(conteos_sql.format(where=where_sql), params)
+    conteos = {row[0]: row[1] for row in cur.fetchall()}
+
+    cur.execute(pagina_sql.format(where=where_sql), params + [limit, offset])
+    return {"rows": cur.fetchall(), "conteos": conteos}
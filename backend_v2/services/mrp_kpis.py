@@ -0,0 +1,334 @@
+"""
+KPIs MRP calculados sobre datos reales
+
+Una sola pasada agregada (GROUP BY centro) por cada fuente calcula los KPIs
+de todos los centros a la vez:
+- materiales_mrp (con su estado): riesgo, sobrestock, rotación y lead time
+  planificado
+- solpeds del período: cumplimiento y tiempo de respuesta
+- purchase_orders: pedidos vencidos y lead time real de entrega
+
+Cada centro guarda sumas y conteos (no promedios), así el total de la
+empresa sale de sumar los centros sin volver a consultar.
+
+El lote completo se cachea por período bajo una clave que incluye la
+versión de los datos de referencia (la incrementa la importación MRP) y la
+fecha, de modo que una importación invalida los KPIs sin limpiar la cache a
+mano. Las solpeds y órdenes de compra se refrescan por TTL.
+
+Status de solpeds y órdenes de compra: el sistema solo escribe los de alta
+('creada', 'emitida'); los siguientes los carga la integración de compras
+y no son un conjunto fijo. Por eso una solped u orden se cuenta como
+cerrada cuando ya no está en un status abierto ni anulado, comparando sin
+distinguir mayúsculas.
+"""
+
+import sqlite3
+from datetime import date, timedelta
+from typing import Any, Dict, Optional
+
+try:
+    from backend_v2.core.cache import analysis_cache
+    from backend_v2.core.repository import ReferenceDataRepository
+    from backend_v2.services.mrp_alertas import fuente_estados
+except ImportError:
+    from core.cache import analysis_cache
+    from core.repository import ReferenceDataRepository
+    from services.mrp_alertas import fuente_estados
+
+KEY_PREFIX = "mrp_kpis"
+CACHE_TTL = 300
+PERIODOS = {"mes": 30, "trimestre": 90, "anio": 365}
+DIAS_VENCIDO = 30
+
+ESTADOS_RIESGO = ("Quiebre de Stock", "Bajo Punto de Pedido", "Bajo Stock de Seguridad")
+ESTADOS_SOBRESTOCK = ("Exceso de Stock", "Sobrestock Crítico")
+SOLPED_PENDIENTE = "creada"
+SOLPED_ENVIADA = "enviada"
+PO_ABIERTA = "emitida"
+ANULADAS = ("cancelada", "anulada", "rechazada")
+
+# Sumas por centro; el total de la empresa es la suma de los centros
+CAMPOS = (
+    "materiales",
+    "en_riesgo",
+    "sobrestock",
+    "consumo_anual",
+    "stock_total",
+    "lead_time_plan_sum",
+    "lead_time_plan_n",
+    "solpeds",
+    "solpeds_pendientes",
+    "solpeds_enviadas",
+    "solpeds_completadas",
+    "respuesta_dias_sum",
+    "pos_abiertas",
+    "pos_vencidas",
+    "lead_time_real_sum",
+    "lead_time_real_n",
+)
+
+
+def _en(valores) -> str:
+    return ", ".join("'{}'".format(v.replace("'", "''")) for v in valores)
+
+
+def _status(columna: str) -> str:
+    return f"LOWER(TRIM({columna}))"
+
+
+def _cerrada(columna: str, *abiertos: str) -> str:
+    """Condición SQL: status fuera de los abiertos y de los anulados"""
+    return f"{_status(columna)} NOT IN ({_en(abiertos + ANULADAS)})"
+
+
+def _db_file(conn: sqlite3.Connection) -> str:
+    for row in conn.execute("PRAGMA database_list"):
+        if row[1] == "main":
+            return row[2]
+    return ""
+
+
+def agregar_centros(
+    conn: sqlite3.Connection, fecha_inicio: str, hoy: date
+) -> Dict[str, Dict[str, float]]:
+    """
+    Sumas de cada centro en una pasada por fuente.
+
+    Args:
+        conn: Conexión a la BD principal
+        fecha_inicio: Inicio del período (YYYY-MM-DD)
+        hoy: Fecha de referencia para pedidos vencidos
+
+    Returns:
+        Dict centro (str) -> {campo: suma} con todos los CAMPOS
+    """
+    centros: Dict[str, Dict[str, float]] = {}
+
+    def acumular(cursor):
+        nombres = [d[0] for d in cursor.description]
+        for row in cursor.fetchall():
+            fila = dict(zip(nombres, row))
+            centro = str(fila.pop("centro") or "")
+            sumas = centros.setdefault(centro, dict.fromkeys(CAMPOS, 0))
+            for campo, valor in fila.items():
+                sumas[campo] += valor or 0
+
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT centro,
+               COUNT(*) AS materiales,
+               SUM(estado IN ({_en(ESTADOS_RIESGO)})) AS en_riesgo,
+               SUM(estado IN ({_en(ESTADOS_SOBRESTOCK)})) AS sobrestock,
+               SUM(COALESCE(consumo_promedio_mensual, 0) * 12) AS consumo_anual,
+               SUM(MAX(COALESCE(stock_actual, 0), 0)) AS stock_total,
+               SUM(lead_time_dias) AS lead_time_plan_sum,
+               COUNT(lead_time_dias) AS lead_time_plan_n
+        FROM ({fuente_estados(conn)})
+        GROUP BY centro
+        """
+    )
+    acumular(cur)
+
+    solped_cerrada = _cerrada("sp.status", SOLPED_PENDIENTE, SOLPED_ENVIADA)
+    cur.execute(
+        f"""
+        SELECT s.centro,
+               COUNT(*) AS solpeds,
+               SUM({_status("sp.status")} = '{SOLPED_PENDIENTE}') AS solpeds_pendientes,
+               SUM({_status("sp.status")} = '{SOLPED_ENVIADA}') AS solpeds_enviadas,
+               SUM({solped_cerrada}) AS solpeds_completadas,
+               SUM(CASE WHEN {solped_cerrada}
+                        THEN julianday(sp.updated_at) - julianday(sp.created_at) END)
+                   AS respuesta_dias_sum
+        FROM solpeds sp
+        JOIN solicitudes s ON s.id = sp.solicitud_id
+        WHERE sp.created_at >= ?
+        GROUP BY s.centro
+        """,
+        (fecha_inicio,),
+    )
+    acumular(cur)
+
+    po_abierta = f"{_status('po.status')} = '{PO_ABIERTA}'"
+    po_cerrada = _cerrada("po.status", PO_ABIERTA)
+    cur.execute(
+        f"""
+        SELECT s.centro,
+               SUM({po_abierta}) AS pos_abiertas,
+               SUM({po_abierta} AND po.created_at < date(?, ?)) AS pos_vencidas,
+               SUM(CASE WHEN {po_cerrada} AND po.created_at >= ?
+                        THEN julianday(po.updated_at) - julianday(po.created_at) END)
+                   AS lead_time_real_sum,
+               SUM({po_cerrada} AND po.created_at >= ?)
+                   AS lead_time_real_n
+        FROM purchase_orders po
+        JOIN solicitudes s ON s.id = po.solicitud_id
+        GROUP BY s.centro
+        """,
+        (hoy.isoformat(), f"-{DIAS_VENCIDO} days", fecha_inicio, fecha_inicio),
+    )
+    acumular(cur)
+    return centros
+
+
+def _pct(parte: float, total: float) -> float:
+    return round(parte / total * 100, 1) if total else 0.0
+
+
+def _promedio(suma: float, n: float) -> Optional[float]:
+    return round(suma / n, 1) if n else None
+
+
+def kpis_desde_sumas(sumas: Dict[str, float]) -> Dict[str, Any]:
+    """KPIs (formato de /api/mrp/kpis) a partir de las sumas de uno o más centros"""
+    pct_en_riesgo = _pct(sumas["en_riesgo"], sumas["materiales"])
+    pct_sobrestock = _pct(sumas["sobrestock"], sumas["materiales"])
+    stock_total = sumas["stock_total"]
+    rotacion = round(sumas["consumo_anual"] / stock_total, 2) if stock_total else 0
+    lead_time_objetivo = _promedio(sumas["lead_time_plan_sum"], sumas["lead_time_plan_n"])
+    lead_time_real = _promedio(sumas["lead_time_real_sum"], sumas["lead_time_real_n"])
+    cumplimiento = _pct(sumas["solpeds_completadas"], sumas["solpeds"])
+    respuesta = _promedio(sumas["respuesta_dias_sum"], sumas["solpeds_completadas"])
+    vencidos = int(sumas["pos_vencidas"])
+
+    return {
+        "materiales_en_riesgo": {
+            "valor": pct_en_riesgo,
+            "unidad": "%",
+            "cantidad": int(sumas["en_riesgo"]),
+            "tendencia": "up" if pct_en_riesgo > 10 else "down",
+            "descripcion": "Materiales por quiebre o bajo punto de pedido",
+        },
+        "materiales_sobrestock": {
+            "valor": pct_sobrestock,
+            "unidad": "%",
+            "cantidad": int(sumas["sobrestock"]),
+            "tendencia": "stable",
+            "descripcion": "Materiales con exceso de inventario",
+        },
+        "rotacion_promedio": {
+            "valor": rotacion,
+            "unidad": "veces/año",
+            "tendencia": "up" if rotacion > 3 else "down",
+            "descripcion": "Consumo anual sobre stock total del portafolio",
+        },
+        "lead_time_promedio": {
+            "valor": lead_time_real,
+            "unidad": "días",
+            "objetivo": lead_time_objetivo,
+            "tendencia": (
+                "up"
+                if lead_time_real is not None
+                and lead_time_objetivo is not None
+                and lead_time_real > lead_time_objetivo
+                else "down"
+            ),
+            "descripcion": "Tiempo promedio de entrega de órdenes de compra cerradas",
+        },
+        "cumplimiento_mrp": {
+            "valor": cumplimiento,
+            "unidad": "%",
+            "tendencia": "up" if cumplimiento > 80 else "down",
+            "descripcion": "Solpeds completadas sobre creadas en el período",
+        },
+        "pedidos_vencidos": {
+            "valor": vencidos,
+            "unidad": "pedidos",
+            "tendencia": "down" if vencidos < 5 else "up",
+            "descripcion": f"Pedidos con más de {DIAS_VENCIDO} días sin completar",
+        },
+        "pct_pedidos_vencidos": {
+            "valor": _pct(vencidos, sumas["pos_abiertas"]),
+            "unidad": "%",
+            "tendencia": "down" if vencidos < 5 else "up",
+            "descripcion": "Porcentaje de pedidos abiertos que están vencidos",
+        },
+        "velocidad_respuesta": {
+            "valor": respuesta,
+            "unidad": "días",
+            "tendencia": "down" if respuesta is not None and respuesta < 5 else "up",
+            "descripcion": "Días promedio entre creación y cierre de solpeds",
+        },
+    }
+
+
+def _total(centros: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+    total = dict.fromkeys(CAMPOS, 0)
+    for sumas in centros.values():
+        for campo in CAMPOS:
+            total[campo] += sumas[campo]
+    return total
+
+
+def kpis_todos_los_centros(
+    conn: sqlite3.Connection, periodo: str = "mes", hoy: Optional[date] = None
+) -> Dict[str, Any]:
+    """
+    KPIs de todos los centros y del total, desde cache si las entradas no cambiaron.
+
+    El resultado cacheado se comparte entre llamadas: no debe modificarse.
+
+    Args:
+        conn: Conexión a la BD principal
+        periodo: 'mes', 'trimestre' o 'anio' (otro valor = 'mes')
+        hoy: Fecha de referencia (default: hoy)
+
+    Returns:
+        Dict con 'periodo', 'fecha_inicio', 'fecha_fin', 'centros'
+        (centro -> {'kpis', 'sumas'}) y 'total' ({'kpis', 'sumas'})
+    """
+    periodo = periodo if periodo in PERIODOS else "mes"
+    hoy = hoy or date.today()
+    version = ReferenceDataRepository.get_version(conn)
+    key = f"{KEY_PREFIX}:{_db_file(conn)}:{periodo}:{hoy.isoformat()}:{version}"
+    cached = analysis_cache.get(key)
+    if cached is not None:
+        return cached
+
+    fecha_inicio = (hoy - timedelta(days=PERIODOS[periodo])).isoformat()
+    centros = agregar_centros(conn, fecha_inicio, hoy)
+    total = _total(centros)
+    resultado = {
+        "periodo": periodo,
+        "fecha_inicio": fecha_inicio,
+        "fecha_fin": hoy.isoformat(),
+        "centros": {
+            centro: {"kpis": kpis_desde_sumas(sumas), "sumas": sumas}
+            for centro, sumas in sorted(centros.items())
+        },
+        "total": {"kpis": kpis_desde_sumas(total), "sumas": total},
+    }
+    analysis_cache.invalidate_pattern(f"{KEY_PREFIX}:{_db_file(conn)}:{periodo}:")
+    analysis_cache.set(key, resultado, ttl=CACHE_TTL)
+    return resultado
+
+
+def kpis_centro(
+    conn: sqlite3.Connection,
+    centro: Optional[str] = None,
+    periodo: str = "mes",
+    hoy: Optional[date] = None,
+) -> Dict[str, Any]:
+    """
+    KPIs de un centro (o del total si centro es vacío), servidos desde el lote.
+
+    Returns:
+        Dict con 'kpis', 'sumas', 'periodo', 'fecha_inicio' y 'fecha_fin'
+    """
+    lote = kpis_todos_los_centros(conn, periodo, hoy)
+    if centro:
+        vacio = dict.fromkeys(CAMPOS, 0)
+        datos = lote["centros"].get(str(centro)) or {
+            "kpis": kpis_desde_sumas(vacio),
+            "sumas": vacio,
+        }
+    else:
+        datos = lote["total"]
+    return {
+        **datos,
+        "periodo": lote["periodo"],
+        "fecha_inicio": lote["fecha_inicio"],
+        "fecha_fin": lote["fecha_fin"],
+    }
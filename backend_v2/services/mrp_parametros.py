@@ -0,0 +1,520 @@
+"""
+Recalculo de parámetros MRP desde el consumo histórico
+
+Los parámetros de materiales_mrp (stock de seguridad, punto de pedido y
+stock máximo) vienen de BBDD.xlsx y no se adaptan a la demanda. Este
+módulo los recalcula en lote con pandas:
+
+1. El consumo (histórico importado en la BD, services/consumo_store) se
+   agrupa por (centro, almacen, codigo_material, período).
+   Los períodos sin movimientos dentro de la ventana cuentan como 0.
+2. Por material: demanda media y desvío por período.
+3. Con el lead time de materiales_mrp y el nivel de servicio objetivo (z):
+
+       stock_seguridad = z * desvio * sqrt(lead_time / dias_periodo)
+       punto_pedido    = demanda_diaria * lead_time + stock_seguridad
+       stock_maximo    = punto_pedido + demanda_media (un período de cobertura)
+
+Solo se sugieren parámetros para materiales con consumo en el histórico;
+sin consumo no hay demanda de la que partir y los de BBDD.xlsx se mantienen.
+
+Las sugerencias se guardan en materiales_mrp_sugerencias para que el
+planificador las revise; aceptar una copia los valores a materiales_mrp y
+los registra en materiales_mrp_parametros_aceptados, que la importación MRP
+aplica sobre BBDD.xlsx para no revertirlos.
+"""
+
+import sqlite3
+from datetime import datetime
+from statistics import NormalDist
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    from backend_v2.core.repository import ReferenceDataRepository
+    from backend_v2.services import consumo_store
+except ImportError:
+    from core.repository import ReferenceDataRepository
+    from services import consumo_store
+
+SUGERENCIAS_TABLE = "materiales_mrp_sugerencias"
+ACEPTADOS_TABLE = "materiales_mrp_parametros_aceptados"
+PERIODOS = {"mes": ("M", 30), "semana": ("W", 7)}
+NIVEL_SERVICIO_DEFAULT = 0.95
+LEAD_TIME_DEFAULT = 30
+BATCH_SIZE = 10000
+# Ids por sentencia al revisar (debajo del límite de variables de SQLite)
+IDS_POR_LOTE = 500
+KEY = ["centro", "almacen", "codigo_material"]
+PARAMETROS = ["stock_seguridad", "punto_pedido", "stock_maximo"]
+
+ESTADO_PENDIENTE = "pendiente"
+ESTADO_ACEPTADA = "aceptada"
+ESTADO_RECHAZADA = "rechazada"
+
+CREATE_SUGERENCIAS_SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS {SUGERENCIAS_TABLE} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        centro INTEGER NOT NULL,
+        almacen INTEGER NOT NULL,
+        codigo_material TEXT NOT NULL,
+        run_id TEXT NOT NULL,
+        periodo TEXT NOT NULL,
+        periodos INTEGER NOT NULL,
+        demanda_media REAL NOT NULL,
+        demanda_desvio REAL NOT NULL,
+        lead_time_dias INTEGER NOT NULL,
+        nivel_servicio REAL NOT NULL,
+        stock_seguridad_actual INTEGER,
+        punto_pedido_actual INTEGER,
+        stock_maximo_actual INTEGER,
+        stock_seguridad_sugerido INTEGER NOT NULL,
+        punto_pedido_sugerido INTEGER NOT NULL,
+        stock_maximo_sugerido INTEGER NOT NULL,
+        estado TEXT NOT NULL DEFAULT '{ESTADO_PENDIENTE}',
+        revisado_por TEXT,
+        revisado_at TEXT,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(centro, almacen, codigo_material)
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_mrp_sugerencias_estado
+        ON {SUGERENCIAS_TABLE}(estado, centro);
+
+    -- Último valor aceptado por material; la importación MRP lo respeta
+    CREATE TABLE IF NOT EXISTS {ACEPTADOS_TABLE} (
+        centro INTEGER NOT NULL,
+        almacen INTEGER NOT NULL,
+        codigo_material TEXT NOT NULL,
+        stock_seguridad INTEGER NOT NULL,
+        punto_pedido INTEGER NOT NULL,
+        stock_maximo INTEGER NOT NULL,
+        sugerencia_id INTEGER,
+        aceptado_por TEXT,
+        aceptado_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (centro, almacen, codigo_material)
+    );
+"""
+
+_COLUMNAS = [
+    "centro",
+    "almacen",
+    "codigo_material",
+    "run_id",
+    "periodo",
+    "periodos",
+    "demanda_media",
+    "demanda_desvio",
+    "lead_time_dias",
+    "nivel_servicio",
+    "stock_seguridad_actual",
+    "punto_pedido_actual",
+    "stock_maximo_actual",
+    "stock_seguridad_sugerido",
+    "punto_pedido_sugerido",
+    "stock_maximo_sugerido",
+]
+
+# Una nueva corrida reemplaza la sugerencia anterior (revisada o no) del material
+_UPSERT_SQL = f"""
+    INSERT INTO {SUGERENCIAS_TABLE} ({", ".join(_COLUMNAS)})
+    VALUES ({", ".join("?" for _ in _COLUMNAS)})
+    ON CONFLICT(centro, almacen, codigo_material) DO UPDATE SET
+        {", ".join(f"{c} = excluded.{c}" for c in _COLUMNAS[3:])},
+        estado = '{ESTADO_PENDIENTE}',
+        revisado_por = NULL,
+        revisado_at = NULL,
+        created_at = CURRENT_TIMESTAMP
+"""
+
+
+def ensure_sugerencias_schema(conn: sqlite3.Connection) -> None:
+    """Crear materiales_mrp_sugerencias y materiales_mrp_parametros_aceptados si no existen"""
+    conn.executescript(CREATE_SUGERENCIAS_SCHEMA)
+
+
+def aplicar_parametros_aceptados(conn: sqlite3.Connection, tabla: str) -> int:
+    """
+    Pisar en `tabla` los parámetros con los últimos valores aceptados.
+
+    La importación MRP lo aplica a su staging antes del diff, así los
+    valores de BBDD.xlsx no revierten lo que aceptó el planificador.
+
+    Args:
+        conn: Conexión a la BD principal
+        tabla: Tabla con las columnas clave y de parámetros de materiales_mrp
+
+    Returns:
+        Filas de `tabla` actualizadas
+    """
+    cur = conn.execute(
+        f"""
+        UPDATE {tabla} SET
+            {", ".join(f"{c} = p.{c}" for c in PARAMETROS)}
+        FROM {ACEPTADOS_TABLE} p
+        WHERE {tabla}.centro = p.centro
+          AND {tabla}.almacen = p.almacen
+          AND {tabla}.codigo_material = p.codigo_material
+        """
+    )
+    return cur.rowcount
+
+
+def normalizar_consumo(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Normalizar movimientos de consumo (mismas conversiones que la importación MRP).
+
+    Args:
+        df: Columnas fecha, centro, almacen, codigo_material, cantidad
+
+    Returns:
+        DataFrame con tipos normalizados y sin fechas inválidas
+    """
+    df = df.copy()
+    for col in ("centro", "almacen"):
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(int)
+    df["codigo_material"] = (
+        pd.to_numeric(df["codigo_material"], errors="coerce").fillna(0).astype(np.int64).astype(str)
+    )
+    df["cantidad"] = pd.to_numeric(df["cantidad"], errors="coerce").fillna(0)
+    df["fecha"] = pd.to_datetime(df["fecha"], errors="coerce")
+    return df.dropna(subset=["fecha"])
+
+
+def cargar_consumo(path) -> pd.DataFrame:
+    """Leer docs/consumo historico.xlsx (solo las columnas necesarias)"""
+    df = pd.read_excel(
+        path,
+        sheet_name="consumo historico",
+        usecols=["Fecha", "Centro", "Almacen", "Cantidad", "Material"],
+    )
+    df = df.rename(
+        columns={
+            "Fecha": "fecha",
+            "Centro": "centro",
+            "Almacen": "almacen",
+            "Cantidad": "cantidad",
+            "Material": "codigo_material",
+        }
+    )
+    return normalizar_consumo(df)
+
+
+def cargar_consumo_bd(
+    conn: sqlite3.Connection, periodo: str = "mes", centro: Optional[int] = None
+) -> pd.DataFrame:
+    """
+    Consumo desde el histórico importado en la BD (services/consumo_store).
+
+    Con periodo 'mes' se lee el resumen mensual en lugar de los movimientos;
+    la demanda por período resultante es la misma.
+
+    Returns:
+        DataFrame normalizado (vacío si el histórico no fue importado)
+    """
+    if not consumo_store.tiene_consumo(conn):
+        return normalizar_consumo(
+            pd.DataFrame(columns=["fecha", "centro", "almacen", "codigo_material", "cantidad"])
+        )
+    return normalizar_consumo(consumo_store.consumo_por_periodo(conn, periodo, centro))
+
+
+def estadisticas_demanda(consumo: pd.DataFrame, periodo: str = "mes") -> pd.DataFrame:
+    """
+    Demanda media y desvío por período de cada material/ubicación.
+
+    La ventana va del primer al último período del archivo; los períodos sin
+    consumo de un material cuentan como demanda 0.
+
+    Returns:
+        DataFrame con centro, almacen, codigo_material, periodos,
+        demanda_media y demanda_desvio (desvío muestral; 0 con un período)
+    """
+    freq, _ = PERIODOS[periodo]
+    columnas = KEY + ["periodos", "demanda_media", "demanda_desvio"]
+    if consumo.empty:
+        tipos = [int, int, str, int, float, float]
+        return pd.DataFrame({c: pd.Series(dtype=t) for c, t in zip(columnas, tipos)})
+
+    buckets = consumo["fecha"].dt.to_period(freq)
+    n = int((buckets.max() - buckets.min()).n) + 1
+
+    por_periodo = (
+        consumo.assign(_periodo=buckets)
+        .groupby(KEY + ["_periodo"], sort=False)["cantidad"]
+        .sum()
+    )
+    agregados = (
+        pd.DataFrame({"x": por_periodo, "x2": por_periodo**2})
+        .groupby(level=[0, 1, 2], sort=False)
+        .sum()
+    )
+    media = agregados["x"] / n
+    if n > 1:
+        varianza = (agregados["x2"] - n * media**2) / (n - 1)
+        desvio = np.sqrt(varianza.clip(lower=0))
+    else:
+        desvio = media * 0.0
+
+    stats = pd.DataFrame(
+        {"periodos": n, "demanda_media": media, "demanda_desvio": desvio}
+    ).reset_index()
+    return stats[columnas]
+
+
+def calcular_sugerencias(
+    stats: pd.DataFrame,
+    materiales: pd.DataFrame,
+    nivel_servicio: float = NIVEL_SERVICIO_DEFAULT,
+    periodo: str = "mes",
+) -> pd.DataFrame:
+    """
+    Parámetros sugeridos para los materiales de materiales_mrp con consumo.
+
+    Args:
+        stats: Resultado de estadisticas_demanda
+        materiales: centro, almacen, codigo_material, lead_time_dias y los
+            parámetros actuales (stock_seguridad, punto_pedido, stock_maximo)
+        nivel_servicio: Probabilidad objetivo de no quebrar en el lead time
+        periodo: 'mes' o 'semana' (el mismo usado en las estadísticas)
+
+    Returns:
+        DataFrame con las columnas de materiales_mrp_sugerencias (sin run_id);
+        los materiales sin consumo en stats quedan afuera
+    """
+    _, dias_periodo = PERIODOS[periodo]
+    z = NormalDist().inv_cdf(nivel_servicio)
+
+    df = materiales.merge(stats, on=KEY, how="inner")
+    lead_time = pd.to_numeric(df["lead_time_dias"], errors="coerce").fillna(LEAD_TIME_DEFAULT)
+
+    media = df["demanda_media"].clip(lower=0)
+    seguridad = z * df["demanda_desvio"] * np.sqrt(lead_time / dias_periodo)
+    punto = media / dias_periodo * lead_time + seguridad
+
+    return pd.DataFrame(
+        {
+            "centro": df["centro"].astype(int),
+            "almacen": df["almacen"].astype(int),
+            "codigo_material": df["codigo_material"].astype(str),
+            "periodo": periodo,
+            "periodos": df["periodos"].astype(int),
+            "demanda_media": df["demanda_media"].round(4),
+            "demanda_desvio": df["demanda_desvio"].round(4),
+            "lead_time_dias": lead_time.astype(int),
+            "nivel_servicio": nivel_servicio,
+            "stock_seguridad_actual": df["stock_seguridad"],
+            "punto_pedido_actual": df["punto_pedido"],
+            "stock_maximo_actual": df["stock_maximo"],
+            "stock_seguridad_sugerido": np.ceil(seguridad.round(6)).astype(int),
+            "punto_pedido_sugerido": np.ceil(punto.round(6)).astype(int),
+            "stock_maximo_sugerido": np.ceil((punto + media).round(6)).astype(int),
+        }
+    )
+
+
+def guardar_sugerencias(
+    conn: sqlite3.Connection,
+    sugerencias: pd.DataFrame,
+    run_id: str,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """
+    Escribir sugerencias en lotes (una transacción por lote).
+
+    Args:
+        progress: Callback (escritas, total) llamado después de cada lote
+
+    Returns:
+        Cantidad de sugerencias escritas
+    """
+    ensure_sugerencias_schema(conn)
+    datos = sugerencias.assign(run_id=run_id)[_COLUMNAS]
+    total = len(datos)
+    escritas = 0
+    for inicio in range(0, total, BATCH_SIZE):
+        lote = datos.iloc[inicio : inicio + BATCH_SIZE]
+        # object + None: tipos nativos de Python que sqlite3 sabe enlazar
+        filas = list(lote.astype(object).where(lote.notna(), None).itertuples(index=False, name=None))
+        conn.executemany(_UPSERT_SQL, filas)
+        conn.commit()
+        escritas += len(filas)
+        if progress:
+            progress(escritas, total)
+    return escritas
+
+
+def recalcular_parametros(
+    conn: sqlite3.Connection,
+    consumo: pd.DataFrame,
+    nivel_servicio: float = NIVEL_SERVICIO_DEFAULT,
+    periodo: str = "mes",
+    centro: Optional[int] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Corrida completa: estadísticas, sugerencias y escritura.
+
+    Args:
+        conn: Conexión a la BD principal
+        consumo: Movimientos normalizados (normalizar_consumo/cargar_consumo)
+        nivel_servicio: Entre 0.5 y 0.9999
+        periodo: 'mes' o 'semana'
+        centro: Limitar la corrida a un centro
+        progress: Callback (escritas, total)
+
+    Returns:
+        Resumen de la corrida
+    """
+    if periodo not in PERIODOS:
+        raise ValueError(f"Periodo inválido: {periodo}")
+    if not 0.5 <= nivel_servicio < 1:
+        raise ValueError("El nivel de servicio debe estar entre 0.5 y 1")
+
+    run_id = datetime.now().strftime("%Y%m%d%H%M%S")
+    sql = (
+        "SELECT centro, almacen, codigo_material, lead_time_dias, "
+        "stock_seguridad, punto_pedido, stock_maximo FROM materiales_mrp"
+    )
+    params: List[Any] = []
+    if centro:
+        sql += " WHERE centro = ?"
+        params.append(centro)
+        consumo = consumo[consumo["centro"] == int(centro)]
+    materiales = pd.read_sql_query(sql, conn, params=params)
+
+    stats = estadisticas_demanda(consumo, periodo)
+    sugerencias = calcular_sugerencias(stats, materiales, nivel_servicio, periodo)
+    escritas = guardar_sugerencias(conn, sugerencias, run_id, progress)
+
+    cambios = (
+        (sugerencias["stock_seguridad_sugerido"] != sugerencias["stock_seguridad_actual"])
+        | (sugerencias["punto_pedido_sugerido"] != sugerencias["punto_pedido_actual"])
+        | (sugerencias["stock_maximo_sugerido"] != sugerencias["stock_maximo_actual"])
+    )
+    return {
+        "run_id": run_id,
+        "materiales": escritas,
+        "con_consumo": int(len(stats)),
+        "sin_consumo": int(len(materiales)) - escritas,
+        "con_cambios": int(cambios.sum()),
+        "periodos": int(stats["periodos"].max()) if len(stats) else 0,
+        "nivel_servicio": nivel_servicio,
+        "z": round(NormalDist().inv_cdf(nivel_servicio), 4),
+    }
+
+
+def listar_sugerencias(
+    conn: sqlite3.Connection,
+    centro: Optional[int] = None,
+    estado: Optional[str] = ESTADO_PENDIENTE,
+    limit: int = 50,
+    offset: int = 0,
+) -> Dict[str, Any]:
+    """
+    Sugerencias para revisión, las de mayor cambio en punto de pedido primero.
+
+    Returns:
+        Dict con 'rows' (dicts) y 'total'
+    """
+    ensure_sugerencias_schema(conn)
+    where = ["1=1"]
+    params: List[Any] = []
+    if centro:
+        where.append("centro = ?")
+        params.append(centro)
+    if estado:
+        where.append("estado = ?")
+        params.append(estado)
+    where_sql = " AND ".join(where)
+
+    cur = conn.cursor()
+    cur.execute(f"SELECT COUNT(*) FROM {SUGERENCIAS_TABLE} WHERE {where_sql}", params)
+    total = cur.fetchone()[0]
+    cur.execute(
+        f"""
+        SELECT * FROM {SUGERENCIAS_TABLE}
+        WHERE {where_sql}
+        ORDER BY ABS(punto_pedido_sugerido - COALESCE(punto_pedido_actual, 0)) DESC, id
+        LIMIT ? OFFSET ?
+        """,
+        params + [limit, offset],
+    )
+    nombres = [d[0] for d in cur.description]
+    return {"rows": [dict(zip(nombres, r)) for r in cur.fetchall()], "total": total}
+
+
+def _aceptar(conn: sqlite3.Connection, filtro: str, ids: List[int], usuario: str) -> None:
+    """Copiar las sugerencias pendientes de `ids` a materiales_mrp y a los aceptados"""
+    conn.execute(
+        f"""
+        UPDATE materiales_mrp SET
+            stock_seguridad = s.stock_seguridad_sugerido,
+            punto_pedido = s.punto_pedido_sugerido,
+            stock_maximo = s.stock_maximo_sugerido,
+            updated_at = CURRENT_TIMESTAMP
+        FROM (SELECT * FROM {SUGERENCIAS_TABLE} WHERE {filtro}) s
+        WHERE materiales_mrp.centro = s.centro
+          AND materiales_mrp.almacen = s.almacen
+          AND materiales_mrp.codigo_material = s.codigo_material
+        """,
+        ids,
+    )
+    conn.execute(
+        f"""
+        INSERT INTO {ACEPTADOS_TABLE} ({", ".join(KEY + PARAMETROS)}, sugerencia_id, aceptado_por)
+        SELECT centro, almacen, codigo_material, stock_seguridad_sugerido,
+               punto_pedido_sugerido, stock_maximo_sugerido, id, ?
+        FROM {SUGERENCIAS_TABLE} WHERE {filtro}
+        ON CONFLICT(centro, almacen, codigo_material) DO UPDATE SET
+            {", ".join(f"{c} = excluded.{c}" for c in PARAMETROS)},
+            sugerencia_id = excluded.sugerencia_id,
+            aceptado_por = excluded.aceptado_por,
+            aceptado_at = CURRENT_TIMESTAMP
+        """,
+        [usuario] + ids,
+    )
+
+
+def revisar_sugerencias(
+    conn: sqlite3.Connection, ids: List[int], aceptar: bool, usuario: str
+) -> int:
+    """
+    Aceptar o rechazar sugerencias pendientes.
+
+    Aceptar copia los parámetros sugeridos a materiales_mrp y los registra
+    como aceptados en la misma transacción (los triggers recalculan el
+    estado de esos materiales) e incrementa la versión de datos de
+    referencia. Los ids se procesan en lotes de IDS_POR_LOTE.
+
+    Returns:
+        Cantidad de sugerencias revisadas
+    """
+    if not ids:
+        return 0
+    ensure_sugerencias_schema(conn)
+    revisadas = 0
+    try:
+        for inicio in range(0, len(ids), IDS_POR_LOTE):
+            lote = list(ids[inicio : inicio + IDS_POR_LOTE])
+            filtro = f"id IN ({','.join('?' * len(lote))}) AND estado = '{ESTADO_PENDIENTE}'"
+            if aceptar:
+                _aceptar(conn, filtro, lote, usuario)
+            cur = conn.execute(
+                f"""
+                UPDATE {SUGERENCIAS_TABLE}
+                SET estado = ?, revisado_por = ?, revisado_at = CURRENT_TIMESTAMP
+                WHERE {filtro}
+                """,
+                [ESTADO_ACEPTADA if aceptar else ESTADO_RECHAZADA, usuario] + lote,
+            )
+            revisadas += cur.rowcount
+        if aceptar:
+            ReferenceDataRepository.bump(conn)
+        conn.commit()
+        return revisadas
+    except Exception:
+        conn.rollback()
+        raise
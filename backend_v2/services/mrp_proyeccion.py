@@ -0,0 +1,257 @@
+"""
+Proyección de stock MRP vectorizada
+
+Simula el nivel de stock de todos los materiales a la vez sobre una grilla
+de días (paso diario o semanal) con arrays de NumPy:
+
+    nivel(t) = stock_actual - consumo_diario * t + pedidos_en_curso * [t >= lead_time]
+
+- consumo_diario = consumo_promedio_mensual / 30
+- Los pedidos en curso se reciben completos al cumplirse lead_time_dias.
+- El quiebre es el primer punto de la grilla con nivel <= 0; dentro del paso
+  el día exacto se interpola con el consumo diario.
+- La fecha límite de pedido es la fecha de quiebre menos el lead time: un
+  pedido emitido después llega tarde.
+
+Los materiales se procesan en bloques para acotar la memoria de la matriz
+materiales x días.
+"""
+
+import sqlite3
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+DIAS_POR_MES = 30
+LEAD_TIME_DEFAULT = 30
+HORIZONTE_DEFAULT = 180
+HORIZONTE_MAX = 730
+PASOS = {"dia": 1, "semana": 7}
+CHUNK = 20000
+
+PROYECCION_COLUMNS = """
+    codigo_material AS codigo, descripcion, sector, almacen, centro,
+    stock_actual, pedidos_en_curso, consumo_promedio_mensual, lead_time_dias
+"""
+
+
+def _arrays(rows: List[Any]) -> Dict[str, np.ndarray]:
+    """Columnas numéricas de las filas como arrays (NULL = 0, lead time por defecto)"""
+    n = len(rows)
+
+    def col(nombre, default=0.0):
+        return np.fromiter(
+            (default if r[nombre] is None else r[nombre] for r in rows), dtype=np.float64, count=n
+        )
+
+    return {
+        "stock": col("stock_actual"),
+        "pedidos": col("pedidos_en_curso"),
+        "consumo": col("consumo_promedio_mensual"),
+        "lead_time": col("lead_time_dias", LEAD_TIME_DEFAULT),
+    }
+
+
+def grilla(horizonte_dias: int, paso_dias: int) -> np.ndarray:
+    """Días simulados: 0, paso, 2*paso, ... y siempre el último día del horizonte"""
+    dias = np.arange(0, horizonte_dias + 1, paso_dias, dtype=np.float64)
+    return np.unique(np.append(dias, float(horizonte_dias)))
+
+
+def niveles(
+    stock: np.ndarray,
+    pedidos: np.ndarray,
+    consumo_mensual: np.ndarray,
+    lead_time: np.ndarray,
+    dias: np.ndarray,
+) -> np.ndarray:
+    """
+    Matriz de niveles proyectados.
+
+    Args:
+        stock, pedidos, consumo_mensual, lead_time: Arrays de largo N
+        dias: Grilla de días (largo T)
+
+    Returns:
+        Array N x T con el stock proyectado en cada día de la grilla
+    """
+    diario = consumo_mensual / DIAS_POR_MES
+    return (
+        stock[:, None]
+        - diario[:, None] * dias[None, :]
+        + pedidos[:, None] * (dias[None, :] >= lead_time[:, None])
+    )
+
+
+def proyectar(
+    stock: np.ndarray,
+    pedidos: np.ndarray,
+    consumo_mensual: np.ndarray,
+    lead_time: np.ndarray,
+    horizonte_dias: int = HORIZONTE_DEFAULT,
+    paso_dias: int = 1,
+    chunk: int = CHUNK,
+) -> Dict[str, np.ndarray]:
+    """
+    Días hasta el quiebre de stock de cada material.
+
+    Args:
+        stock, pedidos, consumo_mensual, lead_time: Arrays de largo N
+        horizonte_dias: Días a simular
+        paso_dias: 1 (diario) o 7 (semanal)
+        chunk: Materiales por bloque
+
+    Returns:
+        Dict con 'dias_cobertura' (días hasta el quiebre, NaN si no quiebra
+        dentro del horizonte) y 'dias_para_pedir' (dias_cobertura - lead
+        time; negativo = pedido atrasado)
+    """
+    dias = grilla(horizonte_dias, paso_dias)
+    n = len(stock)
+    cobertura = np.full(n, np.nan)
+    diario_total = consumo_mensual / DIAS_POR_MES
+
+    for inicio in range(0, n, chunk):
+        sl = slice(inicio, inicio + chunk)
+        nivel = niveles(stock[sl], pedidos[sl], consumo_mensual[sl], lead_time[sl], dias)
+        bajo = nivel <= 0
+        quiebra = bajo.any(axis=1)
+        idx = bajo.argmax(axis=1)
+        previo = np.maximum(idx - 1, 0)
+        nivel_previo = nivel[np.arange(len(idx)), previo]
+        diario = diario_total[sl]
+
+        # Día exacto dentro del paso: el stock previo se agota al ritmo diario
+        largo = dias[idx] - dias[previo]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dentro = np.minimum(np.where(diario > 0, nivel_previo / diario, largo), largo)
+        cruce = np.where(idx == 0, 0.0, dias[previo] + dentro)
+        cobertura[sl] = np.where(quiebra, np.floor(cruce), np.nan)
+
+    return {"dias_cobertura": cobertura, "dias_para_pedir": cobertura - lead_time}
+
+
+def _fecha(hoy: date, dias: float) -> Optional[str]:
+    if np.isnan(dias):
+        return None
+    return (np.datetime64(hoy, "D") + np.timedelta64(int(dias), "D")).astype(str)
+
+
+def consultar_proyeccion(
+    conn: sqlite3.Connection,
+    centro: Optional[int] = None,
+    almacen: Optional[int] = None,
+    sector: Optional[str] = None,
+    horizonte_dias: int = HORIZONTE_DEFAULT,
+    paso: str = "dia",
+    solo_quiebre: bool = False,
+    limit: int = 50,
+    offset: int = 0,
+    hoy: Optional[date] = None,
+    incluir_serie: bool = False,
+) -> Dict[str, Any]:
+    """
+    Proyección de los materiales MRP filtrados, ordenada por urgencia.
+
+    Args:
+        conn: Conexión con row_factory sqlite3.Row
+        centro, almacen, sector: Filtros exactos
+        horizonte_dias: Días a simular (máximo HORIZONTE_MAX)
+        paso: 'dia' o 'semana'
+        solo_quiebre: Solo materiales que quiebran dentro del horizonte
+        limit, offset: Paginación
+        hoy: Fecha de referencia (default: hoy)
+        incluir_serie: Agregar los niveles proyectados de cada fila de la página
+
+    Returns:
+        Dict con 'rows' (página ordenada por fecha límite de pedido y
+        cobertura), 'total' y 'resumen'
+    """
+    hoy = hoy or date.today()
+    horizonte_dias = max(1, min(int(horizonte_dias), HORIZONTE_MAX))
+    paso_dias = PASOS.get(paso, 1)
+
+    where = ["1=1"]
+    params: List[Any] = []
+    if centro:
+        where.append("centro = ?")
+        params.append(centro)
+    if almacen:
+        where.append("almacen = ?")
+        params.append(almacen)
+    if sector:
+        where.append("sector = ?")
+        params.append(sector)
+
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT {PROYECCION_COLUMNS} FROM materiales_mrp WHERE {' AND '.join(where)} "
+        "ORDER BY codigo_material, centro, almacen",
+        params,
+    )
+    rows = cur.fetchall()
+    datos = _arrays(rows)
+    resultado = proyectar(
+        datos["stock"], datos["pedidos"], datos["consumo"], datos["lead_time"],
+        horizonte_dias, paso_dias,
+    )
+    cobertura = resultado["dias_cobertura"]
+    para_pedir = resultado["dias_para_pedir"]
+
+    quiebra = ~np.isnan(cobertura)
+    seleccion = np.flatnonzero(quiebra) if solo_quiebre else np.arange(len(rows))
+    # Más urgente primero; los que no quiebran al final (orden estable por código)
+    orden = seleccion[
+        np.lexsort(
+            (
+                np.where(quiebra[seleccion], cobertura[seleccion], np.inf),
+                np.where(quiebra[seleccion], para_pedir[seleccion], np.inf),
+            )
+        )
+    ]
+    pagina = orden[offset : offset + limit]
+
+    serie = None
+    if incluir_serie and len(pagina):
+        dias = grilla(horizonte_dias, paso_dias)
+        serie = niveles(
+            datos["stock"][pagina], datos["pedidos"][pagina], datos["consumo"][pagina],
+            datos["lead_time"][pagina], dias,
+        )
+
+    salida = []
+    for pos, i in enumerate(pagina):
+        r = rows[i]
+        item = {
+            "codigo": r["codigo"],
+            "descripcion": r["descripcion"],
+            "centro": r["centro"],
+            "almacen": r["almacen"],
+            "sector": r["sector"],
+            "stock_actual": r["stock_actual"] or 0,
+            "pedidos_en_curso": r["pedidos_en_curso"] or 0,
+            "consumo_promedio_mensual": r["consumo_promedio_mensual"] or 0,
+            "lead_time_dias": int(datos["lead_time"][i]),
+            "dias_cobertura": None if np.isnan(cobertura[i]) else int(cobertura[i]),
+            "fecha_quiebre": _fecha(hoy, cobertura[i]),
+            "dias_para_pedir": None if np.isnan(para_pedir[i]) else int(para_pedir[i]),
+            "fecha_ultimo_pedido": _fecha(hoy, para_pedir[i]),
+            "pedido_atrasado": bool(para_pedir[i] < 0),
+        }
+        if serie is not None:
+            item["serie"] = [round(float(v), 2) for v in serie[pos]]
+        salida.append(item)
+
+    return {
+        "rows": salida,
+        "total": int(len(seleccion)),
+        "resumen": {
+            "materiales": len(rows),
+            "con_quiebre": int(quiebra.sum()),
+            "quiebre_actual": int((cobertura == 0).sum()),
+            "pedidos_atrasados": int((para_pedir < 0).sum()),
+            "horizonte_dias": horizonte_dias,
+            "paso_dias": paso_dias,
+        },
+    }
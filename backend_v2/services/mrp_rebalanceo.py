@@ -0,0 +1,503 @@
+"""
+Rebalanceo de stock entre centros y almacenes
+
+El tablero MRP marca el mismo material como "Sobrestock Crítico"/"Exceso de
+Stock" en unas ubicaciones y "Quiebre de Stock"/"Bajo Punto de Pedido" en
+otras. Este módulo propone traslados del excedente al déficit:
+
+1. Estado de cada fila de materiales_mrp con la misma regla SQL del tablero
+   (services/mrp_alertas.ESTADO_SQL).
+   - excedente = stock_actual - stock_maximo
+   - necesidad = objetivo - (stock_actual + pedidos_en_curso), con
+     objetivo = stock_maximo (o punto_pedido si no hay máximo)
+2. Familias de materiales: el mismo código más sus equivalentes del
+   catálogo (componentes conexos). Un déficit puede cubrirse con el mismo
+   material o con un equivalente de él.
+3. Un único problema de transporte (programación lineal, HiGHS) sobre todos
+   los arcos excedente -> déficit de cada familia. Cada arco cuesta por
+   unidad penalidad / capacidad del arco, la relajación lineal del costo
+   fijo por traslado: un traslado por la capacidad completa cuesta su
+   penalidad, así que se prefieren pocos traslados grandes. Un bono por
+   unidad cubierta hace que primero se maximice la cobertura. La solución
+   básica tiene a lo sumo (orígenes + destinos - 1) traslados y, como
+   excedentes y necesidades son enteros, cantidades enteras.
+
+Las sugerencias se guardan en traslados_sugeridos para revisión del
+planificador (la tabla traslados exige una solicitud de origen). Un
+traslado aceptado está en curso hasta que el planificador lo marca como
+ejecutado: mientras tanto su cantidad se descuenta del excedente del origen
+y de la necesidad del destino, para no volver a sugerirlo.
+"""
+
+import sqlite3
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.optimize import linprog
+from scipy.sparse.csgraph import connected_components
+
+try:
+    from backend_v2.core.utils import tiene_tabla
+    from backend_v2.services.mrp_alertas import ESTADO_SQL
+except ImportError:
+    from core.utils import tiene_tabla
+    from services.mrp_alertas import ESTADO_SQL
+
+TRASLADOS_TABLE = "traslados_sugeridos"
+
+ESTADOS_EXCEDENTE = ("Sobrestock Crítico", "Exceso de Stock")
+ESTADOS_DEFICIT = ("Quiebre de Stock", "Bajo Punto de Pedido")
+
+# Penalidad por traslado: mover entre centros cuesta más que entre almacenes
+# del mismo centro, y usar un equivalente más que el mismo material
+PENALIDAD_TRASLADO = 1.0
+PENALIDAD_CENTRO = 1.0
+PENALIDAD_EQUIVALENTE = 0.5
+# Bono por unidad cubierta, mayor que el costo unitario de cualquier arco
+BONO_COBERTURA = 10.0
+
+ESTADO_PENDIENTE = "pendiente"
+ESTADO_ACEPTADA = "aceptada"
+ESTADO_RECHAZADA = "rechazada"
+ESTADO_EJECUTADA = "ejecutada"
+
+CREATE_TRASLADOS_SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS {TRASLADOS_TABLE} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id TEXT NOT NULL,
+        material TEXT NOT NULL,
+        material_origen TEXT NOT NULL,
+        equivalente INTEGER NOT NULL DEFAULT 0,
+        descripcion TEXT,
+        cantidad REAL NOT NULL CHECK (cantidad > 0),
+        origen_centro INTEGER NOT NULL,
+        origen_almacen INTEGER NOT NULL,
+        origen_estado TEXT,
+        destino_centro INTEGER NOT NULL,
+        destino_almacen INTEGER NOT NULL,
+        destino_estado TEXT,
+        estado TEXT NOT NULL DEFAULT '{ESTADO_PENDIENTE}',
+        revisado_por TEXT,
+        revisado_at TEXT,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_traslados_sugeridos_estado
+        ON {TRASLADOS_TABLE}(estado, destino_centro);
+    CREATE INDEX IF NOT EXISTS idx_traslados_sugeridos_origen
+        ON {TRASLADOS_TABLE}(estado, origen_centro);
+"""
+
+_COLUMNAS = [
+    "run_id",
+    "material",
+    "material_origen",
+    "equivalente",
+    "descripcion",
+    "cantidad",
+    "origen_centro",
+    "origen_almacen",
+    "origen_estado",
+    "destino_centro",
+    "destino_almacen",
+    "destino_estado",
+]
+
+
+def ensure_traslados_schema(conn: sqlite3.Connection) -> None:
+    """Crear traslados_sugeridos si no existe"""
+    conn.executescript(CREATE_TRASLADOS_SCHEMA)
+
+
+def _norm(serie: pd.Series) -> pd.Series:
+    return serie.astype(str).str.strip().str.replace(r"\.0$", "", regex=True).str.lstrip("0")
+
+
+def _en_curso(conn: sqlite3.Connection, lado: str, material: str) -> pd.DataFrame:
+    """
+    Cantidad de los traslados aceptados (aún no ejecutados) por ubicación.
+
+    Args:
+        lado: 'origen' o 'destino'
+        material: Columna del material de ese lado ('material_origen' o 'material')
+
+    Returns:
+        DataFrame con codigo_norm, centro, almacen (normalizados) y cantidad
+    """
+    columnas = ["codigo_norm", "centro", "almacen", "cantidad"]
+    if not tiene_tabla(conn, TRASLADOS_TABLE):
+        return pd.DataFrame(columns=columnas)
+    df = pd.read_sql_query(
+        f"""
+        SELECT {material} AS codigo_norm, {lado}_centro AS centro,
+               {lado}_almacen AS almacen, cantidad
+        FROM {TRASLADOS_TABLE}
+        WHERE estado = ?
+        """,
+        conn,
+        params=[ESTADO_ACEPTADA],
+    )
+    for col in ("codigo_norm", "centro", "almacen"):
+        df[col] = _norm(df[col])
+    return df.groupby(columnas[:3], as_index=False)["cantidad"].sum()
+
+
+def _descontar(df: pd.DataFrame, columna: str, en_curso: pd.DataFrame) -> pd.Series:
+    """`columna` de cada posición menos la cantidad en curso en ella, sin bajar de 0"""
+    if en_curso.empty:
+        return df[columna]
+    claves = pd.DataFrame(
+        {
+            "codigo_norm": df["codigo_norm"],
+            "centro": _norm(df["centro"]),
+            "almacen": _norm(df["almacen"]),
+        }
+    )
+    cantidad = claves.merge(en_curso, how="left", on=["codigo_norm", "centro", "almacen"])
+    return (df[columna] - cantidad["cantidad"].fillna(0).to_numpy()).clip(lower=0)
+
+
+def cargar_posiciones(conn: sqlite3.Connection) -> pd.DataFrame:
+    """
+    Excedentes y déficits de materiales_mrp.
+
+    Descuenta los traslados aceptados y no ejecutados: el excedente que ya
+    sale de un origen y la necesidad que ya cubre un destino.
+
+    Returns:
+        DataFrame con centro, almacen, codigo_material, codigo_norm,
+        descripcion, estado, excedente y necesidad (enteros; uno de los dos
+        es 0). Solo filas con excedente o necesidad positivos.
+    """
+    estados = ESTADOS_EXCEDENTE + ESTADOS_DEFICIT
+    df = pd.read_sql_query(
+        f"""
+        SELECT centro, almacen, codigo_material, descripcion, estado,
+               stock_actual, pedidos_en_curso, punto_pedido, stock_maximo
+        FROM (
+            SELECT *, {ESTADO_SQL} AS estado FROM materiales_mrp
+        )
+        WHERE estado IN ({",".join("?" * len(estados))})
+        """,
+        conn,
+        params=list(estados),
+    )
+    numericas = ["stock_actual", "pedidos_en_curso", "punto_pedido", "stock_maximo"]
+    df[numericas] = df[numericas].apply(pd.to_numeric, errors="coerce").fillna(0.0)
+
+    objetivo = df["stock_maximo"].where(df["stock_maximo"] > 0, df["punto_pedido"])
+    es_excedente = df["estado"].isin(ESTADOS_EXCEDENTE)
+    df["excedente"] = np.where(
+        es_excedente, np.floor(df["stock_actual"] - df["stock_maximo"]), 0.0
+    ).clip(min=0)
+    df["necesidad"] = np.where(
+        ~es_excedente, np.ceil(objetivo - df["stock_actual"] - df["pedidos_en_curso"]), 0.0
+    ).clip(min=0)
+    df["codigo_norm"] = _norm(df["codigo_material"])
+    df["excedente"] = _descontar(df, "excedente", _en_curso(conn, "origen", "material_origen"))
+    df["necesidad"] = _descontar(df, "necesidad", _en_curso(conn, "destino", "material"))
+    df = df[(df["excedente"] > 0) | (df["necesidad"] > 0)]
+    return df.drop(columns=numericas).reset_index(drop=True)
+
+
+def _familias(codigos: pd.Series, equivalencias: pd.DataFrame) -> pd.Series:
+    """Id de familia (componente conexo por equivalencias) de cada código"""
+    unicos = pd.Index(codigos.unique())
+    if equivalencias.empty:
+        return pd.Series(np.arange(len(unicos)), index=unicos)
+    a = unicos.get_indexer(equivalencias["base"])
+    b = unicos.get_indexer(equivalencias["equivalente"])
+    validos = (a >= 0) & (b >= 0)
+    grafo = sparse.coo_matrix(
+        (np.ones(validos.sum()), (a[validos], b[validos])), shape=(len(unicos), len(unicos))
+    )
+    _, etiquetas = connected_components(grafo, directed=False)
+    return pd.Series(etiquetas, index=unicos)
+
+
+def _pares_equivalencia(equivalencias: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """Pares (base, equivalente) normalizados del catálogo de equivalencias"""
+    if equivalencias is None or equivalencias.empty:
+        return pd.DataFrame(columns=["base", "equivalente"])
+    pares = pd.DataFrame(
+        {
+            "base": _norm(equivalencias["codigo_base_norm"]),
+            "equivalente": _norm(equivalencias["codigo_equivalente_norm"]),
+        }
+    )
+    pares = pares[(pares["base"] != "") & (pares["base"] != pares["equivalente"])]
+    return pares.drop_duplicates()
+
+
+def _arcos(posiciones: pd.DataFrame, pares: pd.DataFrame) -> pd.DataFrame:
+    """Arcos excedente -> déficit admisibles, con su capacidad y costo unitario"""
+    familias = _familias(posiciones["codigo_norm"], pares)
+    posiciones = posiciones.assign(familia=posiciones["codigo_norm"].map(familias))
+    origen = posiciones[posiciones["excedente"] > 0].reset_index().add_prefix("o_")
+    destino = posiciones[posiciones["necesidad"] > 0].reset_index().add_prefix("d_")
+    arcos = origen.merge(destino, left_on="o_familia", right_on="d_familia")
+
+    mismo = (arcos["o_codigo_norm"] == arcos["d_codigo_norm"]).to_numpy()
+    # El déficit de un material se cubre con uno de sus equivalentes
+    equivalente = np.zeros(len(arcos), dtype=bool)
+    if len(pares) and len(arcos):
+        claves = pd.MultiIndex.from_frame(arcos[["d_codigo_norm", "o_codigo_norm"]])
+        equivalente = claves.isin(pd.MultiIndex.from_frame(pares[["base", "equivalente"]]))
+    misma_ubicacion = (
+        (arcos["o_centro"] == arcos["d_centro"]) & (arcos["o_almacen"] == arcos["d_almacen"])
+    ).to_numpy()
+    arcos = arcos[(mismo | equivalente) & ~misma_ubicacion].copy()
+
+    arcos["equivalente"] = (arcos["o_codigo_norm"] != arcos["d_codigo_norm"]).astype(int)
+    arcos["capacidad"] = np.minimum(arcos["o_excedente"], arcos["d_necesidad"])
+    penalidad = (
+        PENALIDAD_TRASLADO
+        + PENALIDAD_CENTRO * (arcos["o_centro"] != arcos["d_centro"])
+        + PENALIDAD_EQUIVALENTE * arcos["equivalente"]
+    )
+    arcos["costo"] = penalidad / arcos["capacidad"].clip(lower=1)
+    return arcos.reset_index(drop=True)
+
+
+def resolver_traslados(arcos: pd.DataFrame) -> np.ndarray:
+    """
+    Cantidades por arco del problema de transporte.
+
+    Minimiza sum((costo - BONO_COBERTURA) * x) sujeto a que cada origen no
+    entregue más que su excedente y cada destino no reciba más que su
+    necesidad. Todas las familias se resuelven en un solo problema disperso.
+
+    Returns:
+        Array de cantidades enteras (una por fila de arcos)
+    """
+    if arcos.empty:
+        return np.zeros(0)
+    origenes, fila_origen = np.unique(arcos["o_index"], return_inverse=True)
+    destinos, fila_destino = np.unique(arcos["d_index"], return_inverse=True)
+    n = len(arcos)
+    columnas = np.arange(n)
+    restricciones = sparse.csr_matrix(
+        (
+            np.ones(2 * n),
+            (
+                np.concatenate([fila_origen, len(origenes) + fila_destino]),
+                np.concatenate([columnas, columnas]),
+            ),
+        ),
+        shape=(len(origenes) + len(destinos), n),
+    )
+    excedente = arcos.groupby("o_index")["o_excedente"].first().reindex(origenes)
+    necesidad = arcos.groupby("d_index")["d_necesidad"].first().reindex(destinos)
+    resultado = linprog(
+        arcos["costo"].to_numpy() - BONO_COBERTURA,
+        A_ub=restricciones,
+        b_ub=np.concatenate([excedente.to_numpy(), necesidad.to_numpy()]),
+        bounds=(0, None),
+        method="highs-ds",
+    )
+    if not resultado.success:
+        raise RuntimeError(f"No se pudo resolver el rebalanceo: {resultado.message}")
+    # Excedentes y necesidades enteros: la solución básica ya es entera
+    return np.round(resultado.x)
+
+
+def calcular_rebalanceo(
+    conn: sqlite3.Connection, equivalencias: Optional[pd.DataFrame] = None
+) -> Dict[str, Any]:
+    """
+    Traslados sugeridos para todo materiales_mrp, sin escribir.
+
+    Args:
+        conn: Conexión a la BD principal
+        equivalencias: Catálogo con codigo_base_norm y codigo_equivalente_norm
+            (get_equivalencias_cache); None = solo el mismo material
+
+    Returns:
+        Dict con 'traslados' (DataFrame con las columnas de
+        traslados_sugeridos salvo run_id) y 'posiciones' (cargar_posiciones)
+    """
+    posiciones = cargar_posiciones(conn)
+    arcos = _arcos(posiciones, _pares_equivalencia(equivalencias))
+    cantidades = resolver_traslados(arcos)
+    elegidos = arcos[cantidades > 0].assign(cantidad=cantidades[cantidades > 0])
+    traslados = pd.DataFrame(
+        {
+            "material": elegidos["d_codigo_material"],
+            "material_origen": elegidos["o_codigo_material"],
+            "equivalente": elegidos["equivalente"],
+            "descripcion": elegidos["o_descripcion"],
+            "cantidad": elegidos["cantidad"],
+            "origen_centro": elegidos["o_centro"],
+            "origen_almacen": elegidos["o_almacen"],
+            "origen_estado": elegidos["o_estado"],
+            "destino_centro": elegidos["d_centro"],
+            "destino_almacen": elegidos["d_almacen"],
+            "destino_estado": elegidos["d_estado"],
+        }
+    ).sort_values(["material", "destino_centro", "destino_almacen", "origen_centro"])
+    return {"traslados": traslados.reset_index(drop=True), "posiciones": posiciones}
+
+
+def recalcular_rebalanceo(
+    conn: sqlite3.Connection, equivalencias: Optional[pd.DataFrame] = None
+) -> Dict[str, Any]:
+    """
+    Corrida completa: calcula los traslados y reemplaza los pendientes.
+
+    Los traslados ya revisados se conservan; los aceptados no ejecutados
+    descuentan sus cantidades de las posiciones (cargar_posiciones).
+
+    Returns:
+        Resumen de la corrida
+    """
+    inicio = time.perf_counter()
+    ensure_traslados_schema(conn)
+    resultado = calcular_rebalanceo(conn, equivalencias)
+    traslados = resultado["traslados"]
+    posiciones = resultado["posiciones"]
+
+    run_id = datetime.now().strftime("%Y%m%d%H%M%S")
+    datos = traslados.assign(run_id=run_id)[_COLUMNAS]
+    filas = list(datos.astype(object).where(datos.notna(), None).itertuples(index=False, name=None))
+    try:
+        conn.execute(f"DELETE FROM {TRASLADOS_TABLE} WHERE estado = ?", (ESTADO_PENDIENTE,))
+        conn.executemany(
+            f"INSERT INTO {TRASLADOS_TABLE} ({', '.join(_COLUMNAS)}) "
+            f"VALUES ({', '.join('?' for _ in _COLUMNAS)})",
+            filas,
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    necesidad = float(posiciones["necesidad"].sum())
+    cubierta = float(traslados["cantidad"].sum())
+    return {
+        "run_id": run_id,
+        "ubicaciones_excedente": int((posiciones["excedente"] > 0).sum()),
+        "ubicaciones_deficit": int((posiciones["necesidad"] > 0).sum()),
+        "traslados": len(filas),
+        "con_equivalente": int(traslados["equivalente"].sum()),
+        "necesidad_total": necesidad,
+        "cantidad_trasladada": cubierta,
+        "cobertura_pct": round(cubierta / necesidad * 100, 1) if necesidad else 0.0,
+        "elapsed_ms": int((time.perf_counter() - inicio) * 1000),
+    }
+
+
+def hay_corridas(conn: sqlite3.Connection) -> bool:
+    """Si ya se calculó algún rebalanceo"""
+    ensure_traslados_schema(conn)
+    return conn.execute(f"SELECT 1 FROM {TRASLADOS_TABLE} LIMIT 1").fetchone() is not None
+
+
+def listar_traslados(
+    conn: sqlite3.Connection,
+    centro: Optional[int] = None,
+    codigo: Optional[str] = None,
+    estado: Optional[str] = ESTADO_PENDIENTE,
+    limit: int = 50,
+    offset: int = 0,
+) -> Dict[str, Any]:
+    """
+    Traslados sugeridos, los que cubren un quiebre y los más grandes primero.
+
+    Args:
+        centro: Centro de origen o de destino
+        codigo: Material pedido o material de origen
+
+    Returns:
+        Dict con 'rows' (dicts) y 'total'
+    """
+    ensure_traslados_schema(conn)
+    where = ["1=1"]
+    params: List[Any] = []
+    if centro:
+        where.append("(origen_centro = ? OR destino_centro = ?)")
+        params.extend([centro, centro])
+    if codigo:
+        where.append("(material = ? OR material_origen = ?)")
+        params.extend([codigo, codigo])
+    if estado:
+        where.append("estado = ?")
+        params.append(estado)
+    where_sql = " AND ".join(where)
+
+    cur = conn.cursor()
+    cur.execute(f"SELECT COUNT(*) FROM {TRASLADOS_TABLE} WHERE {where_sql}", params)
+    total = cur.fetchone()[0]
+    cur.execute(
+        f"""
+        SELECT * FROM {TRASLADOS_TABLE}
+        WHERE {where_sql}
+        ORDER BY destino_estado = '{ESTADOS_DEFICIT[0]}' DESC, cantidad DESC, id
+        LIMIT ? OFFSET ?
+        """,
+        params + [limit, offset],
+    )
+    nombres = [d[0] for d in cur.description]
+    return {"rows": [dict(zip(nombres, r)) for r in cur.fetchall()], "total": total}
+
+
+def revisar_traslados(
+    conn: sqlite3.Connection, ids: List[int], aceptar: bool, usuario: str
+) -> int:
+    """
+    Aceptar o rechazar traslados sugeridos pendientes.
+
+    Returns:
+        Cantidad de traslados revisados
+    """
+    if not ids:
+        return 0
+    ensure_traslados_schema(conn)
+    marcas = ",".join("?" * len(ids))
+    try:
+        cur = conn.execute(
+            f"""
+            UPDATE {TRASLADOS_TABLE}
+            SET estado = ?, revisado_por = ?, revisado_at = CURRENT_TIMESTAMP
+            WHERE id IN ({marcas}) AND estado = '{ESTADO_PENDIENTE}'
+            """,
+            [ESTADO_ACEPTADA if aceptar else ESTADO_RECHAZADA, usuario] + list(ids),
+        )
+        conn.commit()
+        return cur.rowcount
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def ejecutar_traslados(conn: sqlite3.Connection, ids: List[int], usuario: str) -> int:
+    """
+    Marcar como ejecutados traslados aceptados.
+
+    Desde ese momento el traslado ya no se descuenta de las posiciones: el
+    stock movido se refleja en la próxima importación MRP.
+
+    Returns:
+        Cantidad de traslados marcados
+    """
+    if not ids:
+        return 0
+    ensure_traslados_schema(conn)
+    marcas = ",".join("?" * len(ids))
+    try:
+        cur = conn.execute(
+            f"""
+            UPDATE {TRASLADOS_TABLE}
+            SET estado = ?, revisado_por = ?, revisado_at = CURRENT_TIMESTAMP
+            WHERE id IN ({marcas}) AND estado = '{ESTADO_ACEPTADA}'
+            """,
+            [ESTADO_EJECUTADA, usuario] + list(ids),
+        )
+        conn.commit()
+        return cur.rowcount
+    except Exception:
+        conn.rollback()
+        raise
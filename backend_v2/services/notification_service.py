@@ -11,7 +11,7 @@ Maneja la lógica de negocio para notificaciones:
 import sqlite3
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
 
 try:
     from backend_v2.core.config import settings
@@ -19,14 +19,24 @@ try:
                                                       NotificacionCreate,
                                                       NotificacionEvent,
                                                       NotificacionListResponse)
+    from backend_v2.services.retention_service import (archived_source,
+                                                       attach_archive)
+    from backend_v2.services.unread_counters import UnreadCounterService
 except ImportError:
     from core.config import settings
     from core.notification_schemas import Notificacion
+    from services.retention_service import archived_source, attach_archive
+    from services.unread_counters import UnreadCounterService
+
+COUNTER_FIELD = "unread_notifications"
 
 
 class NotificationService:
     """Servicio para gestionar notificaciones"""
 
+    # Callbacks invocados con la lista de notificaciones creadas (un evento por lote)
+    _listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+
     @staticmethod
     def _db_path() -> Path:
         """Obtener ruta de la base de datos"""
@@ -40,6 +50,34 @@ class NotificationService:
         path = NotificationService._db_path()
         return sqlite3.connect(path)
 
+    @classmethod
+    def add_listener(cls, callback: Callable[[List[Dict[str, Any]]], None]) -> None:
+        """
+        Registrar un callback que recibe las notificaciones recién creadas.
+
+        Se invoca una vez por create_notification y una vez por lote en
+        create_notifications_bulk, después del commit.
+        """
+        if callback not in cls._listeners:
+            cls._listeners.append(callback)
+
+    @classmethod
+    def remove_listener(cls, callback: Callable[[List[Dict[str, Any]]], None]) -> None:
+        """Quitar un callback registrado con add_listener"""
+        if callback in cls._listeners:
+            cls._listeners.remove(callback)
+
+    @classmethod
+    def _publish(cls, notifications: List[Dict[str, Any]]) -> None:
+        """Emitir un único evento con las notificaciones creadas"""
+        if not notifications:
+            return
+        for callback in list(cls._listeners):
+            try:
+                callback(notifications)
+            except Exception as e:
+                print(f"Error in notification listener: {e}")
+
     @classmethod
     def create_notification(
         cls,
@@ -62,6 +100,7 @@ class NotificationService:
         """
         conn = cls._connect()
         try:
+            UnreadCounterService.ensure_table(conn)
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -70,17 +109,109 @@ class NotificationService:
                 """,
                 (destinatario_id, mensaje, tipo, solicitud_id, datetime.now().isoformat()),
             )
+            UnreadCounterService.adjust(conn, destinatario_id, COUNTER_FIELD, 1)
             conn.commit()
-            return cursor.lastrowid
+            notification_id = cursor.lastrowid
         except Exception as e:
             print(f"Error creating notification: {e}")
+            conn.rollback()
             return None
         finally:
             conn.close()
 
+        cls._publish(
+            [
+                {
+                    "id": notification_id,
+                    "destinatario_id": destinatario_id,
+                    "mensaje": mensaje,
+                    "tipo": tipo,
+                    "solicitud_id": solicitud_id,
+                }
+            ]
+        )
+        return notification_id
+
+    @classmethod
+    def create_notifications_bulk(
+        cls,
+        recipients: Iterable[str],
+        mensaje: str,
+        tipo: str = "info",
+        solicitud_id: Optional[int] = None,
+    ) -> List[int]:
+        """
+        Crear la misma notificación para varios destinatarios en una sola transacción.
+
+        Inserta con executemany, ajusta los contadores de no leídos de todos los
+        destinatarios y emite un único evento con el lote completo. Destinatarios
+        vacíos o repetidos se ignoran.
+
+        Args:
+            recipients: IDs de usuarios destinatarios
+            mensaje: Mensaje de la notificación
+            tipo: Tipo de notificación (info, success, warning, error)
+            solicitud_id: ID de solicitud relacionada (opcional)
+
+        Returns:
+            IDs de las notificaciones creadas (lista vacía si falla)
+        """
+        destinatarios = list(dict.fromkeys(str(r) for r in recipients if r))
+        if not destinatarios:
+            return []
+
+        now = datetime.now().isoformat()
+        conn = cls._connect()
+        try:
+            UnreadCounterService.ensure_table(conn)
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM notificaciones")
+            last_id = cursor.fetchone()[0]
+            cursor.executemany(
+                """
+                INSERT INTO notificaciones
+                    (destinatario_id, mensaje, tipo, solicitud_id, leido, created_at)
+                VALUES (?, ?, ?, ?, 0, ?)
+                """,
+                [(d, mensaje, tipo, solicitud_id, now) for d in destinatarios],
+            )
+            UnreadCounterService.adjust_many(conn, destinatarios, COUNTER_FIELD, 1)
+            # BEGIN IMMEDIATE garantiza que los IDs posteriores a last_id son del lote
+            cursor.execute(
+                "SELECT id, destinatario_id FROM notificaciones WHERE id > ? ORDER BY id",
+                (last_id,),
+            )
+            created = cursor.fetchall()
+            conn.commit()
+        except Exception as e:
+            print(f"Error creating bulk notifications: {e}")
+            conn.rollback()
+            return []
+        finally:
+            conn.close()
+
+        cls._publish(
+            [
+                {
+                    "id": notification_id,
+                    "destinatario_id": destinatario_id,
+                    "mensaje": mensaje,
+                    "tipo": tipo,
+                    "solicitud_id": solicitud_id,
+                }
+                for notification_id, destinatario_id in created
+            ]
+        )
+        return [row[0] for row in created]
+
     @classmethod
     def get_user_notifications(
-        cls, user_id: str, unread_only: bool = False, limit: int = 50
+        cls,
+        user_id: str,
+        unread_only: bool = False,
+        limit: int = 50,
+        include_archived: bool = False,
     ) -> List[Dict[str, Any]]:
         """
         Obtener notificaciones de un usuario.
@@ -89,6 +220,7 @@ class NotificationService:
             user_id: ID del usuario
             unread_only: Solo notificaciones no leídas
             limit: Cantidad máxima de notificaciones
+            include_archived: Incluir notificaciones movidas a la BD de archivo
 
         Returns:
             Lista de notificaciones como diccionarios
@@ -104,10 +236,14 @@ class NotificationService:
             if unread_only:
                 where_clause += " AND leido = 0"
 
+            source = "notificaciones"
+            if include_archived and attach_archive(conn, cls._db_path()):
+                source = archived_source(conn, "notificaciones")
+
             cursor.execute(
                 f"""
                 SELECT id, destinatario_id, mensaje, tipo, solicitud_id, leido, created_at
-                FROM notificaciones
+                FROM {source} AS n
                 {where_clause}
                 ORDER BY created_at DESC
                 LIMIT ?
@@ -130,11 +266,106 @@ class NotificationService:
         finally:
             conn.close()
 
+    @classmethod
+    def get_latest_id(cls) -> int:
+        """
+        Obtener el ID de la notificación más reciente (0 si no hay).
+
+        Returns:
+            ID máximo de la tabla notificaciones
+        """
+        conn = cls._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM notificaciones")
+            result = cursor.fetchone()
+            return int(result[0]) if result else 0
+        except Exception as e:
+            print(f"Error fetching latest notification id: {e}")
+            return 0
+        finally:
+            conn.close()
+
+    @classmethod
+    def get_notifications_after(cls, last_id: int, limit: int = 500) -> List[Dict[str, Any]]:
+        """
+        Obtener notificaciones creadas después de un ID, de todos los usuarios.
+
+        Usado por el servidor de streaming para hacer un único polling compartido
+        por todas las conexiones abiertas (en vez de una consulta por conexión).
+
+        Args:
+            last_id: Último ID ya entregado
+            limit: Cantidad máxima de notificaciones
+
+        Returns:
+            Lista de notificaciones ordenadas por ID ascendente
+        """
+        conn = cls._connect()
+        try:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT id, destinatario_id, mensaje, tipo, solicitud_id, leido, created_at
+                FROM notificaciones
+                WHERE id > ?
+                ORDER BY id ASC
+                LIMIT ?
+                """,
+                (last_id, limit),
+            )
+            return [Notificacion.from_db_row(dict(row)).to_dict() for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"Error fetching notifications after {last_id}: {e}")
+            return []
+        finally:
+            conn.close()
+
+    @classmethod
+    def get_user_notifications_between(
+        cls, user_id: str, after_id: int, upto_id: int, limit: int = 500
+    ) -> List[Dict[str, Any]]:
+        """
+        Notificaciones de un usuario con after_id < id <= upto_id.
+
+        Usado para ponerse al día al reconectar: el llamador pagina avanzando
+        after_id hasta recibir menos de `limit` filas. A diferencia del
+        polling, un error se propaga para no saltar notificaciones.
+
+        Args:
+            user_id: ID del destinatario
+            after_id: Último ID ya entregado al usuario
+            upto_id: ID máximo a incluir
+            limit: Tamaño de página
+
+        Returns:
+            Lista de notificaciones ordenadas por ID ascendente
+        """
+        conn = cls._connect()
+        try:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(
+                """
+                SELECT id, destinatario_id, mensaje, tipo, solicitud_id, leido, created_at
+                FROM notificaciones
+                WHERE destinatario_id = ? AND id > ? AND id <= ?
+                ORDER BY id ASC
+                LIMIT ?
+                """,
+                (str(user_id), after_id, upto_id, limit),
+            )
+            return [Notificacion.from_db_row(dict(row)).to_dict() for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
     @classmethod
     def get_unread_count(cls, user_id: str) -> int:
         """
         Contar notificaciones no leídas de un usuario.
 
+        Lee el contador materializado (búsqueda por PK) en vez de un COUNT(*).
+
         Args:
             user_id: ID del usuario
 
@@ -143,13 +374,7 @@ class NotificationService:
         """
         conn = cls._connect()
         try:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT COUNT(*) FROM notificaciones WHERE destinatario_id = ? AND leido = 0",
-                (user_id,),
-            )
-            result = cursor.fetchone()
-            return result[0] if result else 0
+            return UnreadCounterService.get(conn, user_id, COUNTER_FIELD)
         except Exception as e:
             print(f"Error counting unread: {e}")
             return 0
@@ -170,19 +395,27 @@ class NotificationService:
         """
         conn = cls._connect()
         try:
+            UnreadCounterService.ensure_table(conn)
             cursor = conn.cursor()
             cursor.execute(
-                """
-                UPDATE notificaciones
-                SET leido = 1
-                WHERE id = ? AND destinatario_id = ?
-                """,
+                "SELECT leido FROM notificaciones WHERE id = ? AND destinatario_id = ?",
                 (notification_id, user_id),
             )
+            row = cursor.fetchone()
+            if not row:
+                return False
+            if not row[0]:
+                cursor.execute(
+                    "UPDATE notificaciones SET leido = 1 WHERE id = ? AND leido = 0",
+                    (notification_id,),
+                )
+                if cursor.rowcount:
+                    UnreadCounterService.adjust(conn, user_id, COUNTER_FIELD, -1)
             conn.commit()
-            return cursor.rowcount > 0
+            return True
         except Exception as e:
             print(f"Error marking as read: {e}")
+            conn.rollback()
             return False
         finally:
             conn.close()
@@ -200,6 +433,7 @@ class NotificationService:
         """
         conn = cls._connect()
         try:
+            UnreadCounterService.ensure_table(conn)
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -209,10 +443,13 @@ class NotificationService:
                 """,
                 (user_id,),
             )
+            marked = cursor.rowcount
+            UnreadCounterService.reset(conn, user_id, COUNTER_FIELD)
             conn.commit()
-            return cursor.rowcount
+            return marked
         except Exception as e:
             print(f"Error marking all as read: {e}")
+            conn.rollback()
             return 0
         finally:
             conn.close()
@@ -231,64 +468,76 @@ class NotificationService:
         """
         conn = cls._connect()
         try:
+            UnreadCounterService.ensure_table(conn)
             cursor = conn.cursor()
-            cursor.execute(
-                """
-                DELETE FROM notificaciones
-                WHERE id = ? AND destinatario_id = ?
-                """,
-                (notification_id, user_id),
-            )
+            # Primero solo si está sin leer, para que el descuento no dependa de un
+            # SELECT previo que otra conexión pudo dejar obsoleto
+            delete_sql = "DELETE FROM notificaciones WHERE id = ? AND destinatario_id = ?"
+            cursor.execute(delete_sql + " AND leido = 0", (notification_id, user_id))
+            deleted = cursor.rowcount == 1
+            if deleted:
+                UnreadCounterService.adjust(conn, user_id, COUNTER_FIELD, -1)
+            else:
+                cursor.execute(delete_sql, (notification_id, user_id))
+                deleted = cursor.rowcount == 1
             conn.commit()
-            return cursor.rowcount > 0
+            return deleted
         except Exception as e:
             print(f"Error deleting notification: {e}")
+            conn.rollback()
             return False
         finally:
             conn.close()
 
 
 # Helper functions para crear notificaciones automáticas
+# Aceptan un destinatario o varios; siempre pasan por el insert en lote
+
+
+def _destinatarios(ids: Union[str, Iterable[str]]) -> List[str]:
+    return [ids] if isinstance(ids, (str, int)) else list(ids)
 
 
-def notify_solicitud_created(solicitud_id: int, aprobador_id: str):
+def notify_solicitud_created(solicitud_id: int, aprobador_id: Union[str, Iterable[str]]):
     """Notificar cuando se crea una solicitud"""
-    NotificationService.create_notification(
-        destinatario_id=aprobador_id,
+    NotificationService.create_notifications_bulk(
+        _destinatarios(aprobador_id),
         mensaje=f"Nueva solicitud #{solicitud_id} pendiente de aprobación",
         tipo="solicitud_created",
         solicitud_id=solicitud_id,
     )
 
 
-def notify_solicitud_approved(solicitud_id: int, solicitante_id: str):
+def notify_solicitud_approved(solicitud_id: int, solicitante_id: Union[str, Iterable[str]]):
     """Notificar cuando se aprueba una solicitud"""
-    NotificationService.create_notification(
-        destinatario_id=solicitante_id,
+    NotificationService.create_notifications_bulk(
+        _destinatarios(solicitante_id),
         mensaje=f"Tu solicitud #{solicitud_id} ha sido aprobada",
         tipo="solicitud_approved",
         solicitud_id=solicitud_id,
     )
 
 
-def notify_solicitud_rejected(solicitud_id: int, solicitante_id: str, motivo: str = ""):
+def notify_solicitud_rejected(
+    solicitud_id: int, solicitante_id: Union[str, Iterable[str]], motivo: str = ""
+):
     """Notificar cuando se rechaza una solicitud"""
     mensaje = f"Tu solicitud #{solicitud_id} ha sido rechazada"
     if motivo:
         mensaje += f": {motivo}"
 
-    NotificationService.create_notification(
-        destinatario_id=solicitante_id,
+    NotificationService.create_notifications_bulk(
+        _destinatarios(solicitante_id),
         mensaje=mensaje,
         tipo="solicitud_rejected",
         solicitud_id=solicitud_id,
     )
 
 
-def notify_solicitud_planned(solicitud_id: int, solicitante_id: str):
+def notify_solicitud_planned(solicitud_id: int, solicitante_id: Union[str, Iterable[str]]):
     """Notificar cuando se planifica una solicitud"""
-    NotificationService.create_notification(
-        destinatario_id=solicitante_id,
+    NotificationService.create_notifications_bulk(
+        _destinatarios(solicitante_id),
         mensaje=f"Tu solicitud #{solicitud_id} ha sido planificada",
         tipo="solicitud_planned",
         solicitud_id=solicitud_id,
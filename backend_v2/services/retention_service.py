@@ -0,0 +1,460 @@
+"""
+Servicio de Retención y Archivo
+
+Mueve filas antiguas de tablas que crecen sin límite a una BD de archivo
+(ATTACH) para mantener chica la BD principal:
+- notificaciones (leídas)
+- mensajes (hilos completos, todos leídos)
+- solicitud_tratamiento_log (de la BD de auditoría, ver audit_log)
+- presupuesto_ledger
+
+Cada tabla tiene su política (antigüedad, condición extra, tamaño de lote).
+El movimiento se hace en lotes cortos, cada uno en su propia transacción
+BEGIN IMMEDIATE, para no retener el lock de escritura más de unos
+milisegundos. Los datos archivados siguen consultables desde los endpoints
+existentes con include_archived=true (ver archived_source).
+
+Las políticas con parent_column mueven hilos completos: un hilo se archiva
+solo si todos sus mensajes cumplen la política, así get_thread nunca queda
+con la raíz archivada y las respuestas vivas (o al revés).
+
+Las políticas con database="audit" operan sobre la BD de auditoría
+append-only: se archiva siempre un prefijo de ids y el borrado pasa por
+audit_log.purge_archived, la única vía que su trigger permite.
+"""
+
+import sqlite3
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    from backend_v2.core.config import settings
+    from backend_v2.services.audit_log import (audit_path_for,
+                                               ensure_audit_schema,
+                                               purge_archived)
+    from backend_v2.services.message_threads import MessageThreadService
+except ImportError:
+    from core.config import settings
+    from services.audit_log import (audit_path_for, ensure_audit_schema,
+                                    purge_archived)
+    from services.message_threads import MessageThreadService
+
+ARCHIVE_ALIAS = "archive"
+
+
+@dataclass
+class RetentionPolicy:
+    """Política de retención de una tabla"""
+
+    table: str
+    retention_days: int
+    date_column: str = "created_at"
+    condition: str = ""  # Condición SQL adicional (p.ej. "leido = 1")
+    batch_size: int = 500
+    indexes: tuple = ()  # Columnas a indexar en la tabla de archivo
+    database: str = "main"  # "main" o "audit" (BD de auditoría append-only)
+    archive_table: str = ""  # Nombre en la BD de archivo (default: table)
+    parent_column: str = ""  # Columna del padre: se archivan hilos completos
+
+    @property
+    def archive_name(self) -> str:
+        return self.archive_table or self.table
+
+
+# Políticas por defecto. Solo se archiva lo leído para no alterar los
+# contadores de no leídos; el ledger se conserva más tiempo por auditoría.
+DEFAULT_POLICIES: Dict[str, RetentionPolicy] = {
+    "notificaciones": RetentionPolicy(
+        table="notificaciones",
+        retention_days=90,
+        condition="leido = 1",
+        indexes=("destinatario_id",),
+    ),
+    "mensajes": RetentionPolicy(
+        table="mensajes",
+        retention_days=365,
+        condition="leido = 1",
+        indexes=("destinatario_id", "remitente_id"),
+        parent_column="parent_id",
+    ),
+    # Tabla propia en el archivo: la original puede tener filas de spm.db
+    # archivadas antes de la migración 008, con ids que se pisarían
+    "solicitud_tratamiento_log": RetentionPolicy(
+        table="solicitud_tratamiento_log",
+        retention_days=365,
+        indexes=("solicitud_id",),
+        database="audit",
+        archive_table="solicitud_tratamiento_log_audit",
+    ),
+    "presupuesto_ledger": RetentionPolicy(
+        table="presupuesto_ledger",
+        retention_days=730,
+        indexes=("centro", "sector"),
+    ),
+}
+
+
+def _main_db_path() -> Path:
+    if settings.DATABASE_URL.startswith("sqlite:///"):
+        return Path(settings.DATABASE_URL.split("sqlite:///", 1)[1])
+    return Path("spm.db")
+
+
+def archive_path_for(db_path: Path) -> Path:
+    """
+    Ruta de la BD de archivo asociada a una BD principal.
+
+    Usa settings.ARCHIVE_DATABASE_URL si está definida; si no,
+    <nombre>_archive.db en el mismo directorio.
+    """
+    url = settings.ARCHIVE_DATABASE_URL
+    if url and url.startswith("sqlite:///"):
+        return Path(url.split("sqlite:///", 1)[1])
+    db_path = Path(db_path)
+    return db_path.with_name(f"{db_path.stem}_archive{db_path.suffix or '.db'}")
+
+
+def _columns(conn: sqlite3.Connection, schema: str, table: str) -> List[str]:
+    return [r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def attach_archive(conn: sqlite3.Connection, db_path: Optional[Path] = None) -> bool:
+    """
+    Adjuntar la BD de archivo a una conexión (solo lectura lógica).
+
+    Args:
+        conn: Conexión a la BD principal
+        db_path: Ruta de la BD principal (default: la de settings)
+
+    Returns:
+        True si el archivo existe y quedó adjunto como 'archive'
+    """
+    attached = {r[1] for r in conn.execute("PRAGMA database_list")}
+    if ARCHIVE_ALIAS in attached:
+        return True
+    path = archive_path_for(db_path or _main_db_path())
+    if not path.exists():
+        return False
+    conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_ALIAS}", (str(path),))
+    return True
+
+
+def archived_source(conn: sqlite3.Connection, table: str) -> str:
+    """
+    Expresión FROM que une la tabla viva con su archivo.
+
+    Requiere attach_archive() previo. Si el archivo no tiene la tabla,
+    retorna solo la tabla viva. Las columnas se listan explícitamente para
+    tolerar columnas agregadas después de archivar.
+
+    Returns:
+        Subconsulta usable como "FROM {source} AS alias"
+    """
+    columns = _columns(conn, "main", table)
+    archived = set(_columns(conn, ARCHIVE_ALIAS, table))
+    if not archived:
+        return f"main.{table}"
+    archive_cols = ", ".join(c if c in archived else f"NULL AS {c}" for c in columns)
+    main_cols = ", ".join(columns)
+    return (
+        f"(SELECT {main_cols} FROM main.{table} "
+        f"UNION ALL SELECT {archive_cols} FROM {ARCHIVE_ALIAS}.{table})"
+    )
+
+
+class RetentionService:
+    """Ejecuta las políticas de retención sobre una BD principal"""
+
+    def __init__(
+        self,
+        db_path: Optional[Path] = None,
+        archive_path: Optional[Path] = None,
+        policies: Optional[Dict[str, RetentionPolicy]] = None,
+        pause_seconds: float = 0.05,
+        audit_path: Optional[Path] = None,
+    ):
+        """
+        Args:
+            db_path: BD principal (default: la de settings)
+            archive_path: BD de archivo (default: archive_path_for(db_path))
+            policies: Políticas por tabla (default: DEFAULT_POLICIES)
+            pause_seconds: Pausa entre lotes para dejar pasar otras escrituras
+            audit_path: BD de auditoría (default: audit_path_for(db_path))
+        """
+        self.db_path = Path(db_path or _main_db_path())
+        self.archive_path = Path(archive_path or archive_path_for(self.db_path))
+        self.audit_path = Path(audit_path or audit_path_for(self.db_path))
+        self.policies = policies or DEFAULT_POLICIES
+        self.pause_seconds = pause_seconds
+
+    def _database_path(self, database: str) -> Path:
+        return self.audit_path if database == "audit" else self.db_path
+
+    def _grouped_policies(self, tables: Optional[List[str]] = None):
+        """Políticas agrupadas por BD de origen: [(database, path, [(name, policy)])]"""
+        groups = []
+        for database in ("main", "audit"):
+            policies = [
+                (name, p)
+                for name, p in self.policies.items()
+                if p.database == database and (not tables or name in tables)
+            ]
+            path = self._database_path(database)
+            if policies and path.exists():
+                groups.append((database, path, policies))
+        return groups
+
+    def _connect(self, path: Optional[Path] = None) -> sqlite3.Connection:
+        conn = sqlite3.connect(path or self.db_path, timeout=30)
+        conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_ALIAS}", (str(self.archive_path),))
+        return conn
+
+    @staticmethod
+    def _ensure_archive_table(conn: sqlite3.Connection, policy: RetentionPolicy) -> None:
+        """Crear (o ampliar) la tabla de archivo con las columnas de la tabla viva"""
+        table = policy.table
+        archive = policy.archive_name
+        if not _columns(conn, ARCHIVE_ALIAS, archive):
+            conn.execute(
+                f"CREATE TABLE {ARCHIVE_ALIAS}.{archive} AS SELECT * FROM main.{table} WHERE 0"
+            )
+            conn.execute(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS {ARCHIVE_ALIAS}.idx_{archive}_id "
+                f"ON {archive}(id)"
+            )
+            for column in (policy.date_column,) + tuple(policy.indexes):
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {ARCHIVE_ALIAS}.idx_{archive}_{column} "
+                    f"ON {archive}({column})"
+                )
+        archived = set(_columns(conn, ARCHIVE_ALIAS, archive))
+        for column in _columns(conn, "main", table):
+            if column not in archived:
+                conn.execute(f"ALTER TABLE {ARCHIVE_ALIAS}.{archive} ADD COLUMN {column}")
+
+    @staticmethod
+    def _cutoff(policy: RetentionPolicy, now: Optional[datetime] = None) -> str:
+        # Fecha sin hora: compara bien contra ISO ('T'), CURRENT_TIMESTAMP (' ') y 'Z'
+        return ((now or datetime.now()) - timedelta(days=policy.retention_days)).strftime(
+            "%Y-%m-%d"
+        )
+
+    def _where(self, policy: RetentionPolicy) -> str:
+        if policy.database == "audit":
+            # Prefijo de ids anterior al primer evento vigente: purge_archived
+            # borra por "id <= hasta_id" y no puede dejar huecos
+            return (
+                f"id < COALESCE((SELECT MIN(id) FROM main.{policy.table} "
+                f"WHERE {policy.date_column} >= ?), "
+                f"(SELECT MAX(id) + 1 FROM main.{policy.table}))"
+            )
+        where = f"{policy.date_column} < ?"
+        if policy.condition:
+            where += f" AND ({policy.condition})"
+        return where
+
+    def _thread_rows(
+        self, conn: sqlite3.Connection, policy: RetentionPolicy, cutoff: str, limit: int = -1
+    ) -> List[tuple]:
+        """
+        Mensajes (hilo, id) de los hilos que cumplen la política completos.
+
+        El hilo de un mensaje es el de MessageThreadService: la raíz, o el
+        padre huérfano si la raíz ya no está en la tabla. Un hilo califica si
+        su mensaje más reciente es anterior al corte y todos cumplen la
+        condición.
+
+        Args:
+            limit: Cantidad máxima de hilos (-1 = todos)
+        """
+        table = policy.table
+        parent = policy.parent_column
+        condition = policy.condition or "1"
+        return conn.execute(
+            f"""
+            WITH RECURSIVE hilo(raiz, id) AS (
+                SELECT COALESCE(t.{parent}, t.id), t.id FROM main.{table} t
+                WHERE t.{parent} IS NULL
+                   OR NOT EXISTS (SELECT 1 FROM main.{table} p WHERE p.id = t.{parent})
+                UNION
+                SELECT h.raiz, t.id FROM main.{table} t JOIN hilo h ON t.{parent} = h.id
+            ),
+            elegidos AS (
+                SELECT h.raiz FROM hilo h JOIN main.{table} t ON t.id = h.id
+                GROUP BY h.raiz
+                HAVING MAX(t.{policy.date_column}) < ?
+                   AND MIN(CASE WHEN ({condition}) THEN 1 ELSE 0 END) = 1
+                ORDER BY h.raiz
+                LIMIT ?
+            )
+            SELECT raiz, id FROM hilo WHERE raiz IN (SELECT raiz FROM elegidos) ORDER BY id
+            """,
+            (cutoff, limit),
+        ).fetchall()
+
+    def preview(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Contar filas que se archivarían, sin modificar nada.
+
+        Returns:
+            Dict tabla -> filas candidatas
+        """
+        result = {}
+        for _, path, policies in self._grouped_policies():
+            conn = sqlite3.connect(path, timeout=30)
+            try:
+                for name, policy in policies:
+                    if not _columns(conn, "main", policy.table):
+                        continue
+                    if policy.parent_column:
+                        rows = self._thread_rows(conn, policy, self._cutoff(policy, now))
+                        result[name] = len(rows)
+                        continue
+                    row = conn.execute(
+                        f"SELECT COUNT(*) FROM {policy.table} WHERE {self._where(policy)}",
+                        (self._cutoff(policy, now),),
+                    ).fetchone()
+                    result[name] = row[0]
+            finally:
+                conn.close()
+        return result
+
+    def _archive_table(
+        self, conn: sqlite3.Connection, policy: RetentionPolicy, cutoff: str
+    ) -> Dict[str, Any]:
+        table = policy.table
+        archive = policy.archive_name
+        columns = ", ".join(_columns(conn, "main", table))
+        moved = 0
+        batches = 0
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                threads = set()
+                if policy.parent_column:
+                    # Lote de hilos completos
+                    rows = self._thread_rows(conn, policy, cutoff, policy.batch_size)
+                    ids = [r[1] for r in rows]
+                    threads = {r[0] for r in rows}
+                else:
+                    ids = [
+                        r[0]
+                        for r in conn.execute(
+                            f"""
+                            SELECT id FROM main.{table}
+                            WHERE {self._where(policy)}
+                            ORDER BY id
+                            LIMIT ?
+                            """,
+                            (cutoff, policy.batch_size),
+                        )
+                    ]
+                if not ids:
+                    conn.rollback()
+                    break
+
+                placeholders = ",".join("?" * len(ids))
+
+                conn.execute(
+                    f"""
+                    INSERT OR IGNORE INTO {ARCHIVE_ALIAS}.{archive} ({columns})
+                    SELECT {columns} FROM main.{table} WHERE id IN ({placeholders})
+                    """,
+                    ids,
+                )
+                if policy.database == "audit":
+                    purge_archived(conn, ids[-1], str(self.archive_path))
+                else:
+                    conn.execute(f"DELETE FROM main.{table} WHERE id IN ({placeholders})", ids)
+
+                # Los hilos archivados recalculan (eliminan) su resumen
+                if table == "mensajes" and threads and _columns(conn, "main", "message_threads"):
+                    for thread_id in threads:
+                        MessageThreadService.refresh_thread(conn, thread_id)
+
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+            moved += len(ids)
+            batches += 1
+            if len(threads if policy.parent_column else ids) < policy.batch_size:
+                break
+            if self.pause_seconds:
+                time.sleep(self.pause_seconds)
+
+        return {"rows": moved, "batches": batches, "cutoff": cutoff}
+
+    def run(
+        self,
+        tables: Optional[List[str]] = None,
+        vacuum: bool = False,
+        now: Optional[datetime] = None,
+    ) -> Dict[str, Any]:
+        """
+        Ejecutar las políticas de retención.
+
+        Args:
+            tables: Tablas a procesar (default: todas las de las políticas)
+            vacuum: Ejecutar VACUUM al final para devolver el espacio al disco
+            now: Fecha de referencia (para tests)
+
+        Returns:
+            Reporte con filas movidas por tabla y bytes recuperados
+        """
+        started = time.time()
+        groups = self._grouped_policies(tables)
+        paths = [path for _, path, _ in groups]
+        size_before = sum(p.stat().st_size for p in paths)
+
+        report_tables: Dict[str, Any] = {}
+        bytes_freed = 0
+        for database, path, policies in groups:
+            conn = self._connect(path)
+            conn.isolation_level = None  # Transacciones explícitas por lote
+            try:
+                if database == "audit":
+                    ensure_audit_schema(conn)
+                page_size = conn.execute("PRAGMA main.page_size").fetchone()[0]
+                free_before = conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+
+                for name, policy in policies:
+                    if not _columns(conn, "main", policy.table):
+                        continue
+                    self._ensure_archive_table(conn, policy)
+                    report_tables[name] = self._archive_table(
+                        conn, policy, self._cutoff(policy, now)
+                    )
+
+                free_after = conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+                bytes_freed += max(free_after - free_before, 0) * page_size
+            finally:
+                conn.close()
+
+        if vacuum:
+            for path in paths:
+                conn = sqlite3.connect(path, timeout=30)
+                try:
+                    conn.execute("VACUUM")
+                finally:
+                    conn.close()
+
+        size_after = sum(p.stat().st_size for p in paths if p.exists())
+        return {
+            "tables": report_tables,
+            "rows_archived": sum(t["rows"] for t in report_tables.values()),
+            # Páginas liberadas dentro de los archivos (reutilizables por SQLite)
+            "bytes_freed": bytes_freed,
+            # Reducción real del archivo (solo con vacuum)
+            "bytes_reclaimed": max(size_before - size_after, 0),
+            "archive_path": str(self.archive_path),
+            "elapsed_ms": round((time.time() - started) * 1000, 1),
+        }
+
+    def policies_dict(self) -> List[Dict[str, Any]]:
+        """Políticas configuradas (para reportes)"""
+        return [asdict(p) for p in self.policies.values()]
@@ -0,0 +1,554 @@
+"""
+Sincronización incremental de stock desde exportaciones SAP
+
+Compara una exportación de stock (xlsx o csv) contra stock_almacenes por la
+clave (codigo_material, centro, almacen, lote) y aplica solo las diferencias:
+- alta: clave nueva en la exportación
+- modificacion: misma clave con otra cantidad
+- baja: clave que ya no está en la exportación (se puede desactivar)
+
+Los cambios se aplican en lotes, cada uno en su propia transacción BEGIN
+IMMEDIATE. Cada lote incrementa la versión de los datos de referencia y
+registra sus filas en stock_sync_cambios con esa versión: ese es el
+change-set que leen las caches dependientes (ver materiales_cambiados) para
+refrescar solo los materiales afectados.
+
+Una sola sincronización corre a la vez (endpoint admin en cualquier worker o
+script): antes de leer el stock reclama una fila 'en_curso' de
+stock_sync_log dentro de BEGIN IMMEDIATE. Cada lote además verifica dentro
+de su transacción que las filas que toca siguen como se leyeron.
+"""
+
+import csv
+import sqlite3
+import time
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from openpyxl import load_workbook
+
+try:
+    from backend_v2.core.config import settings
+    from backend_v2.core.repository import ReferenceDataRepository
+except ImportError:
+    from core.config import settings
+    from core.repository import ReferenceDataRepository
+
+BATCH_SIZE = 2000
+TOLERANCIA = 1e-9
+# Una sincronización 'en_curso' más vieja se considera abandonada
+EN_CURSO_MAX_MINUTOS = 60
+
+Clave = Tuple[str, str, str, Optional[str]]
+
+CREATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stock_almacenes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    codigo_material TEXT NOT NULL,
+    centro TEXT NOT NULL,
+    almacen TEXT NOT NULL,
+    lote TEXT,
+    cantidad REAL NOT NULL DEFAULT 0,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS stock_sync_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    archivo TEXT,
+    usuario TEXT,
+    estado TEXT NOT NULL DEFAULT 'en_curso',
+    filas_exportacion INTEGER DEFAULT 0,
+    altas INTEGER DEFAULT 0,
+    modificaciones INTEGER DEFAULT 0,
+    bajas INTEGER DEFAULT 0,
+    lotes INTEGER DEFAULT 0,
+    error TEXT,
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    finished_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS stock_sync_cambios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sync_id INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    tipo TEXT NOT NULL,
+    codigo_material TEXT NOT NULL,
+    centro TEXT NOT NULL,
+    almacen TEXT NOT NULL,
+    lote TEXT,
+    cantidad_anterior REAL,
+    cantidad_nueva REAL
+);
+CREATE INDEX IF NOT EXISTS idx_stock_sync_cambios_version
+    ON stock_sync_cambios(version, codigo_material);
+CREATE INDEX IF NOT EXISTS idx_stock_sync_cambios_sync
+    ON stock_sync_cambios(sync_id);
+"""
+
+CREATE_INDEX_CLAVE = """
+CREATE INDEX IF NOT EXISTS idx_stock_almacenes_clave
+    ON stock_almacenes(codigo_material, centro, almacen, lote)
+"""
+
+# Encabezado normalizado (minúsculas, sin acentos) -> columna
+COLUMNAS_EXPORT = {
+    "material": "codigo_material",
+    "codigo": "codigo_material",
+    "codigo_material": "codigo_material",
+    "centro": "centro",
+    "almacen": "almacen",
+    "lote": "lote",
+    "stock": "cantidad",
+    "cantidad": "cantidad",
+    "libre utilizacion": "cantidad",
+}
+
+
+class SyncConflictoError(RuntimeError):
+    """Otra sincronización está en curso o modificó el stock de un lote"""
+
+
+def _main_db_path() -> Path:
+    if settings.DATABASE_URL.startswith("sqlite:///"):
+        return Path(settings.DATABASE_URL.split("sqlite:///", 1)[1])
+    return Path("spm.db")
+
+
+def ensure_schema(conn: sqlite3.Connection) -> None:
+    """Crea stock_almacenes y las tablas del change-set si no existen"""
+    conn.executescript(CREATE_SCHEMA)
+    # Tablas stock_almacenes anteriores pueden no tener lote/updated_at
+    columnas = {row[1] for row in conn.execute("PRAGMA table_info(stock_almacenes)")}
+    for columna in ("lote", "updated_at"):
+        if columna not in columnas:
+            conn.execute(f"ALTER TABLE stock_almacenes ADD COLUMN {columna} TEXT")
+    conn.execute(CREATE_INDEX_CLAVE)
+
+
+def _texto(val: Any) -> str:
+    base = "" if val is None else str(val).strip()
+    return base[:-2] if base.endswith(".0") else base
+
+
+def clave(codigo: Any, centro: Any, almacen: Any, lote: Any) -> Clave:
+    """Clave normalizada de una fila de stock (almacén con 4 dígitos, lote vacío = None)"""
+    almacen = _texto(almacen)
+    return (
+        _texto(codigo),
+        _texto(centro),
+        almacen.zfill(4) if almacen else almacen,
+        _texto(lote) or None,
+    )
+
+
+def _encabezado(val: Any) -> str:
+    base = unicodedata.normalize("NFKD", str(val or "").strip().lower())
+    return "".join(c for c in base if not unicodedata.combining(c))
+
+
+def _filas_archivo(path: Path) -> Iterator[Tuple[Any, ...]]:
+    if path.suffix.lower() == ".csv":
+        with open(path, newline="", encoding="utf-8-sig") as fh:
+            muestra = fh.read(4096)
+            fh.seek(0)
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t")
+            yield from csv.reader(fh, dialecto)
+        return
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from wb.active.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _cantidad(val: Any) -> float:
+    if isinstance(val, (int, float)):
+        return float(val)
+    base = _texto(val).replace(" ", "")
+    if "," in base:
+        base = base.replace(".", "").replace(",", ".")
+    try:
+        return float(base) if base else 0.0
+    except ValueError:
+        return 0.0
+
+
+def leer_exportacion(path: Path) -> Tuple[Dict[Clave, float], int]:
+    """
+    Lee una exportación de stock y suma las cantidades por clave.
+
+    Args:
+        path: Archivo .xlsx o .csv con columnas Material, Centro, Almacén,
+            Lote (opcional) y Stock
+
+    Returns:
+        (dict clave -> cantidad, filas leídas)
+
+    Raises:
+        ValueError: Si faltan columnas obligatorias
+    """
+    filas = _filas_archivo(Path(path))
+    encabezado = next(filas, None) or ()
+    posiciones: Dict[str, int] = {}
+    for i, nombre in enumerate(encabezado):
+        columna = COLUMNAS_EXPORT.get(_encabezado(nombre))
+        if columna and columna not in posiciones:
+            posiciones[columna] = i
+    faltantes = {"codigo_material", "centro", "almacen", "cantidad"} - set(posiciones)
+    if faltantes:
+        raise ValueError(f"Columnas faltantes en la exportación: {', '.join(sorted(faltantes))}")
+
+    def valor(fila, columna):
+        pos = posiciones.get(columna)
+        return fila[pos] if pos is not None and pos < len(fila) else None
+
+    stock: Dict[Clave, float] = {}
+    leidas = 0
+    for fila in filas:
+        k = clave(*(valor(fila, c) for c in ("codigo_material", "centro", "almacen", "lote")))
+        if not k[0]:
+            continue
+        leidas += 1
+        stock[k] = stock.get(k, 0.0) + _cantidad(valor(fila, "cantidad"))
+    return stock, leidas
+
+
+def stock_actual(conn: sqlite3.Connection) -> Dict[Clave, Tuple[List[int], float]]:
+    """stock_almacenes por clave: (rowids, cantidad total)"""
+    actual: Dict[Clave, Tuple[List[int], float]] = {}
+    cur = conn.execute(
+        "SELECT rowid, codigo_material, centro, almacen, lote, cantidad FROM stock_almacenes"
+    )
+    for rowid, codigo, centro, almacen, lote, cantidad in cur:
+        k = clave(codigo, centro, almacen, lote)
+        rowids, total = actual.get(k, ([], 0.0))
+        rowids.append(rowid)
+        actual[k] = (rowids, total + float(cantidad or 0))
+    return actual
+
+
+def calcular_deltas(
+    actual: Dict[Clave, Tuple[List[int], float]],
+    nuevo: Dict[Clave, float],
+    con_bajas: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    Diferencias fila a fila entre la BD y la exportación.
+
+    Returns:
+        Lista de cambios {tipo, clave, rowids, anterior, nueva}, en orden
+        de clave
+    """
+    deltas = []
+    for k in sorted(set(actual) | set(nuevo), key=lambda c: tuple(x or "" for x in c)):
+        rowids, anterior = actual.get(k, ([], None))
+        nueva = nuevo.get(k)
+        if anterior is None:
+            tipo = "alta"
+        elif nueva is None:
+            if not con_bajas:
+                continue
+            tipo = "baja"
+        # Claves duplicadas en BD se consolidan en una sola fila
+        elif abs(anterior - nueva) > TOLERANCIA or len(rowids) > 1:
+            tipo = "modificacion"
+        else:
+            continue
+        deltas.append(
+            {"tipo": tipo, "clave": k, "rowids": rowids, "anterior": anterior, "nueva": nueva}
+        )
+    return deltas
+
+
+def materiales_cambiados(
+    conn: sqlite3.Connection, desde_version: int, hasta_version: int
+) -> Optional[Set[str]]:
+    """
+    Materiales con stock modificado entre dos versiones de los datos de referencia.
+
+    Args:
+        desde_version: Versión con la que se construyó la cache (excluida)
+        hasta_version: Versión actual (incluida)
+
+    Returns:
+        Códigos afectados, o None si algún incremento de versión no vino de
+        una sincronización de stock (la cache debe reconstruirse completa)
+    """
+    if hasta_version <= desde_version:
+        return set()
+    try:
+        cur = conn.execute(
+            """
+            SELECT COUNT(DISTINCT version) FROM stock_sync_cambios
+            WHERE version > ? AND version <= ?
+            """,
+            (desde_version, hasta_version),
+        )
+        if cur.fetchone()[0] != hasta_version - desde_version:
+            return None
+        cur = conn.execute(
+            """
+            SELECT DISTINCT codigo_material FROM stock_sync_cambios
+            WHERE version > ? AND version <= ?
+            """,
+            (desde_version, hasta_version),
+        )
+        return {row[0] for row in cur.fetchall()}
+    except sqlite3.OperationalError:
+        return None
+
+
+class StockSyncService:
+    """Aplica exportaciones de stock SAP sobre stock_almacenes"""
+
+    def __init__(self, db_path: Optional[Path] = None, batch_size: int = BATCH_SIZE):
+        """
+        Args:
+            db_path: BD principal (default: la de settings)
+            batch_size: Cambios por transacción
+        """
+        self.db_path = Path(db_path or _main_db_path())
+        self.batch_size = batch_size
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.isolation_level = None  # Transacciones explícitas por lote
+        return conn
+
+    @staticmethod
+    def _reclamar(
+        conn: sqlite3.Connection, archivo: str, usuario: Optional[str], leidas: int
+    ) -> int:
+        """
+        Registra la sincronización como 'en_curso' si no hay otra corriendo.
+
+        Returns:
+            sync_id
+
+        Raises:
+            SyncConflictoError: Si otra sincronización está en curso
+        """
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                """
+                UPDATE stock_sync_log SET estado = 'error', error = 'abandonada',
+                    finished_at = datetime('now')
+                WHERE estado = 'en_curso' AND created_at < datetime('now', ?)
+                """,
+                (f"-{EN_CURSO_MAX_MINUTOS} minutes",),
+            )
+            en_curso = conn.execute(
+                "SELECT id FROM stock_sync_log WHERE estado = 'en_curso' LIMIT 1"
+            ).fetchone()
+            if en_curso:
+                raise SyncConflictoError(f"Sincronización #{en_curso[0]} en curso")
+            cur = conn.execute(
+                """
+                INSERT INTO stock_sync_log (archivo, usuario, filas_exportacion, estado)
+                VALUES (?, ?, ?, 'en_curso')
+                """,
+                (archivo, usuario, leidas),
+            )
+            conn.execute("COMMIT")
+            return cur.lastrowid
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _verificar_lote(conn: sqlite3.Connection, lote: List[Dict[str, Any]]) -> None:
+        """
+        Dentro de la transacción del lote: las filas a tocar siguen como se leyeron.
+
+        Raises:
+            SyncConflictoError: Si cambió una cantidad, falta una fila o una
+                alta ya existe
+        """
+        for d in lote:
+            if d["tipo"] == "alta":
+                existe = conn.execute(
+                    """
+                    SELECT 1 FROM stock_almacenes
+                    WHERE codigo_material = ? AND centro = ? AND almacen = ? AND lote IS ?
+                    """,
+                    d["clave"],
+                ).fetchone()
+                if not existe:
+                    continue
+            else:
+                marcas = ",".join("?" * len(d["rowids"]))
+                filas, total = conn.execute(
+                    f"""
+                    SELECT COUNT(*), COALESCE(SUM(cantidad), 0) FROM stock_almacenes
+                    WHERE rowid IN ({marcas})
+                    """,
+                    d["rowids"],
+                ).fetchone()
+                if filas == len(d["rowids"]) and abs(total - d["anterior"]) <= TOLERANCIA:
+                    continue
+            raise SyncConflictoError(f"Stock modificado durante la sincronización: {d['clave']}")
+
+    def _aplicar_lote(
+        self, conn: sqlite3.Connection, sync_id: int, lote: List[Dict[str, Any]]
+    ) -> int:
+        """Aplica un lote de cambios en una transacción; devuelve la versión nueva"""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._verificar_lote(conn, lote)
+            borrar = [(rowid,) for d in lote if d["tipo"] != "alta" for rowid in d["rowids"][1:]]
+            if borrar:
+                conn.executemany("DELETE FROM stock_almacenes WHERE rowid = ?", borrar)
+            conn.executemany(
+                "DELETE FROM stock_almacenes WHERE rowid = ?",
+                [(d["rowids"][0],) for d in lote if d["tipo"] == "baja"],
+            )
+            conn.executemany(
+                """
+                UPDATE stock_almacenes SET cantidad = ?, updated_at = datetime('now')
+                WHERE rowid = ?
+                """,
+                [(d["nueva"], d["rowids"][0]) for d in lote if d["tipo"] == "modificacion"],
+            )
+            conn.executemany(
+                """
+                INSERT INTO stock_almacenes
+                    (codigo_material, centro, almacen, lote, cantidad, updated_at)
+                VALUES (?, ?, ?, ?, ?, datetime('now'))
+                """,
+                [(*d["clave"], d["nueva"]) for d in lote if d["tipo"] == "alta"],
+            )
+            conn.execute("UPDATE stock_sync_log SET lotes = lotes + 1 WHERE id = ?", (sync_id,))
+            ReferenceDataRepository.bump(conn)
+            version = ReferenceDataRepository.get_version(conn)
+            conn.executemany(
+                """
+                INSERT INTO stock_sync_cambios (sync_id, version, tipo, codigo_material,
+                    centro, almacen, lote, cantidad_anterior, cantidad_nueva)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (sync_id, version, d["tipo"], *d["clave"], d["anterior"], d["nueva"])
+                    for d in lote
+                ],
+            )
+            conn.execute("COMMIT")
+            return version
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def sync(
+        self,
+        path: Path,
+        dry_run: bool = False,
+        con_bajas: bool = True,
+        usuario: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Sincronizar stock_almacenes con una exportación.
+
+        Args:
+            path: Exportación .xlsx o .csv
+            dry_run: Solo calcular las diferencias, sin escribir
+            con_bajas: Eliminar las claves ausentes en la exportación
+            usuario: Quién ejecuta la sincronización (para el log)
+
+        Returns:
+            Reporte con sync_id, conteos por tipo, lotes, versiones y tiempos
+
+        Raises:
+            SyncConflictoError: Si otra sincronización está en curso o el stock
+                cambió mientras se aplicaba
+        """
+        started = time.time()
+        nuevo, leidas = leer_exportacion(Path(path))
+
+        conn = self._connect()
+        try:
+            ensure_schema(conn)
+            # El stock se lee con la sincronización ya reclamada
+            sync_id = None
+            if not dry_run:
+                sync_id = self._reclamar(conn, Path(path).name, usuario, leidas)
+            try:
+                reporte = self._aplicar(conn, sync_id, nuevo, leidas, Path(path).name, con_bajas)
+            except Exception as e:
+                if sync_id:
+                    print(f"Error sincronizando stock: {e}")
+                    conn.execute(
+                        """
+                        UPDATE stock_sync_log SET estado = 'error', error = ?,
+                            finished_at = datetime('now')
+                        WHERE id = ?
+                        """,
+                        (str(e), sync_id),
+                    )
+                raise
+        finally:
+            conn.close()
+
+        reporte["dry_run"] = dry_run
+        reporte["elapsed_ms"] = round((time.time() - started) * 1000, 1)
+        return reporte
+
+    def _aplicar(
+        self,
+        conn: sqlite3.Connection,
+        sync_id: Optional[int],
+        nuevo: Dict[Clave, float],
+        leidas: int,
+        archivo: str,
+        con_bajas: bool,
+    ) -> Dict[str, Any]:
+        """Calcula los deltas y, con sync_id (no dry-run), los aplica por lotes"""
+        deltas = calcular_deltas(stock_actual(conn), nuevo, con_bajas)
+        conteos = {t: 0 for t in ("alta", "modificacion", "baja")}
+        for d in deltas:
+            conteos[d["tipo"]] += 1
+        reporte: Dict[str, Any] = {
+            "sync_id": None,
+            "archivo": archivo,
+            "filas_exportacion": leidas,
+            "altas": conteos["alta"],
+            "modificaciones": conteos["modificacion"],
+            "bajas": conteos["baja"],
+            "lotes": 0,
+            "version": ReferenceDataRepository.get_version(conn),
+            "materiales_afectados": len({d["clave"][0] for d in deltas}),
+        }
+        if sync_id is None:
+            return reporte
+        if not deltas:
+            # Nada que escribir: la sincronización no queda en el historial
+            conn.execute("DELETE FROM stock_sync_log WHERE id = ?", (sync_id,))
+            return reporte
+
+        conn.execute(
+            "UPDATE stock_sync_log SET altas = ?, modificaciones = ?, bajas = ? WHERE id = ?",
+            (*conteos.values(), sync_id),
+        )
+        reporte["sync_id"] = sync_id
+        for i in range(0, len(deltas), self.batch_size):
+            reporte["version"] = self._aplicar_lote(conn, sync_id, deltas[i : i + self.batch_size])
+            reporte["lotes"] += 1
+        conn.execute(
+            """
+            UPDATE stock_sync_log SET estado = 'aplicado', finished_at = datetime('now')
+            WHERE id = ?
+            """,
+            (sync_id,),
+        )
+        return reporte
+
+    def historial(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Últimas sincronizaciones registradas"""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            ensure_schema(conn)
+            cur = conn.execute("SELECT * FROM stock_sync_log ORDER BY id DESC LIMIT ?", (limit,))
+            return [dict(row) for row in cur.fetchall()]
+        finally:
+            conn.close()
@@ -0,0 +1,241 @@
+"""
+Contadores materializados de no leídos por usuario
+
+Mantiene la tabla user_unread_counters (una fila por usuario) con:
+- unread_notifications: notificaciones con leido = 0
+- unread_messages: mensajes recibidos con leido = 0
+
+Los servicios de notificaciones y mensajes ajustan el contador dentro de la
+misma transacción que modifica la fila, de modo que los badges se leen con
+una búsqueda por PK en vez de un COUNT(*). reconcile() recalcula todo desde
+las tablas fuente para reparar cualquier desvío.
+"""
+
+import sqlite3
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+# Columna del contador -> (tabla fuente, columna destinatario)
+COUNTER_SOURCES = {
+    "unread_notifications": ("notificaciones", "destinatario_id"),
+    "unread_messages": ("mensajes", "destinatario_id"),
+}
+
+CREATE_COUNTERS_TABLE = """
+CREATE TABLE IF NOT EXISTS user_unread_counters (
+    user_id TEXT PRIMARY KEY,
+    unread_notifications INTEGER NOT NULL DEFAULT 0,
+    unread_messages INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT
+)
+"""
+
+# Rutas de BD ya verificadas en este proceso (evita consultar sqlite_master cada vez)
+_ensured_paths = set()
+
+
+def _db_file(conn: sqlite3.Connection) -> str:
+    row = conn.execute("PRAGMA database_list").fetchone()
+    return row[2] if row else ""
+
+
+class UnreadCounterService:
+    """Lectura y mantenimiento de contadores de no leídos"""
+
+    @staticmethod
+    def ensure_table(conn: sqlite3.Connection) -> None:
+        """
+        Crear la tabla de contadores si no existe.
+
+        Si la tabla se crea en una BD que ya tiene datos, se reconcilia de
+        inmediato para que los contadores arranquen correctos. Debe invocarse
+        antes de modificar la fila fuente; si hay una transacción abierta, la
+        creación queda dentro de ella y la confirma el llamador.
+
+        Args:
+            conn: Conexión abierta
+        """
+        path = _db_file(conn)
+        if path and path in _ensured_paths:
+            return
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='user_unread_counters'"
+        ).fetchone()
+        if not exists:
+            in_transaction = conn.in_transaction
+            conn.execute(CREATE_COUNTERS_TABLE)
+            UnreadCounterService._reconcile_with(conn)
+            if not in_transaction:
+                conn.commit()
+        if path:
+            _ensured_paths.add(path)
+
+    @staticmethod
+    def adjust(conn: sqlite3.Connection, user_id: str, field: str, delta: int) -> None:
+        """
+        Sumar delta al contador de un usuario dentro de la transacción actual.
+
+        El contador nunca baja de 0. No hace commit: el llamador confirma el
+        ajuste junto con la modificación de la fila fuente. El llamador debe
+        haber invocado ensure_table() antes de modificar la fila fuente.
+
+        Args:
+            conn: Conexión con la transacción en curso
+            user_id: ID del usuario
+            field: unread_notifications o unread_messages
+            delta: Incremento (positivo) o decremento (negativo)
+        """
+        if field not in COUNTER_SOURCES:
+            raise ValueError(f"Contador desconocido: {field}")
+        if not user_id or not delta:
+            return
+        conn.execute(
+            f"""
+            INSERT INTO user_unread_counters (user_id, {field}, updated_at)
+            VALUES (?, MAX(?, 0), ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                {field} = MAX({field} + ?, 0),
+                updated_at = excluded.updated_at
+            """,
+            (str(user_id), delta, datetime.utcnow().isoformat(), delta),
+        )
+
+    @staticmethod
+    def adjust_many(
+        conn: sqlite3.Connection, user_ids: Iterable[str], field: str, delta: int
+    ) -> None:
+        """
+        Sumar delta al contador de varios usuarios con un único executemany.
+
+        Misma semántica que adjust(): sin commit y con piso en 0.
+        """
+        if field not in COUNTER_SOURCES:
+            raise ValueError(f"Contador desconocido: {field}")
+        if not delta:
+            return
+        now = datetime.utcnow().isoformat()
+        conn.executemany(
+            f"""
+            INSERT INTO user_unread_counters (user_id, {field}, updated_at)
+            VALUES (?, MAX(?, 0), ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                {field} = MAX({field} + ?, 0),
+                updated_at = excluded.updated_at
+            """,
+            [(str(u), delta, now, delta) for u in user_ids if u],
+        )
+
+    @staticmethod
+    def reset(conn: sqlite3.Connection, user_id: str, field: str) -> None:
+        """Poner en 0 el contador de un usuario (usado por marcar todas como leídas)."""
+        if field not in COUNTER_SOURCES:
+            raise ValueError(f"Contador desconocido: {field}")
+        conn.execute(
+            f"""
+            INSERT INTO user_unread_counters (user_id, {field}, updated_at)
+            VALUES (?, 0, ?)
+            ON CONFLICT(user_id) DO UPDATE SET {field} = 0, updated_at = excluded.updated_at
+            """,
+            (str(user_id), datetime.utcnow().isoformat()),
+        )
+
+    @staticmethod
+    def get(conn: sqlite3.Connection, user_id: str, field: str) -> int:
+        """
+        Leer un contador por PK.
+
+        Un usuario sin fila no tiene pendientes: la fila se crea en el primer
+        ajuste y la reconciliación cubre los datos previos a la tabla.
+
+        Returns:
+            Valor del contador
+        """
+        if field not in COUNTER_SOURCES:
+            raise ValueError(f"Contador desconocido: {field}")
+        UnreadCounterService.ensure_table(conn)
+        row = conn.execute(
+            f"SELECT {field} FROM user_unread_counters WHERE user_id = ?", (str(user_id),)
+        ).fetchone()
+        return int(row[0]) if row else 0
+
+    @staticmethod
+    def _reconcile_with(conn: sqlite3.Connection) -> Dict[str, int]:
+        """Recalcular todos los contadores desde las tablas fuente (sin commit)."""
+        existing_tables = {
+            r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        }
+        before = {
+            r[0]: (r[1], r[2])
+            for r in conn.execute(
+                "SELECT user_id, unread_notifications, unread_messages FROM user_unread_counters"
+            )
+        }
+
+        totals: Dict[str, Dict[str, int]] = {}
+        for field, (table, user_col) in COUNTER_SOURCES.items():
+            if table not in existing_tables:
+                continue
+            for user_id, count in conn.execute(
+                f"SELECT {user_col}, COUNT(*) FROM {table} WHERE leido = 0 GROUP BY {user_col}"
+            ):
+                totals.setdefault(str(user_id), {})[field] = count
+
+        now = datetime.utcnow().isoformat()
+        rows = [
+            (
+                user_id,
+                counts.get("unread_notifications", 0),
+                counts.get("unread_messages", 0),
+                now,
+            )
+            for user_id, counts in totals.items()
+        ]
+        # Usuarios con fila pero sin pendientes en las tablas fuente vuelven a 0
+        rows.extend((user_id, 0, 0, now) for user_id in before if user_id not in totals)
+
+        conn.executemany(
+            """
+            INSERT INTO user_unread_counters (user_id, unread_notifications, unread_messages, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                unread_notifications = excluded.unread_notifications,
+                unread_messages = excluded.unread_messages,
+                updated_at = excluded.updated_at
+            """,
+            rows,
+        )
+
+        drift = sum(1 for r in rows if before.get(r[0]) != (r[1], r[2]))
+        return {"usuarios": len(rows), "corregidos": drift}
+
+    @staticmethod
+    def reconcile(db_path: Optional[str] = None) -> Dict[str, int]:
+        """
+        Job de reconciliación: recalcula todos los contadores y repara desvíos.
+
+        Args:
+            db_path: Ruta de la BD (default: la de settings)
+
+        Returns:
+            Dict con usuarios procesados y cantidad de contadores corregidos
+        """
+        if db_path is None:
+            try:
+                from backend_v2.services.notification_service import \
+                    NotificationService
+            except ImportError:
+                from services.notification_service import NotificationService
+            db_path = NotificationService._db_path()
+
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(CREATE_COUNTERS_TABLE)
+            result = UnreadCounterService._reconcile_with(conn)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
@@ -0,0 +1,462 @@
+#!/usr/bin/env python
+"""
+Servidor asyncio de streaming para notificaciones (SSE y long-poll).
+
+Corre como proceso separado junto al WSGI (gunicorn wsgi:app) y atiende solo
+las conexiones de larga duración, que en un worker sync bloquean un thread
+cada una. Reutiliza la verificación de JWT de core.auth_middleware y el
+NotificationService, por lo que la lógica de negocio no se duplica.
+
+Endpoints:
+- GET /api/notificaciones/stream - Server-Sent Events
+- GET /api/notificaciones/poll?last_id=N&timeout=25 - Long-poll (JSON)
+- GET /health - Estado del servidor y conexiones abiertas
+
+Diseño:
+- Un único loop de polling consulta la BD cada STREAM_POLL_INTERVAL segundos
+  para TODAS las conexiones (una query, no una por cliente) y reparte las
+  notificaciones nuevas por destinatario.
+- Cada conexión es un objeto con __slots__ (writer + último ID), sin buffers
+  propios, por lo que miles de conexiones ociosas ocupan pocos KB cada una.
+- Cada escritura se drena con un límite de STREAM_DRAIN_TIMEOUT segundos; un
+  cliente que no lee a tiempo se desconecta en vez de acumular buffer.
+- Cada evento lleva su "id:" para que el navegador reanude con Last-Event-ID.
+
+Uso (detrás del mismo proxy que enruta /api/notificaciones/stream y /poll):
+    python -m backend_v2.streaming_server --host 0.0.0.0 --port 5001
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from http.cookies import SimpleCookie
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    from backend_v2.core.auth_middleware import _decode_access_token
+    from backend_v2.core.notification_schemas import NotificacionEvent
+    from backend_v2.services.notification_service import NotificationService
+except ImportError:
+    from core.auth_middleware import _decode_access_token
+    from core.notification_schemas import NotificacionEvent
+    from services.notification_service import NotificationService
+
+
+POLL_INTERVAL = float(os.getenv("STREAM_POLL_INTERVAL", "2"))
+HEARTBEAT_INTERVAL = float(os.getenv("STREAM_HEARTBEAT_INTERVAL", "30"))
+DRAIN_TIMEOUT = float(os.getenv("STREAM_DRAIN_TIMEOUT", "5"))
+LONG_POLL_MAX_TIMEOUT = 55.0
+CATCH_UP_PAGE = 500
+MAX_HEADER_BYTES = 8192
+HEADER_READ_TIMEOUT = 10.0
+
+_SSE_HEADERS = (
+    "HTTP/1.1 200 OK\r\n"
+    "Content-Type: text/event-stream\r\n"
+    "Cache-Control: no-cache\r\n"
+    "X-Accel-Buffering: no\r\n"
+    "Connection: keep-alive\r\n"
+    "\r\n"
+).encode()
+
+
+class _Subscriber:
+    """Conexión abierta de un usuario (SSE o long-poll)."""
+
+    __slots__ = ("user_id", "writer", "waiter", "last_id")
+
+    def __init__(
+        self,
+        user_id: str,
+        writer: Optional[asyncio.StreamWriter] = None,
+        waiter: Optional[asyncio.Future] = None,
+        last_id: int = 0,
+    ):
+        self.user_id = user_id
+        self.writer = writer
+        self.waiter = waiter
+        self.last_id = last_id
+
+
+class NotificationHub:
+    """
+    Registro de conexiones por usuario y loop de polling compartido.
+
+    El hub mantiene el último ID de notificación visto globalmente; en cada
+    ciclo pide a NotificationService solo las filas posteriores y las entrega
+    a los suscriptores del destinatario.
+    """
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.last_id = 0
+        self._subs: Dict[str, Set[_Subscriber]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(s) for s in self._subs.values())
+
+    def subscribe(self, sub: _Subscriber) -> None:
+        self._subs.setdefault(sub.user_id, set()).add(sub)
+
+    def unsubscribe(self, sub: _Subscriber) -> None:
+        subs = self._subs.get(sub.user_id)
+        if not subs:
+            return
+        subs.discard(sub)
+        if not subs:
+            del self._subs[sub.user_id]
+
+    async def start(self) -> None:
+        self.last_id = await asyncio.to_thread(NotificationService.get_latest_id)
+        self._task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _poll_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if not self._subs:
+                # Sin clientes: solo avanzar el cursor para no re-entregar histórico
+                self.last_id = await asyncio.to_thread(NotificationService.get_latest_id)
+                continue
+            try:
+                nuevas = await asyncio.to_thread(
+                    NotificationService.get_notifications_after, self.last_id
+                )
+            except Exception as e:
+                print(f"[STREAM] Error en polling: {e}")
+                continue
+            escritos: Set[_Subscriber] = set()
+            for notif in nuevas:
+                self.last_id = max(self.last_id, notif["id"])
+                escritos.update(self.dispatch(notif))
+            if escritos:
+                await asyncio.gather(*(self._drain(sub) for sub in escritos))
+
+    def dispatch(self, notif: dict) -> List[_Subscriber]:
+        """
+        Entregar una notificación a todas las conexiones del destinatario.
+
+        Returns:
+            Suscriptores SSE escritos, que el llamador debe drenar con _drain
+        """
+        subs = self._subs.get(str(notif.get("destinatario_id")))
+        if not subs:
+            return []
+        payload = _event_payload(notif)
+        escritos = []
+        for sub in list(subs):
+            if notif["id"] <= sub.last_id:
+                continue
+            sub.last_id = notif["id"]
+            if sub.waiter is not None:
+                if not sub.waiter.done():
+                    sub.waiter.set_result([payload])
+            elif sub.writer is not None:
+                try:
+                    sub.writer.write(_sse_event(payload))
+                    escritos.append(sub)
+                except Exception:
+                    self._drop(sub)
+        return escritos
+
+    async def _drain(self, sub: _Subscriber) -> None:
+        """Esperar a que el cliente lea lo escrito; si no lo hace a tiempo se desconecta."""
+        try:
+            await asyncio.wait_for(sub.writer.drain(), DRAIN_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError):
+            self._drop(sub)
+
+    def _drop(self, sub: _Subscriber) -> None:
+        self.unsubscribe(sub)
+        sub.writer.close()
+
+
+def _event_payload(notif: dict) -> dict:
+    return {
+        "id": notif["id"],
+        "mensaje": notif["mensaje"],
+        "tipo": notif["tipo"],
+        "solicitud_id": notif["solicitud_id"],
+        "created_at": notif["created_at"],
+    }
+
+
+def _sse_event(payload: dict) -> bytes:
+    return (
+        NotificacionEvent(event="notification", data=payload, id=payload["id"])
+        .to_sse_format()
+        .encode()
+    )
+
+
+async def _write(writer: asyncio.StreamWriter, data: bytes) -> None:
+    """Escribir y drenar; un cliente lento genera asyncio.TimeoutError."""
+    writer.write(data)
+    await asyncio.wait_for(writer.drain(), DRAIN_TIMEOUT)
+
+
+def _extract_token(headers: Dict[str, str]) -> Optional[str]:
+    """Obtener el JWT desde Authorization: Bearer o la cookie spm_token."""
+    auth_header = headers.get("authorization", "")
+    if auth_header.startswith("Bearer "):
+        return auth_header.split(" ", 1)[1].strip()
+    cookie_header = headers.get("cookie")
+    if cookie_header:
+        cookie = SimpleCookie()
+        try:
+            cookie.load(cookie_header)
+        except Exception:
+            return None
+        if "spm_token" in cookie:
+            return cookie["spm_token"].value
+    return None
+
+
+def _authenticate(headers: Dict[str, str]) -> Optional[str]:
+    token = _extract_token(headers)
+    if not token:
+        return None
+    payload = _decode_access_token(token)
+    if not payload:
+        return None
+    user_id = payload.get("sub") or payload.get("user_id")
+    return str(user_id) if user_id else None
+
+
+async def _read_request(
+    reader: asyncio.StreamReader,
+) -> Optional[Tuple[str, str, Dict[str, List[str]], Dict[str, str]]]:
+    """Leer línea de request y headers. Retorna (method, path, query, headers)."""
+    try:
+        raw = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), HEADER_READ_TIMEOUT)
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+        return None
+    if len(raw) > MAX_HEADER_BYTES:
+        return None
+    lines = raw.decode("latin-1").split("\r\n")
+    parts = lines[0].split(" ")
+    if len(parts) != 3:
+        return None
+    method, target, _ = parts
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    url = urlsplit(target)
+    return method.upper(), url.path, parse_qs(url.query), headers
+
+
+def _json_response(status: int, body: dict) -> bytes:
+    reason = {200: "OK", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed"}
+    data = json.dumps(body).encode()
+    head = (
+        f"HTTP/1.1 {status} {reason.get(status, 'OK')}\r\n"
+        "Content-Type: application/json\r\n"
+        "Cache-Control: no-cache\r\n"
+        f"Content-Length: {len(data)}\r\n"
+        "Connection: close\r\n"
+        "\r\n"
+    )
+    return head.encode() + data
+
+
+def _unauthorized() -> bytes:
+    return _json_response(
+        401, {"ok": False, "error": {"code": "unauthorized", "message": "Invalid token"}}
+    )
+
+
+def _int_param(query: Dict[str, List[str]], name: str, default: int) -> int:
+    try:
+        return int(query.get(name, [default])[0])
+    except (TypeError, ValueError):
+        return default
+
+
+class StreamingServer:
+    """Servidor HTTP mínimo sobre asyncio.start_server."""
+
+    def __init__(self, hub: Optional[NotificationHub] = None):
+        self.hub = hub or NotificationHub()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await _read_request(reader)
+            if request is None:
+                return
+            method, path, query, headers = request
+            if method != "GET":
+                writer.write(_json_response(405, {"ok": False, "error": "Method not allowed"}))
+            elif path == "/health":
+                writer.write(
+                    _json_response(
+                        200,
+                        {
+                            "ok": True,
+                            "connections": self.hub.connection_count,
+                            "last_id": self.hub.last_id,
+                        },
+                    )
+                )
+            elif path == "/api/notificaciones/stream":
+                await self._handle_sse(reader, writer, headers)
+            elif path == "/api/notificaciones/poll":
+                await self._handle_long_poll(writer, query, headers)
+            else:
+                writer.write(_json_response(404, {"ok": False, "error": "Not found"}))
+            await writer.drain()
+        except (ConnectionError, asyncio.CancelledError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    async def _catch_up(self, user_id: str, last_id: int) -> Tuple[List[dict], int]:
+        """
+        Una página de notificaciones del usuario entre last_id y el cursor del hub.
+
+        Returns:
+            (notificaciones, nuevo cursor): el cursor pasa la última fila leída
+            si la página vino llena, o el cursor del hub si no quedan más
+        """
+        hasta = self.hub.last_id
+        pagina = await asyncio.to_thread(
+            NotificationService.get_user_notifications_between,
+            user_id,
+            last_id,
+            hasta,
+            CATCH_UP_PAGE,
+        )
+        if len(pagina) >= CATCH_UP_PAGE:
+            return pagina, pagina[-1]["id"]
+        return pagina, hasta
+
+    async def _handle_sse(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        headers: Dict[str, str],
+    ) -> None:
+        user_id = _authenticate(headers)
+        if not user_id:
+            writer.write(_unauthorized())
+            return
+
+        # Last-Event-ID permite reanudar sin perder notificaciones tras reconexión
+        try:
+            last_id = int(headers.get("last-event-id") or self.hub.last_id)
+        except ValueError:
+            last_id = self.hub.last_id
+        sub = _Subscriber(user_id, writer=writer, last_id=last_id)
+
+        writer.write(_SSE_HEADERS)
+        await _write(
+            writer, f"data: {json.dumps({'type': 'connected', 'user_id': user_id})}\n\n".encode()
+        )
+        # Ponerse al día por páginas hasta el cursor del hub; si el hub avanza
+        # mientras tanto se sigue hasta alcanzarlo y recién ahí se suscribe
+        while sub.last_id < self.hub.last_id:
+            pagina, sub.last_id = await self._catch_up(user_id, sub.last_id)
+            for notif in pagina:
+                await _write(writer, _sse_event(_event_payload(notif)))
+
+        self.hub.subscribe(sub)
+        try:
+            while True:
+                # El cliente no envía datos: reader.read() solo retorna al cerrar
+                try:
+                    data = await asyncio.wait_for(reader.read(1024), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    await _write(writer, b": heartbeat\n\n")
+                    continue
+                if not data:
+                    break
+        finally:
+            self.hub.unsubscribe(sub)
+
+    async def _handle_long_poll(
+        self,
+        writer: asyncio.StreamWriter,
+        query: Dict[str, List[str]],
+        headers: Dict[str, str],
+    ) -> None:
+        user_id = _authenticate(headers)
+        if not user_id:
+            writer.write(_unauthorized())
+            return
+
+        last_id = _int_param(query, "last_id", self.hub.last_id)
+        timeout = min(max(_int_param(query, "timeout", 25), 1), LONG_POLL_MAX_TIMEOUT)
+
+        notifications = []
+        next_id = last_id
+        while not notifications and next_id < self.hub.last_id:
+            pagina, next_id = await self._catch_up(user_id, next_id)
+            notifications = [_event_payload(n) for n in pagina]
+
+        if not notifications:
+            waiter = asyncio.get_running_loop().create_future()
+            sub = _Subscriber(user_id, waiter=waiter, last_id=max(next_id, self.hub.last_id))
+            self.hub.subscribe(sub)
+            try:
+                notifications = await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                notifications = []
+            finally:
+                self.hub.unsubscribe(sub)
+
+            if notifications:
+                next_id = notifications[-1]["id"]
+            else:
+                next_id = max(sub.last_id, self.hub.last_id)
+
+        writer.write(
+            _json_response(
+                200,
+                {
+                    "ok": True,
+                    "notifications": notifications,
+                    "last_id": next_id,
+                    "server_time": time.time(),
+                },
+            )
+        )
+
+    async def serve(self, host: str, port: int) -> None:
+        await self.hub.start()
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER_BYTES)
+        print(f"[STREAM] Escuchando en http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.hub.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Servidor de streaming de notificaciones")
+    parser.add_argument("--host", default=os.getenv("STREAM_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("STREAM_PORT", "5001")))
+    args = parser.parse_args()
+    try:
+        asyncio.run(StreamingServer().serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("[STREAM] Detenido")
+
+
+if __name__ == "__main__":
+    main()
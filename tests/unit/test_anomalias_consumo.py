@@ -0,0 +1,175 @@
+"""
+Tests para el escaneo de consumo inusual (services/anomalias_consumo.py)
+
+Verifica:
+- Estadísticas de demanda por material (media, desvío, mediana, MAD)
+- Puntuación: z robusto, z clásico sin MAD y regla del promedio como respaldo
+- Escaneo completo y parcial de solicitudes pendientes
+- Recálculo de estadísticas al importar consumo nuevo
+"""
+
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.services import anomalias_consumo, consumo_store
+
+HISTORIAL = {
+    "M1": [10, 12, 9, 11, 10, 10, 13, 8, 10, 11],
+    "M2": [5, 5, 5, 5, 5, 5],
+    "M3": [1, 1, 1, 1, 1, 21],
+    "M4": [4, 6],
+}
+
+
+def _movimientos(conn, historial, importacion_id):
+    conn.execute(
+        "INSERT INTO consumo_importaciones (id, sha256) VALUES (?, ?)",
+        (importacion_id, f"sha{importacion_id}"),
+    )
+    for codigo, cantidades in historial.items():
+        for dia, cantidad in enumerate(cantidades, start=1):
+            fecha = f"2024-{importacion_id:02d}-{dia:02d}"
+            conn.execute(
+                """
+                INSERT INTO consumo_movimientos
+                    (codigo_material, codigo_norm, centro, almacen, fecha, mes, cantidad,
+                     importacion_id)
+                VALUES (?, ?, '1008', '1', ?, ?, ?, ?)
+                """,
+                (codigo, codigo, fecha, fecha[:7], cantidad, importacion_id),
+            )
+    conn.commit()
+
+
+def _solicitud(conn, solicitud_id, status, items):
+    conn.execute(
+        "INSERT INTO solicitudes (id, status, data_json) VALUES (?, ?, ?)",
+        (solicitud_id, status, json.dumps({"items": items})),
+    )
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """BD con histórico de consumo y solicitudes en distintos status"""
+    conn = sqlite3.connect(tmp_path / "anomalias.db")
+    consumo_store.ensure_schema(conn)
+    conn.execute("CREATE TABLE solicitudes (id INTEGER PRIMARY KEY, status TEXT, data_json TEXT)")
+    _movimientos(conn, HISTORIAL, 1)
+    _solicitud(
+        conn,
+        1,
+        "Enviada",
+        [
+            {"codigo": "M1", "cantidad": 20},
+            {"codigo": "M1", "cantidad": 14},
+            {"codigo": "0M2", "cantidad": 8},
+            {"codigo": "M9", "cantidad": 100},
+        ],
+    )
+    _solicitud(
+        conn,
+        2,
+        "Aprobada",
+        [
+            {"codigo": "M3", "cantidad": 30},
+            {"codigo": "M3", "cantidad": 20},
+            {"codigo": "M4", "cantidad": "8"},
+            {"codigo": "", "cantidad": 5},
+        ],
+    )
+    _solicitud(conn, 3, "Borrador", [{"codigo": "M1", "cantidad": 20}])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _marcas(conn):
+    return conn.execute(
+        "SELECT solicitud_id, item_index, metodo FROM solicitud_anomalias "
+        "ORDER BY solicitud_id, item_index"
+    ).fetchall()
+
+
+class TestPuntuacion:
+    """Estadísticas y reglas sobre columnas"""
+
+    def test_estadisticas_demanda(self):
+        movimientos = pd.DataFrame(
+            [(c, q) for c, cantidades in HISTORIAL.items() for q in cantidades],
+            columns=["codigo_norm", "cantidad"],
+        )
+        stats = anomalias_consumo.estadisticas_demanda(movimientos).set_index("codigo_norm")
+        assert stats.loc["M1", ["registros", "mediana", "mad"]].tolist() == [10, 10.0, 1.0]
+        assert stats.loc["M2", ["desvio", "mad"]].tolist() == [0.0, 0.0]
+        assert stats.loc["M3", "desvio"] == pytest.approx(8.165, abs=1e-3)
+        assert anomalias_consumo.estadisticas_demanda(movimientos.head(0)).empty
+
+    def test_metodos_y_umbrales(self):
+        stats = pd.DataFrame(
+            [("M1", 10, 10.4, 1.43, 10.0, 1.0), ("M2", 6, 5.0, 0.0, 5.0, 0.0)],
+            columns=anomalias_consumo.COLUMNAS_ESTADISTICAS,
+        )
+        items = pd.DataFrame(
+            {"codigo_norm": ["M1", "M1", "M2", "M2", "M9"], "cantidad": [20, 14, 8, 7, 100]}
+        )
+        puntuados = anomalias_consumo.puntuar(items, stats)
+        assert puntuados["metodo"].tolist() == [
+            "z_robusto", "z_robusto", "promedio", "promedio", None
+        ]
+        assert puntuados["anomalia"].tolist() == [True, False, True, False, False]
+        assert puntuados.loc[0, "z_robusto"] == pytest.approx(0.6745 * 10)
+
+
+class TestEscaneo:
+    """Marcas persistidas para las bandejas"""
+
+    def test_escaneo_completo(self, conn):
+        resumen = anomalias_consumo.escanear(conn)
+        assert (resumen["solicitudes"], resumen["items"], resumen["sin_historial"]) == (2, 7, 1)
+        assert resumen["anomalias"] == 4
+        assert _marcas(conn) == [
+            (1, 0, "z_robusto"),
+            (1, 2, "promedio"),
+            (2, 0, "z"),
+            (2, 2, "promedio"),
+        ]
+
+        por_solicitud = anomalias_consumo.anomalias_por_solicitud(conn, [1, 3])
+        assert list(por_solicitud) == [1]
+        assert por_solicitud[1][1]["codigo_norm"] == "M2"
+        assert por_solicitud[1][1]["ratio"] == pytest.approx(1.6)
+
+    def test_escaneo_parcial_y_cierre(self, conn):
+        anomalias_consumo.escanear(conn)
+        conn.execute("UPDATE solicitudes SET status = 'Rechazada' WHERE id = 1")
+        conn.execute("UPDATE solicitudes SET status = 'Enviada' WHERE id = 3")
+        conn.commit()
+
+        anomalias_consumo.actualizar_solicitud(conn, 1)
+        anomalias_consumo.actualizar_solicitud(conn, 3)
+        assert _marcas(conn) == [
+            (2, 0, "z"),
+            (2, 2, "promedio"),
+            (3, 0, "z_robusto"),
+        ]
+
+    def test_importacion_nueva_recalcula(self, conn):
+        anomalias_consumo.escanear(conn)
+        assert anomalias_consumo.estadisticas_vigentes(conn)
+
+        # M2 pasa a consumir de a 8-10 unidades: el pedido de 8 deja de ser inusual
+        _movimientos(conn, {"M2": [8, 9, 10, 8, 9, 10]}, 2)
+        assert not anomalias_consumo.estadisticas_vigentes(conn)
+        assert anomalias_consumo.escanear(conn)["anomalias"] == 3
+        assert (1, 2, "promedio") not in _marcas(conn)
+
+        estado = anomalias_consumo.estado_escaneo(conn)
+        assert (estado["anomalias"], estado["solicitudes"]) == (3, 2)
+        assert estado["estadisticas_vigentes"] is True
@@ -0,0 +1,159 @@
+"""
+Tests para la asignación de presupuesto (services/asignacion_presupuesto.py)
+
+Verifica:
+- Alcance: solo solicitudes pendientes del centro/sector (sector por id o nombre)
+  sobre el catalog_sectores de schema.sql
+- Cobertura con stock por prioridad y precio de respaldo del catálogo
+- Mochila exacta (DP) y MILP contra fuerza bruta
+- Financiamiento por items y por solicitudes completas
+"""
+
+import itertools
+import json
+import re
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.services import asignacion_presupuesto
+from backend_v2.services.asignacion_presupuesto import (_nombres_sector,
+                                                        cargar_items,
+                                                        optimizar,
+                                                        seleccionar)
+
+SCHEMA_SQL = Path(__file__).parent.parent.parent / "backend_v2" / "core" / "schema.sql"
+
+
+def _ddl(tabla):
+    """CREATE TABLE de `tabla` tal como está en schema.sql"""
+    patron = rf"CREATE TABLE IF NOT EXISTS {tabla} \(.*?\n\);"
+    return re.search(patron, SCHEMA_SQL.read_text(encoding="utf-8"), re.DOTALL).group(0)
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / "asignacion.db")
+    conn.executescript(_ddl("catalog_sectores"))
+    conn.executescript(
+        """
+        CREATE TABLE solicitudes (
+            id INTEGER PRIMARY KEY, centro TEXT, sector TEXT, almacen_virtual TEXT,
+            criticidad TEXT, fecha_necesidad TEXT, status TEXT, total_monto REAL,
+            data_json TEXT
+        );
+        CREATE TABLE materiales (codigo TEXT PRIMARY KEY, precio_usd REAL);
+        INSERT INTO catalog_sectores (nombre, activo) VALUES ('Mant', 1), ('Ops', 1);
+        INSERT INTO materiales VALUES ('D', 50);
+        """
+    )
+    solicitudes = [
+        (1, "Mant", "Alta", "2020-01-01", "Enviada", [("A", 2, 100), ("B", 5, 10)]),
+        (2, "Mant", "Normal", None, "Enviada", [("C", 1, 150), ("D", 1, None)]),
+        (3, "Mant", "Normal", None, "Aprobada", [("C", 9, 150)]),
+        (4, "Ops", "Alta", None, "Enviada", [("C", 9, 150)]),
+        (5, "Mant", "Normal", None, "enviada", [("B", 4, 10)]),
+    ]
+    for sid, sector, criticidad, fecha, status, items in solicitudes:
+        data = {
+            "items": [{"codigo": c, "cantidad": q, "precio_unitario": p} for c, q, p in items]
+        }
+        conn.execute(
+            "INSERT INTO solicitudes VALUES (?, '1008', ?, '0001', ?, ?, ?, 10, ?)",
+            (sid, sector, criticidad, fecha, status, json.dumps(data)),
+        )
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _fuerza_bruta(valores, costos, capacidad):
+    mejor = 0.0
+    for combinacion in itertools.product([0, 1], repeat=len(valores)):
+        x = np.array(combinacion)
+        if (x * costos).sum() <= capacidad:
+            mejor = max(mejor, float((x * valores).sum()))
+    return mejor
+
+
+class TestSeleccion:
+    """Solvers de la mochila"""
+
+    @pytest.mark.parametrize("semilla", range(5))
+    def test_dp_y_milp_optimos(self, semilla, monkeypatch):
+        rng = np.random.default_rng(semilla)
+        costos = rng.integers(1, 50, 12) * 100
+        valores = rng.random(12) * costos
+        capacidad = int(costos.sum() // 3)
+        esperado = _fuerza_bruta(valores, costos, capacidad)
+
+        elegidos, metodo, optimo = seleccionar(valores, costos, capacidad)
+        assert (metodo, optimo) == ("dp", True)
+        assert costos[elegidos].sum() <= capacidad
+        assert valores[elegidos].sum() == pytest.approx(esperado)
+
+        monkeypatch.setattr(asignacion_presupuesto, "DP_MAX_CELDAS", 0)
+        elegidos, metodo, _ = seleccionar(valores, costos, capacidad)
+        assert metodo == "milp"
+        assert valores[elegidos].sum() == pytest.approx(esperado, rel=1e-3)
+
+    def test_casos_triviales(self):
+        costos = np.array([0, 500, 2000])
+        elegidos, metodo, _ = seleccionar(np.array([0.0, 1.0, 5.0]), costos, 1000)
+        assert (elegidos.tolist(), metodo) == ([True, True, False], "trivial")
+        assert seleccionar(np.zeros(0), np.zeros(0, dtype=np.int64), 100)[0].size == 0
+
+
+class TestOptimizar:
+    """Asignación sobre las solicitudes pendientes del alcance"""
+
+    def test_alcance_y_precios(self, conn):
+        items = cargar_items(conn, "1008", "Mant")
+        assert sorted(set(items["solicitud_id"])) == [1, 2, 5]
+        assert items.loc[items["codigo"] == "D", "precio_unitario"].tolist() == [50.0]
+        prioridad = items.groupby("solicitud_id")["prioridad"].first()
+        assert prioridad[1] > prioridad[2]
+
+    def test_items_financiados(self, conn):
+        resultado = optimizar(conn, "1008", "Mant", 30000, libre={("B", "0001"): 3})
+        items = {(i["solicitud_id"], i["codigo"]): i for i in resultado["items"]}
+        # El stock de B cubre primero a la solicitud más prioritaria
+        assert (items[(1, "B")]["cantidad_stock"], items[(1, "B")]["costo_cents"]) == (3, 2000)
+        assert (items[(5, "B")]["cantidad_stock"], items[(5, "B")]["costo_cents"]) == (0, 4000)
+        assert items[(2, "D")]["costo_cents"] == 5000
+
+        costos = np.array([i["costo_cents"] for i in resultado["items"]])
+        valores = costos * np.array([i["prioridad"] for i in resultado["items"]])
+        elegidos = np.array([i["financiado"] for i in resultado["items"]])
+        assert valores[elegidos].sum() == pytest.approx(_fuerza_bruta(valores, costos, 30000))
+        assert resultado["costo_financiado_cents"] <= 30000
+        assert resultado["saldo_restante_cents"] == 30000 - resultado["costo_financiado_cents"]
+        assert resultado["solicitudes"][0]["solicitud_id"] == 1
+
+    def test_por_solicitud(self, conn):
+        resultado = optimizar(
+            conn, "1008", "Mant", 25000, por_solicitud=True, libre={("B", "0001"): 3}
+        )
+        completas = {s["solicitud_id"]: s["completa"] for s in resultado["solicitudes"]}
+        # 1 (22000) entra sola; 2 (20000) y 5 (4000) no entran con ella
+        assert completas == {1: True, 2: False, 5: False}
+        assert all(s["items_financiados"] in (0, s["items"]) for s in resultado["solicitudes"])
+        assert resultado["costo_financiado_cents"] == 22000
+
+    def test_sectores_por_id(self, conn):
+        # schema.sql usa el nombre como clave: no hay ids que traducir
+        assert _nombres_sector(conn) == {}
+        legado = sqlite3.connect(":memory:")
+        legado.execute("CREATE TABLE catalog_sectores (id INTEGER PRIMARY KEY, nombre TEXT)")
+        legado.execute("INSERT INTO catalog_sectores VALUES (3, 'Mant')")
+        assert _nombres_sector(legado) == {"3": "Mant"}
+        legado.close()
+
+    def test_sin_pendientes(self, conn):
+        resultado = optimizar(conn, "1050", "Mant", 1000, libre={})
+        assert (resultado["items"], resultado["metodo"]) == ([], "trivial")
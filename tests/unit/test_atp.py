@@ -0,0 +1,190 @@
+"""
+Tests para el stock comprometido (services/atp.py)
+
+Verifica:
+- Las decisiones 'stock' reservan stock al guardarse y se ajustan al cambiar
+- Cerrar la solicitud libera la reserva
+- El análisis PASO 1/2 descuenta lo comprometido por otras solicitudes
+- Reservas y stock se cruzan por almacén físico (almacén virtual 'ALM0001')
+- reconstruir() repara desvíos
+"""
+
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.core import cache_loader, repository
+from backend_v2.core.repository import (MaterialRepository,
+                                        SolicitudRepository,
+                                        TratamientoRepository)
+from backend_v2.core.services.planner_service import (
+    paso_1_analizar_solicitud, paso_2_opciones_abastecimiento_batch)
+from backend_v2.services.atp import ATPService
+
+
+@pytest.fixture
+def atp_db(tmp_path, monkeypatch):
+    """BD con dos solicitudes abiertas que piden el mismo material"""
+    path = tmp_path / "atp.db"
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE solicitudes (
+            id INTEGER PRIMARY KEY, id_usuario TEXT, centro TEXT, sector TEXT,
+            justificacion TEXT, centro_costos TEXT, almacen_virtual TEXT,
+            criticidad TEXT, fecha_necesidad TEXT, status TEXT, total_monto REAL,
+            planner_id TEXT, created_at TEXT, updated_at TEXT, data_json TEXT,
+            aprobador_id TEXT
+        );
+        CREATE TABLE solicitud_items_tratamiento (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, solicitud_id INTEGER NOT NULL,
+            item_index INTEGER NOT NULL, decision TEXT NOT NULL,
+            cantidad_aprobada REAL NOT NULL, codigo_equivalente TEXT,
+            proveedor_sugerido TEXT, precio_unitario_estimado REAL, comentario TEXT,
+            updated_by TEXT NOT NULL, updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(solicitud_id, item_index)
+        );
+        CREATE TABLE presupuestos (centro TEXT, sector TEXT, monto_usd REAL, saldo_usd REAL);
+        CREATE TABLE materiales (codigo TEXT PRIMARY KEY, descripcion TEXT, precio_usd REAL);
+        CREATE TABLE stock_almacenes (
+            codigo_material TEXT, centro TEXT, almacen TEXT, lote TEXT, cantidad REAL
+        );
+        CREATE TABLE proveedores (
+            id_proveedor TEXT, nombre TEXT, plazo_entrega_dias INTEGER, rating REAL,
+            tipo TEXT, activo INTEGER
+        );
+        INSERT INTO presupuestos VALUES ('1008', 'Mant', 1000, 1000);
+        INSERT INTO materiales VALUES ('M1', 'Rodamiento', 10), ('M2', 'Sello', 5);
+        INSERT INTO stock_almacenes VALUES
+            ('M1', '1008', '0001', NULL, 10),
+            ('M2', '1008', '0001', NULL, 5);
+        """
+    )
+    items = [
+        {"codigo": "M1", "cantidad": 6, "precio_unitario": 10},
+        {"codigo": "M2", "cantidad": 2, "precio_unitario": 5},
+    ]
+    for solicitud_id in (1, 2):
+        conn.execute(
+            """
+            INSERT INTO solicitudes (id, centro, sector, almacen_virtual, criticidad, status,
+                                     data_json)
+            VALUES (?, '1008', 'Mant', '0001', 'Normal', 'Aprobada', ?)
+            """,
+            (solicitud_id, json.dumps({"items": items})),
+        )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(repository, "_db_path", lambda: path)
+    monkeypatch.setattr(cache_loader._loader, "_stock_cache", pd.DataFrame())
+    monkeypatch.setattr(cache_loader._loader, "_consumo_cache", pd.DataFrame())
+    monkeypatch.setattr(cache_loader._loader, "_equivalencias_cache", pd.DataFrame())
+    return path
+
+
+def _comprometido(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(
+            "SELECT codigo_norm, centro, almacen, cantidad FROM stock_comprometido "
+            "ORDER BY codigo_norm"
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+class TestMantenimiento:
+    """Ajuste incremental al guardar decisiones y cerrar solicitudes"""
+
+    def test_decisiones_reservan_y_ajustan(self, atp_db):
+        version = MaterialRepository.get_comprometido_version()
+        TratamientoRepository.save_decisiones_bulk(
+            1,
+            [(0, "stock", 6, None, None, None, ""), (1, "proveedor", 2, None, "P1", 5, "")],
+            "P1",
+        )
+        assert _comprometido(atp_db) == [("M1", "1008", "1", 6.0)]
+        assert MaterialRepository.get_comprometido_version() > version
+
+        # La equivalencia reserva el material elegido, no el pedido
+        TratamientoRepository.save_decision(1, 0, "stock", 4, "0000M2", None, None, "", "P1")
+        assert _comprometido(atp_db) == [("M2", "1008", "1", 4.0)]
+
+        TratamientoRepository.save_decisiones_bulk(2, [(0, "stock", 3, None, None, None, "")], "P2")
+        assert _comprometido(atp_db) == [("M1", "1008", "1", 3.0), ("M2", "1008", "1", 4.0)]
+
+    def test_cerrar_solicitud_libera(self, atp_db):
+        TratamientoRepository.save_decisiones_bulk(1, [(0, "stock", 6, None, None, None, "")], "P1")
+        TratamientoRepository.save_decisiones_bulk(2, [(0, "stock", 3, None, None, None, "")], "P2")
+
+        SolicitudRepository.update_status(1, "Tratado")
+        assert _comprometido(atp_db) == [("M1", "1008", "1", 9.0)]
+        SolicitudRepository.update_status(1, "Despachada")
+        assert _comprometido(atp_db) == [("M1", "1008", "1", 3.0)]
+        SolicitudRepository.update_status(2, "Rechazada")
+        assert _comprometido(atp_db) == []
+
+    def test_reconstruir_repara_desvios(self, atp_db):
+        TratamientoRepository.save_decisiones_bulk(1, [(0, "stock", 6, None, None, None, "")], "P1")
+        conn = sqlite3.connect(atp_db)
+        conn.execute("UPDATE stock_comprometido SET cantidad = 99")
+        conn.execute(
+            "INSERT INTO solicitud_items_tratamiento (solicitud_id, item_index, decision, "
+            "cantidad_aprobada, updated_by) VALUES (2, 1, 'stock', 1, 'sql')"
+        )
+        conn.commit()
+        conn.close()
+
+        resultado = ATPService.reconstruir(atp_db)
+        assert resultado == {"compromisos": 2, "materiales": 2, "corregidos": 2}
+        assert _comprometido(atp_db) == [("M1", "1008", "1", 6.0), ("M2", "1008", "1", 1.0)]
+        assert ATPService.reconstruir(atp_db)["corregidos"] == 0
+
+
+class TestDisponible:
+    """Disponible para prometer en el análisis del planner"""
+
+    def test_excluye_reservas_propias(self, atp_db):
+        TratamientoRepository.save_decisiones_bulk(1, [(0, "stock", 6, None, None, None, "")], "P1")
+        assert MaterialRepository.get_comprometido_batch(["M1"], "1008", "0001") == {"M1": 6.0}
+        assert MaterialRepository.get_comprometido_batch(["M1"], "1008", "0002") == {}
+        assert MaterialRepository.get_comprometido_batch(["M1"], excluir_solicitud=1) == {}
+
+    def test_almacen_virtual_contra_stock_fisico(self, atp_db):
+        conn = sqlite3.connect(atp_db)
+        conn.execute("UPDATE solicitudes SET almacen_virtual = 'ALM0001' WHERE id = 1")
+        conn.execute("UPDATE solicitudes SET almacen_virtual = '' WHERE id = 2")
+        conn.commit()
+        conn.close()
+        TratamientoRepository.save_decisiones_bulk(1, [(0, "stock", 6, None, None, None, "")], "P1")
+        TratamientoRepository.save_decisiones_bulk(2, [(0, "stock", 1, None, None, None, "")], "P2")
+        assert _comprometido(atp_db) == [("M1", "1008", "", 1.0), ("M1", "1008", "1", 6.0)]
+
+        # La reserva sin almacén cuenta en todos los almacenes del centro
+        assert MaterialRepository.get_comprometido_batch(["M1"], "1008", "0001") == {"M1": 7.0}
+        assert MaterialRepository.get_comprometido_batch(["M1"], "1008", "ALM-01") == {"M1": 7.0}
+        assert MaterialRepository.get_comprometido_batch(["M1"], "1008", "0002") == {"M1": 1.0}
+
+        material = paso_1_analizar_solicitud(1)["materiales_por_criticidad"]["Normal"][0]
+        assert (material["stock_fisico"], material["stock_comprometido"]) == (10.0, 1.0)
+
+    def test_paso_1_y_2_descuentan_otras_solicitudes(self, atp_db):
+        TratamientoRepository.save_decisiones_bulk(1, [(0, "stock", 6, None, None, None, "")], "P1")
+
+        propio = paso_1_analizar_solicitud(1)
+        assert [c["tipo"] for c in propio["conflictos"]] == []
+
+        otro = paso_1_analizar_solicitud(2)
+        conflicto = otro["conflictos"][0]
+        assert (conflicto["tipo"], conflicto["cantidad_disponible"]) == ("stock_insuficiente", 4.0)
+        material = otro["materiales_por_criticidad"]["Normal"][0]
+        assert (material["stock_fisico"], material["stock_comprometido"]) == (10.0, 6.0)
+
+        item = paso_2_opciones_abastecimiento_batch(2, [0])["items"][0]["item"]
+        assert (item["stock_disponible"], item["stock_comprometido"]) == (4.0, 6.0)
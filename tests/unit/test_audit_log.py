@@ -0,0 +1,193 @@
+"""
+Tests para el log de auditoría (services/audit_log.py)
+
+Verifica:
+- Los eventos encolados quedan en la BD de auditoría, no en la principal
+- La tabla es append-only
+- Lecturas por solicitud, item, tipo y actor con paginación
+- Importación idempotente de eventos existentes
+- Lotes que fallan repetidamente van al spool y se recuperan después
+- La retención archiva la BD de auditoría por la vía que el trigger permite
+"""
+
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.core import repository
+from backend_v2.core.repository import TratamientoRepository
+from backend_v2.services.audit_log import (AuditLog, audit_path_for,
+                                           get_audit_log)
+from backend_v2.services.retention_service import (DEFAULT_POLICIES,
+                                                   RetentionService)
+
+
+@pytest.fixture
+def audit(tmp_path):
+    log = AuditLog(tmp_path / "spm_audit.db")
+    yield log
+    log.close()
+
+
+class TestEscritura:
+    """Tests de append() y el escritor en segundo plano"""
+
+    def test_append_y_flush(self, audit):
+        audit.append(1, None, "planificador_acepta", "En tratamiento", {}, "P1")
+        audit.append(1, 0, "item_tratado", "stock", {"cantidad": 2}, "P1")
+        assert audit.flush()
+
+        conn = sqlite3.connect(audit.path)
+        rows = conn.execute("SELECT tipo, item_index, actor_id FROM solicitud_tratamiento_log").fetchall()
+        conn.close()
+        assert rows == [("planificador_acepta", None, "P1"), ("item_tratado", 0, "P1")]
+
+    def test_escrituras_concurrentes(self, audit):
+        def escribir(n):
+            for i in range(50):
+                audit.append(n, i, "item_tratado", "ok", {"i": i}, f"U{n}")
+
+        hilos = [threading.Thread(target=escribir, args=(n,)) for n in range(8)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+
+        assert audit.flush()
+        for n in range(8):
+            eventos = audit.history(n, limit=100)
+            assert [e["item_index"] for e in eventos] == list(range(49, -1, -1))
+
+    def test_append_only(self, audit):
+        audit.append(1, None, "comentario_agregado", "comentario", {"comentario": "x"}, "U1")
+        audit.flush()
+
+        conn = sqlite3.connect(audit.path)
+        with pytest.raises(sqlite3.IntegrityError, match="append-only"):
+            conn.execute("UPDATE solicitud_tratamiento_log SET tipo = 'otro'")
+        with pytest.raises(sqlite3.IntegrityError, match="append-only"):
+            conn.execute("DELETE FROM solicitud_tratamiento_log")
+        conn.close()
+
+    def test_lote_fallido_va_al_spool(self, tmp_path):
+        audit = AuditLog(tmp_path / "spm_audit.db", retry_seconds=0, max_retries=2)
+        abrir = audit._open
+        fallos = [2]
+
+        def abrir_con_fallos():
+            if fallos[0]:
+                fallos[0] -= 1
+                raise sqlite3.OperationalError("database is locked")
+            return abrir()
+
+        audit._open = abrir_con_fallos
+        audit.append(1, None, "cierre", "closed", {}, "U1")
+        assert audit.flush()
+        assert audit.spool_path.exists()
+
+        # El siguiente lote confirmado recupera lo volcado
+        audit.append(1, 0, "item_tratado", "ok", {}, "U1")
+        assert [e["tipo"] for e in audit.history(1)] == ["cierre", "item_tratado"]
+        assert not audit.spool_path.exists()
+        audit.close()
+
+    def test_repositorio_escribe_fuera_de_la_bd_principal(self, tmp_path, monkeypatch):
+        main_db = tmp_path / "spm.db"
+        sqlite3.connect(main_db).close()
+        monkeypatch.setattr(repository, "_db_path", lambda: main_db)
+
+        TratamientoRepository.log_evento(7, 1, "item_tratado", "compra", {"a": 1}, "P1")
+
+        historial = TratamientoRepository.get_historial(7)
+        assert [(e["tipo"], e["payload"]) for e in historial] == [("item_tratado", {"a": 1})]
+        assert get_audit_log(main_db).path == audit_path_for(main_db).resolve()
+        tablas = sqlite3.connect(main_db).execute("SELECT name FROM sqlite_master").fetchall()
+        assert tablas == []
+
+
+class TestLectura:
+    """Tests de history() y events_by_actor()"""
+
+    def test_filtros_y_paginacion(self, audit):
+        for i in range(5):
+            audit.append(1, i % 2, "item_tratado", "ok", {}, "P1")
+        audit.append(1, None, "comentario_agregado", "comentario", {}, "P2")
+        audit.append(2, None, "comentario_agregado", "comentario", {}, "P2")
+
+        assert len(audit.history(1)) == 6
+        assert {e["item_index"] for e in audit.history(1, item_index=1)} == {1}
+        assert [e["actor_id"] for e in audit.history(1, tipos=["comentario_agregado"])] == ["P2"]
+
+        primera = audit.history(1, limit=4)
+        resto = audit.history(1, limit=4, before_id=primera[-1]["id"])
+        assert len(primera) == 4 and len(resto) == 2
+        assert primera[-1]["id"] > resto[0]["id"]
+
+        assert [e["solicitud_id"] for e in audit.events_by_actor("P2")] == [2, 1]
+
+    def test_sin_archivo(self, tmp_path):
+        assert AuditLog(tmp_path / "nuevo_audit.db").history(1) == []
+
+
+class TestImportacion:
+    """Tests de import_rows()"""
+
+    def test_idempotente(self, audit):
+        rows = [
+            {"id": 10, "solicitud_id": 1, "item_index": None, "actor_id": "U1",
+             "tipo": "cierre", "estado": "closed", "payload_json": "{}",
+             "created_at": "2024-01-01 10:00:00"},
+            {"id": 11, "solicitud_id": 1, "item_index": 0, "actor_id": None,
+             "tipo": "item_tratado", "estado": "ok", "payload_json": None,
+             "created_at": "2024-01-02 10:00:00"},
+        ]
+        assert audit.import_rows(rows) == 2
+        assert audit.import_rows(rows) == 0
+
+        eventos = audit.history(1)
+        assert [e["tipo"] for e in eventos] == ["item_tratado", "cierre"]
+        assert eventos[0]["actor_id"] == "system"
+        assert eventos[0]["payload"] == {}
+
+
+class TestRetencion:
+    """Archivo de la BD de auditoría"""
+
+    def test_archiva_prefijo_y_mantiene_append_only(self, tmp_path, audit):
+        fechas = ["2023-01-01", "2023-02-01", "2025-05-01", "2023-03-01"]
+        audit.import_rows(
+            [
+                {"solicitud_id": 1, "tipo": f"e{i}", "created_at": f"{fecha} 10:00:00"}
+                for i, fecha in enumerate(fechas)
+            ]
+        )
+        service = RetentionService(
+            db_path=tmp_path / "spm.db",
+            audit_path=audit.path,
+            policies={"tratamiento": DEFAULT_POLICIES["solicitud_tratamiento_log"]},
+            pause_seconds=0,
+        )
+
+        # Solo el prefijo anterior al primer evento vigente (e3 espera su turno)
+        now = datetime(2025, 6, 1)
+        assert service.preview(now=now) == {"tratamiento": 2}
+        assert service.run(now=now)["rows_archived"] == 2
+        assert [e["tipo"] for e in audit.history(1)] == ["e3", "e2"]
+
+        archivo = sqlite3.connect(service.archive_path)
+        archivados = archivo.execute(
+            "SELECT tipo FROM solicitud_tratamiento_log_audit ORDER BY id"
+        ).fetchall()
+        archivo.close()
+        assert archivados == [("e0",), ("e1",)]
+
+        conn = sqlite3.connect(audit.path)
+        with pytest.raises(sqlite3.IntegrityError, match="append-only"):
+            conn.execute("DELETE FROM solicitud_tratamiento_log")
+        conn.close()
@@ -0,0 +1,155 @@
+"""
+Tests para el histórico de consumo en SQLite (services/consumo_store.py)
+
+Verifica:
+- Importación desde Excel con normalización de códigos y ubicaciones
+- Reemplazo del rango de fechas de un incremento y resumen mensual
+- Archivos ya importados se omiten
+- Consultas: promedio reciente, resumen por material y demanda por período
+"""
+
+import sqlite3
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from openpyxl import Workbook
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.core.repository import ReferenceDataRepository
+from backend_v2.services import consumo_store
+from backend_v2.services.mrp_parametros import cargar_consumo_bd
+
+ENCABEZADO = ["Material", "Centro", "Almacen", "Cantidad", "Fecha", "Descripción"]
+
+HISTORICO = [
+    [1001, 1008, 1, 4, datetime(2023, 1, 10), "Tornillo"],
+    ["0001001", "1008", "0001", 6, datetime(2023, 1, 20), "Tornillo"],
+    [1001, 1050, 3, 5, datetime(2023, 2, 5), "Tornillo"],
+    [1001, 1008, 1, 10, datetime(2024, 3, 1), "Tornillo"],
+    [2002, 1008, 1, 7, datetime(2024, 3, 15), "Tuerca"],
+    [None, 1008, 1, 99, datetime(2024, 3, 15), None],
+    [2002, 1008, 1, 1, "no es fecha", None],
+]
+
+
+def _excel(path, filas):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = consumo_store.SHEET
+    ws.append(ENCABEZADO)
+    for fila in filas:
+        ws.append(fila)
+    wb.save(path)
+    return path
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """BD importada con el histórico base"""
+    conn = sqlite3.connect(tmp_path / "consumo.db")
+    consumo_store.importar_consumo(conn, _excel(tmp_path / "historico.xlsx", HISTORICO))
+    yield conn
+    conn.close()
+
+
+def _mensual(conn):
+    return conn.execute(
+        "SELECT codigo_norm, centro, almacen, mes, cantidad, movimientos "
+        "FROM consumo_mensual ORDER BY codigo_norm, centro, mes"
+    ).fetchall()
+
+
+class TestImportacion:
+    """Carga completa e incremental"""
+
+    def test_importa_y_resume(self, tmp_path):
+        conn = sqlite3.connect(tmp_path / "consumo.db")
+        try:
+            assert not consumo_store.tiene_consumo(conn)
+            leidas = []
+            resumen = consumo_store.importar_consumo(
+                conn, _excel(tmp_path / "h.xlsx", HISTORICO), batch_size=2, progress=leidas.append
+            )
+            assert (resumen["filas"], resumen["descartadas"]) == (5, 2)
+            assert (resumen["desde"], resumen["hasta"], resumen["meses"]) == (
+                "2023-01-10", "2024-03-15", 3
+            )
+            assert leidas == [2, 4, 5]
+            assert consumo_store.tiene_consumo(conn)
+            assert ReferenceDataRepository.get_version(conn) == 1
+            assert _mensual(conn) == [
+                ("1001", "1008", "1", "2023-01", 10.0, 2),
+                ("1001", "1008", "1", "2024-03", 10.0, 1),
+                ("1001", "1050", "3", "2023-02", 5.0, 1),
+                ("2002", "1008", "1", "2024-03", 7.0, 1),
+            ]
+        finally:
+            conn.close()
+
+    def test_incremento_reemplaza_su_rango(self, conn, tmp_path):
+        incremento = _excel(
+            tmp_path / "incremento.xlsx",
+            [
+                [1001, 1008, 1, 3, datetime(2024, 3, 1), None],
+                [3003, 1008, 2, 8, datetime(2024, 3, 10), None],
+            ],
+        )
+        resumen = consumo_store.importar_consumo(conn, incremento)
+        # El movimiento de 2002 del 2024-03-15 queda fuera del rango y se conserva
+        assert resumen["reemplazadas"] == 1
+        assert _mensual(conn)[1:] == [
+            ("1001", "1008", "1", "2024-03", 3.0, 1),
+            ("1001", "1050", "3", "2023-02", 5.0, 1),
+            ("2002", "1008", "1", "2024-03", 7.0, 1),
+            ("3003", "1008", "2", "2024-03", 8.0, 1),
+        ]
+
+        assert consumo_store.importar_consumo(conn, incremento)["omitido"] is True
+        assert consumo_store.importar_consumo(conn, incremento, forzar=True)["filas"] == 2
+        assert conn.execute("SELECT COUNT(*) FROM consumo_movimientos").fetchone()[0] == 6
+
+    def test_columnas_faltantes(self, tmp_path):
+        wb = Workbook()
+        wb.active.append(["Material", "Cantidad"])
+        wb.save(tmp_path / "malo.xlsx")
+        conn = sqlite3.connect(":memory:")
+        with pytest.raises(ValueError):
+            consumo_store.importar_consumo(conn, tmp_path / "malo.xlsx")
+        conn.close()
+
+
+class TestConsultas:
+    """Lecturas usadas por planner, detalle de material y MRP"""
+
+    def test_promedio_reciente(self, conn):
+        promedios = consumo_store.promedio_reciente(conn, ["1001", "0002002", "9999"], n=3)
+        assert promedios == {"1001": 7.0, "2002": 7.0}
+        # Sin límite efectivo: los cuatro movimientos de 1001 (4, 6, 5, 10)
+        assert consumo_store.promedio_reciente(conn, ["1001"])["1001"] == pytest.approx(6.25)
+
+    def test_resumen_material(self, conn):
+        resumen = consumo_store.resumen_material(conn, "001001", "1008", registros=2)
+        assert (resumen["total"], resumen["anio_desde"], resumen["anio_hasta"]) == (
+            20.0, 2023, 2024
+        )
+        assert resumen["promedio_anual"] == 10.0
+        assert [r["fecha"] for r in resumen["registros"]] == ["2024-03-01", "2023-01-20"]
+        assert consumo_store.resumen_material(conn, "1001", "1060") is None
+
+        assert consumo_store.consumo_por_ubicacion(conn, "1001") == {
+            ("1008", "1"): {"total": 20.0, "promedio_anual": 10.0},
+            ("1050", "3"): {"total": 5.0, "promedio_anual": 5.0},
+        }
+
+    def test_consumo_para_mrp(self, conn):
+        mensual = cargar_consumo_bd(conn, "mes", centro=1008)
+        assert len(mensual) == 3
+        assert mensual["centro"].tolist() == [1008] * 3
+        assert mensual["cantidad"].sum() == 27.0
+
+        semanal = cargar_consumo_bd(conn, "semana")
+        assert len(semanal) == 5
+        assert cargar_consumo_bd(sqlite3.connect(":memory:")).empty
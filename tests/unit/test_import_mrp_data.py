@@ -0,0 +1,191 @@
+"""
+Tests para la importación MRP incremental (scripts/import_mrp_data.py)
+
+Verifica:
+- Lectura en streaming y cruce de las cuatro fuentes
+- Una reimportación sin cambios no escribe en materiales_mrp
+- Solo se aplican altas, modificaciones y bajas (y se recalcula su estado)
+- Los parámetros aceptados por el planificador sobreviven a la reimportación
+"""
+
+import sqlite3
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.core.repository import ReferenceDataRepository
+from backend_v2.scripts import import_mrp_data as imp
+from backend_v2.services import mrp_parametros
+
+
+def _xlsx(path, sheet, header, rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = sheet
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+
+
+@pytest.fixture
+def fuentes(tmp_path, monkeypatch):
+    """Archivos Excel mínimos y una BD temporal"""
+    paths = {
+        "BBDD_PATH": tmp_path / "BBDD.xlsx",
+        "STOCK_PATH": tmp_path / "stock.xlsx",
+        "PEDIDOS_PATH": tmp_path / "pedidos.xlsx",
+        "CONSUMO_PATH": tmp_path / "consumo.xlsx",
+    }
+    for name, path in paths.items():
+        monkeypatch.setattr(imp, name, path)
+
+    def escribir(bbdd, stock):
+        _xlsx(
+            paths["BBDD_PATH"],
+            "BBDD",
+            ["Sector", "Almacen", "Centro", "Codigo Material", "Descripcion",
+             "Stock de seguridad", "Punto de pedido", "Stock maximo"],
+            bbdd,
+        )
+        _xlsx(
+            paths["STOCK_PATH"],
+            "Export",
+            ["Centro", "Almacén", "Material", "Stock", "Planificación_Categorías",
+             "Sub_Categorías", "Critico", "Inmovilizado", "Ubicacion"],
+            stock,
+        )
+
+    escribir(
+        [
+            ["Mant", 1, 1008, 1000001.0, "Bulon", 5, 10, 50],
+            ["Mant", 1, 1008, 1000002.0, None, 0, 0, 0],
+            ["Prod", 2, 1050, 1000003.0, "Valvula", 1, 2, 3],
+        ],
+        [
+            [1008, 1, 1000001.0, 20, "A", None, "Si", None, "R1"],
+            [1008, 1, 1000001.0, 5, None, "A1", None, None, "R2"],
+            [1050, 2, 1000003.0, 0, "C", None, None, None, None],
+        ],
+    )
+    _xlsx(
+        paths["PEDIDOS_PATH"],
+        "ZPEN ME2M SAP",
+        ["Centro", "Almacen", "MATERIAL", "SALDO PEND"],
+        [[1008, 1, 1000002.0, 3.5], [1008, 1, 1000002.0, 4], [1050, 2, 1000003.0, "x"]],
+    )
+    _xlsx(
+        paths["CONSUMO_PATH"],
+        "consumo historico",
+        ["Fecha", "Centro", "Almacen", "Cantidad", "Material"],
+        [
+            [datetime(2024, 1, 1), 1008, 1, 30, 1000001.0],
+            [datetime(2024, 3, 1), 1008, 1, 30, 1000001.0],
+            ["no es fecha", 1050, 2, 6, 1000003.0],
+        ],
+    )
+
+    conn = sqlite3.connect(tmp_path / "spm.db")
+    conn.row_factory = sqlite3.Row
+    imp.create_mrp_table(conn)
+    yield conn, escribir
+    conn.close()
+
+
+def _materiales(conn):
+    return {
+        r["codigo_material"]: dict(r)
+        for r in conn.execute("SELECT * FROM materiales_mrp ORDER BY codigo_material")
+    }
+
+
+class TestImportacion:
+    """Tests de import_mrp_data()"""
+
+    def test_cruce_de_fuentes(self, fuentes):
+        conn, _ = fuentes
+        assert imp.import_mrp_data(conn, max_workers=2) == 3
+
+        mats = _materiales(conn)
+        assert mats["1000001"]["stock_actual"] == 25
+        assert mats["1000001"]["categoria_planificacion"] == "A"
+        assert mats["1000001"]["sub_categoria"] == "A1"
+        assert mats["1000001"]["consumo_promedio_mensual"] == 30.0  # 60 en 2 meses
+        assert mats["1000002"]["descripcion"] == "Sin descripcion"
+        assert mats["1000002"]["pedidos_en_curso"] == 7
+        assert mats["1000003"]["pedidos_en_curso"] == 0
+        estados = dict(conn.execute(
+            "SELECT codigo_material, estado FROM materiales_mrp_estado"
+        ).fetchall())
+        assert estados == {"1000001": "Normal", "1000002": "Quiebre de Stock",
+                           "1000003": "Quiebre de Stock"}
+
+    def test_reimportacion_sin_cambios_no_escribe(self, fuentes):
+        conn, _ = fuentes
+        imp.import_mrp_data(conn, max_workers=2)
+        antes = _materiales(conn)
+        cambios = conn.total_changes
+
+        assert ReferenceDataRepository.get_version(conn) == 1
+
+        imp.import_mrp_data(conn, max_workers=2)
+        assert conn.total_changes - cambios == 3  # Solo la carga del staging
+        assert _materiales(conn) == antes
+        assert ReferenceDataRepository.get_version(conn) == 1
+
+    def test_aplica_solo_el_diff(self, fuentes):
+        conn, escribir = fuentes
+        imp.import_mrp_data(conn, max_workers=2)
+        conn.execute("UPDATE materiales_mrp SET updated_at = 'viejo'")
+        conn.commit()
+        ids = {c: m["id"] for c, m in _materiales(conn).items()}
+
+        escribir(
+            [
+                ["Mant", 1, 1008, 1000001.0, "Bulon", 5, 10, 50],
+                ["Prod", 2, 1050, 1000003.0, "Valvula", 1, 2, 3],
+                ["Prod", 2, 1050, 1000004.0, "Nuevo", 0, 0, 0],
+            ],
+            [
+                [1008, 1, 1000001.0, 25, "A", "A1", "Si", None, "R1"],
+                [1050, 2, 1000003.0, 9, "C", None, None, None, None],
+            ],
+        )
+        imp.import_mrp_data(conn, max_workers=2)
+
+        mats = _materiales(conn)
+        assert set(mats) == {"1000001", "1000003", "1000004"}
+        assert mats["1000001"]["updated_at"] == "viejo"
+        assert mats["1000003"]["updated_at"] != "viejo"
+        assert mats["1000003"]["stock_actual"] == 9
+        assert mats["1000001"]["id"] == ids["1000001"]
+        estado = conn.execute(
+            "SELECT estado FROM materiales_mrp_estado WHERE codigo_material = '1000003'"
+        ).fetchone()[0]
+        assert estado == "Sobrestock Crítico"
+        assert conn.execute("SELECT COUNT(*) FROM materiales_mrp_estado").fetchone()[0] == 3
+
+    def test_reimportacion_respeta_parametros_aceptados(self, fuentes):
+        conn, _ = fuentes
+        imp.import_mrp_data(conn, max_workers=2)
+        consumo = mrp_parametros.normalizar_consumo(
+            pd.DataFrame(
+                [("2024-01-05", 1008, 1, "1000001", 40), ("2024-02-05", 1008, 1, "1000001", 80)],
+                columns=["fecha", "centro", "almacen", "codigo_material", "cantidad"],
+            )
+        )
+        mrp_parametros.recalcular_parametros(conn, consumo)
+        sugerencia = mrp_parametros.listar_sugerencias(conn)["rows"][0]
+        mrp_parametros.revisar_sugerencias(conn, [sugerencia["id"]], True, "P1")
+
+        imp.import_mrp_data(conn, max_workers=2)
+        mat = _materiales(conn)["1000001"]
+        assert mat["punto_pedido"] == sugerencia["punto_pedido_sugerido"] != 10
+        assert mat["stock_maximo"] == sugerencia["stock_maximo_sugerido"]
+        assert _materiales(conn)["1000002"]["punto_pedido"] == 0
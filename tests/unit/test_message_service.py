@@ -0,0 +1,150 @@
+"""
+Tests para hilos de mensajes (backend_v2/services/message_service.py y
+backend_v2/services/message_threads.py)
+
+Verifica:
+- get_thread recorre respuestas a cualquier profundidad en un solo CTE
+- Borrar un mensaje intermedio no deja huérfanas a sus respuestas
+- Nombres desde el directorio de usuarios cacheado
+- Resumen message_threads: último mensaje, participantes y no leídos
+- Reconstrucción del resumen desde mensajes
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.core.cache import catalog_cache
+from backend_v2.services.message_service import MessageService
+from backend_v2.services.message_threads import MessageThreadService
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """BD temporal con usuarios, solicitudes y mensajes"""
+    path = tmp_path / "mensajes.db"
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE usuarios (id_spm TEXT PRIMARY KEY, nombre TEXT, apellido TEXT, rol TEXT);
+        CREATE TABLE solicitudes (id INTEGER PRIMARY KEY, justificacion TEXT);
+        CREATE TABLE mensajes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            remitente_id TEXT NOT NULL,
+            destinatario_id TEXT NOT NULL,
+            solicitud_id INTEGER,
+            asunto TEXT NOT NULL,
+            mensaje TEXT NOT NULL,
+            parent_id INTEGER,
+            leido INTEGER DEFAULT 0,
+            tipo TEXT DEFAULT 'mensaje',
+            metadata_json TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+        INSERT INTO usuarios VALUES ('1', 'Ana', 'Admin', 'Admin');
+        INSERT INTO usuarios VALUES ('2', 'Laura', 'Planner', 'Planificador');
+        """
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(MessageService, "_get_db_path", staticmethod(lambda: path))
+    catalog_cache.clear()
+    return path
+
+
+class TestGetThread:
+    """Tests para get_thread"""
+
+    def test_incluye_respuestas_anidadas(self, db):
+        root = MessageService.send_message("1", "2", "Consulta", "hola")
+        r1 = MessageService.send_message("2", "1", "Re: Consulta", "respuesta", parent_id=root)
+        MessageService.send_message("1", "2", "Re: Re: Consulta", "otra", parent_id=r1)
+
+        thread = MessageService.get_thread(root, "2")
+
+        assert [m["mensaje"] for m in thread] == ["hola", "respuesta", "otra"]
+        assert thread[0]["id"] == root
+        assert thread[0]["remitente_nombre"] == "Ana"
+        assert thread[0]["destinatario_nombre"] == "Laura"
+
+    def test_borrar_mensaje_intermedio_conserva_respuestas(self, db):
+        root = MessageService.send_message("1", "2", "Consulta", "hola")
+        r1 = MessageService.send_message("2", "1", "Re", "respuesta", parent_id=root)
+        MessageService.send_message("1", "2", "Re: Re", "otra", parent_id=r1)
+
+        assert MessageService.delete_message(r1, "2") is True
+
+        assert [m["mensaje"] for m in MessageService.get_thread(root, "2")] == ["hola", "otra"]
+        threads = MessageService.get_threads("2")
+        assert [(t["thread_id"], t["message_count"]) for t in threads] == [(root, 2)]
+
+    def test_directorio_se_invalida(self, db):
+        MessageService.send_message("1", "2", "Consulta", "hola")
+        assert MessageService.get_inbox("2")[0]["remitente_nombre"] == "Ana"
+
+        conn = sqlite3.connect(db)
+        conn.execute("UPDATE usuarios SET nombre = 'Ana María' WHERE id_spm = '1'")
+        conn.commit()
+        conn.close()
+        MessageService.invalidate_user_directory()
+        assert MessageService.get_inbox("2")[0]["remitente_nombre"] == "Ana María"
+
+    def test_sin_permiso(self, db):
+        root = MessageService.send_message("1", "2", "Consulta", "hola")
+        assert MessageService.get_thread(root, "99") == []
+
+    def test_inbox_con_nombres(self, db):
+        MessageService.send_message("1", "2", "Consulta", "hola")
+        inbox = MessageService.get_inbox("2")
+        assert inbox[0]["remitente_nombre"] == "Ana"
+        assert inbox[0]["remitente_rol"] == "Admin"
+
+
+class TestThreadSummary:
+    """Tests para el resumen materializado de hilos"""
+
+    def test_resumen_por_participante(self, db):
+        root = MessageService.send_message("1", "2", "Consulta", "hola")
+        MessageService.send_message("1", "2", "Re: Consulta", "¿novedades?", parent_id=root)
+
+        threads = MessageService.get_threads("2")
+
+        assert len(threads) == 1
+        assert threads[0]["thread_id"] == root
+        assert threads[0]["message_count"] == 2
+        assert threads[0]["unread_count"] == 2
+        assert threads[0]["last_preview"] == "¿novedades?"
+        assert {p["id"] for p in threads[0]["participants"]} == {"1", "2"}
+        assert MessageService.get_threads("1")[0]["unread_count"] == 0
+
+    def test_mark_read_y_delete_actualizan(self, db):
+        root = MessageService.send_message("1", "2", "Consulta", "hola")
+        reply = MessageService.send_message("1", "2", "Re", "segundo", parent_id=root)
+
+        MessageService.mark_as_read(root, "2")
+        assert MessageService.get_threads("2")[0]["unread_count"] == 1
+
+        MessageService.delete_message(reply, "1")
+        thread = MessageService.get_threads("2")[0]
+        assert thread["message_count"] == 1
+        assert thread["unread_count"] == 0
+        assert thread["last_message_id"] == root
+
+    def test_rebuild_coincide_con_incremental(self, db):
+        root = MessageService.send_message("1", "2", "Consulta", "hola")
+        MessageService.send_message("2", "1", "Re", "resp", parent_id=root)
+        MessageService.send_message("2", "1", "Otro", "nuevo hilo")
+        antes = MessageService.get_threads("1")
+
+        assert MessageThreadService.rebuild(str(db)) == 2
+        despues = MessageService.get_threads("1")
+
+        def clave(t):
+            return (t["thread_id"], t["message_count"], t["unread_count"])
+
+        assert sorted(map(clave, antes)) == sorted(map(clave, despues))
@@ -0,0 +1,237 @@
+"""
+Tests para la clasificación de alertas MRP en SQL (services/mrp_alertas.py)
+
+Verifica:
+- El CASE de SQL clasifica igual que calcular_estado_material
+- Filtro por estado, conteos y paginación resueltos en la consulta
+- El estado materializado coincide y los triggers recalculan solo lo afectado
+"""
+
+import random
+import sqlite3
+import sys
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.routes.mrp import calcular_estado_material
+from backend_v2.services.mrp_alertas import (ESTADOS_MRP, consultar_alertas,
+                                             ensure_estado_schema,
+                                             estados_para_filtro,
+                                             refrescar_estados,
+                                             resumen_desde_conteos)
+
+
+@pytest.fixture
+def mrp_conn():
+    """BD en memoria con materiales MRP aleatorios (incluye NULLs y bordes)"""
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        """
+        CREATE TABLE materiales_mrp (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, sector TEXT, almacen INTEGER,
+            centro INTEGER, codigo_material TEXT, descripcion TEXT,
+            stock_seguridad INTEGER, punto_pedido INTEGER, stock_maximo INTEGER,
+            stock_actual INTEGER, pedidos_en_curso INTEGER,
+            consumo_promedio_mensual REAL, lead_time_dias INTEGER,
+            critico TEXT, ubicacion TEXT
+        )
+        """
+    )
+    rng = random.Random(7)
+
+    def valor(hi):
+        return rng.choice([None, 0, rng.randint(0, hi), rng.randint(0, hi)])
+
+    filas = []
+    for i in range(600):
+        filas.append(
+            (
+                rng.choice(["Mant", "Prod"]),
+                rng.choice([1, 2]),
+                rng.choice([1008, 1050]),
+                f"{i:05d}",
+                f"Material {i}",
+                valor(20),
+                valor(40),
+                valor(60),
+                rng.choice([None, -1, 0, rng.randint(0, 200), rng.randint(50, 2000)]),
+                valor(30),
+                rng.choice([None, 0, 0.5, round(rng.uniform(0, 50), 2), 3]),
+            )
+        )
+    # Borde exacto de cobertura: 24 meses con consumo mensual 3 (stock 6 -> 24.0)
+    filas.append(("Mant", 1, 1008, "99999", "Borde", 0, 0, 0, 6, 0, 3))
+    filas.append(("Mant", 1, 1008, "99998", "Bajo seguridad", 10, 0, 0, 5, 0, 1))
+    conn.executemany(
+        """
+        INSERT INTO materiales_mrp (sector, almacen, centro, codigo_material, descripcion,
+            stock_seguridad, punto_pedido, stock_maximo, stock_actual, pedidos_en_curso,
+            consumo_promedio_mensual)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        filas,
+    )
+    yield conn
+    conn.close()
+
+
+def _esperados(conn, centro=None):
+    """Clasificación de referencia fila por fila"""
+    sql = "SELECT * FROM materiales_mrp"
+    params = []
+    if centro:
+        sql += " WHERE centro = ?"
+        params.append(centro)
+    resultado = {}
+    for r in conn.execute(sql, params):
+        resultado[(r["codigo_material"], r["centro"], r["almacen"])] = calcular_estado_material(
+            stock_actual=r["stock_actual"] or 0,
+            stock_seguridad=r["stock_seguridad"] or 0,
+            punto_pedido=r["punto_pedido"] or 0,
+            stock_maximo=r["stock_maximo"] or 0,
+            consumo_promedio=r["consumo_promedio_mensual"] or 0,
+            pedidos_en_curso=r["pedidos_en_curso"] or 0,
+        )["estado"]
+    return resultado
+
+
+class TestClasificacion:
+    """El CASE de SQL coincide con calcular_estado_material"""
+
+    def test_igual_a_funcion_por_fila(self, mrp_conn):
+        rows = consultar_alertas(mrp_conn, limit=10000)["rows"]
+        obtenidos = {(r["codigo"], r["centro"], r["almacen"]): r["estado"] for r in rows}
+        esperados = _esperados(mrp_conn)
+        assert obtenidos == esperados
+        assert len(set(esperados.values())) == 7  # Los datos cubren todos los estados
+        assert obtenidos[("99999", 1008, 1)] == "Normal"
+
+    def test_conteos_por_estado(self, mrp_conn):
+        conteos = consultar_alertas(mrp_conn, centro=1008, limit=1)["conteos"]
+        assert conteos == dict(Counter(_esperados(mrp_conn, centro=1008).values()))
+
+
+class TestFiltroYPaginacion:
+    """Filtro de estado y paginación en la consulta"""
+
+    def test_filtro_por_subcadena(self, mrp_conn):
+        assert estados_para_filtro("bajo") == [
+            "Bajo Punto de Pedido",
+            "Bajo Stock de Seguridad",
+            "Bajo Consumo",
+        ]
+        assert estados_para_filtro("Todos") is None
+        assert estados_para_filtro("inexistente") == []
+
+        resultado = consultar_alertas(mrp_conn, estado="bajo", limit=10000)
+        esperados = [e for e in _esperados(mrp_conn).values() if "bajo" in e.lower()]
+        assert sorted(r["estado"] for r in resultado["rows"]) == sorted(esperados)
+        assert resumen_desde_conteos(resultado["conteos"])["total"] == len(esperados)
+
+    def test_estado_sin_coincidencias(self, mrp_conn):
+        assert consultar_alertas(mrp_conn, estado="inexistente") == {"rows": [], "conteos": {}}
+
+    def test_paginas_consecutivas(self, mrp_conn):
+        completo = [r["codigo"] for r in consultar_alertas(mrp_conn, centro=1050, limit=10000)["rows"]]
+        paginas = []
+        for offset in range(0, len(completo), 40):
+            paginas.extend(
+                r["codigo"]
+                for r in consultar_alertas(mrp_conn, centro=1050, limit=40, offset=offset)["rows"]
+            )
+        assert paginas == completo == sorted(completo)
+
+    def test_resumen(self):
+        resumen = resumen_desde_conteos(
+            {"Quiebre de Stock": 2, "Exceso de Stock": 1, "Sobrestock Crítico": 3, "Normal": 4}
+        )
+        assert resumen == {
+            "total": 10,
+            "quiebre_stock": 2,
+            "bajo_punto_pedido": 0,
+            "bajo_stock_seguridad": 0,
+            "sobrestock": 4,
+            "normal": 4,
+        }
+
+
+class TestEstadoMaterializado:
+    """Tests de materiales_mrp_estado y sus triggers"""
+
+    @staticmethod
+    def _estado(conn, codigo):
+        return conn.execute(
+            """
+            SELECT e.estado, e.estado_clase, e.rotacion FROM materiales_mrp_estado e
+            JOIN materiales_mrp m ON m.id = e.material_id WHERE m.codigo_material = ?
+            """,
+            (codigo,),
+        ).fetchone()
+
+    def test_misma_respuesta_que_al_vuelo(self, mrp_conn):
+        al_vuelo = consultar_alertas(mrp_conn, centro=1008, estado="bajo", limit=10000)
+        assert ensure_estado_schema(mrp_conn) is True
+        assert ensure_estado_schema(mrp_conn) is False
+        materializado = consultar_alertas(mrp_conn, centro=1008, estado="bajo", limit=10000)
+
+        assert materializado["conteos"] == al_vuelo["conteos"]
+        assert [dict(r) for r in materializado["rows"]] == [dict(r) for r in al_vuelo["rows"]]
+        for r in materializado["rows"]:
+            assert (r["estado_clase"], r["sugerencia"]) == ESTADOS_MRP[r["estado"]]
+
+    def test_triggers_recalculan_solo_lo_afectado(self, mrp_conn):
+        ensure_estado_schema(mrp_conn)
+        assert self._estado(mrp_conn, "99999")["estado"] == "Normal"
+
+        # Un cambio que no afecta al estado no toca la fila materializada
+        mrp_conn.execute("UPDATE materiales_mrp_estado SET estado_clase = 'marca'")
+        mrp_conn.execute("UPDATE materiales_mrp SET descripcion = 'x' WHERE codigo_material = '99999'")
+        assert self._estado(mrp_conn, "99999")["estado_clase"] == "marca"
+
+        # Parámetro MRP editado: solo esa fila se recalcula
+        mrp_conn.execute("UPDATE materiales_mrp SET punto_pedido = 10 WHERE codigo_material = '99999'")
+        assert tuple(self._estado(mrp_conn, "99999")) == ("Bajo Punto de Pedido", "warning", 6.0)
+        assert self._estado(mrp_conn, "99998")["estado_clase"] == "marca"
+
+        mrp_conn.execute(
+            "INSERT INTO materiales_mrp (centro, almacen, codigo_material, stock_actual) "
+            "VALUES (1008, 1, 'NUEVO', 0)"
+        )
+        assert self._estado(mrp_conn, "NUEVO")["estado"] == "Quiebre de Stock"
+
+        mrp_conn.execute("DELETE FROM materiales_mrp WHERE codigo_material = '99998'")
+        total = mrp_conn.execute("SELECT COUNT(*) FROM materiales_mrp_estado").fetchone()[0]
+        assert total == mrp_conn.execute("SELECT COUNT(*) FROM materiales_mrp").fetchone()[0]
+
+        # refrescar_estados repara filas puntuales
+        refrescar_estados(mrp_conn, [1, 2])
+        clases = [r[0] for r in mrp_conn.execute(
+            "SELECT estado_clase FROM materiales_mrp_estado WHERE material_id IN (1, 2)"
+        )]
+        assert "marca" not in clases
+
+    def test_reimportacion_actualiza_material_existente(self, mrp_conn):
+        ensure_estado_schema(mrp_conn)
+        mrp_conn.execute(
+            "CREATE UNIQUE INDEX idx_mrp_clave ON materiales_mrp (centro, almacen, codigo_material)"
+        )
+
+        # Mismo upsert que import_mrp_data: el trigger no debe chocar con la fila existente
+        mrp_conn.execute(
+            """
+            INSERT INTO materiales_mrp (sector, almacen, centro, codigo_material, stock_actual,
+                consumo_promedio_mensual)
+            VALUES ('Mant', 1, 1008, '99999', 0, 3)
+            ON CONFLICT(centro, almacen, codigo_material) DO UPDATE SET
+                stock_actual = excluded.stock_actual
+            WHERE materiales_mrp.stock_actual IS NOT excluded.stock_actual
+            """
+        )
+        assert self._estado(mrp_conn, "99999")["estado"] == "Quiebre de Stock"
+        total = mrp_conn.execute("SELECT COUNT(*) FROM materiales_mrp_estado").fetchone()[0]
+        assert total == mrp_conn.execute("SELECT COUNT(*) FROM materiales_mrp").fetchone()[0]
@@ -0,0 +1,150 @@
+"""
+Tests para los KPIs MRP (services/mrp_kpis.py)
+
+Verifica:
+- KPIs calculados desde materiales_mrp, solpeds y purchase_orders
+- Todos los centros en un lote y el total como suma de los centros
+- Cache por período invalidada por la versión de datos de referencia
+"""
+
+import sqlite3
+import sys
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.core.cache import analysis_cache
+from backend_v2.core.repository import ReferenceDataRepository
+from backend_v2.services import mrp_kpis
+from backend_v2.services.mrp_alertas import ensure_estado_schema
+from backend_v2.services.mrp_kpis import kpis_centro, kpis_todos_los_centros
+
+HOY = date(2024, 6, 30)
+
+
+@pytest.fixture
+def kpi_conn(tmp_path):
+    """BD con dos centros, solpeds y órdenes de compra"""
+    conn = sqlite3.connect(tmp_path / "spm.db")
+    conn.row_factory = sqlite3.Row
+    conn.executescript(
+        """
+        CREATE TABLE materiales_mrp (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, sector TEXT, almacen INTEGER,
+            centro INTEGER, codigo_material TEXT, descripcion TEXT,
+            stock_seguridad INTEGER, punto_pedido INTEGER, stock_maximo INTEGER,
+            stock_actual INTEGER, pedidos_en_curso INTEGER,
+            consumo_promedio_mensual REAL, lead_time_dias INTEGER
+        );
+        INSERT INTO materiales_mrp (centro, almacen, codigo_material, stock_seguridad,
+            punto_pedido, stock_maximo, stock_actual, pedidos_en_curso,
+            consumo_promedio_mensual, lead_time_dias) VALUES
+            (1008, 1, 'A', 0, 0, 0, 0, 0, 10, 20),      -- Quiebre
+            (1008, 1, 'B', 0, 0, 10, 40, 0, 5, 40),     -- Sobrestock Crítico
+            (1008, 1, 'C', 0, 0, 100, 60, 0, 5, NULL),  -- Normal
+            (1050, 1, 'D', 0, 20, 0, 10, 0, 1, 30);     -- Bajo Punto de Pedido
+        CREATE TABLE solicitudes (id INTEGER PRIMARY KEY, centro TEXT);
+        INSERT INTO solicitudes VALUES (1, '1008'), (2, '1050');
+        CREATE TABLE solpeds (
+            id INTEGER PRIMARY KEY, solicitud_id INTEGER, status TEXT,
+            created_at TEXT, updated_at TEXT
+        );
+        INSERT INTO solpeds (solicitud_id, status, created_at, updated_at) VALUES
+            (1, 'completada', '2024-06-10', '2024-06-14'),
+            (1, 'creada', '2024-06-20', '2024-06-20'),
+            (1, 'completada', '2024-01-01', '2024-01-03'),
+            (2, 'completada', '2024-06-01', '2024-06-03');
+        CREATE TABLE purchase_orders (
+            id INTEGER PRIMARY KEY, solicitud_id INTEGER, status TEXT,
+            created_at TEXT, updated_at TEXT
+        );
+        INSERT INTO purchase_orders (solicitud_id, status, created_at, updated_at) VALUES
+            (1, 'emitida', '2024-04-01', '2024-04-01'),
+            (1, 'emitida', '2024-06-25', '2024-06-25'),
+            (1, 'recibida', '2024-06-05', '2024-06-17'),
+            (2, 'recibida', '2024-06-10', '2024-06-16');
+        """
+    )
+    conn.commit()
+    analysis_cache.invalidate_pattern(f"{mrp_kpis.KEY_PREFIX}:")
+    yield conn
+    conn.close()
+
+
+class TestKpis:
+    """Tests de los valores calculados"""
+
+    def test_centro(self, kpi_conn):
+        kpis = kpis_centro(kpi_conn, "1008", "mes", HOY)["kpis"]
+
+        assert kpis["materiales_en_riesgo"]["valor"] == 33.3
+        assert kpis["materiales_sobrestock"]["valor"] == 33.3
+        assert kpis["rotacion_promedio"]["valor"] == 2.4  # 240 / 100
+        assert kpis["lead_time_promedio"]["valor"] == 12.0
+        assert kpis["lead_time_promedio"]["objetivo"] == 30.0
+        assert kpis["cumplimiento_mrp"]["valor"] == 50.0
+        assert kpis["velocidad_respuesta"]["valor"] == 4.0
+        assert kpis["pedidos_vencidos"]["valor"] == 1
+        assert kpis["pct_pedidos_vencidos"]["valor"] == 50.0
+
+    def test_status_de_la_integracion(self, kpi_conn):
+        # La integración de compras escribe sus propios status; los anulados no cuentan
+        kpi_conn.executescript(
+            """
+            UPDATE solpeds SET status = 'Cerrada' WHERE status = 'completada';
+            UPDATE purchase_orders SET status = 'Entregada' WHERE status = 'recibida';
+            UPDATE purchase_orders SET status = 'EMITIDA' WHERE created_at = '2024-04-01';
+            INSERT INTO solpeds (solicitud_id, status, created_at, updated_at)
+                VALUES (1, 'cancelada', '2024-06-11', '2024-06-30');
+            INSERT INTO purchase_orders (solicitud_id, status, created_at, updated_at)
+                VALUES (1, 'Anulada', '2024-06-05', '2024-06-29');
+            """
+        )
+        kpis = kpis_centro(kpi_conn, "1008", "mes", HOY)["kpis"]
+
+        assert kpis["lead_time_promedio"]["valor"] == 12.0
+        assert kpis["cumplimiento_mrp"]["valor"] == 33.3
+        assert kpis["velocidad_respuesta"]["valor"] == 4.0
+        assert kpis["pedidos_vencidos"]["valor"] == 1
+
+    def test_lote_y_total(self, kpi_conn):
+        lote = kpis_todos_los_centros(kpi_conn, "trimestre", HOY)
+
+        assert set(lote["centros"]) == {"1008", "1050"}
+        assert lote["total"]["sumas"]["materiales"] == 4
+        assert lote["total"]["kpis"]["materiales_en_riesgo"]["valor"] == 50.0
+        assert lote["total"]["kpis"]["lead_time_promedio"]["valor"] == 9.0
+        assert kpis_centro(kpi_conn, None, "trimestre", HOY)["kpis"] == lote["total"]["kpis"]
+        assert kpis_centro(kpi_conn, "9999", "trimestre", HOY)["sumas"]["materiales"] == 0
+
+    def test_usa_estado_materializado(self, kpi_conn):
+        al_vuelo = kpis_centro(kpi_conn, None, "mes", HOY)["kpis"]
+        ensure_estado_schema(kpi_conn)
+        analysis_cache.invalidate_pattern(f"{mrp_kpis.KEY_PREFIX}:")
+        assert kpis_centro(kpi_conn, None, "mes", HOY)["kpis"] == al_vuelo
+
+
+class TestCache:
+    """Tests de la cache por período"""
+
+    def test_invalidada_por_version(self, kpi_conn, monkeypatch):
+        llamadas = []
+        original = mrp_kpis.agregar_centros
+        monkeypatch.setattr(
+            mrp_kpis, "agregar_centros", lambda *a: llamadas.append(1) or original(*a)
+        )
+
+        for centro in ("1008", "1050", None):
+            kpis_centro(kpi_conn, centro, "mes", HOY)
+        assert llamadas == [1]
+
+        kpi_conn.execute("UPDATE materiales_mrp SET stock_actual = 5 WHERE codigo_material = 'A'")
+        ReferenceDataRepository.bump(kpi_conn)
+        kpi_conn.commit()
+
+        kpis = kpis_centro(kpi_conn, "1008", "mes", HOY)["kpis"]
+        assert llamadas == [1, 1]
+        assert kpis["materiales_en_riesgo"]["valor"] == 0.0
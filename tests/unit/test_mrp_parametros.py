@@ -0,0 +1,174 @@
+"""
+Tests para el recálculo de parámetros MRP (services/mrp_parametros.py)
+
+Verifica:
+- Media y desvío por período (con períodos sin consumo = 0)
+- Stock de seguridad, punto de pedido y máximo desde lead time y nivel de servicio
+- Solo materiales con consumo; escritura por lotes con progreso
+- Revisión de sugerencias (en lotes) y registro de los parámetros aceptados
+"""
+
+import math
+import sqlite3
+import sys
+import warnings
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.core.repository import ReferenceDataRepository
+from backend_v2.services import mrp_parametros
+from backend_v2.services.mrp_parametros import (calcular_sugerencias,
+                                                estadisticas_demanda,
+                                                listar_sugerencias,
+                                                normalizar_consumo,
+                                                recalcular_parametros,
+                                                revisar_sugerencias)
+
+
+def _consumo(filas):
+    return normalizar_consumo(
+        pd.DataFrame(filas, columns=["fecha", "centro", "almacen", "codigo_material", "cantidad"])
+    )
+
+
+@pytest.fixture
+def consumo():
+    """Tres meses: A consume 10/20/30, B solo en marzo"""
+    return _consumo(
+        [
+            ("2024-01-05", 1008, 1, 100.0, 4),
+            ("2024-01-20", 1008, 1, 100.0, 6),
+            ("2024-02-10", 1008, 1, 100.0, 20),
+            ("2024-03-15", 1008, 1, 100.0, 30),
+            ("2024-03-01", 1008, 1, 200.0, 9),
+            ("no es fecha", 1008, 1, 200.0, 99),
+        ]
+    )
+
+
+@pytest.fixture
+def mrp_conn():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(
+        """
+        CREATE TABLE materiales_mrp (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, centro INTEGER, almacen INTEGER,
+            codigo_material TEXT, stock_seguridad INTEGER, punto_pedido INTEGER,
+            stock_maximo INTEGER, lead_time_dias INTEGER, updated_at TEXT,
+            UNIQUE(centro, almacen, codigo_material)
+        );
+        INSERT INTO materiales_mrp
+            (centro, almacen, codigo_material, stock_seguridad, punto_pedido,
+             stock_maximo, lead_time_dias) VALUES
+            (1008, 1, '100', 0, 0, 0, 30),
+            (1008, 1, '200', 5, 5, 5, NULL),
+            (1008, 1, '300', 1, 1, 1, 15),
+            (1050, 1, '100', 0, 0, 0, 30);
+        """
+    )
+    yield conn
+    conn.close()
+
+
+class TestEstadisticas:
+    """Tests de estadisticas_demanda()"""
+
+    def test_media_y_desvio(self, consumo):
+        stats = estadisticas_demanda(consumo).set_index("codigo_material")
+
+        assert stats.loc["100", "periodos"] == 3
+        assert stats.loc["100", "demanda_media"] == pytest.approx(20.0)
+        assert stats.loc["100", "demanda_desvio"] == pytest.approx(10.0)
+        # B: [0, 0, 9]
+        assert stats.loc["200", "demanda_media"] == pytest.approx(3.0)
+        assert stats.loc["200", "demanda_desvio"] == pytest.approx(math.sqrt(27))
+
+    def test_semanal(self, consumo):
+        stats = estadisticas_demanda(consumo, "semana")
+        assert stats["periodos"].iloc[0] == 11
+
+    def test_sin_consumo(self, consumo, mrp_conn):
+        materiales = pd.read_sql_query("SELECT * FROM materiales_mrp", mrp_conn)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            stats = estadisticas_demanda(consumo.head(0))
+            assert calcular_sugerencias(stats, materiales).empty
+
+
+class TestSugerencias:
+    """Tests de recalcular_parametros() y la revisión"""
+
+    def test_parametros_sugeridos(self, consumo, mrp_conn, monkeypatch):
+        monkeypatch.setattr(mrp_parametros, "BATCH_SIZE", 1)
+        avances = []
+
+        resumen = recalcular_parametros(
+            mrp_conn, consumo, nivel_servicio=0.95, progress=lambda e, t: avances.append((e, t))
+        )
+
+        assert (resumen["materiales"], resumen["sin_consumo"]) == (2, 2)
+        assert resumen["con_consumo"] == 2
+        assert avances == [(1, 2), (2, 2)]
+
+        filas = {
+            (r["centro"], r["codigo_material"]): r
+            for r in listar_sugerencias(mrp_conn, limit=10)["rows"]
+        }
+        a = filas[(1008, "100")]
+        z = 1.6448536269514722
+        seguridad = z * 10.0 * math.sqrt(30 / 30)
+        assert a["stock_seguridad_sugerido"] == math.ceil(seguridad)
+        assert a["punto_pedido_sugerido"] == math.ceil(20 / 30 * 30 + seguridad)
+        assert a["stock_maximo_sugerido"] == math.ceil(20 / 30 * 30 + seguridad + 20)
+        assert filas[(1008, "200")]["lead_time_dias"] == 30  # NULL -> default
+        # Sin consumo no hay sugerencia (ni en otro centro con el mismo código)
+        assert (1008, "300") not in filas
+        assert (1050, "100") not in filas
+
+    def test_aceptar_y_rechazar(self, consumo, mrp_conn):
+        recalcular_parametros(mrp_conn, consumo, centro=1008)
+        pendientes = listar_sugerencias(mrp_conn)["rows"]
+        assert len(pendientes) == 2
+        ids = {r["codigo_material"]: r["id"] for r in pendientes}
+
+        assert revisar_sugerencias(mrp_conn, [ids["100"]], True, "P1") == 1
+        assert revisar_sugerencias(mrp_conn, [ids["100"], ids["200"]], False, "P1") == 1
+
+        params = mrp_conn.execute(
+            "SELECT punto_pedido FROM materiales_mrp "
+            "WHERE centro = 1008 AND codigo_material = '100'"
+        ).fetchone()
+        sugerida = next(r for r in pendientes if r["id"] == ids["100"])
+        assert params[0] == sugerida["punto_pedido_sugerido"]
+        assert ReferenceDataRepository.get_version(mrp_conn) == 1
+        assert listar_sugerencias(mrp_conn)["total"] == 0
+        assert listar_sugerencias(mrp_conn, estado="rechazada")["rows"][0]["revisado_por"] == "P1"
+        aceptados = mrp_conn.execute(
+            "SELECT codigo_material, punto_pedido, aceptado_por "
+            f"FROM {mrp_parametros.ACEPTADOS_TABLE}"
+        ).fetchall()
+        assert aceptados == [("100", params[0], "P1")]
+
+        # Una nueva corrida vuelve a dejar todo pendiente
+        recalcular_parametros(mrp_conn, consumo, centro=1008)
+        assert listar_sugerencias(mrp_conn)["total"] == 2
+
+    def test_revision_en_lotes(self, consumo, mrp_conn, monkeypatch):
+        monkeypatch.setattr(mrp_parametros, "IDS_POR_LOTE", 1)
+        recalcular_parametros(mrp_conn, consumo)
+        ids = [r["id"] for r in listar_sugerencias(mrp_conn)["rows"]]
+
+        assert revisar_sugerencias(mrp_conn, ids + [999], True, "P1") == 2
+        assert ReferenceDataRepository.get_version(mrp_conn) == 1
+        total = mrp_conn.execute(
+            f"SELECT COUNT(*) FROM {mrp_parametros.ACEPTADOS_TABLE}"
+        ).fetchone()[0]
+        assert total == 2
+
+    def test_nivel_servicio_invalido(self, consumo, mrp_conn):
+        with pytest.raises(ValueError):
+            recalcular_parametros(mrp_conn, consumo, nivel_servicio=1.0)
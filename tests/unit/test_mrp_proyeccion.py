@@ -0,0 +1,126 @@
+"""
+Tests para la proyección de stock MRP (services/mrp_proyeccion.py)
+
+Verifica:
+- El quiebre vectorizado coincide con una simulación día a día
+- Paso semanal con interpolación dentro del paso
+- Fechas, orden por urgencia, filtro y paginación de consultar_proyeccion
+"""
+
+import random
+import sqlite3
+import sys
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.services.mrp_proyeccion import consultar_proyeccion, proyectar
+
+
+def _simular(stock, pedidos, consumo, lead_time, horizonte):
+    """Referencia: recorre los días uno por uno"""
+    diario = consumo / 30
+    for dia in range(horizonte + 1):
+        nivel = stock - diario * dia + (pedidos if dia >= lead_time else 0)
+        if nivel <= 0:
+            if dia == 0:
+                return 0
+            previo = stock - diario * (dia - 1) + (pedidos if dia - 1 >= lead_time else 0)
+            return int(np.floor(dia - 1 + min(previo / diario, 1)))
+    return None
+
+
+class TestProyectar:
+    """Tests del motor vectorizado"""
+
+    def test_igual_a_simulacion_diaria(self):
+        rng = random.Random(3)
+        filas = [
+            (
+                rng.choice([-2, 0, rng.randint(0, 300)]),
+                rng.choice([0, rng.randint(0, 80)]),
+                rng.choice([0.0, round(rng.uniform(0, 40), 2)]),
+                rng.randint(1, 60),
+            )
+            for _ in range(2000)
+        ]
+        stock, pedidos, consumo, lead = (np.array(c, dtype=float) for c in zip(*filas))
+
+        resultado = proyectar(stock, pedidos, consumo, lead, horizonte_dias=120, chunk=300)
+
+        for i, fila in enumerate(filas):
+            esperado = _simular(*fila, horizonte=120)
+            obtenido = resultado["dias_cobertura"][i]
+            assert (None if np.isnan(obtenido) else int(obtenido)) == esperado
+
+    def test_paso_semanal_y_pedidos(self):
+        # 30/mes = 1/día; 10 de stock y 50 en camino a los 20 días
+        args = [np.array([v], dtype=float) for v in (10, 50, 30, 20)]
+        assert proyectar(*args, horizonte_dias=90, paso_dias=7)["dias_cobertura"][0] == 10
+
+        # El pedido llega antes del quiebre: cubre hasta el día 60
+        args = [np.array([v], dtype=float) for v in (30, 30, 30, 20)]
+        resultado = proyectar(*args, horizonte_dias=90, paso_dias=7)
+        assert resultado["dias_cobertura"][0] == 60
+        assert resultado["dias_para_pedir"][0] == 40
+
+        sin_quiebre = proyectar(*args, horizonte_dias=45)
+        assert np.isnan(sin_quiebre["dias_cobertura"][0])
+
+
+@pytest.fixture
+def mrp_conn():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.executescript(
+        """
+        CREATE TABLE materiales_mrp (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, sector TEXT, almacen INTEGER,
+            centro INTEGER, codigo_material TEXT, descripcion TEXT,
+            stock_actual INTEGER, pedidos_en_curso INTEGER,
+            consumo_promedio_mensual REAL, lead_time_dias INTEGER
+        );
+        INSERT INTO materiales_mrp
+            (sector, almacen, centro, codigo_material, descripcion, stock_actual,
+             pedidos_en_curso, consumo_promedio_mensual, lead_time_dias) VALUES
+            ('Mant', 1, 1008, 'A', 'Sin consumo', 10, 0, 0, 30),
+            ('Mant', 1, 1008, 'B', 'Quiebre', 0, 0, 3, 30),
+            ('Mant', 1, 1008, 'C', 'Atrasado', 15, 0, 30, 30),
+            ('Mant', 1, 1008, 'D', 'Holgado', 100, 0, 30, NULL),
+            ('Prod', 2, 1050, 'E', 'Otro centro', 5, 0, 30, 10);
+        """
+    )
+    yield conn
+    conn.close()
+
+
+class TestConsultarProyeccion:
+    """Tests de consultar_proyeccion()"""
+
+    def test_orden_fechas_y_resumen(self, mrp_conn):
+        resultado = consultar_proyeccion(mrp_conn, centro=1008, hoy=date(2024, 1, 1))
+
+        assert [r["codigo"] for r in resultado["rows"]] == ["B", "C", "D", "A"]
+        atrasado = resultado["rows"][1]
+        assert atrasado["dias_cobertura"] == 15
+        assert atrasado["fecha_quiebre"] == "2024-01-16"
+        assert atrasado["fecha_ultimo_pedido"] == "2023-12-17"
+        assert atrasado["pedido_atrasado"] is True
+        assert resultado["rows"][2]["lead_time_dias"] == 30  # NULL -> default
+        assert resultado["rows"][3]["fecha_quiebre"] is None
+        assert resultado["resumen"]["con_quiebre"] == 3
+        assert resultado["resumen"]["quiebre_actual"] == 1
+        assert resultado["total"] == 4
+
+    def test_solo_quiebre_paginacion_y_serie(self, mrp_conn):
+        resultado = consultar_proyeccion(
+            mrp_conn, solo_quiebre=True, limit=2, offset=1, paso="semana",
+            horizonte_dias=30, incluir_serie=True,
+        )
+        assert resultado["total"] == 3
+        assert [r["codigo"] for r in resultado["rows"]] == ["C", "E"]
+        assert resultado["rows"][0]["serie"] == [15.0, 8.0, 1.0, -6.0, -13.0, -15.0]
@@ -0,0 +1,165 @@
+"""
+Tests para el rebalanceo de stock entre ubicaciones (services/mrp_rebalanceo.py)
+
+Verifica:
+- Excedente y necesidad desde el estado MRP de cada ubicación
+- Cobertura con el mismo material y con equivalentes (en el sentido del catálogo)
+- El problema de transporte prefiere pocos traslados grandes
+- Persistencia, listado paginado y revisión de sugerencias
+- Los traslados aceptados no ejecutados no se vuelven a sugerir
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.services import mrp_rebalanceo
+from backend_v2.services.mrp_rebalanceo import (calcular_rebalanceo,
+                                                cargar_posiciones,
+                                                ejecutar_traslados,
+                                                listar_traslados,
+                                                recalcular_rebalanceo,
+                                                revisar_traslados)
+
+# centro, almacen, codigo, stock_actual, pedidos, punto_pedido, stock_maximo
+MATERIALES = [
+    (1008, 1, "100", 30, 0, 5, 10),  # Sobrestock Crítico: excedente 20
+    (1050, 1, "100", 0, 0, 5, 12),  # Quiebre: necesidad 12
+    (1008, 2, "100", 2, 1, 5, 8),  # Bajo Punto de Pedido: necesidad 5
+    (1060, 1, "200", 12, 0, 5, 10),  # Exceso: excedente 2
+    (1050, 1, "0300", 0, 0, 4, 4),  # Quiebre, equivalente de 200
+    (1050, 1, "400", 0, 0, 3, 3),  # Quiebre sin excedente en ninguna parte
+    (1008, 1, "500", 40, 0, 5, 10),  # Excedente de un material base
+    (1050, 1, "600", 0, 0, 3, 3),  # 600 no puede reemplazarse por 500
+    (1008, 1, "700", 30, 0, 5, 20),  # Excedente 10
+    (1008, 3, "700", 34, 0, 5, 30),  # Excedente 4
+    (1050, 2, "700", 1, 0, 2, 5),  # Necesidad 4
+    (1060, 2, "700", 0, 0, 5, 10),  # Necesidad 10
+    (1070, 1, "100", 6, 0, 5, 10),  # Normal
+]
+
+EQUIVALENCIAS = pd.DataFrame(
+    {
+        "codigo_base_norm": ["300", "500", "999"],
+        "codigo_equivalente_norm": ["200", "600", "100"],
+    }
+)
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        """
+        CREATE TABLE materiales_mrp (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, centro INTEGER, almacen INTEGER,
+            codigo_material TEXT, descripcion TEXT, stock_seguridad INTEGER,
+            punto_pedido INTEGER, stock_maximo INTEGER, stock_actual INTEGER,
+            pedidos_en_curso INTEGER, consumo_promedio_mensual REAL
+        )
+        """
+    )
+    conn.executemany(
+        """
+        INSERT INTO materiales_mrp
+            (centro, almacen, codigo_material, descripcion, stock_seguridad, punto_pedido,
+             stock_maximo, stock_actual, pedidos_en_curso, consumo_promedio_mensual)
+        VALUES (?, ?, ?, ?, 0, ?, ?, ?, ?, 0)
+        """,
+        [(c, a, cod, f"Mat {cod}", pp, mx, st, ped) for c, a, cod, st, ped, pp, mx in MATERIALES],
+    )
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _traslados(df):
+    return sorted(
+        (
+            r.material_origen, r.origen_centro, r.origen_almacen,
+            r.material, r.destino_centro, r.destino_almacen, r.cantidad,
+        )
+        for r in df.itertuples()
+    )
+
+
+class TestCalculo:
+    """Posiciones y asignación"""
+
+    def test_posiciones(self, conn):
+        posiciones = cargar_posiciones(conn).set_index(["codigo_material", "centro", "almacen"])
+        assert posiciones.loc[("100", 1008, 1), ["excedente", "necesidad"]].tolist() == [20, 0]
+        assert posiciones.loc[("100", 1008, 2), "necesidad"] == 5
+        assert posiciones.loc[("0300", 1050, 1), "codigo_norm"] == "300"
+        assert ("100", 1070, 1) not in posiciones.index
+
+    def test_traslados(self, conn):
+        traslados = calcular_rebalanceo(conn, EQUIVALENCIAS)["traslados"]
+        assert _traslados(traslados) == [
+            ("100", 1008, 1, "100", 1008, 2, 5.0),
+            ("100", 1008, 1, "100", 1050, 1, 12.0),
+            ("200", 1060, 1, "0300", 1050, 1, 2.0),
+            ("700", 1008, 1, "700", 1060, 2, 10.0),
+            ("700", 1008, 3, "700", 1050, 2, 4.0),
+        ]
+        assert traslados.loc[traslados["material"] == "0300", "equivalente"].tolist() == [1]
+
+    def test_sin_equivalencias(self, conn):
+        traslados = calcular_rebalanceo(conn)["traslados"]
+        assert "0300" not in traslados["material"].tolist()
+        assert len(traslados) == 4
+
+    def test_sin_posiciones(self, conn):
+        conn.execute("DELETE FROM materiales_mrp")
+        assert calcular_rebalanceo(conn, EQUIVALENCIAS)["traslados"].empty
+
+
+class TestPersistencia:
+    """Corridas, listado y revisión"""
+
+    def test_recalcular_listar_revisar(self, conn):
+        resumen = recalcular_rebalanceo(conn, EQUIVALENCIAS)
+        assert (resumen["traslados"], resumen["con_equivalente"]) == (5, 1)
+        assert (resumen["necesidad_total"], resumen["cantidad_trasladada"]) == (41.0, 33.0)
+
+        pagina = listar_traslados(conn, limit=2)
+        assert pagina["total"] == 5
+        assert [r["destino_estado"] for r in pagina["rows"]] == ["Quiebre de Stock"] * 2
+        assert pagina["rows"][0]["cantidad"] == 12.0
+        assert listar_traslados(conn, centro=1060)["total"] == 2
+        assert listar_traslados(conn, codigo="200")["total"] == 1
+
+        ids = [r["id"] for r in pagina["rows"]]
+        assert revisar_traslados(conn, ids, True, "P1") == 2
+        assert revisar_traslados(conn, ids, False, "P1") == 0
+
+        # Una nueva corrida reemplaza solo los pendientes y no repite los aceptados
+        recalcular_rebalanceo(conn, EQUIVALENCIAS)
+        assert listar_traslados(conn, estado=mrp_rebalanceo.ESTADO_ACEPTADA)["total"] == 2
+        assert listar_traslados(conn)["total"] == 3
+        assert listar_traslados(conn, estado=None)["total"] == 5
+
+    def test_aceptados_en_curso(self, conn):
+        recalcular_rebalanceo(conn, EQUIVALENCIAS)
+        grande = listar_traslados(conn, limit=1)["rows"][0]
+        assert (grande["material"], grande["cantidad"]) == ("100", 12.0)
+        assert revisar_traslados(conn, [grande["id"]], True, "P1") == 1
+
+        # El aceptado descuenta excedente del origen y necesidad del destino
+        posiciones = cargar_posiciones(conn).set_index(["codigo_material", "centro", "almacen"])
+        assert posiciones.loc[("100", 1008, 1), "excedente"] == 8
+        assert ("100", 1050, 1) not in posiciones.index
+        traslados = calcular_rebalanceo(conn, EQUIVALENCIAS)["traslados"]
+        assert ("100", 1008, 1, "100", 1050, 1, 12.0) not in _traslados(traslados)
+        assert ("100", 1008, 1, "100", 1008, 2, 5.0) in _traslados(traslados)
+
+        # Ejecutado, el stock movido lo refleja la próxima importación MRP
+        assert ejecutar_traslados(conn, [grande["id"]], "P1") == 1
+        assert ejecutar_traslados(conn, [grande["id"]], "P1") == 0
+        traslados = calcular_rebalanceo(conn, EQUIVALENCIAS)["traslados"]
+        assert ("100", 1008, 1, "100", 1050, 1, 12.0) in _traslados(traslados)
@@ -0,0 +1,107 @@
+"""
+Tests para NotificationService.create_notifications_bulk
+(backend_v2/services/notification_service.py)
+
+Verifica:
+- Inserción del lote en una transacción
+- Deduplicación de destinatarios
+- Un único evento publicado por lote
+- Contadores de no leídos actualizados
+- Helpers notify_* por lote y listener del stream SSE
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.services.notification_service import (NotificationService,
+                                                      notify_solicitud_created,
+                                                      notify_solicitud_rejected)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """BD temporal con la tabla notificaciones"""
+    path = tmp_path / "notif.db"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        """
+        CREATE TABLE notificaciones(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            destinatario_id TEXT NOT NULL,
+            solicitud_id INTEGER,
+            mensaje TEXT NOT NULL,
+            leido INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            tipo TEXT DEFAULT 'info'
+        )
+        """
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(NotificationService, "_db_path", staticmethod(lambda: path))
+    return path
+
+
+@pytest.fixture
+def events():
+    """Captura los eventos publicados por el servicio"""
+    received = []
+    NotificationService.add_listener(received.append)
+    yield received
+    NotificationService.remove_listener(received.append)
+
+
+class TestCreateNotificationsBulk:
+    """Tests para create_notifications_bulk"""
+
+    def test_crea_una_por_destinatario(self, db, events):
+        ids = NotificationService.create_notifications_bulk(
+            ["1", "2", "2", "", "3"], mensaje="Aprobar BUR", tipo="warning"
+        )
+
+        assert len(ids) == 3
+        conn = sqlite3.connect(db)
+        rows = conn.execute(
+            "SELECT destinatario_id, tipo FROM notificaciones ORDER BY id"
+        ).fetchall()
+        conn.close()
+        assert rows == [("1", "warning"), ("2", "warning"), ("3", "warning")]
+
+    def test_publica_un_solo_evento(self, db, events):
+        NotificationService.create_notifications_bulk(["1", "2"], mensaje="m")
+
+        assert len(events) == 1
+        assert [n["destinatario_id"] for n in events[0]] == ["1", "2"]
+
+    def test_actualiza_contadores(self, db, events):
+        NotificationService.create_notifications_bulk(["1", "2"], mensaje="m")
+        NotificationService.create_notifications_bulk(["1"], mensaje="m2")
+
+        assert NotificationService.get_unread_count("1") == 2
+        assert NotificationService.get_unread_count("2") == 1
+
+    def test_sin_destinatarios(self, db, events):
+        assert NotificationService.create_notifications_bulk([], mensaje="m") == []
+        assert events == []
+
+
+class TestHelpersYListeners:
+    """Helpers notify_* y registro del stream"""
+
+    def test_helpers_usan_el_lote(self, db, events):
+        notify_solicitud_created(7, ["a1", "a2", "a3"])
+        notify_solicitud_rejected(7, "s1", motivo="sin stock")
+
+        assert [len(lote) for lote in events] == [3, 1]
+        assert events[1][0]["mensaje"] == "Tu solicitud #7 ha sido rechazada: sin stock"
+        assert NotificationService.get_unread_count("a2") == 1
+
+    def test_stream_sse_registra_listener(self):
+        from backend_v2.routes import notificaciones
+
+        assert notificaciones._despertar_streams in NotificationService._listeners
@@ -0,0 +1,148 @@
+"""
+Tests para el cache versionado del análisis PASO 1
+(core/services/planner_analysis_cache.py)
+
+Verifica:
+- Hit mientras no cambian solicitud, presupuesto ni datos de referencia
+- Miss al cambiar cada una de las versiones
+- Solo las reservas de los materiales de la solicitud invalidan el análisis
+- Precálculo en segundo plano deja la apertura como hit, también en otro
+  worker (tabla compartida)
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.core import cache_loader, repository
+from backend_v2.core.cache import analysis_cache
+from backend_v2.core.repository import ReferenceDataRepository
+from backend_v2.core.services import planner_analysis_cache
+from backend_v2.core.services.planner_analysis_cache import (
+    get_analysis, precompute_analysis, schedule_precompute)
+
+
+@pytest.fixture
+def cache_db(tmp_path, monkeypatch):
+    """BD temporal con una solicitud y su presupuesto; paso_1 simulado"""
+    path = tmp_path / "analysis.db"
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE solicitudes (
+            id INTEGER PRIMARY KEY, centro TEXT, sector TEXT, almacen_virtual TEXT,
+            status TEXT, updated_at TEXT, data_json TEXT
+        );
+        CREATE TABLE presupuestos (
+            centro TEXT, sector TEXT, monto_usd REAL, saldo_usd REAL, version INTEGER DEFAULT 1
+        );
+        INSERT INTO solicitudes VALUES (
+            1, '1008', 'Mant', 'ALM0001', 'Aprobada', '2025-01-01T10:00:00',
+            '{"items": [{"codigo": "M1", "cantidad": 2}]}'
+        );
+        INSERT INTO presupuestos VALUES ('1008', 'Mant', 1000, 500, 1);
+        """
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(repository, "_db_path", lambda: path)
+
+    calls = []
+
+    def fake_paso_1(solicitud_id):
+        calls.append(solicitud_id)
+        return {"solicitud_id": solicitud_id, "calculo": len(calls)}
+
+    monkeypatch.setattr(planner_analysis_cache, "paso_1_analizar_solicitud", fake_paso_1)
+    analysis_cache.clear()
+    yield path, calls
+    analysis_cache.clear()
+
+
+def _exec(path, sql):
+    conn = sqlite3.connect(path)
+    conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+
+class TestGetAnalysis:
+    """Tests para get_analysis"""
+
+    def test_hit_sin_cambios(self, cache_db):
+        _, calls = cache_db
+        assert get_analysis(1) == get_analysis(1)
+        assert calls == [1]
+
+    def test_cambio_de_solicitud(self, cache_db):
+        path, calls = cache_db
+        get_analysis(1)
+        _exec(path, "UPDATE solicitudes SET updated_at = '2025-01-02T00:00:00' WHERE id = 1")
+        assert get_analysis(1)["calculo"] == 2
+
+    def test_cambio_de_presupuesto(self, cache_db):
+        path, calls = cache_db
+        get_analysis(1)
+        _exec(path, "UPDATE presupuestos SET saldo_usd = 100, version = version + 1")
+        get_analysis(1)
+        assert calls == [1, 1]
+
+    def test_cambio_de_datos_de_referencia(self, cache_db, monkeypatch):
+        _, calls = cache_db
+        get_analysis(1)
+        ReferenceDataRepository.bump()
+        get_analysis(1)
+        monkeypatch.setattr(cache_loader._loader, "snapshot_version", 99)
+        get_analysis(1)
+        assert len(calls) == 3
+        # Solo queda la versión vigente de la solicitud
+        assert analysis_cache.stats()["size"] == 1
+
+    def test_reservas_de_sus_materiales(self, cache_db):
+        path, calls = cache_db
+        get_analysis(1)
+        # ensure_tables crea las tablas de stock comprometido
+        repository.MaterialRepository.get_comprometido_batch(["M1"])
+        _exec(path, "INSERT INTO stock_comprometido VALUES ('M2', '1008', '1', 5, NULL)")
+        get_analysis(1)
+        assert calls == [1]
+        _exec(path, "INSERT INTO stock_comprometido VALUES ('M1', '1008', '1', 3, NULL)")
+        get_analysis(1)
+        assert calls == [1, 1]
+
+    def test_force_y_solicitud_inexistente(self, cache_db):
+        _, calls = cache_db
+        get_analysis(1)
+        get_analysis(1, force=True)
+        assert len(calls) == 2
+        with pytest.raises(ValueError, match="no encontrada"):
+            get_analysis(42)
+
+
+class TestPrecompute:
+    """Tests para el precálculo al aprobar"""
+
+    def test_precompute_deja_hit(self, cache_db):
+        _, calls = cache_db
+        assert precompute_analysis(1) is True
+        assert precompute_analysis(1) is False
+        get_analysis(1)
+        assert calls == [1]
+
+    def test_schedule_en_segundo_plano(self, cache_db):
+        _, calls = cache_db
+        schedule_precompute(1).result(timeout=5)
+        assert get_analysis(1)["calculo"] == 1
+        assert calls == [1]
+
+    def test_hit_en_otro_worker(self, cache_db):
+        _, calls = cache_db
+        precompute_analysis(1)
+        # Otro worker: cache en memoria vacío, misma BD
+        analysis_cache.clear()
+        assert get_analysis(1) == {"solicitud_id": 1, "calculo": 1}
+        assert calls == [1]
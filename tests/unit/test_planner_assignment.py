@@ -0,0 +1,146 @@
+"""
+Tests para el índice de asignaciones de planificadores
+(core/services/planner_assignment.py)
+
+Verifica:
+- Resolución exacta, con comodines y por prioridad; asignaciones inactivas ignoradas
+- El índice se construye una vez y se invalida explícitamente
+- Reasignación en bloque al dar de baja un planificador
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.core import repository
+from backend_v2.core.repository import PlanificadorAsignacionRepository
+from backend_v2.core.services import planner_assignment
+from backend_v2.core.services.planner_assignment import (
+    AssignmentIndex, invalidate_index, reasignar_planificador, resolve_planner)
+
+
+@pytest.fixture
+def asignaciones_db(tmp_path, monkeypatch):
+    """BD temporal con asignaciones y solicitudes abiertas"""
+    path = tmp_path / "asignaciones.db"
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE planificador_asignaciones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, planificador_id TEXT NOT NULL,
+            centro TEXT, sector TEXT, almacen_virtual TEXT,
+            prioridad INTEGER DEFAULT 1, activo BOOLEAN DEFAULT 1,
+            UNIQUE(planificador_id, centro, sector, almacen_virtual)
+        );
+        CREATE TABLE solicitudes (
+            id INTEGER PRIMARY KEY, centro TEXT, sector TEXT, almacen_virtual TEXT,
+            status TEXT, planner_id TEXT, updated_at TEXT
+        );
+        INSERT INTO planificador_asignaciones
+            (planificador_id, centro, sector, almacen_virtual, prioridad, activo) VALUES
+            ('P1', '1008', 'Mant', '', 1, 1),
+            ('P2', '1008', 'Mant', 'AV1', 1, 1),
+            ('P3', '1008', NULL, NULL, 1, 1),
+            ('P4', '*', 'Mant', NULL, 1, 1),
+            ('P5', '1050', 'Prod', NULL, 2, 1),
+            ('P6', '1050', 'Prod', '', 1, 1),
+            ('P7', '1064', 'Mant', NULL, 1, 0);
+        INSERT INTO solicitudes VALUES
+            (1, '1008', 'Mant', '', 'Aprobada', 'P1', NULL),
+            (2, '1008', 'Mant', '', 'En tratamiento', 'P1', NULL),
+            (3, '1008', 'Mant', '', 'Finalizada', 'P1', NULL),
+            (4, '1064', 'Mant', '', 'Aprobada', 'P2', NULL);
+        """
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(repository, "_db_path", lambda: path)
+    invalidate_index()
+    yield path
+    invalidate_index()
+
+
+class TestResolve:
+    """Tests de resolución contra el índice"""
+
+    def test_mas_especifica_primero(self, asignaciones_db):
+        assert resolve_planner("1008", "Mant", "AV1") == "P2"
+        assert resolve_planner("1008", "Mant", "AV9") == "P1"
+        assert resolve_planner("1008", "Compras") == "P3"
+        assert resolve_planner("1099", "Mant") == "P4"
+
+    def test_prioridad_e_inactivas(self, asignaciones_db):
+        assert resolve_planner("1050", "Prod") == "P6"  # prioridad 1 gana a 2
+        assert resolve_planner("1064", "Mant") == "P4"  # P7 inactiva
+
+    def test_sin_asignacion(self, asignaciones_db):
+        assert resolve_planner("1099", "Compras") == "Admin"
+        assert AssignmentIndex([]).resolve("1008", "Mant") == "Admin"
+
+    def test_no_consulta_la_tabla_en_cada_resolucion(self, asignaciones_db, monkeypatch):
+        resolve_planner("1008", "Mant")
+        llamadas = []
+        original = PlanificadorAsignacionRepository.list_activas
+        monkeypatch.setattr(
+            planner_assignment.PlanificadorAsignacionRepository,
+            "list_activas",
+            staticmethod(lambda conn=None: llamadas.append(1) or original(conn)),
+        )
+
+        for _ in range(20):
+            resolve_planner("1008", "Mant")
+        assert llamadas == []
+
+        conn = sqlite3.connect(asignaciones_db)
+        conn.execute("UPDATE planificador_asignaciones SET activo = 0 WHERE planificador_id = 'P1'")
+        conn.commit()
+        conn.close()
+        invalidate_index()
+        assert resolve_planner("1008", "Mant") == "P3"
+        assert llamadas == [1]
+
+
+class TestReasignacion:
+    """Tests de reasignar_planificador"""
+
+    @staticmethod
+    def _planners(path):
+        conn = sqlite3.connect(path)
+        rows = dict(conn.execute("SELECT id, planner_id FROM solicitudes").fetchall())
+        conn.close()
+        return rows
+
+    def test_con_reemplazo(self, asignaciones_db):
+        resultado = reasignar_planificador("P1", "P9")
+
+        assert resultado["asignaciones_transferidas"] == 1
+        assert resultado["asignaciones_desactivadas"] == 1
+        assert resultado["solicitudes_reasignadas"] == 2
+        assert self._planners(asignaciones_db) == {1: "P9", 2: "P9", 3: "P1", 4: "P2"}
+        assert resolve_planner("1008", "Mant") == "P9"
+
+    def test_reemplazo_repetido_no_duplica_comodines(self, asignaciones_db):
+        reasignar_planificador("P3", "P9")
+        conn = sqlite3.connect(asignaciones_db)
+        conn.execute("UPDATE planificador_asignaciones SET activo = 1 WHERE planificador_id = 'P3'")
+        conn.commit()
+        reasignar_planificador("P3", "P9")
+
+        filas = conn.execute(
+            "SELECT centro, sector, almacen_virtual, activo FROM planificador_asignaciones "
+            "WHERE planificador_id = 'P9'"
+        ).fetchall()
+        conn.close()
+        assert filas == [("1008", "", "", 1)]
+        assert resolve_planner("1008", "Compras") == "P9"
+
+    def test_sin_reemplazo_usa_asignaciones_restantes(self, asignaciones_db):
+        resultado = reasignar_planificador("P1")
+
+        assert resultado["asignaciones_transferidas"] == 0
+        assert self._planners(asignaciones_db)[1] == "P3"
+        assert resolve_planner("1008", "Mant") == "P3"
@@ -0,0 +1,289 @@
+"""
+Tests para el análisis en bloque del planner
+(core/repository.py MaterialRepository.*_batch y core/services/planner_service.py)
+
+Verifica:
+- get_stock_detalle_batch equivale a get_stock_detalle por código
+- Consumo promedio desde el histórico en BD, sin recurrir al cache Excel
+- paso_1 detecta los mismos conflictos y totales que el análisis item por item
+- paso_2 en bloque produce por item lo mismo que la consulta individual
+- paso_3 guarda todas las decisiones y el status en una sola transacción
+"""
+
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.core import cache_loader, repository
+from backend_v2.core.repository import MaterialRepository
+from backend_v2.core.services import planner_service
+from backend_v2.core.services.planner_service import (
+    _consumos_promedio, paso_1_analizar_solicitud, paso_2_opciones_abastecimiento,
+    paso_2_opciones_abastecimiento_batch, paso_3_guardar_tratamiento)
+from backend_v2.services import consumo_store
+from backend_v2.services.audit_log import get_audit_log
+
+
+@pytest.fixture
+def planner_db(tmp_path, monkeypatch):
+    """BD temporal con solicitud, presupuesto, catálogo y stock"""
+    path = tmp_path / "planner.db"
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE solicitudes (
+            id INTEGER PRIMARY KEY, id_usuario TEXT, centro TEXT, sector TEXT,
+            justificacion TEXT, centro_costos TEXT, almacen_virtual TEXT,
+            criticidad TEXT, fecha_necesidad TEXT, status TEXT, total_monto REAL,
+            planner_id TEXT, created_at TEXT, updated_at TEXT, data_json TEXT,
+            aprobador_id TEXT
+        );
+        CREATE TABLE presupuestos (centro TEXT, sector TEXT, monto_usd REAL, saldo_usd REAL);
+        CREATE TABLE materiales (codigo TEXT PRIMARY KEY, descripcion TEXT, precio_usd REAL);
+        CREATE TABLE stock_almacenes (
+            codigo_material TEXT, centro TEXT, almacen TEXT, lote TEXT, cantidad REAL
+        );
+        CREATE TABLE config_almacenes (
+            id INTEGER PRIMARY KEY, centro TEXT, almacen TEXT, nombre TEXT,
+            libre_disponibilidad INTEGER, responsable_id TEXT, excluido INTEGER
+        );
+        CREATE TABLE usuarios (id_spm TEXT, nombre TEXT);
+        CREATE TABLE solicitud_items_tratamiento (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, solicitud_id INTEGER NOT NULL,
+            item_index INTEGER NOT NULL, decision TEXT NOT NULL,
+            cantidad_aprobada REAL NOT NULL, codigo_equivalente TEXT,
+            proveedor_sugerido TEXT, precio_unitario_estimado REAL, comentario TEXT,
+            updated_by TEXT NOT NULL, updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(solicitud_id, item_index)
+        );
+        CREATE TABLE proveedores (
+            id_proveedor TEXT, nombre TEXT, plazo_entrega_dias INTEGER, rating REAL,
+            tipo TEXT, activo INTEGER
+        );
+        INSERT INTO presupuestos VALUES ('1008', 'Mant', 1000, 100);
+        INSERT INTO proveedores VALUES ('P1', 'Proveedor Uno', 10, 4.5, 'externo', 1);
+        INSERT INTO materiales VALUES ('M1', 'Rodamiento', 10), ('M2', 'Sello', 5);
+        INSERT INTO stock_almacenes VALUES
+            ('M1', '1008', '0001', NULL, 4),
+            ('M1', '1008', '0002', NULL, 6),
+            ('M2', '1008', '0001', NULL, 50);
+        INSERT INTO config_almacenes (centro, almacen, nombre, libre_disponibilidad, excluido)
+        VALUES ('1008', '0002', 'Excluido', 0, 1);
+        """
+    )
+    items = [
+        {"codigo": "M1", "descripcion": "Rodamiento", "cantidad": 8, "precio_unitario": 10},
+        {"codigo": "M2", "descripcion": "Sello", "cantidad": 2, "precio_unitario": 5},
+        {"codigo": "M3", "descripcion": "Sin stock", "cantidad": 30, "precio_unitario": 4,
+         "criticidad": "critico"},
+    ]
+    conn.execute(
+        "INSERT INTO solicitudes (id, centro, sector, criticidad, data_json) VALUES (?, ?, ?, ?, ?)",
+        (1, "1008", "Mant", "Normal", json.dumps({"items": items})),
+    )
+    consumo_store.ensure_schema(conn)
+    conn.executemany(
+        "INSERT INTO consumo_movimientos "
+        "(codigo_material, codigo_norm, centro, almacen, fecha, mes, cantidad) "
+        "VALUES (?, ?, '1008', '0001', ?, ?, ?)",
+        [
+            (codigo, codigo, fecha, fecha[:7], cantidad)
+            for codigo, fecha, cantidad in [
+                ("M2", "2024-01-01", 2.0),
+                ("M2", "2024-02-01", 2.0),
+                ("M3", "2024-01-01", 10.0),
+                ("M3", "2024-02-01", 20.0),
+                ("M3", "2024-03-01", 30.0),
+            ]
+        ],
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(repository, "_db_path", lambda: path)
+
+    # El cache Excel no debe usarse: el consumo sale de la BD
+    consumo = pd.DataFrame(
+        {
+            "codigo_norm": ["M2", "M3"],
+            "cantidad": [500.0, 500.0],
+            "fecha": pd.to_datetime(["2024-01-01", "2024-01-01"]),
+        }
+    )
+    monkeypatch.setattr(cache_loader._loader, "_stock_cache", pd.DataFrame())
+    equivalencias = pd.DataFrame(
+        {
+            "codigo_base": ["M3"],
+            "codigo_equivalente": ["M2"],
+            "descripcion_equivalente": ["Sello alternativo"],
+            "criterio": ["dimensiones"],
+            "motivo": ["mismo diámetro"],
+            "codigo_base_norm": ["M3"],
+            "codigo_equivalente_norm": ["M2"],
+        }
+    )
+    monkeypatch.setattr(cache_loader._loader, "_consumo_cache", consumo)
+    monkeypatch.setattr(cache_loader._loader, "_equivalencias_cache", equivalencias)
+    return path
+
+
+def _eventos(path):
+    eventos = get_audit_log(path).history(1)
+    return [(e["item_index"], e["tipo"], e["payload"]) for e in eventos]
+
+
+class TestStockBatch:
+    """Tests para MaterialRepository.get_stock_detalle_batch"""
+
+    def test_equivale_a_consulta_individual(self, planner_db):
+        batch = MaterialRepository.get_stock_detalle_batch(["M1", "M2", "M3"], "1008")
+        for codigo in ("M1", "M2", "M3"):
+            assert batch[codigo] == MaterialRepository.get_stock_detalle(codigo, "1008")
+
+    def test_filtra_almacen_excluido(self, planner_db):
+        batch = MaterialRepository.get_stock_detalle_batch(["M1"])
+        assert [r["almacen"] for r in batch["M1"]] == ["0001"]
+
+    def test_info_batch(self, planner_db):
+        info = MaterialRepository.get_info_batch(["M1", "M3", "M1", ""])
+        assert info == {"M1": {"descripcion": "Rodamiento", "precio_usd": 10}}
+
+
+class TestConsumoBatch:
+    """Tests para _consumos_promedio"""
+
+    def test_desde_historico_en_bd(self, planner_db):
+        assert _consumos_promedio(["M2", "M3", "M9"]) == {"M2": 2.0, "M3": 20.0}
+
+    def test_sin_historico_importado(self, planner_db):
+        conn = sqlite3.connect(planner_db)
+        conn.execute("DELETE FROM consumo_movimientos")
+        conn.commit()
+        conn.close()
+        assert _consumos_promedio(["M2", "M3"]) == {}
+
+
+class TestPaso1Batch:
+    """Tests para paso_1_analizar_solicitud con análisis en bloque"""
+
+    def test_conflictos_y_totales(self, planner_db):
+        resultado = paso_1_analizar_solicitud(1)
+
+        tipos = [(c["tipo"], c["item_idx"]) for c in resultado["conflictos"]]
+        assert tipos == [
+            ("stock_insuficiente", 0),
+            ("stock_insuficiente", 2),
+            ("presupuesto_insuficiente", 2),
+        ]
+        resumen = resultado["resumen"]
+        assert resumen["total_solicitado"] == 80 + 10 + 120
+        # Déficit: M1 faltan 4 (almacén 0002 excluido), M3 faltan 30
+        assert resumen["presupuesto_real_necesario"] == 4 * 10 + 30 * 4
+        assert [m["codigo"] for m in resultado["materiales_por_criticidad"]["Critico"]] == ["M3"]
+
+    def test_consumo_inusual(self, planner_db):
+        conn = sqlite3.connect(planner_db)
+        conn.execute("UPDATE presupuestos SET saldo_usd = 10000")
+        conn.execute("UPDATE consumo_movimientos SET cantidad = cantidad / 10")
+        conn.commit()
+        conn.close()
+
+        resultado = paso_1_analizar_solicitud(1)
+
+        inusuales = [c for c in resultado["conflictos"] if c["tipo"] == "consumo_inusual"]
+        assert [c["codigo"] for c in inusuales] == ["M2", "M3"]
+        assert inusuales[0]["consumo_promedio"] == pytest.approx(0.2)
+
+    def test_solicitud_sin_items(self, planner_db, monkeypatch):
+        monkeypatch.setattr(planner_service.SolicitudRepository, "parse_items", lambda _s: [])
+        resultado = paso_1_analizar_solicitud(1)
+        assert resultado["resumen"]["total_solicitado"] == 0
+        assert resultado["resumen"]["puede_cubrirse_con_stock"] is True
+
+
+class TestPaso2Batch:
+    """Tests para paso_2_opciones_abastecimiento_batch"""
+
+    def test_igual_a_consulta_individual(self, planner_db):
+        batch = paso_2_opciones_abastecimiento_batch(1)
+
+        assert batch["total_items"] == 3
+        for resultado in batch["items"]:
+            assert resultado == paso_2_opciones_abastecimiento(1, resultado["item_idx"])
+
+        equivalencia = [o for o in batch["items"][2]["opciones"] if o["tipo"] == "equivalencia"]
+        assert equivalencia[0]["codigo_material"] == "M2"
+        assert equivalencia[0]["descripcion"] == "Sello"  # Del catálogo de materiales
+
+    def test_subconjunto_y_un_solo_evento(self, planner_db):
+        batch = paso_2_opciones_abastecimiento_batch(1, [2, 0, 2])
+
+        assert [r["item_idx"] for r in batch["items"]] == [2, 0]
+        eventos = _eventos(planner_db)
+        assert len(eventos) == 1
+        item_index, tipo, payload = eventos[0]
+        assert item_index is None and tipo == "opciones_consultadas"
+        assert [i["item_idx"] for i in payload["items"]] == [2, 0]
+
+    def test_indice_fuera_de_rango(self, planner_db):
+        with pytest.raises(ValueError, match="fuera de rango"):
+            paso_2_opciones_abastecimiento_batch(1, [0, 7])
+        assert _eventos(planner_db) == []
+
+
+class TestPaso3Bulk:
+    """Tests para paso_3_guardar_tratamiento con guardado en bloque"""
+
+    @staticmethod
+    def _decisiones(path):
+        conn = sqlite3.connect(path)
+        rows = conn.execute(
+            "SELECT item_index, decision, cantidad_aprobada, updated_by "
+            "FROM solicitud_items_tratamiento ORDER BY item_index"
+        ).fetchall()
+        status = conn.execute("SELECT status FROM solicitudes WHERE id = 1").fetchone()[0]
+        conn.close()
+        return rows, status
+
+    def test_guarda_todo_en_una_transaccion(self, planner_db):
+        decisiones = [
+            {"item_idx": i, "decision_tipo": "STOCK", "cantidad_aprobada": i + 1}
+            for i in range(3)
+        ] + [{"decision_tipo": "compra"}]  # Sin item_idx: se ignora
+
+        resultado = paso_3_guardar_tratamiento(1, decisiones, "P1")
+
+        assert resultado["items_guardados"] == 3 and resultado["errores"] == []
+        rows, status = self._decisiones(planner_db)
+        assert rows == [(0, "stock", 1, "P1"), (1, "stock", 2, "P1"), (2, "stock", 3, "P1")]
+        assert status == "En tratamiento"
+        assert [e[1] for e in _eventos(planner_db)] == ["tratamiento_completado"]
+
+    def test_upsert_sobre_decisiones_previas(self, planner_db):
+        paso_3_guardar_tratamiento(1, [{"item_idx": 0, "cantidad_aprobada": 1}], "P1")
+        paso_3_guardar_tratamiento(
+            1, [{"item_idx": 0, "decision_tipo": "compra", "cantidad_aprobada": 5}], "P2"
+        )
+        rows, _ = self._decisiones(planner_db)
+        assert rows == [(0, "compra", 5, "P2")]
+
+    def test_error_por_item_no_descarta_el_resto(self, planner_db):
+        decisiones = [
+            {"item_idx": 0, "cantidad_aprobada": 1},
+            {"item_idx": 1, "cantidad_aprobada": None},  # NOT NULL
+            {"item_idx": 2, "cantidad_aprobada": 3},
+        ]
+
+        resultado = paso_3_guardar_tratamiento(1, decisiones, "P1")
+
+        assert resultado["items_guardados"] == 2
+        assert [e["item_idx"] for e in resultado["errores"]] == [1]
+        assert "NOT NULL" in resultado["errores"][0]["error"]
+        rows, status = self._decisiones(planner_db)
+        assert [r[0] for r in rows] == [0, 2]
+        assert status == "En tratamiento"
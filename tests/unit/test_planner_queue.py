@@ -0,0 +1,170 @@
+"""
+Tests para la cola del planificador (core/services/planner_queue.py)
+
+Verifica:
+- La prioridad calculada en SQL coincide con ScoringPipeline.score_solicitud
+- Paginación por keyset sin repetir ni saltear solicitudes
+- Filtros y exclusión de items
+"""
+
+import json
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.agent.pipelines.scoring import ScoringPipeline
+from backend_v2.core import repository
+from backend_v2.core.services.planner_queue import (cola_planificador,
+                                                    decode_cursor)
+
+
+@pytest.fixture
+def cola_db(tmp_path, monkeypatch):
+    """BD temporal con solicitudes abiertas de distinta urgencia y tamaño"""
+    path = tmp_path / "cola.db"
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE solicitudes (
+            id INTEGER PRIMARY KEY, id_usuario TEXT, centro TEXT, sector TEXT,
+            justificacion TEXT, centro_costos TEXT, almacen_virtual TEXT,
+            criticidad TEXT, fecha_necesidad TEXT, status TEXT, total_monto REAL,
+            planner_id TEXT, created_at TEXT, updated_at TEXT, data_json TEXT,
+            aprobador_id TEXT
+        );
+        CREATE TABLE usuarios (id_spm TEXT, nombre TEXT, apellido TEXT);
+        INSERT INTO usuarios VALUES ('U1', 'Ana', 'Paz');
+        """
+    )
+    hoy = datetime.now()
+    filas = []
+    for i in range(1, 31):
+        fecha = None if i % 7 == 0 else (hoy + timedelta(days=(i * 3) % 40 - 2)).strftime("%Y-%m-%d")
+        items = [{"codigo": f"M{j}", "cantidad": 1} for j in range(i % 25)]
+        filas.append(
+            (
+                i,
+                "U1",
+                "1008" if i % 2 else "1050",
+                "Mant",
+                "Alta" if i % 3 == 0 else "Normal",
+                fecha,
+                "Aprobada" if i % 4 else "En tratamiento",
+                float(i * 4000),
+                "P1" if i % 5 else "P2",
+                json.dumps({"items": items}),
+            )
+        )
+    filas.append((31, "U1", "1008", "Mant", "Alta", None, "Aprobada", 0, "P1", "no-json"))
+    filas.append((32, "U1", "1008", "Mant", "Alta", None, "Rechazada", 0, "P1", "{}"))
+    conn.executemany(
+        """
+        INSERT INTO solicitudes (id, id_usuario, centro, sector, criticidad, fecha_necesidad,
+                                 status, total_monto, planner_id, data_json)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        filas,
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(repository, "_db_path", lambda: path)
+    return path
+
+
+def _solicitud(path, solicitud_id):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    row = dict(conn.execute("SELECT * FROM solicitudes WHERE id = ?", (solicitud_id,)).fetchone())
+    conn.close()
+    try:
+        row["data_json"] = json.loads(row["data_json"])
+    except ValueError:
+        row["data_json"] = {}
+    return row
+
+
+class TestPrioridad:
+    """La prioridad en SQL reproduce ScoringPipeline"""
+
+    def test_igual_a_scoring_pipeline(self, cola_db):
+        resultado = cola_planificador(limit=200)
+        pipeline = ScoringPipeline()
+
+        assert len(resultado["solicitudes"]) == 31  # La rechazada queda fuera
+        for row in resultado["solicitudes"]:
+            esperado = pipeline.score_solicitud(_solicitud(cola_db, row["id"]))
+            assert row["prioridad"] == pytest.approx(esperado["total_score"], abs=1e-6)
+            assert row["prioridad_nivel"] == esperado["priority_level"]
+
+    def test_orden_descendente(self, cola_db):
+        filas = cola_planificador(limit=200)["solicitudes"]
+        claves = [(r["prioridad"], r["id"]) for r in filas]
+        assert claves == sorted(claves, reverse=True)
+
+    def test_data_json_invalido_cuenta_cero_items(self, cola_db):
+        filas = cola_planificador(limit=200)["solicitudes"]
+        assert next(r for r in filas if r["id"] == 31)["n_items"] == 0
+
+
+class TestPaginacion:
+    """Paginación por keyset"""
+
+    def test_recorre_todo_sin_repetir(self, cola_db):
+        completo = [r["id"] for r in cola_planificador(limit=200)["solicitudes"]]
+        vistos, cursor = [], None
+        while True:
+            pagina = cola_planificador(limit=7, cursor=cursor)
+            vistos.extend(r["id"] for r in pagina["solicitudes"])
+            cursor = pagina["next_cursor"]
+            if cursor is None:
+                break
+        assert vistos == completo
+
+    def test_cursor_conserva_referencia(self, cola_db):
+        pagina = cola_planificador(limit=5)
+        assert decode_cursor(pagina["next_cursor"])["t"] == pagina["referencia"]
+        siguiente = cola_planificador(limit=5, cursor=pagina["next_cursor"])
+        assert siguiente["referencia"] == pagina["referencia"]
+
+    def test_cursor_invalido(self, cola_db):
+        with pytest.raises(ValueError, match="cursor"):
+            cola_planificador(cursor="no-es-un-cursor")
+
+    def test_limit_fuera_de_rango(self, cola_db):
+        with pytest.raises(ValueError, match="limit"):
+            cola_planificador(limit=0)
+
+
+class TestFiltros:
+    """Filtros del lado del servidor"""
+
+    def test_filtros_combinados(self, cola_db):
+        filas = cola_planificador(
+            planner_id="P1", centro="1008", status=["Aprobada"], criticidad="Alta", limit=200
+        )["solicitudes"]
+        assert filas
+        for r in filas:
+            assert (r["planner_id"], r["centro"], r["status"], r["criticidad"]) == (
+                "P1",
+                "1008",
+                "Aprobada",
+                "Alta",
+            )
+
+    def test_status_no_abierto(self, cola_db):
+        with pytest.raises(ValueError, match="Rechazada"):
+            cola_planificador(status=["Rechazada"])
+
+    def test_items_opcionales(self, cola_db):
+        sin_items = cola_planificador(limit=3)["solicitudes"]
+        assert all("items" not in r and "data_json" not in r for r in sin_items)
+
+        con_items = cola_planificador(limit=3, include_items=True)["solicitudes"]
+        for r in con_items:
+            assert "data_json" not in r
+            assert len(r["items"]) == r["n_items"]
@@ -0,0 +1,187 @@
+"""
+Tests para el servicio de retención y archivo
+(backend_v2/services/retention_service.py)
+
+Verifica:
+- Solo se archivan filas que cumplen la política (antigüedad + condición)
+- Movimiento por lotes a la BD de archivo
+- Mensajes: solo hilos completos, viejos y leídos
+- Lectura con include_archived desde NotificationService
+- Reporte de filas y bytes
+"""
+
+import sqlite3
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.services.notification_service import NotificationService
+from backend_v2.services.retention_service import (DEFAULT_POLICIES,
+                                                   RetentionPolicy,
+                                                   RetentionService)
+
+NOW = datetime(2025, 6, 1)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """BD temporal con notificaciones viejas y nuevas"""
+    path = tmp_path / "spm.db"
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE notificaciones(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            destinatario_id TEXT NOT NULL,
+            solicitud_id INTEGER,
+            mensaje TEXT NOT NULL,
+            leido INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            tipo TEXT DEFAULT 'info'
+        );
+        """
+    )
+    rows = [("u1", f"vieja {i}", 1, "2024-01-01T10:00:00") for i in range(7)]
+    rows.append(("u1", "vieja sin leer", 0, "2024-01-01 10:00:00"))
+    rows.append(("u1", "reciente", 1, "2025-05-30T10:00:00"))
+    conn.executemany(
+        "INSERT INTO notificaciones (destinatario_id, mensaje, leido, created_at) VALUES (?,?,?,?)",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(NotificationService, "_db_path", staticmethod(lambda: path))
+    return path
+
+
+def _service(db):
+    policies = {
+        "notificaciones": RetentionPolicy(
+            table="notificaciones", retention_days=90, condition="leido = 1", batch_size=3
+        )
+    }
+    return RetentionService(db_path=db, policies=policies, pause_seconds=0)
+
+
+class TestRetentionService:
+    """Tests para RetentionService"""
+
+    def test_preview_no_modifica(self, db):
+        assert _service(db).preview(now=NOW) == {"notificaciones": 7}
+        conn = sqlite3.connect(db)
+        assert conn.execute("SELECT COUNT(*) FROM notificaciones").fetchone()[0] == 9
+        conn.close()
+
+    def test_archiva_por_lotes(self, db):
+        report = _service(db).run(now=NOW)
+
+        info = report["tables"]["notificaciones"]
+        assert info["rows"] == 7
+        assert info["batches"] == 3
+        assert report["rows_archived"] == 7
+        assert report["bytes_freed"] >= 0
+
+        conn = sqlite3.connect(db)
+        vivas = [r[0] for r in conn.execute("SELECT mensaje FROM notificaciones ORDER BY id")]
+        conn.close()
+        assert vivas == ["vieja sin leer", "reciente"]
+
+        archive = sqlite3.connect(Path(report["archive_path"]))
+        assert archive.execute("SELECT COUNT(*) FROM notificaciones").fetchone()[0] == 7
+        archive.close()
+
+    def test_idempotente(self, db):
+        service = _service(db)
+        service.run(now=NOW)
+        assert service.run(now=NOW)["rows_archived"] == 0
+
+    def test_include_archived(self, db):
+        _service(db).run(now=NOW)
+
+        vivas = NotificationService.get_user_notifications("u1", limit=100)
+        todas = NotificationService.get_user_notifications(
+            "u1", limit=100, include_archived=True
+        )
+        assert len(vivas) == 2
+        assert len(todas) == 9
+
+
+@pytest.fixture
+def db_mensajes(tmp_path):
+    """BD temporal con hilos de mensajes"""
+    path = tmp_path / "spm.db"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        """
+        CREATE TABLE mensajes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            remitente_id TEXT NOT NULL,
+            destinatario_id TEXT NOT NULL,
+            asunto TEXT NOT NULL,
+            mensaje TEXT NOT NULL,
+            parent_id INTEGER,
+            leido INTEGER DEFAULT 0,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    viejo = "2024-01-01T10:00:00"
+    # id, parent_id, leido, created_at
+    filas = [
+        (1, None, 1, viejo),  # Hilo 1: viejo y leído completo
+        (2, 1, 1, viejo),
+        (3, 2, 1, viejo),
+        (4, None, 1, viejo),  # Hilo 4: raíz vieja con respuesta reciente
+        (5, 4, 1, "2025-05-30T10:00:00"),
+        (6, None, 1, viejo),  # Hilo 6: una respuesta sin leer
+        (7, 6, 0, viejo),
+        (8, 99, 1, viejo),  # Hilo 99: raíz ya borrada
+        (9, 99, 1, viejo),
+    ]
+    conn.executemany(
+        "INSERT INTO mensajes (id, remitente_id, destinatario_id, asunto, mensaje, parent_id, "
+        "leido, created_at) VALUES (?, 'u1', 'u2', 'asunto', 'texto', ?, ?, ?)",
+        filas,
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+class TestRetentionHilos:
+    """Los mensajes se archivan por hilo completo"""
+
+    def test_archiva_solo_hilos_completos(self, db_mensajes):
+        policies = {"mensajes": DEFAULT_POLICIES["mensajes"]}
+        service = RetentionService(db_path=db_mensajes, policies=policies, pause_seconds=0)
+        assert service.preview(now=NOW) == {"mensajes": 5}
+
+        report = service.run(now=NOW)
+        assert report["tables"]["mensajes"]["rows"] == 5
+
+        conn = sqlite3.connect(db_mensajes)
+        vivos = [r[0] for r in conn.execute("SELECT id FROM mensajes ORDER BY id")]
+        conn.close()
+        assert vivos == [4, 5, 6, 7]
+        archive = sqlite3.connect(Path(report["archive_path"]))
+        archivados = [r[0] for r in archive.execute("SELECT id FROM mensajes ORDER BY id")]
+        archive.close()
+        assert archivados == [1, 2, 3, 8, 9]
+
+    def test_lotes_por_hilo(self, db_mensajes):
+        policy = RetentionPolicy(
+            table="mensajes",
+            retention_days=365,
+            condition="leido = 1",
+            parent_column="parent_id",
+            batch_size=1,
+        )
+        service = RetentionService(
+            db_path=db_mensajes, policies={"mensajes": policy}, pause_seconds=0
+        )
+        info = service.run(now=NOW)["tables"]["mensajes"]
+        assert (info["rows"], info["batches"]) == (5, 2)
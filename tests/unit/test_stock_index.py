@@ -0,0 +1,109 @@
+"""
+Tests para el índice de stock (core/services/stock_index.py)
+
+Verifica:
+- Exclusiones de almacén y lote aplicadas al construir el índice
+- BD como fuente principal y Excel solo para códigos/filtros sin filas en BD
+- Enriquecimiento con config_almacenes
+- Reconstrucción al cambiar la versión de los datos de referencia
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.core import cache_loader, repository
+from backend_v2.core.repository import (ConfigAlmacenesRepository,
+                                        MaterialRepository)
+from backend_v2.core.services.stock_index import StockIndex, get_stock_index
+
+CONFIG = [
+    {"centro": "1008", "almacen": "0001", "nombre": "Central", "libre_disponibilidad": 1,
+     "responsable_nombre": "Ana", "excluido": 0},
+    {"centro": "1008", "almacen": "0002", "nombre": "Chatarra", "libre_disponibilidad": 0,
+     "responsable_nombre": None, "excluido": 1},
+]
+
+
+@pytest.fixture
+def index():
+    bd = [
+        ("M1", "1008", "0001", "L1", 4),
+        ("M1", "1008", "0001", "BLOQ", 100),
+        ("M1", "1008", "0002", None, 6),
+        ("M1", "1050", "1", None, 3),
+        ("M4", "1008", "0002", None, 9),
+    ]
+    excel = [
+        ("0000M2", "1008", "1", "A", 5.0),
+        ("0000M2", "1008", "1", "B", 2.0),
+        ("M2", "1050", "3", None, 1.0),
+        ("M3", "1050", "3", None, 8.0),
+    ]
+    return StockIndex(bd, excel, CONFIG, ["bloq"])
+
+
+class TestStockIndex:
+    """Consultas sobre el índice construido"""
+
+    def test_exclusiones_y_enriquecimiento(self, index):
+        assert index.detalle("M1") == [
+            {"centro": "1008", "almacen": "0001", "cantidad": 4.0, "libre_disponibilidad": True,
+             "responsable": "Ana", "nombre_almacen": "Central"},
+            {"centro": "1050", "almacen": "0001", "cantidad": 3.0, "libre_disponibilidad": False,
+             "responsable": None, "nombre_almacen": None},
+        ]
+        assert index.disponible("M1", "1008") == 4.0
+        assert index.disponible("M1", almacen="1") == 7.0
+        # Stock solo en almacén excluido: la BD responde (vacío), no el Excel
+        assert index.detalle("M4") == []
+
+    def test_fallback_excel(self, index):
+        assert index.disponible("M2") == 8.0
+        assert [(r["lote"], r["cantidad"]) for r in index.lotes("M2", "1008")] == [
+            ("A", 5.0), ("B", 2.0)
+        ]
+        detalle = index.detalle("M2", "1008", "0001")
+        assert [(r["almacen"], r["cantidad"], r["lote"]) for r in detalle] == [("0001", 7.0, "A")]
+        # Centro sin stock en BD: responde Excel; sin stock en Excel se relaja el filtro
+        assert index.disponible("M1", "1060") == 0.0
+        assert [r["centro"] for r in index.detalle("M3", "1008")] == ["1050"]
+        assert index.disponible("M3", "1008") == 0.0
+
+    def test_filas_independientes(self, index):
+        index.detalle("M1")[0]["cantidad"] = -1
+        assert index.disponible("M1", "1008") == 4.0
+
+
+def test_reconstruye_con_version(tmp_path, monkeypatch):
+    path = tmp_path / "stock.db"
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE stock_almacenes (
+            codigo_material TEXT, centro TEXT, almacen TEXT, lote TEXT, cantidad REAL
+        );
+        CREATE TABLE config_almacenes (
+            id INTEGER PRIMARY KEY, centro TEXT, almacen TEXT, nombre TEXT,
+            libre_disponibilidad INTEGER, responsable_id TEXT, excluido INTEGER,
+            updated_at TEXT, UNIQUE(centro, almacen)
+        );
+        CREATE TABLE usuarios (id_spm TEXT, nombre TEXT);
+        INSERT INTO stock_almacenes VALUES ('M1', '1008', '0001', NULL, 4);
+        """
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(repository, "_db_path", lambda: path)
+    monkeypatch.setattr(cache_loader._loader, "_stock_cache", pd.DataFrame())
+
+    assert get_stock_index() is get_stock_index()
+    assert MaterialRepository.get_stock_detalle("M1")[0]["cantidad"] == 4.0
+
+    ConfigAlmacenesRepository.upsert("1008", "0001", "Central", True, None, excluido=True)
+    assert MaterialRepository.get_stock_detalle("M1") == []
@@ -0,0 +1,205 @@
+"""
+Tests para la sincronización incremental de stock (services/stock_sync.py)
+
+Verifica:
+- Lectura de exportaciones csv/xlsx y normalización de claves
+- Solo se escriben las filas que cambiaron, en lotes con su change-set
+- Una sola sincronización a la vez; un lote con stock modificado se aborta
+- El índice de stock refresca solo los materiales del change-set
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.core import cache_loader, repository
+from backend_v2.core.repository import ReferenceDataRepository
+from backend_v2.core.services import stock_index
+from backend_v2.services import stock_sync
+from backend_v2.services.stock_sync import (StockSyncService,
+                                            SyncConflictoError,
+                                            leer_exportacion,
+                                            materiales_cambiados)
+
+
+@pytest.fixture
+def stock_db(tmp_path, monkeypatch):
+    """BD con stock inicial (una clave duplicada) apuntada por el repositorio"""
+    path = tmp_path / "stock.db"
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE stock_almacenes (
+            codigo_material TEXT, centro TEXT, almacen TEXT, lote TEXT, cantidad REAL
+        );
+        INSERT INTO stock_almacenes VALUES
+            ('M1', '1008', '0001', NULL, 4),
+            ('M2', '1008', '0001', 'L1', 10),
+            ('M3', '1008', '0002', NULL, 7),
+            ('M4', '1050', '0001', NULL, 1),
+            ('M4', '1050', '0001', NULL, 2);
+        """
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(repository, "_db_path", lambda: path)
+    monkeypatch.setattr(cache_loader._loader, "_stock_cache", pd.DataFrame())
+    return path
+
+
+def _csv(tmp_path, lineas):
+    path = tmp_path / "export.csv"
+    path.write_text("\n".join(["Material;Centro;Almacén;Lote;Stock"] + lineas), encoding="utf-8")
+    return path
+
+
+def _stock(path):
+    conn = sqlite3.connect(path)
+    try:
+        return sorted(
+            conn.execute(
+                "SELECT codigo_material, centro, almacen, lote, cantidad FROM stock_almacenes"
+            ).fetchall(),
+            key=lambda r: (r[0], r[3] or ""),
+        )
+    finally:
+        conn.close()
+
+
+def test_leer_exportacion_xlsx(tmp_path):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Material", "Centro", "Almacén", "Stock"])
+    ws.append(["M1", 1008, 1, 3])
+    ws.append(["M1", 1008, "0001", 2.5])
+    ws.append([None, 1008, 1, 9])
+    wb.save(tmp_path / "export.xlsx")
+
+    stock, leidas = leer_exportacion(tmp_path / "export.xlsx")
+    assert stock == {("M1", "1008", "0001", None): 5.5}
+    assert leidas == 2
+
+    (tmp_path / "malo.csv").write_text("Material,Stock\nM1,1\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        leer_exportacion(tmp_path / "malo.csv")
+
+
+class TestSync:
+    """Aplicación de deltas sobre stock_almacenes"""
+
+    def test_solo_aplica_cambios(self, stock_db, tmp_path):
+        export = _csv(
+            tmp_path,
+            ["M1;1008;1;;4", "M2;1008;1;L1;12", "M2;1008;1;L2;1,5", "M4;1050;1;;3"],
+        )
+        service = StockSyncService(db_path=stock_db, batch_size=2)
+
+        preview = service.sync(export, dry_run=True)
+        assert (preview["altas"], preview["modificaciones"], preview["bajas"]) == (1, 2, 1)
+        assert len(_stock(stock_db)) == 5
+
+        reporte = service.sync(export, usuario="admin")
+        assert reporte["lotes"] == 2
+        assert reporte["materiales_afectados"] == 3
+        assert _stock(stock_db) == [
+            ("M1", "1008", "0001", None, 4.0),
+            ("M2", "1008", "0001", "L1", 12.0),
+            ("M2", "1008", "0001", "L2", 1.5),
+            ("M4", "1050", "0001", None, 3.0),
+        ]
+
+        conn = sqlite3.connect(stock_db)
+        try:
+            assert ReferenceDataRepository.get_version(conn) == reporte["version"] == 2
+            assert materiales_cambiados(conn, 0, 2) == {"M2", "M3", "M4"}
+            assert materiales_cambiados(conn, 0, 3) is None
+        finally:
+            conn.close()
+        assert service.historial()[0]["estado"] == "aplicado"
+
+        # Misma exportación otra vez: nada que escribir
+        assert service.sync(export)["sync_id"] is None
+
+    def test_sin_bajas(self, stock_db, tmp_path):
+        export = _csv(tmp_path, ["M1;1008;0001;;5"])
+        reporte = StockSyncService(db_path=stock_db).sync(export, con_bajas=False)
+        assert (reporte["modificaciones"], reporte["bajas"]) == (1, 0)
+        assert len(_stock(stock_db)) == 5
+
+
+class TestConcurrencia:
+    """Sincronizaciones simultáneas"""
+
+    def _en_curso(self, stock_db, created_at):
+        conn = sqlite3.connect(stock_db)
+        stock_sync.ensure_schema(conn)
+        conn.execute(
+            "INSERT INTO stock_sync_log (archivo, estado, created_at) "
+            "VALUES ('otra', 'en_curso', ?)",
+            (created_at,),
+        )
+        conn.commit()
+        conn.close()
+
+    def test_una_sola_en_curso(self, stock_db, tmp_path):
+        self._en_curso(stock_db, "9999-01-01 00:00:00")
+        export = _csv(tmp_path, ["M1;1008;1;;9"])
+        service = StockSyncService(db_path=stock_db)
+        with pytest.raises(SyncConflictoError):
+            service.sync(export)
+        assert len(_stock(stock_db)) == 5
+        # dry-run no escribe: no necesita reclamar
+        assert service.sync(export, dry_run=True)["modificaciones"] == 1
+
+    def test_en_curso_abandonada(self, stock_db, tmp_path):
+        self._en_curso(stock_db, "2000-01-01 00:00:00")
+        service = StockSyncService(db_path=stock_db)
+        reporte = service.sync(_csv(tmp_path, ["M1;1008;1;;9"]), con_bajas=False)
+        assert reporte["lotes"] == 1
+        estados = [(h["archivo"], h["estado"]) for h in service.historial()]
+        assert estados == [("export.csv", "aplicado"), ("otra", "error")]
+
+    def test_lote_con_stock_modificado(self, stock_db, tmp_path, monkeypatch):
+        service = StockSyncService(db_path=stock_db)
+        leer = stock_sync.stock_actual
+
+        def leer_y_modificar(conn):
+            # Otra escritura entre la lectura y el lote
+            actual = leer(conn)
+            conn.execute("UPDATE stock_almacenes SET cantidad = 99 WHERE codigo_material = 'M1'")
+            return actual
+
+        monkeypatch.setattr(stock_sync, "stock_actual", leer_y_modificar)
+        with pytest.raises(SyncConflictoError):
+            service.sync(_csv(tmp_path, ["M1;1008;1;;5"]), con_bajas=False)
+        assert ("M1", "1008", "0001", None, 99.0) in _stock(stock_db)
+        historial = service.historial()[0]
+        assert (historial["estado"], historial["lotes"]) == ("error", 0)
+
+
+def test_indice_refresca_solo_el_change_set(stock_db, tmp_path, monkeypatch):
+    index = stock_index.get_stock_index()
+    assert index.disponible("M3") == 7.0
+
+    construidos = []
+    original = stock_index.construir_indice
+    monkeypatch.setattr(
+        stock_index, "construir_indice", lambda *a: construidos.append(a) or original(*a)
+    )
+    StockSyncService(db_path=stock_db).sync(_csv(tmp_path, ["M1;1008;1;;4", "M2;1008;1;L1;3"]))
+
+    nuevo = stock_index.get_stock_index()
+    assert construidos == []
+    assert [nuevo.disponible(c) for c in ("M1", "M2", "M3")] == [4.0, 3.0, 0.0]
+    assert index.disponible("M3") == 7.0  # El índice anterior no se modifica
+
+    # Un cambio de versión sin change-set reconstruye completo
+    ReferenceDataRepository.bump()
+    stock_index.get_stock_index()
+    assert len(construidos) == 1
@@ -0,0 +1,236 @@
+"""
+Tests para el servidor asyncio de streaming (backend_v2/streaming_server.py)
+
+Verifica:
+- Extracción de token desde header y cookie
+- Reparto de notificaciones del hub por destinatario
+- Clientes lentos se desconectan al no drenar a tiempo
+- Long-poll: entrega inmediata de pendientes y timeout sin novedades
+- Reconexión: las pendientes del usuario se paginan sin perder ninguna
+"""
+
+import asyncio
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2 import streaming_server
+from backend_v2.streaming_server import (NotificationHub, StreamingServer,
+                                         _extract_token, _Subscriber)
+
+
+@pytest.fixture
+def notif_db(tmp_path, monkeypatch):
+    """BD temporal con la tabla notificaciones"""
+    db = tmp_path / "stream.db"
+    conn = sqlite3.connect(db)
+    conn.execute(
+        """
+        CREATE TABLE notificaciones(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            destinatario_id TEXT NOT NULL,
+            solicitud_id INTEGER,
+            mensaje TEXT NOT NULL,
+            leido INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            tipo TEXT DEFAULT 'info'
+        )
+        """
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(streaming_server.NotificationService, "_db_path", staticmethod(lambda: db))
+    return db
+
+
+def _insert(db, destinatario, mensaje):
+    conn = sqlite3.connect(db)
+    cur = conn.execute(
+        "INSERT INTO notificaciones (destinatario_id, mensaje) VALUES (?, ?)",
+        (destinatario, mensaje),
+    )
+    conn.commit()
+    conn.close()
+    return cur.lastrowid
+
+
+class _FakeWriter:
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(data)
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    @property
+    def body(self):
+        return b"".join(self.chunks).decode()
+
+
+class TestExtractToken:
+    """Tests para _extract_token"""
+
+    def test_bearer_header(self):
+        assert _extract_token({"authorization": "Bearer abc"}) == "abc"
+
+    def test_cookie(self):
+        assert _extract_token({"cookie": "otro=1; spm_token=xyz"}) == "xyz"
+
+    def test_sin_token(self):
+        assert _extract_token({}) is None
+
+
+class TestNotificationHub:
+    """Tests para el reparto de notificaciones"""
+
+    def test_dispatch_solo_al_destinatario(self):
+        hub = NotificationHub()
+        w1, w2 = _FakeWriter(), _FakeWriter()
+        hub.subscribe(_Subscriber("u1", writer=w1))
+        hub.subscribe(_Subscriber("u2", writer=w2))
+
+        hub.dispatch(
+            {"id": 5, "destinatario_id": "u1", "mensaje": "hola", "tipo": "info",
+             "solicitud_id": None, "created_at": "2025-01-01"}
+        )
+
+        assert w1.body.startswith("id: 5\nevent: notification\n")
+        assert "hola" in w1.body
+        assert w2.body == ""
+
+    def test_cliente_lento_se_desconecta(self, monkeypatch):
+        monkeypatch.setattr(streaming_server, "DRAIN_TIMEOUT", 0.01)
+
+        class _SlowWriter(_FakeWriter):
+            async def drain(self):
+                await asyncio.sleep(1)
+
+        hub = NotificationHub()
+        lento = _Subscriber("u1", writer=_SlowWriter())
+        rapido = _Subscriber("u1", writer=_FakeWriter())
+        hub.subscribe(lento)
+        hub.subscribe(rapido)
+        escritos = hub.dispatch(
+            {"id": 1, "destinatario_id": "u1", "mensaje": "x", "tipo": "info",
+             "solicitud_id": None, "created_at": "2025-01-01"}
+        )
+
+        async def run():
+            await asyncio.gather(*(hub._drain(sub) for sub in escritos))
+
+        asyncio.run(run())
+        assert lento.writer.closed and not rapido.writer.closed
+        assert hub.connection_count == 1
+
+    def test_unsubscribe_libera_usuario(self):
+        hub = NotificationHub()
+        sub = _Subscriber("u1", writer=_FakeWriter())
+        hub.subscribe(sub)
+        assert hub.connection_count == 1
+        hub.unsubscribe(sub)
+        assert hub.connection_count == 0
+
+
+class TestLongPoll:
+    """Tests para el endpoint de long-poll"""
+
+    def test_entrega_pendientes(self, notif_db, monkeypatch):
+        monkeypatch.setattr(streaming_server, "_authenticate", lambda headers: "u1")
+        _insert(notif_db, "u1", "pendiente")
+        _insert(notif_db, "u2", "ajena")
+
+        async def run():
+            server = StreamingServer(NotificationHub())
+            server.hub.last_id = 2
+            writer = _FakeWriter()
+            await server._handle_long_poll(writer, {"last_id": ["0"]}, {})
+            return writer.body
+
+        body = asyncio.run(run())
+        assert "pendiente" in body
+        assert "ajena" not in body
+
+    def test_timeout_sin_novedades(self, notif_db, monkeypatch):
+        monkeypatch.setattr(streaming_server, "_authenticate", lambda headers: "u1")
+        monkeypatch.setattr(streaming_server, "LONG_POLL_MAX_TIMEOUT", 0.05)
+
+        async def run():
+            server = StreamingServer(NotificationHub())
+            writer = _FakeWriter()
+            await server._handle_long_poll(writer, {"timeout": ["1"]}, {})
+            return writer.body
+
+        body = asyncio.run(run())
+        assert '"notifications": []' in body
+
+    def test_pagina_sin_saltar_pendientes(self, notif_db, monkeypatch):
+        monkeypatch.setattr(streaming_server, "_authenticate", lambda headers: "u1")
+        monkeypatch.setattr(streaming_server, "CATCH_UP_PAGE", 2)
+        for i in range(5):
+            _insert(notif_db, "u2", f"ajena{i}")
+        propias = [_insert(notif_db, "u1", f"propia{i}") for i in range(3)]
+        _insert(notif_db, "u2", "ultima")
+
+        async def run():
+            server = StreamingServer(NotificationHub())
+            server.hub.last_id = 9
+            respuestas = []
+            last_id = 0
+            for _ in range(2):
+                writer = _FakeWriter()
+                await server._handle_long_poll(writer, {"last_id": [str(last_id)]}, {})
+                body = json.loads(writer.body.split("\r\n\r\n", 1)[1])
+                respuestas.append(body)
+                last_id = body["last_id"]
+            return respuestas
+
+        primera, segunda = asyncio.run(run())
+        assert [n["id"] for n in primera["notifications"]] == propias[:2]
+        assert primera["last_id"] == propias[1]
+        assert [n["id"] for n in segunda["notifications"]] == propias[2:]
+        assert segunda["last_id"] == 9
+
+    def test_sin_token_401(self, notif_db):
+        async def run():
+            server = StreamingServer(NotificationHub())
+            writer = _FakeWriter()
+            await server._handle_long_poll(writer, {}, {})
+            return writer.body
+
+        assert asyncio.run(run()).startswith("HTTP/1.1 401")
+
+
+class TestSSE:
+    """Tests para el endpoint SSE"""
+
+    def test_reconexion_entrega_todas_las_pendientes(self, notif_db, monkeypatch):
+        monkeypatch.setattr(streaming_server, "_authenticate", lambda headers: "u1")
+        monkeypatch.setattr(streaming_server, "CATCH_UP_PAGE", 2)
+        propias = []
+        for i in range(3):
+            _insert(notif_db, "u2", f"ajena{i}")
+            propias.append(_insert(notif_db, "u1", f"propia{i}"))
+
+        async def run():
+            server = StreamingServer(NotificationHub())
+            server.hub.last_id = 6
+            reader = asyncio.StreamReader()
+            reader.feed_eof()
+            writer = _FakeWriter()
+            await server._handle_sse(reader, writer, {"last-event-id": "0"})
+            return writer.body
+
+        body = asyncio.run(run())
+        assert [f"propia{i}" in body for i in range(3)] == [True] * 3
+        assert "ajena" not in body
@@ -0,0 +1,161 @@
+"""
+Tests para los contadores materializados de no leídos
+(backend_v2/services/unread_counters.py)
+
+Verifica:
+- Mantenimiento transaccional desde NotificationService y MessageService
+- Lectura por PK del contador
+- Reconciliación de desvíos
+"""
+
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.services.message_service import MessageService
+from backend_v2.services.notification_service import NotificationService
+from backend_v2.services.unread_counters import UnreadCounterService
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """BD temporal con notificaciones y mensajes"""
+    path = tmp_path / "counters.db"
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE notificaciones(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            destinatario_id TEXT NOT NULL,
+            solicitud_id INTEGER,
+            mensaje TEXT NOT NULL,
+            leido INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            tipo TEXT DEFAULT 'info'
+        );
+        CREATE TABLE mensajes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            remitente_id TEXT NOT NULL,
+            destinatario_id TEXT NOT NULL,
+            solicitud_id INTEGER,
+            asunto TEXT NOT NULL,
+            mensaje TEXT NOT NULL,
+            parent_id INTEGER,
+            leido INTEGER DEFAULT 0,
+            tipo TEXT DEFAULT 'mensaje',
+            metadata_json TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(NotificationService, "_db_path", staticmethod(lambda: path))
+    monkeypatch.setattr(MessageService, "_get_db_path", staticmethod(lambda: path))
+    return path
+
+
+def _counter(path, user_id, field):
+    conn = sqlite3.connect(path)
+    row = conn.execute(
+        f"SELECT {field} FROM user_unread_counters WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+
+class TestNotificationCounters:
+    """Contador unread_notifications"""
+
+    def test_create_incrementa(self, db):
+        NotificationService.create_notification("u1", "a")
+        NotificationService.create_notification("u1", "b")
+        assert NotificationService.get_unread_count("u1") == 2
+        assert _counter(db, "u1", "unread_notifications") == 2
+
+    def test_mark_as_read_es_idempotente(self, db):
+        nid = NotificationService.create_notification("u1", "a")
+        assert NotificationService.mark_as_read(nid, "u1") is True
+        assert NotificationService.mark_as_read(nid, "u1") is True
+        assert NotificationService.get_unread_count("u1") == 0
+
+    def test_mark_as_read_ajeno_no_modifica(self, db):
+        nid = NotificationService.create_notification("u1", "a")
+        assert NotificationService.mark_as_read(nid, "u2") is False
+        assert NotificationService.get_unread_count("u1") == 1
+
+    def test_mark_all_y_delete(self, db):
+        NotificationService.create_notification("u1", "a")
+        nid = NotificationService.create_notification("u1", "b")
+        assert NotificationService.delete_notification(nid, "u1") is True
+        assert NotificationService.get_unread_count("u1") == 1
+        assert NotificationService.mark_all_as_read("u1") == 1
+        assert NotificationService.get_unread_count("u1") == 0
+
+
+class TestMessageCounters:
+    """Contador unread_messages"""
+
+    def test_send_read_delete(self, db):
+        m1 = MessageService.send_message("u1", "u2", "asunto", "hola")
+        m2 = MessageService.send_message("u1", "u2", "asunto", "chau")
+        assert MessageService.get_unread_count("u2") == 2
+        assert MessageService.get_unread_count("u1") == 0
+
+        assert MessageService.mark_as_read(m1, "u2") is True
+        assert MessageService.get_unread_count("u2") == 1
+
+        # El remitente borra un mensaje aún no leído por el destinatario
+        assert MessageService.delete_message(m2, "u1") is True
+        assert MessageService.get_unread_count("u2") == 0
+
+    def test_llamadas_concurrentes_descuentan_una_vez(self, db):
+        leido = MessageService.send_message("u1", "u2", "asunto", "a")
+        borrado = MessageService.send_message("u1", "u2", "asunto", "b")
+        MessageService.send_message("u1", "u2", "asunto", "c")
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            marcas = list(pool.map(lambda _: MessageService.mark_as_read(leido, "u2"), range(8)))
+            borrados = list(
+                pool.map(lambda _: MessageService.delete_message(borrado, "u2"), range(8))
+            )
+        assert all(marcas) and borrados.count(True) == 1
+        assert MessageService.get_unread_count("u2") == 1
+
+        # Borrar un mensaje ya leído no toca el contador
+        assert MessageService.delete_message(leido, "u2") is True
+        assert MessageService.get_unread_count("u2") == 1
+
+
+class TestReconcile:
+    """Reconciliación de desvíos"""
+
+    def test_repara_escrituras_directas(self, db):
+        NotificationService.create_notification("u1", "a")
+        conn = sqlite3.connect(db)
+        conn.execute("INSERT INTO notificaciones (destinatario_id, mensaje) VALUES ('u1', 'x')")
+        conn.execute("UPDATE user_unread_counters SET unread_messages = 7 WHERE user_id = 'u1'")
+        conn.commit()
+        conn.close()
+
+        result = UnreadCounterService.reconcile(str(db))
+
+        assert result["corregidos"] == 1
+        assert _counter(db, "u1", "unread_notifications") == 2
+        assert _counter(db, "u1", "unread_messages") == 0
+
+    def test_tabla_creada_tarde_arranca_reconciliada(self, db):
+        conn = sqlite3.connect(db)
+        conn.execute("INSERT INTO mensajes (remitente_id, destinatario_id, asunto, mensaje) "
+                     "VALUES ('u1', 'u3', 's', 'm')")
+        conn.commit()
+        conn.close()
+
+        MessageService.send_message("u1", "u3", "asunto", "otro")
+        assert MessageService.get_unread_count("u3") == 2
@@ -0,0 +1,52 @@
+"""
+Tests para las utilidades compartidas (core/utils.py)
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend_v2.core.utils import almacen_fisico, norm_codigo, tiene_tabla
+
+
+@pytest.mark.parametrize(
+    "valor,esperado",
+    [
+        ("000123", "123"),
+        (" 0042.0 ", "42"),
+        (1008.0, "1008"),
+        (7, "7"),
+        ("A-01", "A-01"),
+        ("", ""),
+        (None, ""),
+    ],
+)
+def test_norm_codigo(valor, esperado):
+    assert norm_codigo(valor) == esperado
+
+
+@pytest.mark.parametrize(
+    "valor,esperado",
+    [
+        ("ALM0001", "1"),
+        ("alm-12", "12"),
+        ("0001", "1"),
+        (1.0, "1"),
+        ("ALM-A1", "ALM-A1"),
+        (None, ""),
+    ],
+)
+def test_almacen_fisico(valor, esperado):
+    assert almacen_fisico(valor) == esperado
+
+
+def test_tiene_tabla():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE materiales (codigo TEXT)")
+    assert tiene_tabla(conn, "materiales")
+    assert not tiene_tabla(conn, "stock_almacenes")
+    conn.close()